@@ -8,6 +8,7 @@ Chức năng:
 - Chat Actions: buttons cho đặt hàng, khiếu nại, hỗ trợ
 """
 from .agent import CustomerServiceAgent
+from .intent_classifier import IntentClassifier
 from .rag import RAGService
 from .recommendation import ProductRecommender
 from .summarization import ConversationSummarizer
@@ -21,6 +22,7 @@ from .order_workflow import (
 
 __all__ = [
     "CustomerServiceAgent",
+    "IntentClassifier",
     "RAGService", 
     "ProductRecommender",
     "ConversationSummarizer",
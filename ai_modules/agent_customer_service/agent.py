@@ -7,15 +7,19 @@ Customer Service Agent - Main orchestrator
 4. Order Workflow: Đặt hàng, thanh toán QR
 5. Chat Actions: Buttons cho các thao tác nhanh
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from sqlalchemy.orm import Session
 
 from ai_modules.core.base_agent import BaseAgent, AgentType, AgentResponse
 from ai_modules.core.config import ai_config
+from ai_modules.core.keyword_matcher import KeywordMatcher
+from ai_modules.core.timing import stage_timer, span
 from .rag import RAGService
+from .rag.gazetteer import GazetteerCache, db_catalog_gazetteer
 from .recommendation import ProductRecommender
 from .summarization import ConversationSummarizer
-from .order_workflow import OrderWorkflowManager, OrderState, ChatAction
+from .order_workflow import OrderWorkflowManager, OrderState, ChatAction, get_workflow_store
+from .intent_classifier import IntentClassifier
 
 
 class CustomerServiceAgent(BaseAgent):
@@ -30,30 +34,37 @@ class CustomerServiceAgent(BaseAgent):
     - Actions: khiếu nại, gặp nhân viên, tra cứu đơn
     """
     
-    # Mapping conversation_id -> OrderWorkflowManager
-    _order_workflows: Dict[int, OrderWorkflowManager] = {}
+    # Intent keywords mapping (thứ tự = ưu tiên khi hòa điểm)
+    intent_keywords = {
+        "rag_query": ["chính sách", "policy", "hướng dẫn", "faq", "làm sao", "thế nào", "là gì"],
+        "product_recommend": ["gợi ý", "recommend", "phù hợp", "tốt nhất", "nên mua", "đề xuất"],
+        "product_search": ["tìm", "search", "có bán", "giá", "sản phẩm"],
+        "product_compare": ["so sánh", "compare", "khác gì", "khác nhau", "hơn", "thua", "vs", "hay", "hoặc", "chọn cái nào", "nên chọn"],
+        "summarize": ["tóm tắt", "summary", "tổng kết"],
+        "order": ["đặt hàng", "mua", "order", "đặt mua", "thêm vào giỏ", "mua ngay"],
+        "payment": ["thanh toán", "chuyển khoản", "payment", "trả tiền"],
+        "track_order": ["tra cứu đơn", "đơn hàng", "kiểm tra đơn", "theo dõi đơn"],
+        "complaint": ["khiếu nại", "phản ánh", "không hài lòng", "lỗi", "hỏng"],
+        "support": ["gặp nhân viên", "hỗ trợ", "tư vấn viên", "support", "liên hệ"]
+    }
     
-    def __init__(self, db: Session):
+    # Compiled once at class load → single-pass intent scan per message
+    _intent_matcher = KeywordMatcher(intent_keywords)
+    
+    # Keyword score (tổng độ dài cụm khớp) đủ để bỏ qua embedding classifier.
+    # Từ đơn ngắn ("mua", "giá", "hơn") không đủ → nhờ classifier xác nhận.
+    KEYWORD_CONFIDENT_SCORE = 5
+    
+    # Product DB gazetteer for order entity linking (shared per worker, built lazily)
+    _order_catalog: Optional[GazetteerCache] = None
+    
+    def __init__(self, db: Optional[Session] = None):
         super().__init__(db, AgentType.CUSTOMER_SERVICE)
         
         # Initialize sub-services
         self.rag_service = RAGService()
         self.recommender = ProductRecommender(db)
         self.summarizer = ConversationSummarizer()
-        
-        # Intent keywords mapping
-        self.intent_keywords = {
-            "rag_query": ["chính sách", "policy", "hướng dẫn", "faq", "làm sao", "thế nào", "là gì"],
-            "product_recommend": ["gợi ý", "recommend", "phù hợp", "tốt nhất", "nên mua", "đề xuất"],
-            "product_search": ["tìm", "search", "có bán", "giá", "sản phẩm"],
-            "product_compare": ["so sánh", "compare", "khác gì", "khác nhau", "hơn", "thua", "vs", "hay", "hoặc", "chọn cái nào", "nên chọn"],
-            "summarize": ["tóm tắt", "summary", "tổng kết"],
-            "order": ["đặt hàng", "mua", "order", "đặt mua", "thêm vào giỏ", "mua ngay"],
-            "payment": ["thanh toán", "chuyển khoản", "payment", "trả tiền"],
-            "track_order": ["tra cứu đơn", "đơn hàng", "kiểm tra đơn", "theo dõi đơn"],
-            "complaint": ["khiếu nại", "phản ánh", "không hài lòng", "lỗi", "hỏng"],
-            "support": ["gặp nhân viên", "hỗ trợ", "tư vấn viên", "support", "liên hệ"]
-        }
     
     def process_query(
         self, 
@@ -63,16 +74,27 @@ class CustomerServiceAgent(BaseAgent):
     ) -> AgentResponse:
         """
         Process customer query and route to appropriate service
+        Per-stage latency (intent, embedding, chroma, llm...) → response.timings
         """
-        query_lower = query.lower()
-        context = context or {}
-        
+        with stage_timer() as timer:
+            with span("agent"):
+                response = self._route_query(query, user_id, context or {})
+        response.timings = timer.as_dict()
+        return response
+    
+    def _route_query(
+        self,
+        query: str,
+        user_id: Optional[int],
+        context: Dict[str, Any]
+    ) -> AgentResponse:
+        """Detect intent and dispatch to the matching handler"""
         # Check for action button click
         if context.get("action_id"):
             return self._handle_action(context["action_id"], user_id, context)
         
-        # Detect intent
-        intent = self._detect_intent(query_lower)
+        # Detect intent (embedding is reused by the RAG path if computed)
+        intent, query_embedding = self._detect_intent(query)
         
         try:
             if intent == "product_recommend":
@@ -93,7 +115,7 @@ class CustomerServiceAgent(BaseAgent):
                 return self._handle_support_request(user_id, context)
             else:
                 # Default: RAG query for product/policy info
-                return self._handle_rag_query(query, user_id, context)
+                return self._handle_rag_query(query, user_id, context, query_embedding)
                 
         except Exception as e:
             return AgentResponse(
@@ -117,18 +139,46 @@ class CustomerServiceAgent(BaseAgent):
             "contact_staff"          # Gặp nhân viên
         ]
     
-    def _detect_intent(self, query: str) -> str:
-        """Detect user intent from query"""
-        for intent, keywords in self.intent_keywords.items():
-            if any(kw in query for kw in keywords):
-                return intent
-        return "rag_query"  # Default intent
+    def _detect_intent(self, query: str) -> Tuple[str, Optional[List[float]]]:
+        """
+        Detect user intent from query
+        1. Keyword fast path (Aho–Corasick) khi khớp cụm từ đủ dài
+        2. Nearest-centroid trên query embedding cho câu không có keyword rõ ràng
+        3. Fallback: keyword yếu hoặc rag_query
+        
+        Returns:
+            (intent, query_embedding) — embedding là None nếu đi fast path
+        """
+        with span("intent"):
+            keyword_intent, keyword_score = self._intent_matcher.best(query.lower())
+        if keyword_intent and keyword_score >= self.KEYWORD_CONFIDENT_SCORE:
+            return keyword_intent, None
+        
+        query_embedding = self._embed_query(query)
+        if query_embedding is not None:
+            classifier = IntentClassifier.shared(self.rag_service.policy_retriever.embedding_fn)
+            if classifier:
+                with span("intent"):
+                    intent, _ = classifier.predict(query_embedding)
+                if intent:
+                    return intent, query_embedding
+        
+        return keyword_intent or "rag_query", query_embedding
+    
+    def _embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed query via the RAG retriever (same vector space as ChromaDB)"""
+        try:
+            return self.rag_service.policy_retriever.embed_query(query)
+        except Exception as e:
+            print(f"[CustomerServiceAgent] Embedding error: {e}")
+            return None
     
     def _handle_rag_query(
         self, 
         query: str, 
         user_id: Optional[int],
-        context: Optional[Dict[str, Any]]
+        context: Optional[Dict[str, Any]],
+        query_embedding: Optional[List[float]] = None
     ) -> AgentResponse:
         """Handle RAG-based Q&A"""
         # Get category from context if available
@@ -138,7 +188,9 @@ class CustomerServiceAgent(BaseAgent):
             question=query,
             category=category,
             top_k_policy=4,
-            top_k_product=6
+            top_k_product=6,
+            query_embedding=query_embedding,
+            crm_context=context.get("crm_context") if context else None
         )
         
         # Add suggested actions after RAG response
@@ -164,22 +216,19 @@ class CustomerServiceAgent(BaseAgent):
         context: Optional[Dict[str, Any]]
     ) -> AgentResponse:
         """Handle product comparison requests"""
-        # Extract product names from query
-        product_names = self._extract_product_names_for_compare(query)
-        
-        if len(product_names) < 2:
-            # Try to get more products from context or use RAG to find similar
-            result = self.rag_service.compare_products(
-                query=query,
-                product_names=product_names,
-                category=context.get("category") if context else None
-            )
-        else:
-            result = self.rag_service.compare_products(
-                query=query,
-                product_names=product_names,
-                category=context.get("category") if context else None
-            )
+        # Link mentions straight to catalog product ids (one pass, no vector search)
+        with span("entity_linking"):
+            product_ids = self.rag_service.product_retriever.gazetteer().resolve(query, limit=5)
+        
+        # Free-text names only when the catalog could not resolve enough products
+        product_names = self._extract_product_names_for_compare(query) if len(product_ids) < 2 else []
+        
+        result = self.rag_service.compare_products(
+            query=query,
+            product_names=product_names,
+            category=context.get("category") if context else None,
+            product_ids=product_ids
+        )
         
         if not result.get("products"):
             return AgentResponse(
@@ -216,7 +265,7 @@ class CustomerServiceAgent(BaseAgent):
         )
     
     def _extract_product_names_for_compare(self, query: str) -> List[str]:
-        """Extract product names mentioned in comparison query"""
+        """Extract free-text product names from comparison patterns (fallback for unlinked mentions)"""
         import re
         
         # Common comparison patterns
@@ -243,22 +292,8 @@ class CustomerServiceAgent(BaseAgent):
                         product_names.append(name)
                 break
         
-        # If no pattern matched, try to extract known product keywords
-        if not product_names:
-            # Look for product indicators
-            keywords = ['iphone', 'samsung', 'macbook', 'laptop', 'điện thoại', 'tablet', 
-                       'airpods', 'galaxy', 'xiaomi', 'oppo', 'realme', 'asus', 'dell', 'hp']
-            for kw in keywords:
-                if kw in query_lower:
-                    # Extract the full product name context
-                    idx = query_lower.find(kw)
-                    # Get surrounding context
-                    start = max(0, idx - 5)
-                    end = min(len(query), idx + len(kw) + 15)
-                    snippet = query[start:end].strip()
-                    product_names.append(snippet)
-        
-        return list(set(product_names))[:5]  # Max 5 products to compare
+        # Brand / model keywords are resolved by the catalog gazetteer instead
+        return list(dict.fromkeys(product_names))[:5]  # Max 5 products to compare
     
     def _handle_recommendation(
         self, 
@@ -330,15 +365,44 @@ class CustomerServiceAgent(BaseAgent):
     
     # === ORDER WORKFLOW HANDLERS ===
     
+    def _load_workflow(self, user_id: Optional[int], conversation_id: int) -> Optional[OrderWorkflowManager]:
+        """Load workflow state from the shared store (bound to this request's db)"""
+        stored = get_workflow_store().get(conversation_id)
+        if stored is None:
+            return None
+        state, draft = stored
+        return OrderWorkflowManager.restore(
+            db=self.db,
+            user_id=user_id or draft.user_id,
+            conversation_id=conversation_id,
+            state=state,
+            draft=draft
+        )
+    
     def _get_or_create_workflow(self, user_id: int, conversation_id: int) -> OrderWorkflowManager:
         """Get existing or create new order workflow for conversation"""
-        if conversation_id not in self._order_workflows:
-            self._order_workflows[conversation_id] = OrderWorkflowManager(
+        workflow = self._load_workflow(user_id, conversation_id)
+        if workflow is None:
+            workflow = OrderWorkflowManager(
                 db=self.db,
                 user_id=user_id,
                 conversation_id=conversation_id
             )
-        return self._order_workflows[conversation_id]
+        return workflow
+    
+    def _save_workflow(self, workflow: OrderWorkflowManager):
+        """Persist workflow state (terminal states are evicted)"""
+        get_workflow_store().save(workflow.conversation_id, workflow.state, workflow.draft)
+    
+    def _link_order_product(self, query: str) -> Optional[str]:
+        """Product id when the query names exactly one catalog product"""
+        if not query:
+            return None
+        if CustomerServiceAgent._order_catalog is None:
+            CustomerServiceAgent._order_catalog = db_catalog_gazetteer()
+        with span("entity_linking"):
+            product_ids = CustomerServiceAgent._order_catalog.get().resolve(query)
+        return product_ids[0] if len(product_ids) == 1 else None
     
     def _handle_order_intent(
         self, 
@@ -358,8 +422,8 @@ class CustomerServiceAgent(BaseAgent):
         conversation_id = context.get("conversation_id", 0)
         workflow = self._get_or_create_workflow(user_id, conversation_id)
         
-        # Check if product_id is provided
-        product_id = context.get("product_id")
+        # Check if product_id is provided, otherwise link a product named in the query
+        product_id = context.get("product_id") or self._link_order_product(query)
         
         if workflow.state == OrderState.IDLE:
             result = workflow.start_order(product_id)
@@ -370,7 +434,7 @@ class CustomerServiceAgent(BaseAgent):
             # Show current cart status
             result = workflow._handle_collecting_products()
         
-        return self._workflow_to_response(result, "order")
+        return self._workflow_to_response(result, "order", workflow)
     
     def _handle_payment_intent(
         self, 
@@ -386,7 +450,7 @@ class CustomerServiceAgent(BaseAgent):
             )
         
         conversation_id = context.get("conversation_id", 0)
-        workflow = self._order_workflows.get(conversation_id)
+        workflow = self._load_workflow(user_id, conversation_id)
         
         if not workflow or workflow.state == OrderState.IDLE:
             return AgentResponse(
@@ -401,7 +465,7 @@ class CustomerServiceAgent(BaseAgent):
         payment_method = context.get("payment_method", "BANK_TRANSFER")
         result = workflow.select_payment_method(payment_method)
         
-        return self._workflow_to_response(result, "payment")
+        return self._workflow_to_response(result, "payment", workflow)
     
     def _handle_track_order(
         self, 
@@ -574,31 +638,31 @@ Trong khi chờ, bạn có thể mô tả vấn đề của mình.""",
         
         elif action_id == "proceed_checkout":
             conversation_id = context.get("conversation_id", 0)
-            workflow = self._order_workflows.get(conversation_id)
+            workflow = self._load_workflow(user_id, conversation_id)
             if workflow:
                 result = workflow.proceed_to_checkout()
-                return self._workflow_to_response(result, "checkout")
+                return self._workflow_to_response(result, "checkout", workflow)
         
         elif action_id == "confirm_order":
             conversation_id = context.get("conversation_id", 0)
-            workflow = self._order_workflows.get(conversation_id)
+            workflow = self._load_workflow(user_id, conversation_id)
             if workflow:
                 result = workflow.confirm_order()
-                return self._workflow_to_response(result, "confirm_order")
+                return self._workflow_to_response(result, "confirm_order", workflow)
         
         elif action_id == "confirm_payment":
             conversation_id = context.get("conversation_id", 0)
-            workflow = self._order_workflows.get(conversation_id)
+            workflow = self._load_workflow(user_id, conversation_id)
             if workflow:
                 result = workflow.confirm_payment()
-                return self._workflow_to_response(result, "payment")
+                return self._workflow_to_response(result, "payment", workflow)
         
         elif action_id == "cancel_order":
             conversation_id = context.get("conversation_id", 0)
-            workflow = self._order_workflows.get(conversation_id)
+            workflow = self._load_workflow(user_id, conversation_id)
             if workflow:
                 result = workflow.cancel_order()
-                return self._workflow_to_response(result, "cancel")
+                return self._workflow_to_response(result, "cancel", workflow)
         
         elif action_id in ["pay_bank_transfer", "pay_momo", "pay_cod"]:
             method_map = {
@@ -674,8 +738,15 @@ Bạn có thể theo dõi trạng thái tại mục "Hỗ trợ" trong tài kho
                 tool_used="create_ticket"
             )
     
-    def _workflow_to_response(self, result, tool_used: str) -> AgentResponse:
-        """Convert workflow result to AgentResponse"""
+    def _workflow_to_response(
+        self,
+        result,
+        tool_used: str,
+        workflow: Optional[OrderWorkflowManager] = None
+    ) -> AgentResponse:
+        """Convert workflow result to AgentResponse (and persist workflow state)"""
+        if workflow is not None:
+            self._save_workflow(workflow)
         return AgentResponse(
             success=True,
             message=result.message,
@@ -0,0 +1,193 @@
+"""
+Intent Classifier - Nearest-centroid intent classification trên embedding
+
+Bổ sung cho keyword matcher: khi câu hỏi không chứa keyword rõ ràng
+(cách diễn đạt ghép, nói tắt...), so query embedding với centroid của
+từng intent (1 phép nhân ma trận NumPy). Dùng lại vector mà RAG đã embed
+nên không tốn thêm lần gọi model.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import threading
+
+import numpy as np
+
+
+# Labelled examples per intent (cùng key với CustomerServiceAgent.intent_keywords)
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "rag_query": [
+        "chính sách đổi trả như thế nào",
+        "bảo hành bao lâu vậy shop",
+        "phí vận chuyển về Hà Nội bao nhiêu",
+        "shop có giao hàng cuối tuần không",
+        "mình muốn biết điều kiện hoàn tiền",
+        "cửa hàng mở cửa mấy giờ",
+    ],
+    "product_recommend": [
+        "tư vấn giúp mình laptop cho sinh viên",
+        "điện thoại nào chụp ảnh đẹp tầm 10 triệu",
+        "mình cần máy để chơi game thì lấy con nào",
+        "nên lấy tai nghe loại nào để tập gym",
+        "cho mình vài mẫu phù hợp làm quà tặng",
+        "ngân sách 15 triệu thì lấy gì ổn",
+    ],
+    "product_search": [
+        "shop còn iphone 15 pro max không",
+        "có bán sạc dự phòng anker không",
+        "giá macbook air m2 hiện tại",
+        "cho xem các mẫu chuột không dây",
+        "còn hàng màu xanh không shop",
+        "laptop dell xps bao nhiêu tiền",
+    ],
+    "product_compare": [
+        "iphone 15 với samsung s24 cái nào ngon hơn",
+        "macbook air và dell xps khác nhau chỗ nào",
+        "giữa hai con này lấy con nào",
+        "so với bản thường thì bản pro có gì hơn",
+        "airpods pro 2 đối đầu sony wf-1000xm5",
+        "hai mẫu này chênh nhau những gì",
+    ],
+    "summarize": [
+        "tóm lại nãy giờ mình đã hỏi những gì",
+        "tổng hợp lại cuộc trò chuyện giúp mình",
+        "nhắc lại các ý chính vừa nói",
+        "recap lại giúp mình với",
+    ],
+    "order": [
+        "lấy cho mình một cái",
+        "chốt đơn cái này nhé",
+        "mình lấy con màu đen",
+        "cho vào giỏ giúp mình",
+        "mình muốn mua cái này",
+        "ship cho mình 2 cái",
+    ],
+    "payment": [
+        "mình chuyển khoản qua đâu",
+        "quét mã qr để trả được không",
+        "có trả góp không shop",
+        "thanh toán khi nhận hàng được không",
+        "gửi mình số tài khoản",
+    ],
+    "track_order": [
+        "đơn của mình giao tới đâu rồi",
+        "bao giờ hàng tới",
+        "kiện hàng đang ở đâu",
+        "mình đặt hôm qua sao chưa thấy giao",
+        "xem giúp mình tình trạng đơn",
+    ],
+    "complaint": [
+        "hàng nhận được bị trầy xước",
+        "máy mới mua đã không lên nguồn",
+        "giao sai màu cho mình rồi",
+        "dịch vụ tệ quá",
+        "sản phẩm bị lỗi mình muốn đổi",
+        "đóng gói cẩu thả làm vỡ hàng",
+    ],
+    "support": [
+        "cho mình nói chuyện với người thật",
+        "mình cần nhân viên gọi lại",
+        "số hotline của shop là gì",
+        "chuyển mình sang bộ phận chăm sóc khách hàng",
+        "có ai trực không",
+    ],
+}
+
+
+class IntentClassifier:
+    """
+    Nearest-centroid classifier trên không gian embedding của RAG retriever.
+
+    Usage:
+        classifier = IntentClassifier.shared(embed_fn)
+        intent, score = classifier.predict(query_embedding)
+
+    Centroid được tính một lần (một batch embed cho toàn bộ ví dụ) và dùng chung
+    cho mọi agent trong process.
+    """
+
+    _shared: Optional["IntentClassifier"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        centroids: Dict[str, Sequence[float]],
+        min_score: float = 0.45,
+        min_margin: float = 0.03
+    ):
+        self.labels: List[str] = list(centroids.keys())
+        matrix = np.asarray([centroids[label] for label in self.labels], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._matrix = matrix / norms
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+    @classmethod
+    def fit(
+        cls,
+        embed_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        examples: Optional[Dict[str, List[str]]] = None,
+        **kwargs
+    ) -> "IntentClassifier":
+        """
+        Tính centroid cho từng intent từ ví dụ gán nhãn
+
+        Args:
+            embed_fn: Hàm embed batch (vd. SentenceTransformerEmbeddingFunction)
+            examples: Mapping intent -> câu ví dụ (mặc định INTENT_EXAMPLES)
+        """
+        examples = examples or INTENT_EXAMPLES
+        texts, owners = [], []
+        for label, sentences in examples.items():
+            for sentence in sentences:
+                texts.append(sentence)
+                owners.append(label)
+
+        vectors = np.asarray(embed_fn(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        owners_arr = np.asarray(owners)
+        centroids = {
+            label: vectors[owners_arr == label].mean(axis=0)
+            for label in examples
+        }
+        return cls(centroids, **kwargs)
+
+    @classmethod
+    def shared(cls, embed_fn: Callable) -> Optional["IntentClassifier"]:
+        """Process-wide instance; None nếu không embed được ví dụ"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    try:
+                        cls._shared = cls.fit(embed_fn)
+                    except Exception as e:
+                        print(f"[IntentClassifier] Failed to build centroids: {e}")
+                        return None
+        return cls._shared
+
+    def scores(self, query_embedding: Sequence[float]) -> Dict[str, float]:
+        """Cosine similarity giữa query và từng centroid"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != self._matrix.shape[1]:
+            return {}
+        sims = self._matrix @ (query / norm)
+        return {label: float(sim) for label, sim in zip(self.labels, sims)}
+
+    def predict(self, query_embedding: Sequence[float]) -> Tuple[Optional[str], float]:
+        """
+        Returns:
+            (intent, score) — intent là None khi không đủ tự tin
+            (score < min_score hoặc cách biệt với hạng 2 < min_margin)
+        """
+        scores = self.scores(query_embedding)
+        if not scores:
+            return None, 0.0
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_label, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+
+        if best_score < self.min_score or best_score - runner_up < self.min_margin:
+            return None, best_score
+        return best_label, best_score
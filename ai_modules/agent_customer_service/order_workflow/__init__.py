@@ -9,6 +9,12 @@ Xử lý quy trình đặt hàng trong chat:
 from .workflow_manager import OrderWorkflowManager, OrderState, OrderDraft, ChatAction, WorkflowResponse
 from .payment_service import PaymentService
 from .qr_generator import QRGenerator
+from .state_store import (
+    WorkflowStateStore,
+    InMemoryWorkflowStore,
+    SQLWorkflowStore,
+    get_workflow_store
+)
 
 __all__ = [
     "OrderWorkflowManager",
@@ -17,5 +23,9 @@ __all__ = [
     "ChatAction",
     "WorkflowResponse",
     "PaymentService",
-    "QRGenerator"
+    "QRGenerator",
+    "WorkflowStateStore",
+    "InMemoryWorkflowStore",
+    "SQLWorkflowStore",
+    "get_workflow_store"
 ]
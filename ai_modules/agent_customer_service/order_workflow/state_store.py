@@ -0,0 +1,242 @@
+"""
+Workflow State Store - Lưu state của order workflow theo conversation
+
+Thay cho dict class-level trong CustomerServiceAgent (tăng mãi, giữ Session
+chết, không chia sẻ giữa các uvicorn worker). Chỉ lưu dữ liệu thuần
+(state + OrderDraft) dạng JSON gọn; Session được gắn lại mỗi request.
+
+Backends:
+- InMemoryWorkflowStore: LRU + TTL trong process (dev / single worker)
+- SQLWorkflowStore: SQLite file hoặc MySQL (crm_order_db) dùng chung mọi worker
+
+TTL: theo draft.expires_at nếu có (vd. hạn thanh toán 15 phút),
+ngược lại updated_at + default_ttl.
+"""
+from typing import Any, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+
+from .workflow_manager import OrderDraft, OrderItem, ShippingInfo, OrderState
+
+DEFAULT_WORKFLOW_TTL_MINUTES = 30
+
+# Trạng thái kết thúc → xóa khỏi store thay vì lưu
+TERMINAL_STATES = {OrderState.ORDER_CREATED, OrderState.CANCELLED}
+
+
+# ─── Serialization ───────────────────────────────────────────────
+
+def _prune(value: Any) -> Any:
+    """Drop None / empty values and convert datetimes → compact JSON"""
+    if isinstance(value, dict):
+        return {k: _prune(v) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [_prune(v) for v in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _parse_dt(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def serialize_workflow(state: OrderState, draft: OrderDraft) -> str:
+    """Encode (state, draft) thành JSON gọn (không khoảng trắng, bỏ field rỗng)"""
+    payload = {"s": state.value, "d": _prune(asdict(draft))}
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def deserialize_workflow(raw: str) -> Tuple[OrderState, OrderDraft]:
+    """Decode JSON từ serialize_workflow"""
+    payload = json.loads(raw)
+    data = dict(payload.get("d", {}))
+
+    data["items"] = [OrderItem(**item) for item in data.get("items", [])]
+    data["shipping"] = ShippingInfo(**data.get("shipping", {}))
+    for key in ("created_at", "expires_at", "payment_confirmed_at"):
+        if key in data:
+            data[key] = _parse_dt(data[key])
+
+    return OrderState(payload.get("s", OrderState.IDLE.value)), OrderDraft(**data)
+
+
+def _expiry_for(draft: OrderDraft, ttl: timedelta) -> datetime:
+    """TTL aligned with draft.expires_at when the workflow set one"""
+    return draft.expires_at or (datetime.now() + ttl)
+
+
+# ─── Backends ────────────────────────────────────────────────────
+
+class WorkflowStateStore:
+    """Interface chung cho các backend lưu workflow state"""
+
+    def __init__(self, ttl_minutes: int = DEFAULT_WORKFLOW_TTL_MINUTES):
+        self.ttl = timedelta(minutes=ttl_minutes)
+
+    def get(self, conversation_id: Any) -> Optional[Tuple[OrderState, OrderDraft]]:
+        raise NotImplementedError
+
+    def put(self, conversation_id: Any, state: OrderState, draft: OrderDraft):
+        raise NotImplementedError
+
+    def delete(self, conversation_id: Any):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Xóa các entry đã hết hạn, trả về số entry bị xóa"""
+        raise NotImplementedError
+
+    def save(self, conversation_id: Any, state: OrderState, draft: OrderDraft):
+        """put(), hoặc delete() khi workflow đã kết thúc"""
+        if state in TERMINAL_STATES:
+            self.delete(conversation_id)
+        else:
+            self.put(conversation_id, state, draft)
+
+
+class InMemoryWorkflowStore(WorkflowStateStore):
+    """LRU + TTL trong process. Giới hạn max_entries để không tăng vô hạn."""
+
+    def __init__(self, max_entries: int = 10000, ttl_minutes: int = DEFAULT_WORKFLOW_TTL_MINUTES):
+        super().__init__(ttl_minutes)
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[datetime, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, conversation_id: Any) -> Optional[Tuple[OrderState, OrderDraft]]:
+        key = str(conversation_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, raw = entry
+            if expires_at <= datetime.now():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return deserialize_workflow(raw)
+
+    def put(self, conversation_id: Any, state: OrderState, draft: OrderDraft):
+        key = str(conversation_id)
+        raw = serialize_workflow(state, draft)
+        with self._lock:
+            self._data[key] = (_expiry_for(draft, self.ttl), raw)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, conversation_id: Any):
+        with self._lock:
+            self._data.pop(str(conversation_id), None)
+
+    def purge_expired(self) -> int:
+        now = datetime.now()
+        with self._lock:
+            expired = [k for k, (exp, _) in self._data.items() if exp <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+
+class SQLWorkflowStore(WorkflowStateStore):
+    """
+    Store dùng chung giữa các worker qua SQLAlchemy.
+
+    url:
+        sqlite:///./data/order_workflows.db   (1 máy, nhiều worker)
+        mysql+pymysql://...crm_order_db        (bảng order_workflow_states)
+    """
+
+    def __init__(self, url: str, ttl_minutes: int = DEFAULT_WORKFLOW_TTL_MINUTES):
+        super().__init__(ttl_minutes)
+        from sqlalchemy import (
+            create_engine, MetaData, Table, Column, String, Text, DateTime
+        )
+
+        connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+        self.engine = create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+
+        metadata = MetaData()
+        self.table = Table(
+            "order_workflow_states", metadata,
+            Column("conversation_id", String(64), primary_key=True),
+            Column("state", String(32), nullable=False),
+            Column("payload", Text, nullable=False),
+            Column("expires_at", DateTime, nullable=False, index=True),
+            Column("updated_at", DateTime, nullable=False),
+        )
+        metadata.create_all(self.engine, checkfirst=True)
+
+    def get(self, conversation_id: Any) -> Optional[Tuple[OrderState, OrderDraft]]:
+        from sqlalchemy import select
+        t = self.table
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(t.c.payload, t.c.expires_at).where(t.c.conversation_id == str(conversation_id))
+            ).first()
+        if row is None or row.expires_at <= datetime.now():
+            return None
+        return deserialize_workflow(row.payload)
+
+    def put(self, conversation_id: Any, state: OrderState, draft: OrderDraft):
+        t = self.table
+        key = str(conversation_id)
+        values = {
+            "state": state.value,
+            "payload": serialize_workflow(state, draft),
+            "expires_at": _expiry_for(draft, self.ttl),
+            "updated_at": datetime.now(),
+        }
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                t.update().where(t.c.conversation_id == key).values(**values)
+            ).rowcount
+            if not updated:
+                conn.execute(t.insert().values(conversation_id=key, **values))
+
+    def delete(self, conversation_id: Any):
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.conversation_id == str(conversation_id)))
+
+    def purge_expired(self) -> int:
+        t = self.table
+        with self.engine.begin() as conn:
+            return conn.execute(t.delete().where(t.c.expires_at <= datetime.now())).rowcount
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_store: Optional[WorkflowStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_workflow_store() -> WorkflowStateStore:
+    """
+    Process-wide store theo env ORDER_WORKFLOW_STORE:
+    - không đặt / "memory": InMemoryWorkflowStore
+    - SQLAlchemy URL (sqlite:///..., mysql+pymysql://...): SQLWorkflowStore
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = os.getenv("ORDER_WORKFLOW_STORE", "memory")
+                ttl = int(os.getenv("ORDER_WORKFLOW_TTL_MINUTES", str(DEFAULT_WORKFLOW_TTL_MINUTES)))
+                if url == "memory":
+                    _store = InMemoryWorkflowStore(ttl_minutes=ttl)
+                else:
+                    try:
+                        _store = SQLWorkflowStore(url, ttl_minutes=ttl)
+                    except Exception as e:
+                        print(f"[WorkflowStateStore] SQL store unavailable ({e}), using memory")
+                        _store = InMemoryWorkflowStore(ttl_minutes=ttl)
+    return _store
@@ -4,7 +4,7 @@ Order Workflow Manager - State Machine cho quy trình đặt hàng
 from enum import Enum
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
 from sqlalchemy.orm import Session
 
@@ -206,6 +206,9 @@ class OrderWorkflowManager:
     → AWAITING_CONFIRM → PAYMENT_PENDING → PAYMENT_CONFIRMED → ORDER_CREATED
     """
     
+    # Thời hạn thanh toán QR (draft hết hạn → state store tự evict)
+    PAYMENT_TIMEOUT_MINUTES = 15
+    
     # Shipping fee tính theo vùng
     SHIPPING_FEES = {
         "Hà Nội": 15000,
@@ -223,6 +226,21 @@ class OrderWorkflowManager:
             conversation_id=conversation_id
         )
     
+    @classmethod
+    def restore(
+        cls,
+        db: Session,
+        user_id: int,
+        conversation_id: int,
+        state: OrderState,
+        draft: OrderDraft
+    ) -> "OrderWorkflowManager":
+        """Dựng lại workflow từ state store, gắn Session của request hiện tại"""
+        manager = cls(db=db, user_id=user_id, conversation_id=conversation_id)
+        manager.state = state
+        manager.draft = draft
+        return manager
+    
     def start_order(self, product_id: Optional[int] = None) -> WorkflowResponse:
         """Bắt đầu quy trình đặt hàng"""
         self.state = OrderState.COLLECTING_PRODUCTS
@@ -432,6 +450,7 @@ class OrderWorkflowManager:
         
         # Bank transfer / MoMo - generate QR
         payment_info = self._generate_payment_info(method)
+        self.draft.expires_at = datetime.now() + timedelta(minutes=self.PAYMENT_TIMEOUT_MINUTES)
         
         return WorkflowResponse(
             state=self.state,
@@ -459,6 +478,7 @@ class OrderWorkflowManager:
         try:
             from backend.models.order import Order, OrderItem as OrderItemModel, OrderStatus
             from backend.models.product import Product
+            from backend.services.crm_context import invalidate_customer_context
             
             # Generate order number
             order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
@@ -501,6 +521,7 @@ class OrderWorkflowManager:
                     product.stock_quantity -= item.quantity
             
             self.db.commit()
+            invalidate_customer_context(self.user_id)
             
             self.state = OrderState.ORDER_CREATED
             
@@ -636,7 +657,7 @@ class OrderWorkflowManager:
             "amount": self.draft.total_amount,
             "qr_url": qr_url,
             "bank_info": bank_info if method == "BANK_TRANSFER" else None,
-            "expires_in_minutes": 15
+            "expires_in_minutes": self.PAYMENT_TIMEOUT_MINUTES
         }
     
     def get_suggested_actions(self, context: str = "general") -> List[ChatAction]:
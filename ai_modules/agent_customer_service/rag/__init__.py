@@ -5,10 +5,15 @@ Tư vấn theo Knowledge Base, chính sách, FAQ
 from .service import RAGService
 from .retriever import PolicyRetriever, ProductRetriever
 from .indexer import ChromaIndexer
+from .faq_cache import FAQCache, FAQMiner
+from .gazetteer import ProductGazetteer
 
 __all__ = [
     "RAGService",
     "PolicyRetriever",
     "ProductRetriever", 
-    "ChromaIndexer"
+    "ChromaIndexer",
+    "FAQCache",
+    "FAQMiner",
+    "ProductGazetteer"
 ]
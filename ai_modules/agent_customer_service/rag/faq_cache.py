@@ -0,0 +1,267 @@
+"""
+FAQ Cache - Câu trả lời dựng sẵn cho các câu hỏi thường gặp
+
+Offline (batch job):
+1. Embed các câu hỏi thật của khách hàng (ConversationMessage role="user")
+2. Gom cụm (leader clustering theo cosine similarity)
+3. Chạy RAGService.query một lần cho câu hỏi đại diện của mỗi cụm
+4. Lưu centroid + answer + sources ra file JSON
+
+Online (chat time):
+- So khớp query embedding với các centroid (1 phép nhân ma trận)
+- Nếu similarity >= threshold → trả answer dựng sẵn, không gọi LLM
+"""
+from typing import Dict, Any, List, Optional, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+import json
+
+import numpy as np
+
+# Default path for the precomputed FAQ answers
+DEFAULT_FAQ_CACHE_PATH = str(Path(__file__).parent / "data" / "faq_cache.json")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so dot product == cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+@dataclass
+class FAQEntry:
+    """Một cụm câu hỏi cùng intent và câu trả lời dựng sẵn"""
+    question: str                      # Câu hỏi đại diện (gần centroid nhất)
+    answer: str
+    centroid: List[float]
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    confidence: float = 0.0
+    cluster_size: int = 1
+    examples: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "question": self.question,
+            "answer": self.answer,
+            "centroid": [round(float(x), 6) for x in self.centroid],
+            "sources": self.sources,
+            "confidence": self.confidence,
+            "cluster_size": self.cluster_size,
+            "examples": self.examples[:5]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FAQEntry":
+        return cls(
+            question=data.get("question", ""),
+            answer=data.get("answer", ""),
+            centroid=list(data.get("centroid", [])),
+            sources=data.get("sources", []),
+            confidence=float(data.get("confidence", 0.0)),
+            cluster_size=int(data.get("cluster_size", 1)),
+            examples=data.get("examples", [])
+        )
+
+
+class FAQCache:
+    """
+    Nearest-centroid lookup cho các câu trả lời FAQ dựng sẵn.
+
+    Usage:
+        cache = FAQCache.load()
+        hit = cache.match(query_embedding, threshold=0.92)
+        if hit:
+            return hit["answer"]
+    """
+
+    def __init__(self, entries: Optional[List[FAQEntry]] = None, built_at: Optional[str] = None):
+        self.entries: List[FAQEntry] = entries or []
+        self.built_at = built_at
+        self._matrix: Optional[np.ndarray] = None
+        self._rebuild_matrix()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _rebuild_matrix(self):
+        """Stack centroids into one normalized matrix for a single dot product"""
+        if not self.entries:
+            self._matrix = None
+            return
+        matrix = np.asarray([e.centroid for e in self.entries], dtype=np.float32)
+        self._matrix = _normalize_rows(matrix)
+
+    def match(
+        self,
+        query_embedding: Sequence[float],
+        threshold: float = 0.92
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Tìm FAQ gần nhất với query.
+
+        Args:
+            query_embedding: Vector của câu hỏi (cùng model với lúc build)
+            threshold: Cosine similarity tối thiểu
+
+        Returns:
+            Dict với answer, sources, similarity... hoặc None nếu không khớp
+        """
+        if self._matrix is None or query_embedding is None:
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != self._matrix.shape[1]:
+            return None
+
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+
+        similarities = self._matrix @ (query / norm)
+        best = int(np.argmax(similarities))
+        best_sim = float(similarities[best])
+
+        if best_sim < threshold:
+            return None
+
+        entry = self.entries[best]
+        return {
+            "question": entry.question,
+            "answer": entry.answer,
+            "sources": entry.sources,
+            "confidence": entry.confidence,
+            "similarity": round(best_sim, 4)
+        }
+
+    # ─── Persistence ─────────────────────────────────────────────
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Ghi cache ra file JSON"""
+        path = path or DEFAULT_FAQ_CACHE_PATH
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "built_at": self.built_at or datetime.utcnow().isoformat(),
+            "entries": [e.to_dict() for e in self.entries]
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "FAQCache":
+        """Đọc cache từ file JSON (trả về cache rỗng nếu chưa build)"""
+        path = path or DEFAULT_FAQ_CACHE_PATH
+        if not Path(path).exists():
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            entries = [FAQEntry.from_dict(e) for e in payload.get("entries", [])]
+            return cls(entries=entries, built_at=payload.get("built_at"))
+        except (OSError, json.JSONDecodeError, TypeError, ValueError) as e:
+            print(f"[FAQCache] Failed to load {path}: {e}")
+            return cls()
+
+
+class FAQMiner:
+    """
+    Gom cụm câu hỏi lịch sử và dựng sẵn câu trả lời qua RAGService.
+
+    Clustering: leader clustering một lượt (O(N·K)) — mỗi câu hỏi gán vào
+    centroid gần nhất nếu similarity >= cluster_threshold, ngược lại mở cụm mới.
+    Centroid được cập nhật bằng trung bình cộng dồn.
+    """
+
+    def __init__(
+        self,
+        rag_service,
+        cluster_threshold: float = 0.85,
+        min_cluster_size: int = 3,
+        max_clusters: int = 500
+    ):
+        self.rag_service = rag_service
+        self.cluster_threshold = cluster_threshold
+        self.min_cluster_size = min_cluster_size
+        self.max_clusters = max_clusters
+
+    def cluster(self, embeddings: np.ndarray) -> List[List[int]]:
+        """
+        Gom cụm các vector đã chuẩn hóa.
+
+        Returns:
+            List các cụm (mỗi cụm là list index), sắp xếp theo kích thước giảm dần
+        """
+        if len(embeddings) == 0:
+            return []
+
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        dim = vectors.shape[1]
+
+        sums = np.zeros((0, dim), dtype=np.float32)
+        centroids = np.zeros((0, dim), dtype=np.float32)
+        members: List[List[int]] = []
+
+        for idx, vec in enumerate(vectors):
+            if len(members):
+                sims = centroids @ vec
+                best = int(np.argmax(sims))
+                if sims[best] >= self.cluster_threshold:
+                    members[best].append(idx)
+                    sums[best] += vec
+                    centroids[best] = sums[best] / (np.linalg.norm(sums[best]) or 1.0)
+                    continue
+
+            members.append([idx])
+            sums = np.vstack([sums, vec])
+            centroids = np.vstack([centroids, vec])
+
+        members.sort(key=len, reverse=True)
+        return members
+
+    def build(
+        self,
+        questions: List[str],
+        embeddings: np.ndarray
+    ) -> FAQCache:
+        """
+        Build FAQCache từ câu hỏi lịch sử và embeddings tương ứng.
+
+        Args:
+            questions: Câu hỏi (đã lọc rỗng)
+            embeddings: Ma trận (len(questions), dim)
+
+        Returns:
+            FAQCache chứa các cụm đủ lớn
+        """
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        entries: List[FAQEntry] = []
+
+        for cluster in self.cluster(vectors):
+            if len(cluster) < self.min_cluster_size or len(entries) >= self.max_clusters:
+                break
+
+            centroid = vectors[cluster].mean(axis=0)
+            centroid /= (np.linalg.norm(centroid) or 1.0)
+
+            # Representative = member closest to the centroid
+            sims = vectors[cluster] @ centroid
+            representative = questions[cluster[int(np.argmax(sims))]]
+
+            result = self.rag_service.query(question=representative, use_faq_cache=False)
+            if not result.get("sources"):
+                # Nothing retrieved → not worth caching a "no info" answer
+                continue
+
+            entries.append(FAQEntry(
+                question=representative,
+                answer=result["answer"],
+                centroid=centroid.tolist(),
+                sources=result.get("sources", []),
+                confidence=result.get("confidence", 0.0),
+                cluster_size=len(cluster),
+                examples=[questions[i] for i in cluster[:5]]
+            ))
+
+        return FAQCache(entries=entries, built_at=datetime.utcnow().isoformat())
@@ -0,0 +1,232 @@
+"""
+Product Gazetteer - Entity linking tên sản phẩm → product id
+
+Dựng từ catalog (tên, thương hiệu, SKU + alias chuẩn hóa) thành một
+Aho–Corasick automaton. Một lượt quét câu hỏi trả về luôn product id được
+nhắc tới, để so sánh / đặt hàng lấy sản phẩm theo id thay vì vector search.
+
+- normalize(): lowercase, bỏ dấu tiếng Việt, gộp ký tự đặc biệt thành khoảng trắng
+- ProductGazetteer: automaton bất biến, dựng lại khi catalog đổi
+- GazetteerCache: giữ gazetteer hiện tại, kiểm tra signature catalog định kỳ
+  và dựng lại khi signature thay đổi
+"""
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+
+from ai_modules.core.keyword_matcher import KeywordMatcher
+
+BRAND_PREFIX = "brand:"
+MIN_ALIAS_LENGTH = 3
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """'iPhone 15 Pro-Max (256GB)' → 'iphone 15 pro max 256gb'; 'Điện thoại' → 'dien thoai'"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", str(text).lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def product_aliases(name: str, brand: Optional[str] = None) -> List[str]:
+    """
+    Alias suy ra từ tên sản phẩm:
+    - tên chuẩn hóa ("samsung galaxy s24")
+    - bỏ tiền tố thương hiệu ("galaxy s24")
+    - viết liền ("iphone15" cho "iphone 15")
+    """
+    base = normalize(name)
+    if not base:
+        return []
+    aliases = [base]
+    brand_norm = normalize(brand)
+    if brand_norm and base.startswith(brand_norm + " "):
+        aliases.append(base[len(brand_norm) + 1:])
+    aliases.extend(a.replace(" ", "") for a in list(aliases) if " " in a)
+    return [a for a in dict.fromkeys(aliases) if len(a) >= MIN_ALIAS_LENGTH]
+
+
+class ProductGazetteer:
+    """
+    Catalog gazetteer.
+
+    Usage:
+        gazetteer = ProductGazetteer([
+            {"id": "p1", "name": "iPhone 15", "brand": "Apple", "sku": "IP15-128"},
+            {"id": "p2", "name": "Samsung Galaxy S24", "brand": "Samsung"},
+        ])
+        gazetteer.resolve("so sánh iphone 15 với galaxy s24")   # ["p1", "p2"]
+        gazetteer.brands("điện thoại samsung nào tốt")          # ["samsung"]
+
+    Alias trùng giữa nhiều sản phẩm: tên đầy đủ và SKU thắng alias suy ra;
+    cùng loại thì sản phẩm đứng trước trong catalog thắng.
+    """
+
+    def __init__(self, products: Iterable[Dict[str, Any]]):
+        owner: Dict[str, str] = {}
+        brands: Dict[str, str] = {}
+        derived: List[tuple] = []
+
+        for p in products:
+            product_id = p.get("id")
+            name = p.get("name")
+            if not product_id or not name:
+                continue
+            product_id = str(product_id)
+            aliases = product_aliases(name, p.get("brand"))
+            exact = [aliases[0]] + [a for a in [normalize(p.get("sku"))] if len(a) >= MIN_ALIAS_LENGTH]
+            for alias in exact:
+                owner.setdefault(alias, product_id)
+            derived.extend((alias, product_id) for alias in aliases[1:])
+            brand = normalize(p.get("brand"))
+            if len(brand) >= 2:
+                brands.setdefault(brand, BRAND_PREFIX + brand)
+
+        for alias, product_id in derived:
+            owner.setdefault(alias, product_id)
+
+        keywords: Dict[str, List[str]] = {}
+        for alias, product_id in owner.items():
+            keywords.setdefault(product_id, []).append(alias)
+        self.product_count = len(keywords)
+        for brand, label in brands.items():
+            # Brand alone is not a product mention; product aliases take priority
+            if brand not in owner:
+                keywords.setdefault(label, []).append(brand)
+
+        self._matcher = KeywordMatcher(keywords, case_sensitive=True, whole_word=True)
+
+    def __len__(self) -> int:
+        return self.product_count
+
+    def _mentions(self, query: str):
+        return self._matcher.select(self._matcher.find_all(normalize(query)))
+
+    def resolve(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """Product id được nhắc tới, theo thứ tự xuất hiện (không trùng)"""
+        ids = [m.label for m in self._mentions(query) if not m.label.startswith(BRAND_PREFIX)]
+        ids = list(dict.fromkeys(ids))
+        return ids[:limit] if limit else ids
+
+    def brands(self, query: str) -> List[str]:
+        """Thương hiệu được nhắc tới riêng lẻ (không kèm model cụ thể)"""
+        labels = [m.label for m in self._mentions(query) if m.label.startswith(BRAND_PREFIX)]
+        return [label[len(BRAND_PREFIX):] for label in dict.fromkeys(labels)]
+
+    @classmethod
+    def from_metadatas(cls, metadatas: Iterable[Dict[str, Any]]) -> "ProductGazetteer":
+        """Dựng từ metadata product trong ChromaDB (product_id, title, brand)"""
+        return cls(products_from_metadatas(metadatas))
+
+
+def products_from_metadatas(metadatas: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Metadata product của ChromaIndexer → product dicts cho ProductGazetteer"""
+    return [
+        {
+            "id": m.get("product_id"),
+            "name": m.get("title") or m.get("name"),
+            "brand": m.get("brand"),
+            "sku": m.get("sku")
+        }
+        for m in metadatas if m
+    ]
+
+
+def metadata_signature(ids: Iterable[str], metadatas: Iterable[Dict[str, Any]]) -> str:
+    """Hash nội dung (id + metadata) của catalog - đổi khi sửa tên/brand/SKU, không chỉ khi đổi số lượng"""
+    digest = hashlib.blake2b(digest_size=16)
+    for doc_id, metadata in sorted(zip(ids, metadatas), key=lambda item: str(item[0])):
+        digest.update(json.dumps([doc_id, metadata], sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class GazetteerCache:
+    """
+    Giữ gazetteer của một catalog; dựng lại khi signature catalog đổi.
+
+    Args:
+        loader: () -> iterable product dicts (id, name, brand, sku)
+        signature: () -> giá trị rẻ phản ánh thay đổi catalog (count, max(updated_at)...)
+        check_interval: Số giây tối thiểu giữa hai lần kiểm tra signature
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Iterable[Dict[str, Any]]],
+        signature: Callable[[], Hashable],
+        check_interval: float = 30.0
+    ):
+        self._loader = loader
+        self._signature = signature
+        self.check_interval = check_interval
+        self._gazetteer: Optional[ProductGazetteer] = None
+        self._built_for: Optional[Hashable] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def get(self) -> ProductGazetteer:
+        now = time.monotonic()
+        if self._gazetteer is not None and now - self._checked_at < self.check_interval:
+            return self._gazetteer
+        with self._lock:
+            if self._gazetteer is not None and now - self._checked_at < self.check_interval:
+                return self._gazetteer
+            try:
+                signature = self._signature()
+                if self._gazetteer is None or signature != self._built_for:
+                    self._gazetteer = ProductGazetteer(self._loader())
+                    self._built_for = signature
+                    print(f"[ProductGazetteer] Built {len(self._gazetteer)} products")
+            except Exception as e:
+                print(f"[ProductGazetteer] Rebuild failed: {e}")
+                if self._gazetteer is None:
+                    self._gazetteer = ProductGazetteer([])
+            self._checked_at = now
+            return self._gazetteer
+
+    def invalidate(self):
+        """Buộc kiểm tra lại catalog ở lần get() kế tiếp"""
+        with self._lock:
+            self._checked_at = float("-inf")
+            self._built_for = None
+
+
+def db_catalog_gazetteer(session_factory: Optional[Callable] = None, check_interval: float = 30.0) -> GazetteerCache:
+    """
+    Gazetteer trên bảng products (Product DB) - id dùng trực tiếp cho order workflow.
+    Signature = (count, max(created_at), max(updated_at)) nên mọi worker đều thấy thay đổi.
+    """
+    def _session():
+        if session_factory is not None:
+            return session_factory()
+        from backend.database.session import ProductSession
+        return ProductSession()
+
+    def loader():
+        from backend.models.product import Product
+        db = _session()
+        try:
+            rows = db.query(Product.id, Product.name, Product.sku).filter(Product.is_active == True).all()
+            return [{"id": r.id, "name": r.name, "sku": r.sku} for r in rows]
+        finally:
+            db.close()
+
+    def signature():
+        from sqlalchemy import func
+        from backend.models.product import Product
+        db = _session()
+        try:
+            return tuple(db.query(
+                func.count(Product.id), func.max(Product.created_at), func.max(Product.updated_at)
+            ).one())
+        finally:
+            db.close()
+
+    return GazetteerCache(loader, signature, check_interval=check_interval)
@@ -7,6 +7,8 @@ import chromadb
 from chromadb.utils import embedding_functions
 
 from ai_modules.core.config import ai_config
+from ai_modules.core.timing import span
+from .gazetteer import GazetteerCache, ProductGazetteer, metadata_signature, products_from_metadatas
 
 # Default paths
 DEFAULT_CHROMA_PATH = str(Path(__file__).parent / "chroma")
@@ -48,6 +50,21 @@ class BaseRetriever:
         """Retrieve relevant documents"""
         raise NotImplementedError
     
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a query once so the vector can be shared across retrievers
+        (policy + product) and downstream consumers (FAQ cache).
+        """
+        with span("embedding"):
+            embedding = self.embedding_fn([query])[0]
+        return [float(x) for x in embedding]
+    
+    def _query_args(self, query: str, query_embedding: Optional[List[float]]) -> Dict[str, Any]:
+        """Use a precomputed embedding when available, otherwise let Chroma embed"""
+        if query_embedding is not None:
+            return {"query_embeddings": [query_embedding]}
+        return {"query_texts": [query]}
+    
     def _post_filter(self, docs: List[Dict], max_distance: float) -> List[Dict]:
         """Filter documents by max distance threshold"""
         return [d for d in docs if d["distance"] <= max_distance]
@@ -66,7 +83,8 @@ class PolicyRetriever(BaseRetriever):
         self, 
         query: str, 
         top_k: int = 4,
-        domain: Optional[str] = None
+        domain: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve policy documents
@@ -75,6 +93,7 @@ class PolicyRetriever(BaseRetriever):
             query: Search query
             top_k: Number of results
             domain: Optional filter by policy domain
+            query_embedding: Precomputed query vector (skips re-embedding)
             
         Returns:
             List of policy documents with content, metadata, distance
@@ -85,12 +104,13 @@ class PolicyRetriever(BaseRetriever):
             if domain:
                 where_filter["domain"] = domain
             
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k,
-                where=where_filter,
-                include=["documents", "metadatas", "distances"]
-            )
+            with span("chroma_policy"):
+                results = self.collection.query(
+                    **self._query_args(query, query_embedding),
+                    n_results=top_k,
+                    where=where_filter,
+                    include=["documents", "metadatas", "distances"]
+                )
             
             docs = []
             if results["documents"] and results["documents"][0]:
@@ -117,12 +137,56 @@ class ProductRetriever(BaseRetriever):
     
     def __init__(self, chroma_path: Optional[str] = None, collection_name: str = DEFAULT_COLLECTION_NAME):
         super().__init__(chroma_path, collection_name)
+        
+        # Name/brand/alias → product_id, rebuilt when the indexed catalog changes
+        self._gazetteer = GazetteerCache(
+            loader=self._load_catalog,
+            signature=self._catalog_signature
+        )
+    
+    def gazetteer(self) -> ProductGazetteer:
+        """Catalog gazetteer for entity linking (see gazetteer.py)"""
+        return self._gazetteer.get()
+    
+    def _load_catalog(self) -> List[Dict[str, Any]]:
+        results = self.collection.get(where={"type": "product"}, include=["metadatas"])
+        return products_from_metadatas(results.get("metadatas") or [])
+
+    def _catalog_signature(self) -> str:
+        results = self.collection.get(where={"type": "product"}, include=["metadatas"])
+        return metadata_signature(results.get("ids") or [], results.get("metadatas") or [])
+    
+    def get_by_ids(self, product_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetch product documents by id (no vector search).
+        Result order follows product_ids; unknown ids are skipped.
+        """
+        if not product_ids:
+            return []
+        try:
+            with span("chroma_product"):
+                results = self.collection.get(
+                    ids=[f"product_{pid}" for pid in product_ids],
+                    include=["documents", "metadatas"]
+                )
+            by_id = {}
+            for i, doc_id in enumerate(results.get("ids") or []):
+                by_id[doc_id] = {
+                    "content": results["documents"][i] if results.get("documents") else "",
+                    "metadata": results["metadatas"][i] if results.get("metadatas") else {},
+                    "distance": 0.0
+                }
+            return [by_id[f"product_{pid}"] for pid in product_ids if f"product_{pid}" in by_id]
+        except Exception as e:
+            print(f"[ProductRetriever] Error: {e}")
+            return []
     
     def retrieve(
         self, 
         query: str, 
         top_k: int = 6,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve product documents
@@ -131,6 +195,7 @@ class ProductRetriever(BaseRetriever):
             query: Search query
             top_k: Number of results
             category: Optional filter by product category
+            query_embedding: Precomputed query vector (skips re-embedding)
             
         Returns:
             List of product documents with content, metadata, distance
@@ -139,12 +204,13 @@ class ProductRetriever(BaseRetriever):
             # Build where filter
             where_filter = {"type": "product"}
             
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k,
-                where=where_filter,
-                include=["documents", "metadatas", "distances"]
-            )
+            with span("chroma_product"):
+                results = self.collection.query(
+                    **self._query_args(query, query_embedding),
+                    n_results=top_k,
+                    where=where_filter,
+                    include=["documents", "metadatas", "distances"]
+                )
             
             docs = []
             if results["documents"] and results["documents"][0]:
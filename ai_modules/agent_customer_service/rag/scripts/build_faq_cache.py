@@ -0,0 +1,101 @@
+"""
+Build FAQ Cache from chat history
+Batch job: embed câu hỏi lịch sử của khách hàng, gom cụm, chạy RAG một lần
+cho mỗi cụm và lưu câu trả lời dựng sẵn ra rag/data/faq_cache.json
+
+Usage (from project root):
+    python -m ai_modules.agent_customer_service.rag.scripts.build_faq_cache
+"""
+from pathlib import Path
+import sys
+
+# =====================
+# CONFIG
+# =====================
+BASE_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = BASE_DIR.parent.parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+
+LOOKBACK_DAYS = 180
+MAX_MESSAGES = 50000
+MIN_QUESTION_LENGTH = 8
+CLUSTER_THRESHOLD = 0.85
+MIN_CLUSTER_SIZE = 3
+EMBED_BATCH_SIZE = 256
+
+
+def load_questions(lookback_days: int = LOOKBACK_DAYS, limit: int = MAX_MESSAGES):
+    """Load historical user messages from the knowledge DB"""
+    from datetime import datetime, timedelta
+    from database.session import KnowledgeSession
+    from models.conversation import ConversationMessage
+
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    db = KnowledgeSession()
+    try:
+        rows = db.query(ConversationMessage.content).filter(
+            ConversationMessage.role == "user",
+            ConversationMessage.created_at >= since
+        ).order_by(ConversationMessage.created_at.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+    questions = []
+    for (content,) in rows:
+        text = (content or "").strip()
+        if len(text) >= MIN_QUESTION_LENGTH:
+            questions.append(text)
+    return questions
+
+
+def build_faq_cache(output_path: str = None):
+    """
+    Build FAQ cache
+
+    Args:
+        output_path: Where to write the cache (default rag/data/faq_cache.json)
+    """
+    import numpy as np
+    from ai_modules.agent_customer_service.rag.service import RAGService
+    from ai_modules.agent_customer_service.rag.faq_cache import FAQMiner
+
+    questions = load_questions()
+    print(f"[FAQ] Loaded {len(questions)} user questions")
+    if not questions:
+        print("[FAQ] Nothing to cluster")
+        return {"questions": 0, "entries": 0}
+
+    rag_service = RAGService()
+    embedding_fn = rag_service.policy_retriever.embedding_fn
+
+    # Embed in batches (one model call per batch)
+    vectors = []
+    for start in range(0, len(questions), EMBED_BATCH_SIZE):
+        vectors.extend(embedding_fn(questions[start:start + EMBED_BATCH_SIZE]))
+    embeddings = np.asarray(vectors, dtype=np.float32)
+    print(f"[FAQ] Embedded {len(embeddings)} questions")
+
+    miner = FAQMiner(
+        rag_service,
+        cluster_threshold=CLUSTER_THRESHOLD,
+        min_cluster_size=MIN_CLUSTER_SIZE
+    )
+    cache = miner.build(questions, embeddings)
+    path = cache.save(output_path)
+
+    print("\n[FAQ] === COMPLETED ===")
+    print(f"[FAQ] FAQ entries: {len(cache)}")
+    print(f"[FAQ] Saved to: {path}")
+
+    return {
+        "questions": len(questions),
+        "entries": len(cache),
+        "path": path
+    }
+
+
+if __name__ == "__main__":
+    result = build_faq_cache()
+    print(f"\nResult: {result}")
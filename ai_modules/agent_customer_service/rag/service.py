@@ -8,7 +8,9 @@ import re
 from pathlib import Path
 
 from ai_modules.core.config import ai_config
+from ai_modules.core.timing import span
 from .retriever import PolicyRetriever, ProductRetriever, DEFAULT_CHROMA_PATH
+from .faq_cache import FAQCache
 
 
 class RAGService:
@@ -23,7 +25,7 @@ class RAGService:
     LLM Priority: Gemini > OpenAI > Mock
     """
     
-    def __init__(self, chroma_path: Optional[str] = None):
+    def __init__(self, chroma_path: Optional[str] = None, faq_cache_path: Optional[str] = None):
         # Use default chroma path from retriever module if not specified
         self.chroma_path = chroma_path or DEFAULT_CHROMA_PATH
         
@@ -34,6 +36,11 @@ class RAGService:
         self.policy_retriever = PolicyRetriever(self.chroma_path)
         self.product_retriever = ProductRetriever(self.chroma_path)
         
+        # Precomputed FAQ answers (built offline by scripts/build_faq_cache.py)
+        self.faq_cache = FAQCache.load(faq_cache_path)
+        if len(self.faq_cache):
+            print(f"[RAGService] Loaded {len(self.faq_cache)} FAQ answers")
+        
         # Initialize LLM client (Gemini first)
         self._init_llm_client()
     
@@ -84,7 +91,10 @@ class RAGService:
         question: str,
         category: Optional[str] = None,
         top_k_policy: int = 4,
-        top_k_product: int = 6
+        top_k_product: int = 6,
+        use_faq_cache: bool = True,
+        query_embedding: Optional[List[float]] = None,
+        crm_context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Query RAG pipeline
@@ -94,20 +104,44 @@ class RAGService:
             category: Filter theo category sản phẩm (optional)
             top_k_policy: Số lượng policy docs để retrieve
             top_k_product: Số lượng product docs để retrieve
+            use_faq_cache: Cho phép trả answer dựng sẵn từ FAQ cache
+            query_embedding: Vector của câu hỏi nếu caller đã embed (vd. intent classifier)
+            crm_context: Thông tin khách hàng / đơn / ticket để cá nhân hóa câu trả lời
             
         Returns:
             Dict với answer và sources
         """
+        # Embed once, reuse for FAQ lookup + both retrievers
+        if query_embedding is None:
+            query_embedding = self.policy_retriever.embed_query(question)
+        
+        # FAQ cache chỉ áp dụng khi không filter category và không cá nhân hóa
+        if use_faq_cache and category is None and not crm_context:
+            with span("faq_lookup"):
+                hit = self.faq_cache.match(query_embedding, threshold=ai_config.faq_cache_threshold)
+            if hit:
+                return {
+                    "answer": hit["answer"],
+                    "sources": hit["sources"],
+                    "confidence": hit["confidence"],
+                    "faq_match": {
+                        "question": hit["question"],
+                        "similarity": hit["similarity"]
+                    }
+                }
+        
         # Retrieve relevant documents
         policy_docs = self.policy_retriever.retrieve(
             query=question,
-            top_k=top_k_policy
+            top_k=top_k_policy,
+            query_embedding=query_embedding
         )
         
         product_docs = self.product_retriever.retrieve(
             query=question,
             category=category,
-            top_k=top_k_product
+            top_k=top_k_product,
+            query_embedding=query_embedding
         )
         
         if not policy_docs and not product_docs:
@@ -118,16 +152,17 @@ class RAGService:
             }
         
         # Build context
-        context = self._build_context(policy_docs, product_docs)
+        context = self._build_context(policy_docs, product_docs, crm_context)
         
         # Generate answer with LLM (natural language)
-        if self.demo_mode:
-            answer = self._generate_demo_answer(question, policy_docs, product_docs)
-        elif self.llm_client:
-            answer = self._generate_llm_answer(question, context)
-        else:
-            # No LLM configured - return structured data with friendly message
-            answer = self._generate_fallback_answer(question, policy_docs, product_docs)
+        with span("llm"):
+            if self.demo_mode:
+                answer = self._generate_demo_answer(question, policy_docs, product_docs)
+            elif self.llm_client:
+                answer = self._generate_llm_answer(question, context)
+            else:
+                # No LLM configured - return structured data with friendly message
+                answer = self._generate_fallback_answer(question, policy_docs, product_docs)
         
         # Build sources
         sources = self._build_sources(policy_docs, product_docs)
@@ -143,7 +178,8 @@ class RAGService:
         query: str,
         product_names: List[str],
         category: Optional[str] = None,
-        top_k: int = 6
+        top_k: int = 6,
+        product_ids: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         So sánh nhiều sản phẩm dựa trên query và tên sản phẩm.
@@ -153,12 +189,19 @@ class RAGService:
             product_names: Danh sách tên sản phẩm cần so sánh
             category: Filter theo category (optional)
             top_k: Số sản phẩm tối đa để retrieve mỗi query
+            product_ids: Product id đã link qua gazetteer (lấy trực tiếp, không vector search)
             
         Returns:
             Dict với comparison, products, comparison_table
         """
         all_products = []
         
+        # Sản phẩm đã resolve được id → lấy thẳng theo id
+        for doc in self.product_retriever.get_by_ids(product_ids or []):
+            product_info = self._parse_product_from_doc(doc)
+            if product_info and product_info not in all_products:
+                all_products.append(product_info)
+        
         # Retrieve products cho mỗi tên sản phẩm
         for name in product_names:
             docs = self.product_retriever.retrieve(
@@ -394,11 +437,24 @@ SO SÁNH:
     def _build_context(
         self, 
         policy_docs: List[Dict], 
-        product_docs: List[Dict]
+        product_docs: List[Dict],
+        crm_context: Optional[Dict[str, Any]] = None
     ) -> str:
         """Build context string from retrieved documents"""
         context_blocks = []
         
+        if crm_context:
+            context_blocks.append("### THÔNG TIN KHÁCH HÀNG")
+            customer = crm_context.get("customer") or {}
+            if customer.get("full_name"):
+                context_blocks.append(f"Khách hàng: {customer['full_name']}")
+            for o in crm_context.get("orders", []):
+                context_blocks.append(
+                    f"[ORDER] {o.get('order_number')} - {o.get('status')} - {o.get('total_amount', 0):,.0f} VNĐ"
+                )
+            for t in crm_context.get("tickets", []):
+                context_blocks.append(f"[TICKET] {t.get('ticket_number')} - {t.get('subject')} - {t.get('status')}")
+        
         if product_docs:
             context_blocks.append("### THÔNG TIN SẢN PHẨM")
             for i, d in enumerate(product_docs, 1):
@@ -11,6 +11,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from collections import Counter
 
+from ai_modules.core.request_scope import RequestScoped
+
 
 class ProductRecommender:
     """
@@ -23,6 +25,9 @@ class ProductRecommender:
     4. Personalized: Kết hợp lịch sử user
     """
     
+    # Bound per call when shared by a pooled CustomerServiceAgent
+    db = RequestScoped("db")
+    
     def __init__(self, db: Session):
         self.db = db
     
@@ -11,8 +11,11 @@ from sqlalchemy.orm import Session
 
 from ai_modules.core.base_agent import BaseAgent, AgentType, AgentResponse
 from ai_modules.core.config import ai_config
-from ai_modules.sentiment import SentimentAnalyzer
+from ai_modules.core.keyword_matcher import KeywordMatcher
+from ai_modules.core.request_scope import RequestScoped
+from ai_modules.sentiment import SentimentAnalyzer, SentimentAggregate
 from ai_modules.ticket_deduplication import TicketDeduplicationService
+from backend.services.crm_context import invalidate_customer_context
 
 
 class OperationsAgent(BaseAgent):
@@ -26,7 +29,32 @@ class OperationsAgent(BaseAgent):
     - Phát hiện ticket trùng lặp
     """
     
-    def __init__(self, db: Session, current_user=None, order_db: Optional[Session] = None):
+    # Intent keywords mapping (thứ tự = ưu tiên khi hòa điểm)
+    intent_keywords = {
+        "order_lookup": ["đơn hàng", "order", "tra cứu", "kiểm tra đơn", "ORD-"],
+        "order_cancel": ["hủy đơn", "cancel order", "bỏ đơn"],
+        "order_history": ["lịch sử đơn", "đơn gần đây", "my orders"],
+        "ticket_create": ["hỗ trợ", "khiếu nại", "báo cáo", "có vấn đề", "tạo ticket"],
+        "ticket_status": ["ticket", "TKT-", "trạng thái ticket"],
+        "analyze_sentiment": [
+            "cảm xúc", "sentiment", "phân tích cảm xúc", "tâm trạng",
+            "analyze sentiment", "mood", "cảm nhận"
+        ],
+        "find_duplicates": [
+            "trùng lặp", "duplicate", "trùng", "ticket giống",
+            "ticket tương tự", "similar ticket", "gộp ticket", "merge"
+        ],
+    }
+    
+    # Compiled once at class load (case-insensitive) → single-pass intent scan.
+    # word_prefix: keyword tiếng Anh khớp cả dạng số nhiều/biến tố ("tickets", "duplicates")
+    _intent_matcher = KeywordMatcher(intent_keywords, word_prefix=True)
+    
+    # Request-scoped (agent dùng chung): bind qua run(..., order_db=..., current_user=...)
+    order_db = RequestScoped("order_db", fallback="db")
+    current_user = RequestScoped("current_user")
+    
+    def __init__(self, db: Optional[Session] = None, current_user=None, order_db: Optional[Session] = None):
         """
         Initialize OperationsAgent with multi-DB support.
         
@@ -34,6 +62,9 @@ class OperationsAgent(BaseAgent):
             db: Support DB session (primary - tickets, routing, assignments)
             current_user: Current authenticated user
             order_db: Order DB session for order queries. Falls back to db if not provided.
+        
+        Pooled usage: OperationsAgent() once per worker, then
+        agent.run(query, user_id, context, db=support_db, order_db=order_db, current_user=user)
         """
         super().__init__(db, AgentType.OPERATIONS)
         self.current_user = current_user
@@ -42,23 +73,6 @@ class OperationsAgent(BaseAgent):
         # Initialize sub-services
         self.sentiment_analyzer = SentimentAnalyzer()
         self.dedup_service = TicketDeduplicationService(db)
-        
-        # Intent keywords mapping
-        self.intent_keywords = {
-            "order_lookup": ["đơn hàng", "order", "tra cứu", "kiểm tra đơn", "ORD-"],
-            "order_cancel": ["hủy đơn", "cancel order", "bỏ đơn"],
-            "order_history": ["lịch sử đơn", "đơn gần đây", "my orders"],
-            "ticket_create": ["hỗ trợ", "khiếu nại", "báo cáo", "có vấn đề", "tạo ticket"],
-            "ticket_status": ["ticket", "TKT-", "trạng thái ticket"],
-            "analyze_sentiment": [
-                "cảm xúc", "sentiment", "phân tích cảm xúc", "tâm trạng",
-                "analyze sentiment", "mood", "cảm nhận"
-            ],
-            "find_duplicates": [
-                "trùng lặp", "duplicate", "trùng", "ticket giống",
-                "ticket tương tự", "similar ticket", "gộp ticket", "merge"
-            ],
-        }
     
     def process_query(
         self, 
@@ -126,11 +140,11 @@ class OperationsAgent(BaseAgent):
         ]
     
     def _detect_intent(self, query: str) -> str:
-        """Detect user intent from query"""
-        for intent, keywords in self.intent_keywords.items():
-            if any(kw.lower() in query for kw in keywords):
-                return intent
-        return "unknown"
+        """
+        Detect user intent from query
+        Một lượt quét Aho–Corasick; intent có tổng độ dài keyword khớp lớn nhất thắng
+        """
+        return self._intent_matcher.classify(query, default="unknown")
     
     def _extract_order_number(self, query: str) -> Optional[str]:
         """Extract order number from query"""
@@ -227,6 +241,7 @@ class OperationsAgent(BaseAgent):
         # Cancel order
         order.status = OrderStatus.CANCELLED
         self.order_db.commit()
+        invalidate_customer_context(order.customer_id)
         
         return AgentResponse(
             success=True,
@@ -323,25 +338,36 @@ class OperationsAgent(BaseAgent):
             category=TicketCategory.GENERAL_INQUIRY,
             status=TicketStatus.OPEN,
             priority=initial_priority,
-            channel="CHAT_AI",
-            sentiment_score=sentiment_result.score,
-            sentiment_label=sentiment_result.label.value
+            channel="CHAT_AI"
         )
+        # Query = first customer message → seed the incremental aggregate
+        SentimentAggregate().update(sentiment_result.score).apply_to(new_ticket)
         
         self.db.add(new_ticket)
         self.db.flush()  # Get ID before routing
         
+        # Online duplicate check (same customer's open tickets)
+        duplicate = self.dedup_service.check_new_ticket(new_ticket, query)
+        
         # Auto-route ticket
         routing_info = None
         try:
             from backend.services.ticket_routing import TicketRoutingService
             routing_service = TicketRoutingService(self.db)
-            routing_info = routing_service.route_ticket(new_ticket)
+            routing_info = routing_service.route_ticket(new_ticket, first_message=query)
         except Exception as e:
             # Routing failure should not block ticket creation
             print(f"[OperationsAgent] Auto-routing failed (non-blocking): {e}")
         
+        # SLA deadlines from the final priority and routed queue
+        from backend.services.sla import get_sla_engine
+        sla = get_sla_engine()
+        routed_queue = (routing_info or {}).get("actions_applied", {}).get("queue")
+        sla.apply(new_ticket, queue=routed_queue)
+        
         self.db.commit()
+        sla.sync(new_ticket)
+        invalidate_customer_context(new_ticket.customer_id)
         
         # Build response message
         message = f"✅ Đã tạo ticket hỗ trợ **#{ticket_number}**. Nhân viên sẽ phản hồi trong 24h."
@@ -357,6 +383,9 @@ class OperationsAgent(BaseAgent):
             if route_details:
                 message += f"\n📋 Auto-routed: {', '.join(route_details)}"
         
+        if duplicate:
+            message += f"\n🔁 Có thể trùng với ticket đang mở {duplicate[0]} (độ tương đồng {duplicate[1]:.0%})"
+        
         sentiment_emoji = {"POSITIVE": "😊", "NEUTRAL": "😐", "NEGATIVE": "😟"}
         message += f"\n📊 Sentiment: {sentiment_emoji.get(sentiment_result.label.value, '😐')} {sentiment_result.label.value}"
         
@@ -366,7 +395,8 @@ class OperationsAgent(BaseAgent):
             data={
                 "ticket_number": ticket_number,
                 "sentiment": sentiment_result.to_dict(),
-                "routing": routing_info
+                "routing": routing_info,
+                "possible_duplicate_of": duplicate[0] if duplicate else None
             },
             tool_used="create_ticket"
         )
@@ -20,6 +20,7 @@ from backend.models.product import Product
 from backend.models.order import Order
 from backend.models.ticket import Ticket, TicketStatus
 from backend.models.user import User
+from ai_modules.sentiment import get_sentiment_analyzer
 import json
 
 
@@ -171,6 +172,7 @@ class AgentTools:
                 message=message
             )
             self.db.add(initial_message)
+            get_sentiment_analyzer().score_ticket_message(new_ticket, initial_message)
             self.db.commit()
             
             return {
@@ -3,5 +3,30 @@ AI Modules Core - Shared utilities and base classes
 """
 from .config import AIConfig
 from .base_agent import BaseAgent
+from .keyword_matcher import KeywordMatcher, KeywordMatch
+from .request_scope import RequestScoped, bind_request
+from .agent_pool import get_agent, warm_up
+from .ttl_cache import TTLCache
+from .timing import StageTimer, stage_timer, span
+from .minhash import MinHasher, LSHIndex
+from .timing_wheel import TimingWheel
+from .streaming_stats import EWMAStats
 
-__all__ = ["AIConfig", "BaseAgent"]
+__all__ = [
+    "AIConfig",
+    "BaseAgent",
+    "KeywordMatcher",
+    "KeywordMatch",
+    "RequestScoped",
+    "bind_request",
+    "get_agent",
+    "warm_up",
+    "TTLCache",
+    "StageTimer",
+    "stage_timer",
+    "span",
+    "MinHasher",
+    "LSHIndex",
+    "TimingWheel",
+    "EWMAStats"
+]
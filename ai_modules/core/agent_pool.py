@@ -0,0 +1,50 @@
+"""
+Agent Pool - Một instance agent cho mỗi worker
+
+Tạo agent (RAGService, embedding model, LLM client, sub-services) tốn kém;
+pool giữ một instance mỗi class trong process và tái sử dụng cho mọi request.
+DB session được truyền theo lời gọi qua BaseAgent.run(..., db=...).
+"""
+from typing import Dict, Type, TypeVar
+import threading
+
+from .base_agent import BaseAgent
+
+T = TypeVar("T", bound=BaseAgent)
+
+_pool: Dict[type, BaseAgent] = {}
+_pool_lock = threading.Lock()
+
+
+def get_agent(agent_cls: Type[T]) -> T:
+    """Lấy (hoặc tạo lần đầu) agent dùng chung cho worker hiện tại"""
+    agent = _pool.get(agent_cls)
+    if agent is None:
+        with _pool_lock:
+            agent = _pool.get(agent_cls)
+            if agent is None:
+                agent = agent_cls(db=None)
+                _pool[agent_cls] = agent
+    return agent
+
+
+def warm_up(*agent_classes: type) -> Dict[str, bool]:
+    """
+    Khởi tạo trước các agent lúc startup để chi phí dựng agent
+    không rơi vào request đầu tiên.
+    """
+    status = {}
+    for agent_cls in agent_classes:
+        try:
+            get_agent(agent_cls)
+            status[agent_cls.__name__] = True
+        except Exception as e:
+            print(f"[AgentPool] Failed to warm up {agent_cls.__name__}: {e}")
+            status[agent_cls.__name__] = False
+    return status
+
+
+def reset_pool():
+    """Xóa pool (dùng cho test / reload config)"""
+    with _pool_lock:
+        _pool.clear()
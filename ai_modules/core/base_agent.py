@@ -7,6 +7,8 @@ from dataclasses import dataclass
 from enum import Enum
 from sqlalchemy.orm import Session
 
+from .request_scope import RequestScoped, bind_request
+
 
 class AgentType(str, Enum):
     """Types of AI Agents in the system"""
@@ -23,6 +25,7 @@ class AgentResponse:
     sources: Optional[List[Dict[str, Any]]] = None
     tool_used: Optional[str] = None
     confidence: float = 1.0
+    timings: Optional[Dict[str, float]] = None  # Per-stage latency (ms)
 
 
 class BaseAgent(ABC):
@@ -34,10 +37,29 @@ class BaseAgent(ABC):
     - get_available_tools(): List available tools
     """
     
-    def __init__(self, db: Session, agent_type: AgentType):
+    # Request-scoped: đọc Session đã bind cho lời gọi hiện tại (agent dùng chung)
+    db = RequestScoped("db")
+    
+    def __init__(self, db: Optional[Session], agent_type: AgentType):
         self.db = db
         self.agent_type = agent_type
     
+    def run(
+        self,
+        query: str,
+        user_id: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None,
+        **sessions: Any
+    ) -> AgentResponse:
+        """
+        process_query với DB session / user truyền theo lời gọi.
+        
+        Dùng cho agent dùng chung giữa các request (agent_pool):
+            agent.run(query, user_id, context, db=db)
+        """
+        with bind_request(**sessions):
+            return self.process_query(query, user_id=user_id, context=context)
+    
     @abstractmethod
     def process_query(
         self, 
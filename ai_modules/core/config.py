@@ -33,6 +33,12 @@ class AIConfig:
     chunk_overlap: int = 200
     top_k_retrieval: int = 5
     similarity_threshold: float = 0.7
+    faq_cache_threshold: float = 0.92
+    
+    # Sentiment Batch Settings
+    sentiment_batch_token_budget: int = 3000
+    sentiment_batch_max_items: int = 25
+    sentiment_batch_concurrency: int = 4
     
     # Agent Settings
     agent_max_iterations: int = 5
@@ -55,6 +61,10 @@ class AIConfig:
             chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "200")),
             top_k_retrieval=int(os.getenv("TOP_K_RETRIEVAL", "5")),
             similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.7")),
+            faq_cache_threshold=float(os.getenv("FAQ_CACHE_THRESHOLD", "0.92")),
+            sentiment_batch_token_budget=int(os.getenv("SENTIMENT_BATCH_TOKEN_BUDGET", "3000")),
+            sentiment_batch_max_items=int(os.getenv("SENTIMENT_BATCH_MAX_ITEMS", "25")),
+            sentiment_batch_concurrency=int(os.getenv("SENTIMENT_BATCH_CONCURRENCY", "4")),
             agent_max_iterations=int(os.getenv("AGENT_MAX_ITERATIONS", "5")),
             agent_timeout_seconds=int(os.getenv("AGENT_TIMEOUT_SECONDS", "30")),
         )
@@ -0,0 +1,180 @@
+"""
+Keyword Matcher - Aho–Corasick multi-pattern matching
+
+Compile một bảng {label: [keywords]} thành một automaton duy nhất, sau đó
+quét text một lượt O(len(text) + số match) để lấy toàn bộ keyword khớp
+kèm vị trí. Dùng chung cho intent detection, sentiment lexicon, gazetteer...
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class KeywordMatch:
+    """Một keyword khớp trong text"""
+    label: str
+    keyword: str
+    start: int
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordMatcher:
+    """
+    Aho–Corasick automaton cho nhiều nhóm keyword.
+
+    Usage:
+        matcher = KeywordMatcher({"order": ["đặt hàng", "mua"], "payment": ["thanh toán"]})
+        matcher.find_all("tôi muốn đặt hàng")   # [KeywordMatch("order", "đặt hàng", 9, 17)]
+        matcher.classify("tôi muốn đặt hàng")   # "order"
+
+    Args:
+        keywords: Mapping label -> danh sách keyword. Thứ tự label là thứ tự ưu tiên
+                  khi hòa điểm.
+        case_sensitive: Mặc định so khớp không phân biệt hoa thường
+        whole_word: Chỉ nhận match nằm trọn ranh giới từ (tránh "hay" khớp trong "thay")
+        word_prefix: Với whole_word, keyword được phép khớp phần đầu của một từ dài
+                     hơn ("ticket" khớp "tickets") - chỉ kiểm tra ranh giới bên trái
+    """
+
+    def __init__(
+        self,
+        keywords: Dict[str, Iterable[str]],
+        case_sensitive: bool = False,
+        whole_word: bool = True,
+        word_prefix: bool = False
+    ):
+        self.case_sensitive = case_sensitive
+        self.whole_word = whole_word
+        self.word_prefix = word_prefix
+        self.labels: List[str] = list(keywords.keys())
+        self._priority = {label: i for i, label in enumerate(self.labels)}
+
+        # Trie: list of transition dicts; outputs[state] = [(label, keyword)]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[str, str]]] = [[]]
+
+        for label, words in keywords.items():
+            for word in words:
+                self._add(label, word)
+        self._build_failure_links()
+
+    def _normalize(self, text: str) -> str:
+        return text if self.case_sensitive else text.lower()
+
+    def _add(self, label: str, keyword: str):
+        word = self._normalize(keyword)
+        if not word:
+            return
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = nxt
+        if (label, word) not in self._outputs[state]:
+            self._outputs[state].append((label, word))
+
+    def _build_failure_links(self):
+        """BFS over the trie; each node inherits the outputs of its failure node"""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._outputs[nxt] = self._outputs[nxt] + self._outputs[self._fail[nxt]]
+
+    def _at_boundary(self, text: str, start: int, end: int, keyword: str) -> bool:
+        """Word-boundary semantics like regex \\b (only checked on word-char edges)"""
+        if _is_word_char(keyword[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if self.word_prefix:
+            return True
+        if _is_word_char(keyword[-1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """
+        Quét text một lượt, trả về mọi keyword khớp (kể cả chồng lấn).
+
+        Vị trí tính trên text đã normalize (lowercase khi case_sensitive=False).
+        """
+        if not text:
+            return []
+        text = self._normalize(text)
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+
+        matches: List[KeywordMatch] = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for label, word in outputs[state]:
+                start = i - len(word) + 1
+                if self.whole_word and not self._at_boundary(text, start, i + 1, word):
+                    continue
+                matches.append(KeywordMatch(label, word, start, i + 1))
+
+        matches.sort(key=lambda m: (m.start, -m.length, self._priority[m.label]))
+        return matches
+
+    def select(self, matches: List[KeywordMatch]) -> List[KeywordMatch]:
+        """Leftmost-longest, non-overlapping subset of matches"""
+        selected: List[KeywordMatch] = []
+        last_end = -1
+        for m in matches:  # already sorted by (start, -length, priority)
+            if m.start >= last_end:
+                selected.append(m)
+                last_end = m.end
+        return selected
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """
+        Điểm mỗi label = tổng độ dài các keyword được chọn (leftmost-longest,
+        không chồng lấn). Keyword dài/cụ thể hơn thắng keyword ngắn chung chung.
+        """
+        result: Dict[str, int] = {}
+        for m in self.select(self.find_all(text)):
+            result[m.label] = result.get(m.label, 0) + m.length
+        return result
+
+    def best(self, text: str) -> Tuple[Optional[str], int]:
+        """
+        (label, score) có điểm cao nhất; hòa điểm → label khai báo trước.
+        Trả về (None, 0) nếu không có keyword nào khớp.
+        """
+        scores = self.scores(text)
+        if not scores:
+            return None, 0
+        label = max(scores, key=lambda l: (scores[l], -self._priority[l]))
+        return label, scores[label]
+
+    def classify(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """Label có điểm cao nhất, hoặc default nếu không có keyword nào khớp"""
+        label, _ = self.best(text)
+        return label if label is not None else default
+
+    def contains_any(self, text: str, label: Optional[str] = None) -> bool:
+        """True nếu text chứa ít nhất một keyword (của label nếu chỉ định)"""
+        return any(label is None or m.label == label for m in self.find_all(text))
@@ -0,0 +1,149 @@
+"""
+MinHash / LSH - Tìm cặp văn bản gần giống nhau trong thời gian gần tuyến tính
+
+- shingles(): tập k-gram ký tự (hash 32-bit ổn định giữa các process)
+- MinHasher: signature num_perm giá trị; tỉ lệ vị trí trùng ≈ Jaccard của hai tập shingle
+- LSHIndex: chia signature thành bands × rows; hai văn bản chung ít nhất một
+  band thì thành cặp ứng viên. Chỉ cặp ứng viên mới cần tính similarity chính xác.
+
+Với b bands × r rows, xác suất thành ứng viên khi Jaccard = s là 1 - (1 - s^r)^b
+(ngưỡng xấp xỉ (1/b)^(1/r)).
+"""
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+import hashlib
+import zlib
+
+import numpy as np
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, k: int = SHINGLE_SIZE) -> Set[int]:
+    """Hash các k-gram ký tự của text (lowercase, gộp khoảng trắng)"""
+    text = " ".join((text or "").lower().split())
+    if not text:
+        return set()
+    if len(text) <= k:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {zlib.crc32(text[i:i + k].encode("utf-8")) for i in range(len(text) - k + 1)}
+
+
+class MinHasher:
+    """
+    Universal-hash MinHash.
+
+    Usage:
+        hasher = MinHasher()
+        a = hasher.signature("chưa nhận được hàng")
+        b = hasher.signature("chưa nhận được hàng ạ")
+        MinHasher.similarity(a, b)   # ≈ Jaccard(shingles(a), shingles(b))
+
+    Signature của cùng một text luôn giống nhau với cùng (num_perm, seed),
+    nên có thể lưu xuống DB và so sánh giữa các lần chạy.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1, shingle_size: int = SHINGLE_SIZE):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.scheme = f"minhash-{num_perm}-k{shingle_size}-s{seed}"
+
+    def signature(self, text: str) -> np.ndarray:
+        """Signature uint32[num_perm] của text"""
+        hashes = shingles(text, self.shingle_size)
+        if not hashes:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        hv = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        # Overflow uint64 là cố ý (wrap-around) - vẫn tất định
+        permuted = ((hv[:, None] * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> float:
+        """Jaccard ước lượng từ hai signature"""
+        return float(np.mean(a == b))
+
+    @staticmethod
+    def to_bytes(signature: np.ndarray) -> bytes:
+        return signature.astype("<u4").tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype="<u4").astype(np.uint32)
+
+
+class LSHIndex:
+    """
+    Banded LSH index trên MinHash signature.
+
+    Usage:
+        index = LSHIndex(num_perm=128, bands=32)
+        index.add("t1", sig1, scope="customer-1")
+        index.add("t2", sig2, scope="customer-1")
+        index.candidate_pairs()          # {("t1", "t2")} nếu chung ít nhất một band
+        index.query(sig3, scope="customer-1")
+
+    scope: chỉ key cùng scope mới thành ứng viên của nhau (vd. cùng khách hàng).
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: Dict[Tuple[Hashable, int, bytes], List[Hashable]] = {}
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """Key của từng band (bytes của r giá trị liên tiếp)"""
+        data = np.ascontiguousarray(signature, dtype="<u4")
+        return [data[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def band_hashes(self, signature: np.ndarray, salt: str = "") -> List[int]:
+        """
+        Một số nguyên 64-bit có dấu cho mỗi band (band index + salt nằm trong hash)
+        → lưu được vào cột BIGINT có index để tra ứng viên bằng SQL
+        """
+        prefix = salt.encode("utf-8")
+        return [
+            int.from_bytes(
+                hashlib.blake2b(prefix + band.to_bytes(2, "little") + key, digest_size=8).digest(),
+                "little", signed=True
+            )
+            for band, key in enumerate(self.band_keys(signature))
+        ]
+
+    def add(self, key: Hashable, signature: np.ndarray, scope: Optional[Hashable] = None):
+        for band, band_key in enumerate(self.band_keys(signature)):
+            self._buckets.setdefault((scope, band, band_key), []).append(key)
+
+    def query(self, signature: np.ndarray, scope: Optional[Hashable] = None) -> Set[Hashable]:
+        """Các key chung ít nhất một band với signature"""
+        found: Set[Hashable] = set()
+        for band, band_key in enumerate(self.band_keys(signature)):
+            found.update(self._buckets.get((scope, band, band_key), ()))
+        return found
+
+    def candidate_pairs(self) -> Set[Tuple[Hashable, Hashable]]:
+        """Mọi cặp (a, b) với a < b chung ít nhất một bucket"""
+        pairs: Set[Tuple[Hashable, Hashable]] = set()
+        for keys in self._buckets.values():
+            if len(keys) < 2:
+                continue
+            ordered = sorted(set(keys))
+            for i, a in enumerate(ordered):
+                for b in ordered[i + 1:]:
+                    pairs.add((a, b))
+        return pairs
+
+
+def candidate_probability(similarity: float, bands: int = DEFAULT_BANDS, rows: int = DEFAULT_NUM_PERM // DEFAULT_BANDS) -> float:
+    """Xác suất một cặp có Jaccard = similarity trở thành ứng viên"""
+    return 1.0 - (1.0 - similarity ** rows) ** bands
+
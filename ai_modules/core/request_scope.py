@@ -0,0 +1,65 @@
+"""
+Request Scope - Gắn DB session / user theo từng lời gọi cho agent dùng chung
+
+Agent và sub-service được tạo một lần mỗi worker (xem agent_pool). Các giá
+trị thay đổi theo request (Session, current_user) không lưu trên instance mà
+đọc từ ContextVar — an toàn khi nhiều request chạy song song trên threadpool
+của FastAPI.
+
+Usage:
+    class ProductRecommender:
+        db = RequestScoped("db")
+
+    with bind_request(db=session):
+        recommender.recommend(...)      # self.db → session của request này
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+_bound: ContextVar[Dict[str, Any]] = ContextVar("ai_request_scope", default={})
+
+
+@contextmanager
+def bind_request(**values: Any) -> Iterator[None]:
+    """
+    Gắn các giá trị request-scoped (vd. db=..., order_db=..., current_user=...)
+    cho khối lệnh hiện tại. Giá trị None bị bỏ qua (giữ fallback).
+    """
+    merged = dict(_bound.get())
+    merged.update({k: v for k, v in values.items() if v is not None})
+    token = _bound.set(merged)
+    try:
+        yield
+    finally:
+        _bound.reset(token)
+
+
+class RequestScoped:
+    """
+    Descriptor: đọc giá trị đã bind cho request hiện tại.
+
+    Thứ tự ưu tiên: bind_request(name) → bind_request(fallback) → giá trị gán
+    lúc khởi tạo (tương thích code cũ tạo agent theo request).
+    """
+
+    def __init__(self, name: str, fallback: Optional[str] = None):
+        self.name = name
+        self.fallback = fallback
+        self.attr = name
+
+    def __set_name__(self, owner, attr: str):
+        self.attr = attr
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        bound = _bound.get()
+        if self.name in bound:
+            return bound[self.name]
+        if self.fallback and self.fallback in bound:
+            return bound[self.fallback]
+        return obj.__dict__.get(self.attr)
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.attr] = value
@@ -0,0 +1,59 @@
+"""
+Streaming Stats - Trung bình / phương sai cập nhật từng giá trị (O(1) bộ nhớ)
+
+EWMAStats giữ trung bình và phương sai có trọng số mũ: giá trị gần đây nặng
+hơn, baseline tự trôi theo quy mô thật của dữ liệu thay vì ngưỡng cố định.
+Dùng cho phát hiện bất thường trên chuỗi KPI (z-score so với baseline).
+"""
+from typing import Optional
+import math
+
+
+class EWMAStats:
+    """
+    Usage:
+        stats = EWMAStats(alpha=0.1, min_count=7)
+        z = stats.zscore(value)      # None khi chưa đủ mẫu
+        stats.update(value)
+
+    Args:
+        alpha: Trọng số của giá trị mới (0 < alpha <= 1), ~ 2 / (N + 1) cho cửa sổ N mẫu
+        min_count: Số mẫu tối thiểu trước khi zscore() trả về giá trị
+    """
+
+    def __init__(self, alpha: float = 0.1, min_count: int = 7):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.min_count = min_count
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= self.min_count
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    def update(self, value: float):
+        """Cập nhật incremental (West 1979: phương sai EWMA không cần lưu lịch sử)"""
+        if self.count == 0:
+            self.mean, self.var = float(value), 0.0
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + diff * increment)
+        self.count += 1
+
+    def zscore(self, value: float, std_floor: float = 0.0) -> Optional[float]:
+        """Độ lệch của value so với baseline, tính bằng số độ lệch chuẩn (>= std_floor)"""
+        if not self.ready:
+            return None
+        std = max(self.std, std_floor)
+        if std <= 0:
+            return None
+        return (value - self.mean) / std
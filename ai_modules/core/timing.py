@@ -0,0 +1,83 @@
+"""
+Stage Timing - Đo thời gian từng giai đoạn của một lượt chat
+
+- stage_timer(): mở (hoặc dùng lại) bộ đếm cho request hiện tại (ContextVar)
+- span("stage"): đo một đoạn code, cộng dồn vào bộ đếm đang mở
+- Mỗi span cũng được ghi vào Prometheus histogram (nếu có prometheus-client)
+
+Usage:
+    with stage_timer() as timer:
+        with span("intent"):
+            ...
+        with span("llm"):
+            ...
+    timer.as_dict()   # {"intent": 0.42, "llm": 812.3}  (milliseconds)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+import time
+
+try:
+    from prometheus_client import Histogram
+    STAGE_LATENCY = Histogram(
+        "crm_ai_stage_latency_seconds",
+        "Latency of AI chat pipeline stages",
+        ["stage"],
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    )
+except ImportError:  # prometheus-client is optional
+    STAGE_LATENCY = None
+
+
+class StageTimer:
+    """Tổng thời gian (ms) theo stage; nhiều span cùng tên được cộng dồn"""
+
+    def __init__(self):
+        self._stages: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float):
+        self._stages[stage] = self._stages.get(stage, 0.0) + seconds * 1000.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {stage: round(ms, 2) for stage, ms in self._stages.items()}
+
+
+_current: ContextVar[Optional[StageTimer]] = ContextVar("ai_stage_timer", default=None)
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current.get()
+
+
+@contextmanager
+def stage_timer() -> Iterator[StageTimer]:
+    """
+    Bộ đếm cho request hiện tại. Nếu đã có bộ đếm bao ngoài (vd. chat_rag
+    bao CustomerServiceAgent) thì dùng lại để gom mọi stage vào một chỗ.
+    """
+    timer = _current.get()
+    if timer is not None:
+        yield timer
+        return
+    timer = StageTimer()
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Đo một stage; ghi vào bộ đếm hiện tại (nếu có) và histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timer = _current.get()
+        if timer is not None:
+            timer.record(stage, elapsed)
+        if STAGE_LATENCY is not None:
+            STAGE_LATENCY.labels(stage=stage).observe(elapsed)
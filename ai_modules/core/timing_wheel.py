@@ -0,0 +1,126 @@
+"""
+Timing Wheel - Hẹn giờ cho rất nhiều deadline với chi phí O(1)
+
+Hierarchical timing wheel (kiểu kernel timer): mỗi tầng có `slots` ô, ô
+ở tầng l bao một khoảng slots^l tick. Timer đặt vào tầng thấp nhất chứa
+được khoảng cách tới deadline; khi kim tầng dưới quay hết một vòng, ô kế
+tiếp của tầng trên được "đổ" xuống các tầng dưới. Vì vậy:
+- schedule / cancel: O(1)
+- advance: O(số tick + số timer đến hạn), không phụ thuộc tổng số timer
+
+Dùng cho SLA deadline của ticket thay vì quét định kỳ toàn bảng.
+"""
+from typing import Any, Dict, Hashable, List, Tuple
+import math
+import threading
+
+
+class TimingWheel:
+    """
+    Usage:
+        wheel = TimingWheel(tick_seconds=1.0, start=time.time())
+        wheel.schedule(("t1", "RESPONSE"), deadline=time.time() + 3600, payload=...)
+        wheel.cancel(("t1", "RESPONSE"))
+        for key, deadline, payload in wheel.advance(time.time()):
+            ...
+
+    Deadline và now là số giây (cùng hệ quy chiếu, vd. epoch). Timer được
+    trả về ở lần advance() đầu tiên có now >= deadline (làm tròn lên theo tick).
+
+    Args:
+        tick_seconds: Độ phân giải
+        slots: Số ô mỗi tầng
+        levels: Số tầng; khoảng cách vượt slots^levels tick nằm ở danh sách tràn
+        start: Thời điểm bắt đầu (mặc định 0)
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 64, levels: int = 4, start: float = 0.0):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.levels = levels
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self._wheels: List[List[Dict[Hashable, Tuple[int, float, Any]]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._overflow: Dict[Hashable, Tuple[int, float, Any]] = {}
+        self._expired: Dict[Hashable, Tuple[int, float, Any]] = {}
+        self._where: Dict[Hashable, Dict[Hashable, Tuple[int, float, Any]]] = {}
+        self._current = math.floor(start / tick_seconds)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    @property
+    def now(self) -> float:
+        """Thời điểm của tick hiện tại"""
+        return self._current * self.tick_seconds
+
+    def schedule(self, key: Hashable, deadline: float, payload: Any = None):
+        """Đặt (hoặc đặt lại) timer `key`"""
+        with self._lock:
+            self._remove(key)
+            self._place(key, (math.ceil(deadline / self.tick_seconds), deadline, payload))
+
+    def cancel(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def advance(self, now: float) -> List[Tuple[Hashable, float, Any]]:
+        """Quay kim tới `now`, trả về [(key, deadline, payload)] đã đến hạn"""
+        target = math.floor(now / self.tick_seconds)
+        fired: List[Tuple[Hashable, float, Any]] = []
+        with self._lock:
+            fired.extend(self._drain(self._expired))
+            while self._current < target:
+                if not self._where:
+                    self._current = target
+                    break
+                self._current += 1
+                tick = self._current
+                if tick % self._spans[self.levels] == 0 and self._overflow:
+                    self._cascade(self._overflow)
+                for level in range(self.levels - 1, 0, -1):
+                    if tick % self._spans[level] == 0:
+                        self._cascade(self._wheels[level][(tick // self._spans[level]) % self.slots])
+                fired.extend(self._drain(self._wheels[0][tick % self.slots]))
+        return fired
+
+    # ─── Internals (caller giữ lock) ─────────────────────────────
+
+    def _place(self, key: Hashable, entry: Tuple[int, float, Any], cascading: bool = False):
+        delta = entry[0] - self._current
+        # Ô của tick hiện tại chỉ còn được drain khi đang cascade trong advance()
+        if delta < 0 or (delta == 0 and not cascading):
+            bucket = self._expired
+        else:
+            bucket = self._overflow
+            for level in range(self.levels):
+                if delta < self._spans[level + 1]:
+                    bucket = self._wheels[level][(entry[0] // self._spans[level]) % self.slots]
+                    break
+        bucket[key] = entry
+        self._where[key] = bucket
+
+    def _remove(self, key: Hashable) -> bool:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def _cascade(self, bucket: Dict[Hashable, Tuple[int, float, Any]]):
+        entries = list(bucket.items())
+        bucket.clear()
+        for key, entry in entries:
+            self._place(key, entry, cascading=True)
+
+    def _drain(self, bucket: Dict[Hashable, Tuple[int, float, Any]]) -> List[Tuple[Hashable, float, Any]]:
+        fired = [(key, deadline, payload) for key, (_, deadline, payload) in bucket.items()]
+        for key, _, _ in fired:
+            del self._where[key]
+        bucket.clear()
+        return fired
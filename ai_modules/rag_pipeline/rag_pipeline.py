@@ -145,43 +145,13 @@ class RAGPipeline:
     def query_crm_entities(self, db_session, user_id: int) -> Dict[str, Any]:
         """
         Query CRM entities for a specific user (customer info, orders, tickets)
-        """
-        from backend.models.user import User
-        from backend.models.order import Order
-        from backend.models.ticket import Ticket
-        
-        crm_context = {}
-        
-        # Get customer info
-        user = db_session.query(User).filter(User.id == user_id).first()
-        if user:
-            crm_context["customer"] = {
-                "full_name": user.full_name,
-                "email": user.email,
-                "phone": user.phone
-            }
         
-        # Get recent orders
-        orders = db_session.query(Order).filter(Order.customer_id == user_id).order_by(Order.created_at.desc()).limit(5).all()
-        crm_context["orders"] = [
-            {
-                "order_number": order.order_number,
-                "status": order.status.value,
-                "total_amount": float(order.total_amount)
-            } for order in orders
-        ]
-        
-        # Get recent tickets
-        tickets = db_session.query(Ticket).filter(Ticket.customer_id == user_id).order_by(Ticket.created_at.desc()).limit(5).all()
-        crm_context["tickets"] = [
-            {
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "status": ticket.status.value
-            } for ticket in tickets
-        ]
-        
-        return crm_context
+        Delegates to CRMContextProvider: identity/order/support DBs are queried
+        concurrently on their own engines and cached per customer.
+        db_session is kept for backward compatibility and no longer used.
+        """
+        from backend.services.crm_context import crm_context_provider
+        return crm_context_provider.get(user_id)
     
     def _generate_mock_answer(self, query: str, chunks: List[str], crm_context: Optional[Dict[str, Any]] = None) -> str:
         """
@@ -13,6 +13,14 @@ from ai_modules.sentiment.analyzer import (
     SentimentAnalyzer,
     SentimentResult,
     SentimentLabel,
+    get_sentiment_analyzer,
 )
+from ai_modules.sentiment.incremental import SentimentAggregate
 
-__all__ = ["SentimentAnalyzer", "SentimentResult", "SentimentLabel"]
+__all__ = [
+    "SentimentAnalyzer",
+    "SentimentResult",
+    "SentimentLabel",
+    "SentimentAggregate",
+    "get_sentiment_analyzer",
+]
@@ -4,18 +4,28 @@ Hỗ trợ: Gemini (primary) > OpenAI (fallback) > Rule-based (offline)
 
 Features:
 - analyze_text: Phân tích 1 tin nhắn
-- analyze_ticket: Phân tích toàn bộ ticket
-- analyze_conversation: Phân tích cuộc hội thoại
-- batch_analyze: Phân tích hàng loạt
+- analyze_ticket: Phân tích toàn bộ ticket (đọc điểm đã lưu)
+- analyze_conversation: Phân tích cuộc hội thoại (đọc điểm đã lưu)
+- score_ticket_message / score_conversation_message: Chấm điểm lúc ghi tin nhắn,
+  cập nhật aggregate (running mean + EWMA) O(1)
+- batch_analyze: Phân tích hàng loạt (nhiều text / một lời gọi LLM)
 """
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from dataclasses import dataclass, field, replace
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 import os
 import re
 import json
+import threading
 
 from ai_modules.core.config import ai_config
+from ai_modules.sentiment.rule_engine import LABEL_THRESHOLD, RuleSentimentEngine
+from ai_modules.sentiment.cache import SentimentCache, cache_key, get_sentiment_cache
+from ai_modules.sentiment.incremental import SentimentAggregate
+
+# Bump when the sentiment prompts change → cached LLM results are not reused
+SENTIMENT_PROMPT_VERSION = "v1"
 
 
 class SentimentLabel(str, Enum):
@@ -25,6 +35,10 @@ class SentimentLabel(str, Enum):
     NEGATIVE = "NEGATIVE"
 
 
+# RuleSentimentEngine.labels() → SentimentLabel
+_LABELS = {1: SentimentLabel.POSITIVE, 0: SentimentLabel.NEUTRAL, -1: SentimentLabel.NEGATIVE}
+
+
 @dataclass
 class SentimentResult:
     """Kết quả phân tích cảm xúc"""
@@ -91,10 +105,28 @@ class SentimentAnalyzer:
         "chưa", "không bao giờ", "ko", "k", "hem", "hông"
     ]
 
-    def __init__(self):
+    # Compiled once at class load → single-pass, phrase-level scoring
+    _rule_engine = RuleSentimentEngine(
+        _POSITIVE_KEYWORDS, _NEGATIVE_KEYWORDS, _NEGATORS, _INTENSIFIERS
+    )
+
+    def __init__(self, cache: Optional[SentimentCache] = None):
         self.demo_mode = ai_config.demo_mode
+        self._cache = cache
         self._init_llm_client()
 
+    @property
+    def cache(self) -> SentimentCache:
+        """LLM result cache (process-wide by default, created on first LLM use)"""
+        if self._cache is None:
+            self._cache = get_sentiment_cache()
+        return self._cache
+
+    @property
+    def model_version(self) -> str:
+        model = ai_config.gemini_model if self.llm_provider == "gemini" else ai_config.openai_model
+        return f"{self.llm_provider}:{model}:{SENTIMENT_PROMPT_VERSION}"
+
     def _init_llm_client(self):
         """
         Initialize LLM client
@@ -160,9 +192,14 @@ class SentimentAnalyzer:
 
         text = text.strip()
 
-        # Use LLM if available, otherwise rule-based
+        # Use LLM if available (cached by content), otherwise rule-based
         if self.llm_client and not self.demo_mode:
-            return self._analyze_with_llm(text)
+            cached = self.cache.get_many([text], self.model_version)[0]
+            if cached is not None:
+                return self._result_from_cache(cached, text)
+            result = self._analyze_with_llm(text)
+            self._remember([text], [result])
+            return result
         return self._analyze_rule_based(text)
 
     def analyze_ticket(
@@ -173,6 +210,10 @@ class SentimentAnalyzer:
         """
         Phân tích cảm xúc toàn bộ ticket.
 
+        Đọc điểm đã lưu trên từng TicketMessage + aggregate của ticket (xem
+        score_ticket_message). Chỉ tin nhắn cũ chưa có điểm mới được chấm
+        (một lần, theo batch).
+
         Args:
             ticket_id: ID của ticket
             db: Database session (Support DB)
@@ -193,67 +234,29 @@ class SentimentAnalyzer:
             TicketMessage.ticket_id == ticket_id
         ).order_by(TicketMessage.created_at).all()
 
-        if not messages:
-            return {
-                "ticket_id": ticket_id,
-                "ticket_number": ticket.ticket_number,
-                "overall_sentiment": SentimentResult(
-                    score=0.0,
-                    label=SentimentLabel.NEUTRAL,
-                    confidence=0.0,
-                    text_preview=ticket.subject or ""
-                ).to_dict(),
-                "message_sentiments": [],
-                "trend": "stable"
+        aggregate = self._load_aggregate(
+            db, ticket, messages,
+            text_of=lambda m: m.message,
+            scorable=lambda m: not m.is_staff,
+            counted=lambda m: not m.is_staff
+        )
+        message_sentiments = [
+            {
+                "message_id": msg.id,
+                "is_staff": bool(msg.is_staff),
+                "sentiment": {"score": msg.sentiment_score, "label": msg.sentiment_label}
             }
-
-        # Analyze each message
-        message_sentiments = []
-        for msg in messages:
-            content = msg.message or ""
-            if content.strip():
-                result = self.analyze_text(content)
-                message_sentiments.append({
-                    "message_id": msg.id,
-                    "is_staff": bool(msg.is_staff),
-                    "sentiment": result.to_dict()
-                })
-
-        # Calculate overall sentiment (weighted by customer messages)
-        customer_sentiments = [
-            ms["sentiment"]["score"]
-            for ms in message_sentiments
-            if not ms["is_staff"]
+            for msg in messages if msg.sentiment_score is not None
         ]
 
-        if customer_sentiments:
-            overall_score = sum(customer_sentiments) / len(customer_sentiments)
-        else:
-            overall_score = 0.0
-
-        overall_label = self._score_to_label(overall_score)
-        trend = self._detect_trend(customer_sentiments)
-
-        # Update ticket sentiment fields
-        try:
-            ticket.sentiment_score = overall_score
-            ticket.sentiment_label = overall_label.value
-            db.commit()
-        except Exception:
-            db.rollback()
-
         return {
             "ticket_id": ticket_id,
             "ticket_number": ticket.ticket_number,
-            "overall_sentiment": {
-                "score": round(overall_score, 4),
-                "label": overall_label.value,
-                "confidence": 0.8
-            },
+            "overall_sentiment": self._overall(aggregate),
             "message_sentiments": message_sentiments,
-            "trend": trend,
+            "trend": aggregate.trend,
             "message_count": len(messages),
-            "customer_message_count": len(customer_sentiments)
+            "customer_message_count": aggregate.count
         }
 
     def analyze_conversation(
@@ -264,6 +267,9 @@ class SentimentAnalyzer:
         """
         Phân tích cảm xúc cuộc hội thoại.
 
+        Đọc điểm đã lưu trên ConversationMessage (tin nhắn user) + aggregate
+        của conversation; tin nhắn cũ chưa có điểm được chấm một lần.
+
         Args:
             conversation_id: ID của conversation
             db: Database session
@@ -274,69 +280,203 @@ class SentimentAnalyzer:
         if not db:
             return {"error": "Database session required"}
 
-        from backend.models.conversation import ConversationMessage
+        from backend.models.conversation import Conversation, ConversationMessage
 
+        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
         messages = db.query(ConversationMessage).filter(
             ConversationMessage.conversation_id == conversation_id
         ).order_by(ConversationMessage.created_at).all()
 
-        if not messages:
-            return {
-                "conversation_id": conversation_id,
-                "overall_sentiment": {
-                    "score": 0.0,
-                    "label": "NEUTRAL",
-                    "confidence": 0.0
-                },
-                "message_sentiments": [],
-                "trend": "stable"
+        aggregate = self._load_aggregate(
+            db, conversation, messages,
+            text_of=lambda m: m.content,
+            scorable=lambda m: m.role == "user",
+            counted=lambda m: m.role == "user"
+        )
+        message_sentiments = [
+            {
+                "message_id": msg.id,
+                "role": msg.role,
+                "sentiment": {"score": msg.sentiment_score, "label": msg.sentiment_label}
             }
-
-        # Analyze each user message
-        message_sentiments = []
-        user_scores = []
-
-        for msg in messages:
-            role = getattr(msg, "role", "user")
-            content = getattr(msg, "content", "") or ""
-            if content.strip():
-                result = self.analyze_text(content)
-                msg_data = {
-                    "message_id": msg.id,
-                    "role": role,
-                    "sentiment": result.to_dict()
-                }
-                message_sentiments.append(msg_data)
-                if role == "user":
-                    user_scores.append(result.score)
-
-        overall_score = sum(user_scores) / len(user_scores) if user_scores else 0.0
-        trend = self._detect_trend(user_scores)
+            for msg in messages if msg.sentiment_score is not None
+        ]
 
         return {
             "conversation_id": conversation_id,
-            "overall_sentiment": {
-                "score": round(overall_score, 4),
-                "label": self._score_to_label(overall_score).value,
-                "confidence": 0.8
-            },
+            "overall_sentiment": self._overall(aggregate),
             "message_sentiments": message_sentiments,
-            "trend": trend,
+            "trend": aggregate.trend,
             "message_count": len(messages),
-            "user_message_count": len(user_scores)
+            "user_message_count": aggregate.count
+        }
+
+    # ─── Incremental (write path) ────────────────────────────────
+
+    def score_ticket_message(self, ticket, message) -> Optional[SentimentResult]:
+        """
+        Chấm điểm một TicketMessage của khách lúc ghi: lưu điểm trên message và
+        cập nhật aggregate của ticket O(1). Tin nhắn staff / AI bỏ qua. Caller commit.
+        """
+        if message.is_staff:
+            return None
+        result = self._score_message(message, message.message)
+        SentimentAggregate.from_row(ticket).update(result.score).apply_to(ticket)
+        return result
+
+    def score_conversation_message(self, conversation, message) -> Optional[SentimentResult]:
+        """
+        Chấm điểm một ConversationMessage của user lúc ghi và cập nhật
+        aggregate của conversation O(1). Tin nhắn assistant bỏ qua. Caller commit.
+        """
+        if message.role != "user":
+            return None
+        result = self._score_message(message, message.content)
+        SentimentAggregate.from_row(conversation).update(result.score).apply_to(conversation)
+        return result
+
+    def _score_message(self, message, text: Optional[str]) -> SentimentResult:
+        result = self.analyze_text(text or "")
+        message.sentiment_score = result.score
+        message.sentiment_label = result.label.value
+        return result
+
+    def _load_aggregate(
+        self,
+        db,
+        owner,
+        messages: List[Any],
+        text_of: Callable[[Any], Optional[str]],
+        scorable: Callable[[Any], bool],
+        counted: Callable[[Any], bool]
+    ) -> SentimentAggregate:
+        """
+        Aggregate đã lưu trên owner (Ticket / Conversation). Nếu còn tin nhắn cũ
+        chưa chấm điểm → chấm theo batch, lưu lại và dựng lại aggregate một lần.
+        """
+        unscored = [
+            m for m in messages
+            if m.sentiment_score is None and scorable(m) and (text_of(m) or "").strip()
+        ]
+        if not unscored and owner is not None:
+            return SentimentAggregate.from_row(owner)
+
+        for msg, result in zip(unscored, self.batch_analyze([text_of(m) for m in unscored])):
+            msg.sentiment_score = result.score
+            msg.sentiment_label = result.label.value
+        aggregate = SentimentAggregate.from_scores(
+            m.sentiment_score for m in messages if m.sentiment_score is not None and counted(m)
+        )
+        if owner is not None:
+            aggregate.apply_to(owner)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+        return aggregate
+
+    @staticmethod
+    def _overall(aggregate: SentimentAggregate) -> Dict[str, Any]:
+        return {
+            "score": round(aggregate.mean, 4),
+            "label": aggregate.label,
+            "ewma": round(aggregate.ewma, 4),
+            "confidence": 0.8 if aggregate.count else 0.0
         }
 
-    def batch_analyze(self, texts: List[str]) -> List[SentimentResult]:
+    def batch_analyze(
+        self,
+        texts: List[str],
+        max_concurrency: Optional[int] = None
+    ) -> List[SentimentResult]:
         """
         Phân tích cảm xúc hàng loạt.
 
+        Với LLM: gom nhiều text vào một prompt (trả về JSON array), chia batch
+        theo token budget và gửi song song có giới hạn. Item nào parse lỗi
+        (hoặc cả batch lỗi) → fallback rule-based cho item đó.
+
         Args:
             texts: Danh sách text cần phân tích
+            max_concurrency: Số lời gọi LLM song song (mặc định theo ai_config)
 
         Returns:
-            List[SentimentResult]
+            List[SentimentResult] theo đúng thứ tự texts
         """
-        return [self.analyze_text(text) for text in texts]
+        results: List[Optional[SentimentResult]] = [None] * len(texts)
+        pending: List[Tuple[int, str]] = []
+        for i, text in enumerate(texts):
+            if not text or not text.strip():
+                results[i] = self.analyze_text(text)
+            else:
+                pending.append((i, text.strip()))
+
+        if not (self.llm_client and not self.demo_mode):
+            rule_results = self._analyze_rule_based_batch([text for _, text in pending])
+            for (i, _), result in zip(pending, rule_results):
+                results[i] = result
+            return results
+
+        # Cache hits first; identical texts (same cache key) are sent once
+        model_version = self.model_version
+        cached = self.cache.get_many([text for _, text in pending], model_version)
+        misses: Dict[str, List[Tuple[int, str]]] = {}
+        for (i, text), hit in zip(pending, cached):
+            if hit is not None:
+                results[i] = self._result_from_cache(hit, text)
+            else:
+                misses.setdefault(cache_key(text, model_version), []).append((i, text))
+        if not misses:
+            return results
+
+        unique = [group[0] for group in misses.values()]
+        batches = self._pack_batches(unique)
+        workers = max(1, min(max_concurrency or ai_config.sentiment_batch_concurrency, len(batches)))
+        if workers == 1:
+            batch_results = [self._analyze_batch_with_llm(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batch_results = list(executor.map(self._analyze_batch_with_llm, batches))
+
+        by_index: Dict[int, SentimentResult] = {}
+        for batch, batch_result in zip(batches, batch_results):
+            for (i, _), result in zip(batch, batch_result):
+                by_index[i] = result
+        for group in misses.values():
+            leader = by_index[group[0][0]]
+            for i, text in group:
+                results[i] = leader if i == group[0][0] else replace(leader, text_preview=text[:100])
+        self._remember([text for _, text in unique], [by_index[i] for i, _ in unique])
+        return results
+
+    # ─── Result cache ────────────────────────────────────────────
+
+    @staticmethod
+    def _cacheable(result: SentimentResult) -> Dict[str, Any]:
+        return {
+            "score": result.score,
+            "label": result.label.value,
+            "confidence": result.confidence,
+            "emotions": dict(result.emotions),
+            "provider": result.provider
+        }
+
+    @staticmethod
+    def _result_from_cache(data: Dict[str, Any], text: str) -> SentimentResult:
+        return SentimentResult(
+            score=data["score"],
+            label=SentimentLabel(data["label"]),
+            confidence=data["confidence"],
+            emotions=dict(data.get("emotions", {})),
+            provider=data.get("provider", "llm"),
+            text_preview=text[:100]
+        )
+
+    def _remember(self, texts: List[str], results: List[SentimentResult]):
+        """Cache LLM results only — rule-based fallbacks are retried next time"""
+        keep = [(t, self._cacheable(r)) for t, r in zip(texts, results) if r.provider == self.llm_provider]
+        if keep:
+            self.cache.put_many([t for t, _ in keep], self.model_version, [r for _, r in keep])
 
     # ─── LLM Analysis ───────────────────────────────────────────
 
@@ -368,132 +508,205 @@ Quy tắc:
 - emotions: Phân bố cảm xúc chi tiết (tổng không cần = 1)
 """
         try:
-            if self.llm_provider == "gemini":
-                response = self.llm_client.models.generate_content(
-                    model=ai_config.gemini_model,
-                    contents=prompt
-                )
-                raw = (response.text or "").strip()
-
-            elif self.llm_provider == "openai":
-                response = self.llm_client.chat.completions.create(
-                    model=ai_config.openai_model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "Bạn là chuyên gia phân tích cảm xúc. Chỉ trả lời JSON."
-                        },
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=256,
-                    temperature=0.1
-                )
-                raw = response.choices[0].message.content.strip()
-            else:
+            raw = self._call_llm(prompt, max_tokens=256)
+            if raw is None:
                 return self._analyze_rule_based(text)
-
             return self._parse_llm_response(raw, text)
 
         except Exception as e:
             print(f"[SentimentAnalyzer] LLM error, falling back to rules: {e}")
             return self._analyze_rule_based(text)
 
+    def _call_llm(self, prompt: str, max_tokens: int) -> Optional[str]:
+        """Gọi LLM hiện tại, trả raw text (None nếu không có provider)"""
+        if self.llm_provider == "gemini":
+            response = self.llm_client.models.generate_content(
+                model=ai_config.gemini_model,
+                contents=prompt
+            )
+            return (response.text or "").strip()
+
+        if self.llm_provider == "openai":
+            response = self.llm_client.chat.completions.create(
+                model=ai_config.openai_model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Bạn là chuyên gia phân tích cảm xúc. Chỉ trả lời JSON."
+                    },
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.1
+            )
+            return response.choices[0].message.content.strip()
+
+        return None
+
+    # ─── Batch LLM Analysis ─────────────────────────────────────
+
+    # Ước lượng token thô (không cần tokenizer): ~3 ký tự / token cho tiếng Việt
+    _CHARS_PER_TOKEN = 3
+    _BATCH_ITEM_MAX_CHARS = 2000
+    _BATCH_RESULT_TOKENS = 60  # Output tokens per item (score/label/emotions)
+
+    @classmethod
+    def _estimate_tokens(cls, text: str) -> int:
+        return len(text) // cls._CHARS_PER_TOKEN + 8
+
+    def _pack_batches(self, items: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """Chia items thành các batch theo token budget và số item tối đa"""
+        budget = ai_config.sentiment_batch_token_budget
+        max_items = max(1, ai_config.sentiment_batch_max_items)
+
+        batches: List[List[Tuple[int, str]]] = []
+        current: List[Tuple[int, str]] = []
+        used = 0
+        for i, text in items:
+            text = text[:self._BATCH_ITEM_MAX_CHARS]
+            cost = self._estimate_tokens(text)
+            if current and (used + cost > budget or len(current) >= max_items):
+                batches.append(current)
+                current, used = [], 0
+            current.append((i, text))
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _analyze_batch_with_llm(self, batch: List[Tuple[int, str]]) -> List[SentimentResult]:
+        """Một lời gọi LLM cho cả batch; item thiếu / lỗi → rule-based"""
+        items = [{"id": n, "text": text} for n, (_, text) in enumerate(batch)]
+        prompt = f"""Phân tích cảm xúc của từng đoạn text khách hàng trong danh sách JSON sau.
+
+ITEMS:
+{json.dumps(items, ensure_ascii=False)}
+
+Trả lời CHÍNH XÁC một JSON array (không thêm bất kỳ text nào khác), mỗi phần tử ứng với một item:
+[
+  {{
+    "id": <id của item>,
+    "score": <float từ -1.0 đến 1.0>,
+    "label": "<POSITIVE hoặc NEUTRAL hoặc NEGATIVE>",
+    "confidence": <float từ 0.0 đến 1.0>,
+    "emotions": {{"joy": <0-1>, "anger": <0-1>, "sadness": <0-1>, "surprise": <0-1>, "fear": <0-1>}}
+  }}
+]
+
+Quy tắc:
+- score: -1.0 = rất tiêu cực, 0.0 = trung lập, 1.0 = rất tích cực
+- label: POSITIVE (score > 0.2), NEUTRAL (-0.2 <= score <= 0.2), NEGATIVE (score < -0.2)
+- Phân tích từng item độc lập, giữ nguyên id
+"""
+        try:
+            raw = self._call_llm(prompt, max_tokens=self._BATCH_RESULT_TOKENS * len(batch) + 64)
+        except Exception as e:
+            print(f"[SentimentAnalyzer] Batch LLM error, falling back to rules: {e}")
+            raw = None
+        return self._parse_batch_response(raw, [text for _, text in batch])
+
+    def _parse_batch_response(self, raw: Optional[str], texts: List[str]) -> List[SentimentResult]:
+        """Parse JSON array theo id; item nào thiếu / sai format → rule-based"""
+        by_id: Dict[int, Dict[str, Any]] = {}
+        if raw:
+            try:
+                data = json.loads(self._extract_json(raw))
+                if isinstance(data, dict):
+                    data = data.get("results", [])
+                for item in data if isinstance(data, list) else []:
+                    if isinstance(item, dict) and str(item.get("id", "")).isdigit():
+                        by_id[int(item["id"])] = item
+            except (json.JSONDecodeError, ValueError, TypeError) as e:
+                print(f"[SentimentAnalyzer] Batch JSON parse error: {e}, raw: {raw[:200]}")
+
+        results = []
+        for n, text in enumerate(texts):
+            result = None
+            if n in by_id:
+                try:
+                    result = self._result_from_data(by_id[n], text)
+                except (ValueError, TypeError, AttributeError):
+                    result = None
+            results.append(result or self._analyze_rule_based(text))
+        return results
+
     def _parse_llm_response(self, raw: str, original_text: str) -> SentimentResult:
         """Parse JSON response from LLM"""
         try:
-            # Extract JSON from possible markdown code block
-            json_str = raw
-            if "```" in raw:
-                match = re.search(r"```(?:json)?\s*([\s\S]*?)```", raw)
-                if match:
-                    json_str = match.group(1).strip()
-
-            data = json.loads(json_str)
-
-            score = float(data.get("score", 0.0))
-            score = max(-1.0, min(1.0, score))
+            data = json.loads(self._extract_json(raw))
+            return self._result_from_data(data, original_text)
 
-            label_str = data.get("label", "NEUTRAL").upper()
-            try:
-                label = SentimentLabel(label_str)
-            except ValueError:
-                label = self._score_to_label(score)
+        except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+            print(f"[SentimentAnalyzer] JSON parse error: {e}, raw: {raw[:200]}")
+            return self._analyze_rule_based(original_text)
 
-            confidence = float(data.get("confidence", 0.8))
-            confidence = max(0.0, min(1.0, confidence))
+    @staticmethod
+    def _extract_json(raw: str) -> str:
+        """Extract JSON from possible markdown code block"""
+        if "```" in raw:
+            match = re.search(r"```(?:json)?\s*([\s\S]*?)```", raw)
+            if match:
+                return match.group(1).strip()
+        return raw
+
+    def _result_from_data(self, data: Dict[str, Any], original_text: str) -> SentimentResult:
+        """Build SentimentResult from one parsed LLM JSON object"""
+        score = float(data.get("score", 0.0))
+        score = max(-1.0, min(1.0, score))
+
+        label_str = data.get("label", "NEUTRAL").upper()
+        try:
+            label = SentimentLabel(label_str)
+        except ValueError:
+            label = self._score_to_label(score)
 
-            emotions = {}
-            raw_emotions = data.get("emotions", {})
-            for key in ["joy", "anger", "sadness", "surprise", "fear"]:
-                val = raw_emotions.get(key, 0.0)
-                emotions[key] = max(0.0, min(1.0, float(val)))
+        confidence = float(data.get("confidence", 0.8))
+        confidence = max(0.0, min(1.0, confidence))
 
-            return SentimentResult(
-                score=score,
-                label=label,
-                confidence=confidence,
-                emotions=emotions,
-                provider=self.llm_provider or "llm",
-                text_preview=original_text[:100]
-            )
+        emotions = {}
+        raw_emotions = data.get("emotions", {})
+        for key in ["joy", "anger", "sadness", "surprise", "fear"]:
+            val = raw_emotions.get(key, 0.0)
+            emotions[key] = max(0.0, min(1.0, float(val)))
 
-        except (json.JSONDecodeError, ValueError, TypeError) as e:
-            print(f"[SentimentAnalyzer] JSON parse error: {e}, raw: {raw[:200]}")
-            return self._analyze_rule_based(original_text)
+        return SentimentResult(
+            score=score,
+            label=label,
+            confidence=confidence,
+            emotions=emotions,
+            provider=self.llm_provider or "llm",
+            text_preview=original_text[:100]
+        )
 
     # ─── Rule-based Analysis ─────────────────────────────────────
 
     def _analyze_rule_based(self, text: str) -> SentimentResult:
         """
         Rule-based sentiment analysis (offline fallback).
-        Sử dụng lexicon tiếng Việt + English keywords.
+        Sử dụng lexicon tiếng Việt + English keywords (compiled, xem rule_engine.py).
         """
-        text_lower = text.lower()
-        words = re.findall(r'\w+', text_lower)
-
-        pos_count = 0
-        neg_count = 0
-        has_negator = False
-        intensifier_boost = 1.0
-
-        # Check for negation in sentence
-        for negator in self._NEGATORS:
-            if negator in text_lower:
-                has_negator = True
-                break
-
-        # Check for intensifiers
-        for intensifier in self._INTENSIFIERS:
-            if intensifier in text_lower:
-                intensifier_boost = 1.3
-                break
-
-        # Count positive keywords
-        for kw in self._POSITIVE_KEYWORDS:
-            if kw in text_lower:
-                pos_count += 1
-
-        # Count negative keywords
-        for kw in self._NEGATIVE_KEYWORDS:
-            if kw in text_lower:
-                neg_count += 1
-
-        # If negator present, swap polarity
-        if has_negator:
-            pos_count, neg_count = neg_count, pos_count
-
-        # Calculate score
-        total = pos_count + neg_count
-        if total == 0:
-            score = 0.0
-            confidence = 0.4
-        else:
-            raw_score = (pos_count - neg_count) / total
-            score = max(-1.0, min(1.0, raw_score * intensifier_boost))
-            confidence = min(0.9, 0.5 + (total * 0.05))
+        return self._analyze_rule_based_batch([text])[0]
+
+    def _analyze_rule_based_batch(self, texts: List[str]) -> List[SentimentResult]:
+        """Rule-based cho nhiều text: một lượt quét mỗi text, score tính trên array"""
+        scores, confidences, _ = self._rule_engine.score_batch(texts)
+        labels = self._rule_engine.labels(scores)
+        return [
+            SentimentResult(
+                score=float(score),
+                label=_LABELS[int(label)],
+                confidence=float(confidence),
+                emotions=self._estimate_emotions(float(score), text),
+                provider="rule_based",
+                text_preview=text[:100]
+            )
+            for text, score, confidence, label in zip(texts, scores, confidences, labels)
+        ]
 
-        # Emotions estimation
-        emotions = {
+    @staticmethod
+    def _estimate_emotions(score: float, text: str) -> Dict[str, float]:
+        """Emotions estimation from the rule-based score"""
+        return {
             "joy": max(0.0, score) * 0.8 if score > 0 else 0.0,
             "anger": abs(min(0.0, score)) * 0.6 if score < -0.3 else 0.0,
             "sadness": abs(min(0.0, score)) * 0.4 if score < -0.1 else 0.0,
@@ -501,44 +714,29 @@ Quy tắc:
             "fear": 0.0
         }
 
-        return SentimentResult(
-            score=round(score, 4),
-            label=self._score_to_label(score),
-            confidence=round(confidence, 4),
-            emotions=emotions,
-            provider="rule_based",
-            text_preview=text[:100]
-        )
-
     # ─── Helpers ─────────────────────────────────────────────────
 
     @staticmethod
     def _score_to_label(score: float) -> SentimentLabel:
         """Convert score to label"""
-        if score > 0.2:
+        if score > LABEL_THRESHOLD:
             return SentimentLabel.POSITIVE
-        elif score < -0.2:
+        elif score < -LABEL_THRESHOLD:
             return SentimentLabel.NEGATIVE
         return SentimentLabel.NEUTRAL
 
-    @staticmethod
-    def _detect_trend(scores: List[float]) -> str:
-        """
-        Detect sentiment trend from ordered scores.
 
-        Returns: 'improving', 'declining', 'stable'
-        """
-        if len(scores) < 2:
-            return "stable"
-
-        # Compare first half vs second half
-        mid = len(scores) // 2
-        first_half = sum(scores[:mid]) / mid if mid > 0 else 0
-        second_half = sum(scores[mid:]) / (len(scores) - mid) if (len(scores) - mid) > 0 else 0
-
-        diff = second_half - first_half
-        if diff > 0.15:
-            return "improving"
-        elif diff < -0.15:
-            return "declining"
-        return "stable"
+# ─── Shared instance ─────────────────────────────────────────────
+
+_analyzer: Optional[SentimentAnalyzer] = None
+_analyzer_lock = threading.Lock()
+
+
+def get_sentiment_analyzer() -> SentimentAnalyzer:
+    """Analyzer dùng chung trong process cho write path (ticket / chat message)"""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = SentimentAnalyzer()
+    return _analyzer
@@ -0,0 +1,204 @@
+"""
+Sentiment Backfill - Chấm lại điểm cảm xúc cho dữ liệu ticket cũ
+
+Ticket cũ chỉ có điểm thô từ keyword mock, tin nhắn chưa có điểm. Job chạy
+hai pha trên Support DB:
+1. messages: quét tin nhắn khách trong ticket_messages theo keyset
+   (id > last_id), chấm điểm bằng SentimentAnalyzer.batch_analyze (batch LLM
+   song song / rule engine + cache), ghi lại bằng bulk UPDATE theo primary key
+2. tickets: dựng lại aggregate (count, mean, EWMA) của từng ticket từ điểm
+   tin nhắn khách, bulk UPDATE
+
+Mỗi batch commit xong là ghi checkpoint (JSON) → dừng giữa chừng thì chạy lại
+sẽ tiếp tục từ batch kế tiếp. max_rows_per_second giới hạn tốc độ để không
+chiếm tài nguyên của traffic production.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from itertools import groupby
+from pathlib import Path
+import json
+import os
+import time
+
+from ai_modules.sentiment.incremental import SentimentAggregate
+
+PHASE_MESSAGES = "messages"
+PHASE_TICKETS = "tickets"
+PHASE_DONE = "done"
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class BackfillCheckpoint:
+    """Trạng thái job trong một file JSON (ghi atomic)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        return json.loads(self.path.read_text(encoding="utf-8"))
+
+    def save(self, state: Dict[str, Any]):
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+class SentimentBackfill:
+    """
+    Checkpointed bulk re-scoring job.
+
+    Usage:
+        job = SentimentBackfill(checkpoint=BackfillCheckpoint("backfill.json"), max_rows_per_second=200)
+        job.run()                 # chạy hết (hoặc tiếp tục từ checkpoint)
+        job.run(max_batches=100)  # chạy tối đa 100 batch rồi dừng, lần sau chạy tiếp
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable] = None,
+        analyzer=None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: Optional[int] = None,
+        max_rows_per_second: Optional[float] = None,
+        only_missing: bool = False,
+        checkpoint: Optional[BackfillCheckpoint] = None
+    ):
+        self.session_factory = session_factory
+        self._analyzer = analyzer
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_rows_per_second = max_rows_per_second
+        self.only_missing = only_missing
+        self.checkpoint = checkpoint
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            from ai_modules.sentiment.analyzer import get_sentiment_analyzer
+            self._analyzer = get_sentiment_analyzer()
+        return self._analyzer
+
+    def _session(self):
+        if self.session_factory is not None:
+            return self.session_factory()
+        from backend.database.session import SupportSession
+        return SupportSession()
+
+    def run(self, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Chạy (tiếp) job. Trả về state hiện tại:
+        phase, last_id, messages, tickets (số row đã ghi), batches
+        """
+        state = self.checkpoint.load() if self.checkpoint else {}
+        state.setdefault("phase", PHASE_MESSAGES)
+        state.setdefault("last_id", None)
+        state.setdefault("messages", 0)
+        state.setdefault("tickets", 0)
+        batches = 0
+
+        db = self._session()
+        try:
+            while state["phase"] != PHASE_DONE:
+                if max_batches is not None and batches >= max_batches:
+                    break
+                started = time.monotonic()
+                if state["phase"] == PHASE_MESSAGES:
+                    last_id, written = self._score_messages(db, state["last_id"])
+                    state["messages"] += written
+                else:
+                    last_id, written = self._rebuild_tickets(db, state["last_id"])
+                    state["tickets"] += written
+
+                if last_id is None:
+                    state["phase"] = PHASE_TICKETS if state["phase"] == PHASE_MESSAGES else PHASE_DONE
+                    state["last_id"] = None
+                else:
+                    state["last_id"] = last_id
+                    batches += 1
+                if self.checkpoint:
+                    self.checkpoint.save(state)
+                if last_id is not None:
+                    print(
+                        f"[SentimentBackfill] {state['phase']}: "
+                        f"messages={state['messages']} tickets={state['tickets']}"
+                    )
+                    self._throttle(written, started)
+        finally:
+            db.close()
+
+        return {**state, "batches": batches}
+
+    # ─── Phases ──────────────────────────────────────────────────
+
+    def _score_messages(self, db, last_id: Optional[str]):
+        """Một batch tin nhắn: (last_id mới | None khi hết, số row đã ghi)"""
+        from sqlalchemy import update
+        from backend.models.ticket import TicketMessage
+
+        # Chỉ tin nhắn khách (staff / AI không được chấm, xem score_ticket_message)
+        query = db.query(TicketMessage.id, TicketMessage.message).filter(TicketMessage.is_staff == False)
+        if last_id is not None:
+            query = query.filter(TicketMessage.id > last_id)
+        if self.only_missing:
+            query = query.filter(TicketMessage.sentiment_score.is_(None))
+        rows = query.order_by(TicketMessage.id).limit(self.batch_size).all()
+        if not rows:
+            return None, 0
+
+        results = self.analyzer.batch_analyze(
+            [row.message or "" for row in rows], max_concurrency=self.workers
+        )
+        db.execute(update(TicketMessage), [
+            {"id": row.id, "sentiment_score": result.score, "sentiment_label": result.label.value}
+            for row, result in zip(rows, results)
+        ])
+        db.commit()
+        return rows[-1].id, len(rows)
+
+    def _rebuild_tickets(self, db, last_id: Optional[str]):
+        """Một batch ticket: aggregate dựng lại từ điểm tin nhắn khách"""
+        from sqlalchemy import update
+        from backend.models.ticket import Ticket, TicketMessage
+
+        query = db.query(Ticket.id)
+        if last_id is not None:
+            query = query.filter(Ticket.id > last_id)
+        ticket_ids = [row.id for row in query.order_by(Ticket.id).limit(self.batch_size).all()]
+        if not ticket_ids:
+            return None, 0
+
+        scores = db.query(TicketMessage.ticket_id, TicketMessage.sentiment_score).filter(
+            TicketMessage.ticket_id.in_(ticket_ids),
+            TicketMessage.is_staff == False,
+            TicketMessage.sentiment_score.isnot(None)
+        ).order_by(TicketMessage.ticket_id, TicketMessage.created_at).all()
+
+        updates: List[Dict[str, Any]] = []
+        for ticket_id, rows in groupby(scores, key=lambda row: row.ticket_id):
+            aggregate = SentimentAggregate.from_scores(row.sentiment_score for row in rows)
+            updates.append({
+                "id": ticket_id,
+                "sentiment_count": aggregate.count,
+                "sentiment_score": aggregate.mean,
+                "sentiment_ewma": aggregate.ewma,
+                "sentiment_label": aggregate.label
+            })
+        # Ticket không có tin nhắn khách (vd. tạo từ OperationsAgent) giữ nguyên aggregate
+        if updates:
+            db.execute(update(Ticket), updates)
+        db.commit()
+        return ticket_ids[-1], len(updates)
+
+    def _throttle(self, rows: int, started: float):
+        if not self.max_rows_per_second or not rows:
+            return
+        remaining = rows / self.max_rows_per_second - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
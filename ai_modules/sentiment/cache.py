@@ -0,0 +1,224 @@
+"""
+Sentiment Cache - Cache kết quả sentiment theo nội dung text
+
+Các tin nhắn ngắn lặp lại ("ok", "cảm ơn", "giao hàng chậm quá") không cần
+gọi LLM lần nữa. Key = sha256(model_version + text đã chuẩn hóa) nên đổi
+provider / model / prompt là tự động tách cache.
+
+Tiers:
+- Memory: LRU + TTL trong process (TTLCache)
+- SQL: bảng sentiment_cache trong Analytics DB, dùng chung mọi worker
+
+Chỉ cache kết quả của LLM (không cache rule-based fallback) để kết quả
+không đổi so với khi gọi LLM trực tiếp.
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from ai_modules.core.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_SIZE = 20000
+DEFAULT_MEMORY_TTL_SECONDS = 24 * 3600
+
+try:
+    from prometheus_client import Counter
+    SENTIMENT_CACHE_LOOKUPS = Counter(
+        "crm_ai_sentiment_cache_lookups_total",
+        "Sentiment cache lookups by tier (memory / sql / miss)",
+        ["tier"]
+    )
+except ImportError:  # prometheus-client is optional
+    SENTIMENT_CACHE_LOOKUPS = None
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase + gộp khoảng trắng (giữ dấu / emoji vì ảnh hưởng cảm xúc)"""
+    return " ".join((text or "").lower().split())
+
+
+def cache_key(text: str, model_version: str) -> str:
+    return hashlib.sha256(f"{model_version}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class SQLSentimentStore:
+    """Persistent tier: bảng sentiment_cache (text_hash → result JSON)"""
+
+    def __init__(self, engine):
+        from sqlalchemy import MetaData, Table, Column, String, Text, DateTime
+
+        self.engine = engine
+        metadata = MetaData()
+        self.table = Table(
+            "sentiment_cache", metadata,
+            Column("text_hash", String(64), primary_key=True),
+            Column("model_version", String(64), nullable=False),
+            Column("result", Text, nullable=False),
+            Column("created_at", DateTime, nullable=False),
+        )
+        metadata.create_all(self.engine, checkfirst=True)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not keys:
+            return {}
+        from sqlalchemy import select
+        t = self.table
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(t.c.text_hash, t.c.result).where(t.c.text_hash.in_(keys))).all()
+        return {row.text_hash: json.loads(row.result) for row in rows}
+
+    def _insert_ignore(self, dialect: str):
+        """INSERT bỏ qua key đã có - một câu lệnh, an toàn khi nhiều worker ghi cùng key"""
+        t = self.table
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(t)
+            # Key theo nội dung nên kết quả trùng nhau: update no-op
+            return stmt.on_duplicate_key_update(text_hash=stmt.inserted.text_hash)
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+            return insert(t).on_conflict_do_nothing(index_elements=[t.c.text_hash])
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+            return insert(t).on_conflict_do_nothing(index_elements=[t.c.text_hash])
+        raise ValueError(f"Sentiment cache upsert not supported for dialect: {dialect}")
+
+    def put_many(self, model_version: str, entries: Dict[str, Dict[str, Any]]):
+        if not entries:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {
+                "text_hash": key,
+                "model_version": model_version,
+                "result": json.dumps(result, ensure_ascii=False),
+                "created_at": now
+            }
+            for key, result in entries.items()
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(self._insert_ignore(conn.dialect.name), rows)
+
+
+class SentimentCache:
+    """
+    Two-tier content-addressed cache.
+
+    Usage:
+        cached = cache.get_many(texts, "openai:gpt-4o-mini:v1")   # [dict | None, ...]
+        cache.put_many(texts_missed, "openai:gpt-4o-mini:v1", results)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_MEMORY_SIZE,
+        ttl_seconds: float = DEFAULT_MEMORY_TTL_SECONDS,
+        store: Optional[SQLSentimentStore] = None
+    ):
+        self.memory = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self.store = store
+        self.memory_hits = 0
+        self.sql_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, tier: str, n: int):
+        if not n:
+            return
+        with self._lock:
+            if tier == "memory":
+                self.memory_hits += n
+            elif tier == "sql":
+                self.sql_hits += n
+            else:
+                self.misses += n
+        if SENTIMENT_CACHE_LOOKUPS is not None:
+            SENTIMENT_CACHE_LOOKUPS.labels(tier=tier).inc(n)
+
+    def get_many(self, texts: List[str], model_version: str) -> List[Optional[Dict[str, Any]]]:
+        """Kết quả đã cache theo thứ tự texts (None = miss)"""
+        keys = [cache_key(text, model_version) for text in texts]
+        found: List[Optional[Dict[str, Any]]] = [self.memory.get(key, record=False) for key in keys]
+        self._count("memory", sum(1 for f in found if f is not None))
+
+        missing = list({key for key, f in zip(keys, found) if f is None})
+        if missing and self.store is not None:
+            try:
+                from_sql = self.store.get_many(missing)
+            except Exception as e:
+                logger.warning(f"[SentimentCache] SQL lookup failed: {e}")
+                from_sql = {}
+            for key, result in from_sql.items():
+                self.memory.set(key, result)
+            sql_hits = 0
+            for i, key in enumerate(keys):
+                if found[i] is None and key in from_sql:
+                    found[i] = from_sql[key]
+                    sql_hits += 1
+            self._count("sql", sql_hits)
+
+        self._count("miss", sum(1 for f in found if f is None))
+        return found
+
+    def put_many(self, texts: List[str], model_version: str, results: List[Dict[str, Any]]):
+        entries = {cache_key(text, model_version): result for text, result in zip(texts, results)}
+        for key, result in entries.items():
+            self.memory.set(key, result)
+        if self.store is not None:
+            try:
+                self.store.put_many(model_version, entries)
+            except Exception as e:
+                logger.warning(f"[SentimentCache] SQL write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.sql_hits
+        total = hits + self.misses
+        return {
+            "memory_size": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "sql_hits": self.sql_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_cache: Optional[SentimentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_sentiment_cache() -> SentimentCache:
+    """
+    Process-wide cache theo env SENTIMENT_CACHE_STORE:
+    - không đặt / "analytics": memory + bảng sentiment_cache trong Analytics DB
+    - "memory": chỉ memory
+    - SQLAlchemy URL (sqlite:///..., mysql+pymysql://...): memory + DB đó
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                target = os.getenv("SENTIMENT_CACHE_STORE", "analytics")
+                store = None
+                if target != "memory":
+                    try:
+                        if target == "analytics":
+                            from backend.database.session import analytics_engine as engine
+                        else:
+                            from sqlalchemy import create_engine
+                            engine = create_engine(target, pool_pre_ping=True)
+                        store = SQLSentimentStore(engine)
+                    except Exception as e:
+                        logger.warning(f"[SentimentCache] SQL store unavailable ({e}), using memory only")
+                _cache = SentimentCache(
+                    maxsize=int(os.getenv("SENTIMENT_CACHE_SIZE", str(DEFAULT_MEMORY_SIZE))),
+                    store=store
+                )
+    return _cache
@@ -0,0 +1,89 @@
+"""
+Incremental Sentiment - Aggregate cảm xúc cập nhật O(1) mỗi tin nhắn
+
+Mỗi TicketMessage / ConversationMessage được chấm điểm một lần khi ghi và
+lưu điểm trên row. Ticket / Conversation giữ aggregate chạy:
+- sentiment_count: số tin nhắn khách đã chấm
+- sentiment_score: trung bình chạy (running mean)
+- sentiment_ewma: trung bình trượt hàm mũ (nhấn mạnh tin nhắn gần đây)
+
+Trend = ewma so với mean: ewma cao hơn rõ rệt → khách đang dịu lại (improving),
+thấp hơn rõ rệt → đang bức xúc thêm (declining).
+"""
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+from ai_modules.sentiment.rule_engine import LABEL_THRESHOLD
+
+EWMA_ALPHA = 0.3
+TREND_THRESHOLD = 0.15
+
+
+@dataclass
+class SentimentAggregate:
+    """Running mean + EWMA của điểm cảm xúc"""
+    count: int = 0
+    mean: float = 0.0
+    ewma: float = 0.0
+
+    def update(self, score: float) -> "SentimentAggregate":
+        """Thêm một điểm mới (O(1))"""
+        self.count += 1
+        self.mean += (score - self.mean) / self.count
+        # alpha = 2/(n+1) lúc đầu (ewma luôn nghiêng về tin mới hơn mean), sàn EWMA_ALPHA
+        alpha = max(EWMA_ALPHA, 2.0 / (self.count + 1))
+        self.ewma += alpha * (score - self.ewma)
+        return self
+
+    @property
+    def trend(self) -> str:
+        """'improving', 'declining', 'stable'"""
+        if self.count < 2:
+            return "stable"
+        diff = self.ewma - self.mean
+        if diff > TREND_THRESHOLD:
+            return "improving"
+        if diff < -TREND_THRESHOLD:
+            return "declining"
+        return "stable"
+
+    @property
+    def label(self) -> str:
+        if self.mean > LABEL_THRESHOLD:
+            return "POSITIVE"
+        if self.mean < -LABEL_THRESHOLD:
+            return "NEGATIVE"
+        return "NEUTRAL"
+
+    @classmethod
+    def from_scores(cls, scores: Iterable[float]) -> "SentimentAggregate":
+        aggregate = cls()
+        for score in scores:
+            aggregate.update(score)
+        return aggregate
+
+    @classmethod
+    def from_row(cls, row: Any) -> "SentimentAggregate":
+        """Đọc aggregate đã lưu trên Ticket / Conversation"""
+        count = getattr(row, "sentiment_count", None) or 0
+        if not count:
+            return cls()
+        mean = float(getattr(row, "sentiment_score", None) or 0.0)
+        ewma = getattr(row, "sentiment_ewma", None)
+        return cls(count=count, mean=mean, ewma=float(mean if ewma is None else ewma))
+
+    def apply_to(self, row: Any):
+        """Ghi aggregate lên Ticket / Conversation"""
+        row.sentiment_count = self.count
+        row.sentiment_score = self.mean
+        row.sentiment_ewma = self.ewma
+        row.sentiment_label = self.label
+
+    def to_dict(self) -> dict:
+        return {
+            "score": round(self.mean, 4),
+            "ewma": round(self.ewma, 4),
+            "label": self.label,
+            "count": self.count,
+            "trend": self.trend
+        }
@@ -0,0 +1,122 @@
+"""
+Rule Engine - Chấm điểm cảm xúc rule-based đã compile sẵn
+
+Các lexicon (positive / negative / negator / intensifier) được compile một lần
+thành một Aho–Corasick automaton. Mỗi text chỉ quét một lượt; cụm dài thắng
+từ ngắn ("không hài lòng" là một cụm negative, không phải negator + positive).
+
+- Phủ định có phạm vi: negator chỉ đảo dấu từ cảm xúc kế tiếp, trong cùng
+  mệnh đề và cách tối đa NEGATION_WINDOW từ
+- Intensifier cũng chỉ tăng trọng số từ cảm xúc kế tiếp trong phạm vi đó
+- score_batch(): quét từng text rồi tính score / confidence / label trên numpy array
+"""
+from typing import Iterable, List, Optional, Tuple
+import re
+
+import numpy as np
+
+from ai_modules.core.keyword_matcher import KeywordMatcher
+
+POSITIVE = "positive"
+NEGATIVE = "negative"
+NEGATOR = "negator"
+INTENSIFIER = "intensifier"
+
+NEGATION_WINDOW = 3      # số từ tối đa giữa negator và từ cảm xúc
+INTENSIFIER_WEIGHT = 1.3
+LABEL_THRESHOLD = 0.2
+
+_WORD = re.compile(r"\w+")
+_CLAUSE_BREAK = re.compile(r"[,.;:!?\n]")
+
+
+class RuleSentimentEngine:
+    """
+    Compiled lexicon scorer.
+
+    Usage:
+        engine = RuleSentimentEngine(positive, negative, negators, intensifiers)
+        score, confidence, hits = engine.score("không tốt lắm")   # (-1.0, 0.55, 1)
+        scores, confidences, hits = engine.score_batch(texts)     # numpy arrays
+    """
+
+    def __init__(
+        self,
+        positive: Iterable[str],
+        negative: Iterable[str],
+        negators: Iterable[str],
+        intensifiers: Iterable[str]
+    ):
+        # Thứ tự label = ưu tiên khi cùng độ dài: cụm cảm xúc trước bổ ngữ
+        self._matcher = KeywordMatcher({
+            NEGATIVE: negative,
+            POSITIVE: positive,
+            NEGATOR: negators,
+            INTENSIFIER: intensifiers,
+        })
+
+    @staticmethod
+    def _in_scope(text: str, end: Optional[int], start: int) -> bool:
+        """Modifier kết thúc tại end có áp dụng cho từ bắt đầu tại start không"""
+        if end is None:
+            return False
+        gap = text[end:start]
+        return not _CLAUSE_BREAK.search(gap) and len(_WORD.findall(gap)) < NEGATION_WINDOW
+
+    def polarity(self, text: str) -> Tuple[float, int]:
+        """
+        (tổng trọng số có dấu, số từ cảm xúc) của một text.
+        Mỗi negator / intensifier chỉ tác động lên từ cảm xúc ngay sau nó.
+        """
+        text = text.lower()
+        total = 0.0
+        hits = 0
+        negator_end: Optional[int] = None
+        intensifier_end: Optional[int] = None
+
+        for m in self._matcher.select(self._matcher.find_all(text)):
+            if m.label == NEGATOR:
+                negator_end = m.end
+                continue
+            if m.label == INTENSIFIER:
+                intensifier_end = m.end
+                continue
+
+            sign = 1.0 if m.label == POSITIVE else -1.0
+            if self._in_scope(text, negator_end, m.start):
+                sign = -sign
+            weight = INTENSIFIER_WEIGHT if self._in_scope(text, intensifier_end, m.start) else 1.0
+            total += sign * weight
+            hits += 1
+            negator_end = intensifier_end = None
+
+        return total, hits
+
+    def score(self, text: str) -> Tuple[float, float, int]:
+        """(score, confidence, hits) cho một text"""
+        scores, confidences, hits = self.score_batch([text])
+        return float(scores[0]), float(confidences[0]), int(hits[0])
+
+    def score_batch(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Chấm điểm nhiều text một lần.
+
+        Returns:
+            (scores [-1, 1], confidences, hits) — numpy arrays cùng độ dài texts
+        """
+        n = len(texts)
+        totals = np.zeros(n, dtype=np.float64)
+        hits = np.zeros(n, dtype=np.int64)
+        for i, text in enumerate(texts):
+            if text:
+                totals[i], hits[i] = self.polarity(text)
+
+        safe_hits = np.maximum(hits, 1)
+        scores = np.where(hits > 0, np.clip(totals / safe_hits, -1.0, 1.0), 0.0)
+        confidences = np.where(hits > 0, np.minimum(0.9, 0.5 + hits * 0.05), 0.4)
+        return np.round(scores, 4), np.round(confidences, 4), hits
+
+    @staticmethod
+    def labels(scores: np.ndarray) -> np.ndarray:
+        """Score → 1 (POSITIVE) / 0 (NEUTRAL) / -1 (NEGATIVE)"""
+        return np.where(scores > LABEL_THRESHOLD, 1, np.where(scores < -LABEL_THRESHOLD, -1, 0))
@@ -1,25 +1,63 @@
 """
 Ticket Deduplication Service
 Detects and merges duplicate support tickets
+
+Batch scan (auto_detect_duplicates): MinHash signature per ticket (persisted in
+ticket_signatures) + LSH banding → candidate pairs in near-linear time; exact
+similarity (SequenceMatcher) is only computed for candidates.
+
+mode="semantic": sentence embeddings + ANN search (TicketEmbeddingIndex) to catch
+paraphrased duplicates that character similarity misses.
 """
 from sqlalchemy.orm import Session
-from backend.models.ticket import Ticket, TicketMessage
-from typing import List, Tuple, Optional
+from backend.models.ticket import Ticket, TicketMessage, TicketSignature, TicketSignatureBand
+from backend.services.ticket_messages import IN_CLAUSE_CHUNK, first_messages
+from ai_modules.core.minhash import MinHasher, LSHIndex
+from ai_modules.core.request_scope import RequestScoped
+from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
 import difflib
 
+import numpy as np
+
+OPEN_STATUSES = ["OPEN", "IN_PROGRESS"]
+
+MODE_LEXICAL = "lexical"
+MODE_SEMANTIC = "semantic"
+
+# Online check at creation: estimated Jaccard of 3-char shingles
+ONLINE_DUPLICATE_THRESHOLD = 0.6
+ONLINE_WINDOW_HOURS = 72
+
 
 class TicketDeduplicationService:
     """Service for detecting and merging duplicate tickets"""
     
-    def __init__(self, db: Session):
+    # Support DB session; bound per call when the service is shared by a pooled agent
+    db = RequestScoped("db")
+    
+    # Stateless and deterministic → shared by all instances
+    hasher = MinHasher()
+    lsh = LSHIndex(num_perm=hasher.num_perm)
+    
+    def __init__(self, db: Session, embedding_index=None):
         self.db = db
+        self._embedding_index = embedding_index
+    
+    @property
+    def embedding_index(self):
+        """Semantic index (lazy: the embedding model only loads when semantic mode is used)"""
+        if self._embedding_index is None:
+            from ai_modules.ticket_embeddings import get_ticket_embedding_index
+            self._embedding_index = get_ticket_embedding_index()
+        return self._embedding_index
     
     def find_similar_tickets(
         self,
         ticket_id: str,
         similarity_threshold: float = 0.7,
-        time_window_hours: int = 72
+        time_window_hours: int = 72,
+        mode: str = MODE_LEXICAL
     ) -> List[Tuple[Ticket, float]]:
         """
         Find tickets similar to the given ticket
@@ -28,6 +66,7 @@ class TicketDeduplicationService:
             ticket_id: ID of the ticket to compare against
             similarity_threshold: Minimum similarity score (0.0-1.0)
             time_window_hours: Only check tickets within this time window
+            mode: "lexical" (SequenceMatcher) or "semantic" (embedding cosine)
             
         Returns:
             List of (Ticket, similarity_score) tuples
@@ -46,16 +85,21 @@ class TicketDeduplicationService:
             Ticket.id != ticket_id,
             Ticket.customer_id == target_ticket.customer_id,
             Ticket.created_at >= cutoff_time,
-            Ticket.status.in_(["OPEN", "IN_PROGRESS"])
+            Ticket.status.in_(OPEN_STATUSES)
         ).all()
         
-        # Calculate similarity scores
+        if mode == MODE_SEMANTIC:
+            return self._find_similar_semantic(target_ticket, candidates, similarity_threshold)
+        
+        # Calculate similarity scores (first messages loaded in one query)
         similar_tickets = []
-        target_content = self._get_ticket_content(target_ticket)
+        contents = self._load_contents([target_ticket] + candidates)
+        target_content = contents[target_ticket.id]
         
         for candidate in candidates:
-            candidate_content = self._get_ticket_content(candidate)
-            similarity = self._calculate_similarity(target_content, candidate_content)
+            similarity = self._calculate_similarity(
+                target_content, contents[candidate.id], similarity_threshold
+            )
             
             if similarity >= similarity_threshold:
                 similar_tickets.append((candidate, similarity))
@@ -65,6 +109,152 @@ class TicketDeduplicationService:
         
         return similar_tickets
     
+    def check_new_ticket(
+        self,
+        ticket: Ticket,
+        first_message: Optional[str],
+        similarity_threshold: float = ONLINE_DUPLICATE_THRESHOLD,
+        time_window_hours: int = ONLINE_WINDOW_HOURS
+    ) -> Optional[Tuple[str, float]]:
+        """
+        Duplicate check while a ticket is being created (ticket must be flushed)
+        
+        Computes the MinHash signature, looks up open tickets of the same customer
+        within the window that share an LSH band (one indexed query on
+        ticket_signature_bands), stores the new signature + bands and sets
+        ticket.possible_duplicate_of. Caller commits.
+        
+        Returns:
+            (ticket_id, estimated_similarity) of the best match, or None
+        """
+        signature = self.hasher.signature(
+            self._compose_content(ticket.subject, getattr(ticket, "description", None), first_message)
+        )
+        band_hashes = self.lsh.band_hashes(signature, salt=self.hasher.scheme)
+        cutoff_time = datetime.utcnow() - timedelta(hours=time_window_hours)
+        
+        best: Optional[Tuple[str, float]] = None
+        savepoint = None
+        try:
+            # SAVEPOINT: a failure here rolls back only the signature rows, not the new ticket
+            savepoint = self.db.begin_nested()
+            rows = self.db.query(TicketSignature.ticket_id, TicketSignature.signature).join(
+                TicketSignatureBand, TicketSignatureBand.ticket_id == TicketSignature.ticket_id
+            ).join(
+                Ticket, Ticket.id == TicketSignature.ticket_id
+            ).filter(
+                TicketSignatureBand.customer_id == ticket.customer_id,
+                TicketSignatureBand.band_hash.in_(band_hashes),
+                TicketSignature.scheme == self.hasher.scheme,
+                TicketSignature.ticket_id != ticket.id,
+                Ticket.status.in_(OPEN_STATUSES),
+                Ticket.created_at >= cutoff_time
+            ).all()
+            
+            # One row per shared band → the same ticket may appear several times
+            for row in {row.ticket_id: row for row in rows}.values():
+                similarity = MinHasher.similarity(signature, MinHasher.from_bytes(row.signature))
+                if similarity >= similarity_threshold and (best is None or similarity > best[1]):
+                    best = (row.ticket_id, similarity)
+            
+            self._store_signature(ticket.id, ticket.customer_id, signature, band_hashes)
+            savepoint.commit()
+        except Exception as e:
+            # Duplicate hint must never block ticket creation
+            print(f"[TicketDeduplication] Online duplicate check skipped: {e}")
+            if savepoint is not None and savepoint.is_active:
+                savepoint.rollback()
+            return None
+        
+        if best:
+            ticket.possible_duplicate_of = best[0]
+        return best
+    
+    def _store_signature(
+        self,
+        ticket_id: str,
+        customer_id: str,
+        signature: np.ndarray,
+        band_hashes: Optional[List[int]] = None
+    ):
+        """Signature row + one band row per LSH band (caller commits)"""
+        if band_hashes is None:
+            band_hashes = self.lsh.band_hashes(signature, salt=self.hasher.scheme)
+        self.db.merge(TicketSignature(
+            ticket_id=ticket_id,
+            customer_id=customer_id,
+            scheme=self.hasher.scheme,
+            signature=MinHasher.to_bytes(signature)
+        ))
+        self.db.query(TicketSignatureBand).filter(
+            TicketSignatureBand.ticket_id == ticket_id
+        ).delete(synchronize_session=False)
+        self.db.add_all([
+            TicketSignatureBand(ticket_id=ticket_id, band_hash=band_hash, customer_id=customer_id)
+            for band_hash in set(band_hashes)
+        ])
+    
+    def _find_similar_semantic(
+        self,
+        target_ticket: Ticket,
+        candidates: List[Ticket],
+        similarity_threshold: float
+    ) -> List[Tuple[Ticket, float]]:
+        """Nearest neighbours of the target among the candidate tickets"""
+        if not candidates:
+            return []
+        by_id = {c.id: c for c in candidates}
+        neighbours = self._semantic_neighbours(
+            [target_ticket] + candidates, similarity_threshold, top_k=len(candidates)
+        )
+        similar_tickets = [
+            (by_id[other_id], similarity)
+            for other_id, similarity in neighbours.get(target_ticket.id, [])
+            if other_id in by_id
+        ]
+        similar_tickets.sort(key=lambda x: x[1], reverse=True)
+        return similar_tickets
+    
+    def _semantic_neighbours(
+        self,
+        tickets: List,
+        similarity_threshold: float,
+        top_k: Optional[int] = None
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Embedding neighbours of each ticket among the given tickets of the same
+        customer. Tickets missing from the index are embedded once in a batch;
+        one ANN query per customer. Without top_k the query covers all of the
+        customer's given tickets, so callers filtering afterwards (time window)
+        never lose neighbours to a fixed cap.
+        """
+        index = self.embedding_index
+        by_id = {t.id: t for t in tickets}
+        missing = index.missing(list(by_id))
+        if missing:
+            contents = self._load_contents([by_id[ticket_id] for ticket_id in missing])
+            index.upsert([
+                {"id": ticket_id, "customer_id": by_id[ticket_id].customer_id, "text": contents[ticket_id]}
+                for ticket_id in missing
+            ])
+        
+        vectors = index.embeddings(list(by_id))
+        by_customer: Dict[str, Dict[str, List[float]]] = {}
+        for ticket_id, vector in vectors.items():
+            by_customer.setdefault(by_id[ticket_id].customer_id, {})[ticket_id] = vector
+        
+        neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        for customer_id, customer_vectors in by_customer.items():
+            among = [ticket_id for ticket_id in by_id if by_id[ticket_id].customer_id == customer_id]
+            neighbours.update(index.neighbours(
+                customer_vectors,
+                customer_id=customer_id,
+                among=among,
+                top_k=top_k or len(among),
+                threshold=similarity_threshold
+            ))
+        return neighbours
+    
     def merge_tickets(
         self,
         primary_ticket_id: str,
@@ -129,26 +319,47 @@ class TicketDeduplicationService:
         self.db.commit()
         self.db.refresh(primary_ticket)
         
+        # Merged tickets are closed → no longer duplicate candidates
+        try:
+            self.embedding_index.remove([dup_id for dup_id in duplicate_ticket_ids if dup_id != primary_ticket_id])
+        except Exception as e:
+            # Index cleanup should not fail the merge; prune_embeddings() catches leftovers
+            print(f"[TicketDeduplication] Embedding cleanup failed (non-blocking): {e}")
+        
         return primary_ticket
     
+    def prune_embeddings(self) -> int:
+        """Drop closed, merged and deleted tickets from the semantic index"""
+        def still_open(ticket_ids: List[str]) -> set:
+            return {
+                row.id for row in self.db.query(Ticket.id).filter(
+                    Ticket.id.in_(ticket_ids), Ticket.status.in_(OPEN_STATUSES)
+                )
+            }
+        return self.embedding_index.prune(still_open, batch_size=IN_CLAUSE_CHUNK)
+    
     def _get_ticket_content(self, ticket: Ticket) -> str:
         """Extract text content from ticket for comparison"""
-        content_parts = [
-            ticket.subject or "",
-            ticket.description or "",
-        ]
-        
-        # Add first message if available
-        if ticket.messages:
-            first_msg = ticket.messages[0]
-            content_parts.append(first_msg.message or "")
-        
-        return " ".join(content_parts).lower()
+        first_message = ticket.messages[0].message if ticket.messages else None
+        return self._compose_content(ticket.subject, getattr(ticket, "description", None), first_message)
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
+    @staticmethod
+    def _compose_content(subject: Optional[str], description: Optional[str], first_message: Optional[str]) -> str:
+        return " ".join([subject or "", description or "", first_message or ""]).lower()
+    
+    def _load_contents(self, tickets: List) -> Dict[str, str]:
+        """Comparison text for many tickets without lazy-loading messages"""
+        first = first_messages(self.db, [t.id for t in tickets])
+        return {
+            t.id: self._compose_content(t.subject, getattr(t, "description", None), first.get(t.id))
+            for t in tickets
+        }
+    
+    def _calculate_similarity(self, text1: str, text2: str, threshold: float = 0.0) -> float:
         """
         Calculate similarity between two text strings
-        Uses SequenceMatcher for fuzzy matching
+        Uses SequenceMatcher for fuzzy matching; cheap upper bounds
+        (real_quick_ratio / quick_ratio) skip pairs that cannot reach threshold
         
         Returns:
             Similarity score between 0.0 and 1.0
@@ -158,8 +369,48 @@ class TicketDeduplicationService:
         
         # Use difflib's SequenceMatcher for similarity
         matcher = difflib.SequenceMatcher(None, text1, text2)
+        if threshold and (matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold):
+            return 0.0
         return matcher.ratio()
     
+    def _signatures(self, tickets: List) -> Dict[str, np.ndarray]:
+        """
+        MinHash signature of each ticket. Stored rows are reused; missing ones
+        (or from an older scheme) are computed once and persisted.
+        """
+        scheme = self.hasher.scheme
+        ids = [t.id for t in tickets]
+        signatures: Dict[str, np.ndarray] = {}
+        try:
+            for i in range(0, len(ids), IN_CLAUSE_CHUNK):
+                rows = self.db.query(TicketSignature.ticket_id, TicketSignature.signature).filter(
+                    TicketSignature.ticket_id.in_(ids[i:i + IN_CLAUSE_CHUNK]),
+                    TicketSignature.scheme == scheme
+                ).all()
+                signatures.update((row.ticket_id, MinHasher.from_bytes(row.signature)) for row in rows)
+            persist = True
+        except Exception as e:
+            print(f"[TicketDeduplication] Signature table unavailable ({e}), computing in memory")
+            self.db.rollback()
+            persist = False
+        
+        missing = [t for t in tickets if t.id not in signatures]
+        if not missing:
+            return signatures
+        
+        contents = self._load_contents(missing)
+        for t in missing:
+            signatures[t.id] = self.hasher.signature(contents[t.id])
+        if persist:
+            try:
+                for t in missing:
+                    self._store_signature(t.id, t.customer_id, signatures[t.id])
+                self.db.commit()
+            except Exception as e:
+                print(f"[TicketDeduplication] Failed to persist signatures: {e}")
+                self.db.rollback()
+        return signatures
+    
     def _move_messages(self, source_ticket: Ticket, target_ticket: Ticket):
         """Move all messages from source ticket to target ticket"""
         for message in source_ticket.messages:
@@ -171,44 +422,98 @@ class TicketDeduplicationService:
     def auto_detect_duplicates(
         self,
         similarity_threshold: float = 0.8,
-        time_window_hours: int = 24
-    ) -> List[Tuple[int, List[Tuple[int, float]]]]:
+        time_window_hours: int = 24,
+        mode: str = MODE_LEXICAL
+    ) -> List[Tuple[str, List[Tuple[str, float]]]]:
         """
         Automatically detect potential duplicate tickets across all open tickets
         
+        Near-linear: MinHash/LSH proposes candidate pairs (same customer, within
+        the time window); SequenceMatcher scores only those candidates.
+        mode="semantic": ANN neighbours in embedding space instead.
+        
         Args:
             similarity_threshold: Minimum similarity score
             time_window_hours: Time window for comparison
+            mode: "lexical" or "semantic"
             
         Returns:
             List of (ticket_id, [(duplicate_id, similarity_score), ...])
         """
-        # Get all open tickets
-        open_tickets = self.db.query(Ticket).filter(
-            Ticket.status.in_(["OPEN", "IN_PROGRESS"])
+        # Get all open tickets (columns only, one query)
+        open_tickets = self.db.query(
+            Ticket.id, Ticket.customer_id, Ticket.subject, Ticket.created_at
+        ).filter(
+            Ticket.status.in_(OPEN_STATUSES)
         ).order_by(Ticket.created_at.desc()).all()
+        if len(open_tickets) < 2:
+            return []
+        
+        window = timedelta(hours=time_window_hours)
+        by_id = {t.id: t for t in open_tickets}
+        if mode == MODE_SEMANTIC:
+            neighbours = {
+                ticket_id: [
+                    (other_id, similarity) for other_id, similarity in found
+                    if other_id in by_id
+                    and self._within_window(by_id[ticket_id].created_at, by_id[other_id].created_at, window)
+                ]
+                for ticket_id, found in self._semantic_neighbours(open_tickets, similarity_threshold).items()
+            }
+            neighbours = {ticket_id: found for ticket_id, found in neighbours.items() if found}
+        else:
+            neighbours = self._lexical_neighbours(open_tickets, by_id, similarity_threshold, window)
         
         duplicates_found = []
         processed_ids = set()
         
+        # Newest first, as before; a ticket reported in one group is not a primary again
         for ticket in open_tickets:
-            ticket_id = str(getattr(ticket, 'id', ''))
-            if ticket_id in processed_ids:
+            if ticket.id in processed_ids or ticket.id not in neighbours:
                 continue
             
-            similar = self.find_similar_tickets(
-                ticket_id,
-                similarity_threshold=similarity_threshold,
-                time_window_hours=time_window_hours
-            )
+            duplicate_list = sorted(neighbours[ticket.id], key=lambda x: x[1], reverse=True)
+            duplicates_found.append((ticket.id, duplicate_list))
             
-            if similar:
-                duplicate_list = [(t.id, score) for t, score in similar]
-                duplicates_found.append((ticket.id, duplicate_list))
-                
-                # Mark as processed to avoid duplicate detection
-                processed_ids.add(ticket.id)
-                for dup_id, _ in duplicate_list:
-                    processed_ids.add(dup_id)
+            # Mark as processed to avoid duplicate detection
+            processed_ids.add(ticket.id)
+            for dup_id, _ in duplicate_list:
+                processed_ids.add(dup_id)
         
         return duplicates_found
+    
+    def _lexical_neighbours(
+        self,
+        open_tickets: List,
+        by_id: Dict[str, object],
+        similarity_threshold: float,
+        window: timedelta
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        # LSH candidates: same customer + at least one identical band
+        signatures = self._signatures(open_tickets)
+        index = LSHIndex(num_perm=self.hasher.num_perm)
+        for t in open_tickets:
+            index.add(t.id, signatures[t.id], scope=t.customer_id)
+        
+        pairs = [
+            (a, b) for a, b in index.candidate_pairs()
+            if self._within_window(by_id[a].created_at, by_id[b].created_at, window)
+        ]
+        if not pairs:
+            return {}
+        
+        # Exact similarity on candidates only
+        contents = self._load_contents([by_id[k] for k in {k for pair in pairs for k in pair}])
+        neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        for a, b in pairs:
+            similarity = self._calculate_similarity(contents[a], contents[b], similarity_threshold)
+            if similarity >= similarity_threshold:
+                neighbours.setdefault(a, []).append((b, similarity))
+                neighbours.setdefault(b, []).append((a, similarity))
+        return neighbours
+    
+    @staticmethod
+    def _within_window(a: Optional[datetime], b: Optional[datetime], window: timedelta) -> bool:
+        if a is None or b is None:
+            return True
+        return abs(a - b) <= window
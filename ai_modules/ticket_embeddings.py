@@ -0,0 +1,177 @@
+"""
+Ticket Embedding Index - Semantic duplicate detection
+
+Ticket (subject + tin nhắn đầu tiên) được embed bằng cùng model
+sentence-transformers với RAG (ai_config.embedding_model) và lưu trong một
+collection ChromaDB riêng (HNSW, cosine). Tìm láng giềng gần nhất theo từng
+khách hàng (where customer_id) hoặc toàn cục, nên bắt được các ticket trùng
+nhưng diễn đạt khác ("chưa nhận được hàng" vs "đơn hàng chưa giao tới") mà
+SequenceMatcher bỏ sót.
+
+Embedding chỉ tính một lần cho mỗi ticket (upsert khi thiếu). Ticket bị
+gộp được xoá khỏi index ngay khi merge; ticket đóng/xoá được dọn định kỳ bằng
+prune() (scripts/prune_ticket_embeddings.py).
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+import threading
+
+from ai_modules.core.config import ai_config
+
+DEFAULT_COLLECTION_NAME = "support_tickets"
+DEFAULT_TOP_K = 10
+DEFAULT_PRUNE_BATCH_SIZE = 1000
+
+
+class TicketEmbeddingIndex:
+    """
+    ANN index cho ticket.
+
+    Usage:
+        index = get_ticket_embedding_index()
+        index.upsert([{"id": t.id, "customer_id": t.customer_id, "text": content}])
+        vectors = index.embeddings([t.id])
+        index.neighbours(vectors, customer_id=t.customer_id, threshold=0.8)
+        # {t.id: [(other_id, 0.87), ...]}
+    """
+
+    def __init__(
+        self,
+        collection=None,
+        embed_fn: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+        chroma_path: Optional[str] = None,
+        collection_name: str = DEFAULT_COLLECTION_NAME
+    ):
+        if collection is None:
+            import chromadb
+            from ai_modules.agent_customer_service.rag.retriever import DEFAULT_CHROMA_PATH
+            client = chromadb.PersistentClient(path=chroma_path or DEFAULT_CHROMA_PATH)
+            collection = client.get_or_create_collection(
+                name=collection_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+        self.collection = collection
+        self._embed_fn = embed_fn
+
+    @property
+    def embed_fn(self) -> Callable[[List[str]], Sequence[Sequence[float]]]:
+        """Cùng model với RAG retriever; load lần đầu khi cần"""
+        if self._embed_fn is None:
+            from chromadb.utils import embedding_functions
+            self._embed_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=ai_config.embedding_model
+            )
+        return self._embed_fn
+
+    def missing(self, ticket_ids: List[str]) -> List[str]:
+        """Ticket chưa có trong index"""
+        if not ticket_ids:
+            return []
+        existing = set(self.collection.get(ids=list(ticket_ids), include=[])["ids"])
+        return [ticket_id for ticket_id in ticket_ids if ticket_id not in existing]
+
+    def upsert(self, entries: List[Dict[str, Any]]):
+        """entries: [{"id", "customer_id", "text"}] - embed một batch"""
+        if not entries:
+            return
+        vectors = self.embed_fn([e["text"] for e in entries])
+        self.collection.upsert(
+            ids=[e["id"] for e in entries],
+            embeddings=[[float(x) for x in v] for v in vectors],
+            metadatas=[{"ticket_id": e["id"], "customer_id": str(e["customer_id"])} for e in entries]
+        )
+
+    def remove(self, ticket_ids: List[str]):
+        if ticket_ids:
+            self.collection.delete(ids=list(ticket_ids))
+
+    def prune(
+        self,
+        keep: Callable[[List[str]], Set[str]],
+        batch_size: int = DEFAULT_PRUNE_BATCH_SIZE
+    ) -> int:
+        """
+        Xoá các ticket không còn cần (đã đóng/gộp/xoá) khỏi index.
+
+        Args:
+            keep: Nhận một trang id, trả về tập id cần giữ (vd. ticket đang mở)
+            batch_size: Số id đọc mỗi trang
+
+        Returns:
+            Số entry đã xoá
+        """
+        removed = offset = 0
+        while True:
+            page = self.collection.get(include=[], limit=batch_size, offset=offset)["ids"]
+            if not page:
+                return removed
+            kept = keep(page)
+            stale = [ticket_id for ticket_id in page if ticket_id not in kept]
+            self.remove(stale)
+            removed += len(stale)
+            offset += len(page) - len(stale)  # entry đã xoá không còn chiếm chỗ trong trang sau
+
+    def embeddings(self, ticket_ids: List[str]) -> Dict[str, List[float]]:
+        if not ticket_ids:
+            return {}
+        found = self.collection.get(ids=list(ticket_ids), include=["embeddings"])
+        return {ticket_id: list(vector) for ticket_id, vector in zip(found["ids"], found["embeddings"])}
+
+    def neighbours(
+        self,
+        vectors: Dict[str, List[float]],
+        customer_id: Optional[str] = None,
+        among: Optional[List[str]] = None,
+        top_k: int = DEFAULT_TOP_K,
+        threshold: float = 0.0
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Láng giềng (id, cosine similarity) của mỗi vector, similarity >= threshold.
+
+        Args:
+            customer_id: Chỉ tìm trong ticket của khách đó; None = toàn cục
+            among: Chỉ tìm trong các ticket id này (vd. ticket đang mở)
+        """
+        if not vectors:
+            return {}
+        limit = len(among) if among is not None else self.collection.count()
+        if limit < 2:
+            return {ticket_id: [] for ticket_id in vectors}
+
+        conditions: List[Dict[str, Any]] = []
+        if customer_id is not None:
+            conditions.append({"customer_id": str(customer_id)})
+        if among is not None:
+            conditions.append({"ticket_id": {"$in": list(among)}})
+        where = None if not conditions else conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+        query_ids = list(vectors)
+        result = self.collection.query(
+            query_embeddings=[vectors[ticket_id] for ticket_id in query_ids],
+            n_results=min(top_k + 1, limit),  # +1: the ticket itself
+            where=where,
+            include=["distances"]
+        )
+        found: Dict[str, List[Tuple[str, float]]] = {}
+        for query_id, hit_ids, distances in zip(query_ids, result["ids"], result["distances"]):
+            found[query_id] = [
+                (hit_id, 1.0 - distance)
+                for hit_id, distance in zip(hit_ids, distances)
+                if hit_id != query_id and 1.0 - distance >= threshold
+            ]
+        return found
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_index: Optional[TicketEmbeddingIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_ticket_embedding_index() -> TicketEmbeddingIndex:
+    """Index dùng chung trong process (model embedding chỉ load một lần)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TicketEmbeddingIndex()
+    return _index
@@ -14,6 +14,7 @@ from backend.schemas.cart import (
 )
 from backend.schemas.order import OrderResponse
 from backend.utils.security import get_current_user
+from backend.services.crm_context import invalidate_customer_context
 from datetime import datetime
 import random
 import string
@@ -268,5 +269,6 @@ def checkout(
     product_db.commit()  # Commit stock changes
     db.commit()
     db.refresh(new_order)
+    invalidate_customer_context(new_order.customer_id)
     
     return new_order
@@ -8,6 +8,7 @@ from backend.models.product import Product
 from backend.models.user import User
 from backend.schemas.order import OrderCreate, OrderUpdate, OrderResponse, RefundRequest, ReturnRequest
 from backend.utils.security import get_current_user, require_role
+from backend.services.crm_context import invalidate_customer_context
 import random
 import string
 
@@ -152,6 +153,7 @@ def create_order(
     product_db.commit()  # Commit stock changes to product DB
     db.commit()
     db.refresh(new_order)
+    invalidate_customer_context(new_order.customer_id)
     
     return new_order
 
@@ -190,6 +192,7 @@ def update_order(
     
     db.commit()
     db.refresh(order)
+    invalidate_customer_context(order.customer_id)
     
     return order
 
@@ -235,6 +238,7 @@ def cancel_order(
     product_db.commit()  # Commit stock changes
     db.commit()
     db.refresh(order)
+    invalidate_customer_context(order.customer_id)
     
     return order
 
@@ -300,6 +304,7 @@ def refund_order(
     product_db.commit()  # Commit stock changes
     db.commit()
     db.refresh(order)
+    invalidate_customer_context(order.customer_id)
     
     return order
 
@@ -373,5 +378,6 @@ def return_order(
     product_db.commit()  # Commit stock changes
     db.commit()
     db.refresh(order)
+    invalidate_customer_context(order.customer_id)
     
     return order
@@ -9,6 +9,9 @@ from backend.models.conversation import Conversation, ConversationMessage
 from backend.models.user import User
 from backend.schemas.conversation import ChatRequest, ChatResponse, ConversationResponse
 from backend.utils.security import get_current_user
+from backend.services.crm_context import crm_context_provider
+from ai_modules.core.timing import stage_timer, span
+from ai_modules.sentiment import get_sentiment_analyzer
 from typing import List, Optional, Dict, Any
 import os
 import json
@@ -17,6 +20,7 @@ import logging
 # Import CustomerServiceAgent (new architecture)
 try:
     from ai_modules.agent_customer_service import CustomerServiceAgent
+    from ai_modules.core.agent_pool import get_agent
     USE_NEW_AGENT = True
 except ImportError:
     USE_NEW_AGENT = False
@@ -42,9 +46,8 @@ def simple_rag_query(
     """
     try:
         if USE_NEW_AGENT:
-            from ai_modules.agent_customer_service import CustomerServiceAgent
-            agent = CustomerServiceAgent(db=None)
-            response = agent.process_query(
+            agent = get_customer_service_agent()
+            response = agent.run(
                 query=query,
                 user_id=str(current_user.id),
                 context={"top_k": top_k}
@@ -78,12 +81,14 @@ def simple_rag_query(
         }
 
 
-def get_customer_service_agent(db: Session):
-    """Get or create CustomerServiceAgent instance"""
+def get_customer_service_agent():
+    """
+    Get the per-worker CustomerServiceAgent instance.
+    DB session is passed per call: agent.run(..., db=db)
+    """
     global _agent_instance
     if USE_NEW_AGENT:
-        # Create new agent with db session
-        return CustomerServiceAgent(db=db)
+        return get_agent(CustomerServiceAgent)
     else:
         # Fallback to legacy RAGPipeline
         if _agent_instance is None:
@@ -211,6 +216,7 @@ def chat_rag(
     conversation_id: Optional[str] = Form(None),
     use_crm_context: bool = Form(False),
     action_id: Optional[str] = Form(None),
+    debug: bool = Form(False),
     db: Session = Depends(get_knowledge_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -222,23 +228,48 @@ def chat_rag(
     - Product comparison
     - Order workflow (add to cart, checkout, payment QR)
     - Action button clicks
+    
+    debug=true → trả thêm "timings" (ms theo stage: db_read, crm_context,
+    sentiment, intent, embedding, chroma_*, llm, db_write...)
     """
+    with stage_timer() as timer:
+        response_data = _chat_rag(
+            query, top_k, conversation_id, use_crm_context, action_id, db, current_user
+        )
+    if debug:
+        response_data["timings"] = timer.as_dict()
+    return response_data
+
+
+def _chat_rag(
+    query: str,
+    top_k: int,
+    conversation_id: Optional[str],
+    use_crm_context: bool,
+    action_id: Optional[str],
+    db: Session,
+    current_user: User
+) -> Dict[str, Any]:
     # Get or create conversation
-    if conversation_id:
-        conversation = db.query(Conversation).filter(
-            Conversation.id == conversation_id,
-            Conversation.user_id == current_user.id
-        ).first()
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-    else:
+    with span("db_read"):
+        if conversation_id:
+            conversation = db.query(Conversation).filter(
+                Conversation.id == conversation_id,
+                Conversation.user_id == current_user.id
+            ).first()
+        else:
+            conversation = None
+    if conversation_id and not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if not conversation:
         # Create new conversation
-        conversation = Conversation(
-            user_id=current_user.id,
-            title=query[:50] if len(query) > 50 else query
-        )
-        db.add(conversation)
-        db.flush()
+        with span("db_write"):
+            conversation = Conversation(
+                user_id=current_user.id,
+                title=query[:50] if len(query) > 50 else query
+            )
+            db.add(conversation)
+            db.flush()
     
     # Save user message
     user_message = ConversationMessage(
@@ -247,6 +278,9 @@ def chat_rag(
         content=query
     )
     db.add(user_message)
+    # Score once on write; conversation aggregate updated O(1)
+    with span("sentiment"):
+        get_sentiment_analyzer().score_conversation_message(conversation, user_message)
     
     # Prepare context
     context = {
@@ -259,6 +293,12 @@ def chat_rag(
     if action_id:
         context["action_id"] = action_id
     
+    # Personalized answers: one parallel, cached round trip (identity + order + support)
+    with span("crm_context"):
+        crm_context = crm_context_provider.get(current_user.id) if use_crm_context else None
+    if crm_context:
+        context["crm_context"] = crm_context
+    
     tool_result = None
     tool_used = None
     answer = ""
@@ -268,11 +308,12 @@ def chat_rag(
     if USE_NEW_AGENT:
         # Use new CustomerServiceAgent
         try:
-            agent = get_customer_service_agent(db)
-            response = agent.process_query(
+            agent = get_customer_service_agent()
+            response = agent.run(
                 query=query,
                 user_id=current_user.id,
-                context=context
+                context=context,
+                db=db
             )
             
             answer = response.message
@@ -320,9 +361,6 @@ def chat_rag(
         if tool_result and tool_result.get("success"):
             answer = format_tool_response(tool_used, tool_result)
         else:
-            crm_context = None
-            if use_crm_context:
-                crm_context = rag_service.query_crm_entities(db, current_user.id)
             answer = rag_service.generate_answer(query, top_k=top_k, crm_context=crm_context)
     
     # Save assistant message
@@ -337,7 +375,8 @@ def chat_rag(
         }) if tool_used else None
     )
     db.add(assistant_message)
-    db.commit()
+    with span("db_write"):
+        db.commit()
     
     # Build response with new fields for frontend
     response_data = {
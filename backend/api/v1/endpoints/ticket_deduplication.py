@@ -4,12 +4,12 @@ Detect and merge duplicate support tickets
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 from backend.database.session import get_support_db
 from backend.models.user import User
 from backend.utils.security import get_current_user, require_role
-from ai_modules.ticket_deduplication import TicketDeduplicationService
+from ai_modules.ticket_deduplication import TicketDeduplicationService, MODE_LEXICAL
 
 router = APIRouter()
 
@@ -52,19 +52,23 @@ def find_similar_tickets(
     ticket_id: str,
     similarity_threshold: float = Query(0.7, ge=0.0, le=1.0),
     time_window_hours: int = Query(72, ge=1, le=720),
+    mode: Literal["lexical", "semantic"] = Query(MODE_LEXICAL),
     db: Session = Depends(get_support_db),
     current_user: User = Depends(require_role("STAFF"))
 ):
     """
     Find tickets similar to the given ticket
     Staff/Admin only
+    
+    mode=semantic: embedding nearest neighbours (catches paraphrased duplicates)
     """
     dedup_service = TicketDeduplicationService(db)
     
     similar_tickets = dedup_service.find_similar_tickets(
         ticket_id=ticket_id,
         similarity_threshold=similarity_threshold,
-        time_window_hours=time_window_hours
+        time_window_hours=time_window_hours,
+        mode=mode
     )
     
     if not similar_tickets:
@@ -125,18 +129,22 @@ def merge_tickets(
 def auto_detect_duplicates(
     similarity_threshold: float = Query(0.8, ge=0.0, le=1.0),
     time_window_hours: int = Query(24, ge=1, le=168),
+    mode: Literal["lexical", "semantic"] = Query(MODE_LEXICAL),
     db: Session = Depends(get_support_db),
     current_user: User = Depends(require_role("STAFF"))
 ):
     """
     Auto-detect potential duplicate tickets
     Staff/Admin only
+    
+    mode=semantic: embedding nearest neighbours (catches paraphrased duplicates)
     """
     dedup_service = TicketDeduplicationService(db)
     
     duplicates_found = dedup_service.auto_detect_duplicates(
         similarity_threshold=similarity_threshold,
-        time_window_hours=time_window_hours
+        time_window_hours=time_window_hours,
+        mode=mode
     )
     
     if not duplicates_found:
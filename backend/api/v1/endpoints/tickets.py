@@ -13,7 +13,13 @@ from backend.schemas.ticket import (
     TicketMessageCreate, TicketMessageResponse
 )
 from backend.utils.security import get_current_user, require_role
+from backend.services.crm_context import invalidate_customer_context
+from backend.services.staff_assignment import get_staff_assignment
+from backend.services.sla import get_sla_engine, current_queue
+from backend.services.dashboard_metrics import ticket_metrics
 from ai_modules.rag_pipeline.rag_pipeline import RAGPipeline
+from ai_modules.sentiment import SentimentLabel, get_sentiment_analyzer
+from ai_modules.ticket_deduplication import TicketDeduplicationService
 import random
 import string
 import json
@@ -28,29 +34,6 @@ def generate_ticket_number() -> str:
     return f"TKT-{timestamp}-{random_suffix}"
 
 
-def analyze_sentiment(message: str) -> tuple[float, str]:
-    """
-    Simple sentiment analysis (mock implementation for demo)
-    In production, use proper NLP model
-    """
-    negative_keywords = ["bad", "terrible", "worst", "hate", "angry", "disappointing", 
-                         "awful", "horrible", "poor", "xấu", "tệ", "tồi", "ghét"]
-    positive_keywords = ["good", "great", "excellent", "love", "amazing", "wonderful",
-                         "fantastic", "perfect", "tốt", "tuyệt", "hay"]
-    
-    message_lower = message.lower()
-    
-    neg_count = sum(1 for word in negative_keywords if word in message_lower)
-    pos_count = sum(1 for word in positive_keywords if word in message_lower)
-    
-    if neg_count > pos_count:
-        return -0.5, "NEGATIVE"
-    elif pos_count > neg_count:
-        return 0.5, "POSITIVE"
-    else:
-        return 0.0, "NEUTRAL"
-
-
 @router.post("/", response_model=TicketResponse, status_code=status.HTTP_201_CREATED)
 def create_ticket(
     ticket_data: TicketCreate,
@@ -61,14 +44,6 @@ def create_ticket(
     """
     Create new support ticket
     """
-    # Analyze sentiment of initial message
-    sentiment_score, sentiment_label = analyze_sentiment(ticket_data.initial_message)
-    
-    # Auto-escalate if negative sentiment
-    priority = TicketPriority.MEDIUM
-    if sentiment_label == "NEGATIVE":
-        priority = TicketPriority.HIGH
-    
     # Create ticket
     new_ticket = Ticket(
         ticket_number=generate_ticket_number(),
@@ -76,10 +51,8 @@ def create_ticket(
         subject=ticket_data.subject,
         category=ticket_data.category,
         status=TicketStatus.OPEN,
-        priority=priority,
+        priority=TicketPriority.MEDIUM,
         order_id=ticket_data.order_id,
-        sentiment_score=sentiment_score,
-        sentiment_label=sentiment_label,
         channel=ticket_data.channel
     )
     
@@ -95,15 +68,30 @@ def create_ticket(
     )
     db.add(initial_message)
     
-    # Auto-assign to staff if high priority (simple round-robin)
+    # Score initial message once (stored on the message + ticket aggregate)
+    sentiment = get_sentiment_analyzer().score_ticket_message(new_ticket, initial_message)
+    
+    # Auto-escalate if negative sentiment
+    priority = TicketPriority.MEDIUM
+    if sentiment.label == SentimentLabel.NEGATIVE:
+        priority = TicketPriority.HIGH
+    new_ticket.priority = priority
+    
+    # Flag a likely duplicate of an open ticket (indexed signature lookup)
+    TicketDeduplicationService(db).check_new_ticket(new_ticket, ticket_data.initial_message)
+    
+    # Auto-assign high priority to the least-loaded staff (in-memory workload counters)
     if priority in [TicketPriority.HIGH, TicketPriority.URGENT]:
-        staff_members = identity_db.query(User).filter(User.role == "STAFF").all()
-        if staff_members:
-            assigned_staff = random.choice(staff_members)
-            new_ticket.assigned_to = assigned_staff.id
+        new_ticket.assigned_to = get_staff_assignment().pick(db, identity_db)
+    
+    # SLA deadlines from priority; timers scheduled once committed
+    sla = get_sla_engine()
+    sla.apply(new_ticket)
     
     db.commit()
     db.refresh(new_ticket)
+    invalidate_customer_context(new_ticket.customer_id)
+    sla.sync(new_ticket)
     
     return new_ticket
 
@@ -182,6 +170,8 @@ def update_ticket(
             detail="Ticket not found"
         )
     
+    previous_assignee, previous_status, previous_priority = ticket.assigned_to, ticket.status, ticket.priority
+    
     # Update fields
     if ticket_data.status:
         ticket.status = ticket_data.status.value  # type: ignore
@@ -190,14 +180,20 @@ def update_ticket(
         elif ticket_data.status == TicketStatus.CLOSED:
             ticket.closed_at = datetime.utcnow()  # type: ignore
     
+    sla = get_sla_engine()
     if ticket_data.priority:
         ticket.priority = ticket_data.priority.value  # type: ignore
+        if ticket_data.priority != previous_priority:
+            sla.apply(ticket, queue=current_queue(db, ticket.id))
     
     if ticket_data.assigned_to is not None:
         ticket.assigned_to = ticket_data.assigned_to  # type: ignore
     
     db.commit()
     db.refresh(ticket)
+    invalidate_customer_context(ticket.customer_id)
+    get_staff_assignment().track(previous_assignee, previous_status, ticket.assigned_to, ticket.status)
+    sla.sync(ticket)
     
     return ticket
 
@@ -235,6 +231,11 @@ def add_ticket_message(
     )
     
     db.add(new_message)
+    get_sentiment_analyzer().score_ticket_message(ticket, new_message)
+    
+    # First staff reply meets the response SLA
+    if new_message.is_staff and ticket.first_response_at is None:
+        ticket.first_response_at = datetime.utcnow()  # type: ignore
     
     # Update ticket status if customer replies
     if current_user.role.value == "CUSTOMER" and str(ticket.status) == TicketStatus.WAITING_CUSTOMER.value:
@@ -242,6 +243,8 @@ def add_ticket_message(
     
     db.commit()
     db.refresh(new_message)
+    get_sla_engine().sync(ticket)
+    invalidate_customer_context(ticket.customer_id)
     
     return new_message
 
@@ -295,9 +298,12 @@ def generate_ai_reply(
         
         db.add(ai_message)
         ticket.status = TicketStatus.WAITING_CUSTOMER.value  # type: ignore
+        if ticket.first_response_at is None:
+            ticket.first_response_at = datetime.utcnow()  # type: ignore
         
         db.commit()
         db.refresh(ai_message)
+        get_sla_engine().sync(ticket)
         
         return ai_message
     except Exception as e:
@@ -315,18 +321,13 @@ def get_ticket_stats(
     """
     Get ticket statistics (Staff/Admin only)
     """
-    total_tickets = db.query(Ticket).count()
-    open_tickets = db.query(Ticket).filter(Ticket.status == TicketStatus.OPEN).count()
-    in_progress = db.query(Ticket).filter(Ticket.status == TicketStatus.IN_PROGRESS).count()
-    resolved = db.query(Ticket).filter(Ticket.status == TicketStatus.RESOLVED).count()
-    
-    # Sentiment distribution
-    negative_tickets = db.query(Ticket).filter(Ticket.sentiment_label == "NEGATIVE").count()
+    # All counts (incl. sentiment distribution) in one conditional-aggregation query
+    stats = ticket_metrics(db)
     
     return {
-        "total": total_tickets,
-        "open": open_tickets,
-        "in_progress": in_progress,
-        "resolved": resolved,
-        "negative_sentiment": negative_tickets
+        "total": stats["total"],
+        "open": stats["open"],
+        "in_progress": stats["in_progress"],
+        "resolved": stats["resolved"],
+        "negative_sentiment": stats["negative"]
     }
@@ -293,6 +293,7 @@ def get_session_for_model(model_class):
         'tickets': 'support',
         'ticket_messages': 'support',
         'routing_rules': 'support',
+        'routing_rule_versions': 'support',
         'work_queues': 'support',
         'assignments': 'support',
         
@@ -307,6 +308,8 @@ def get_session_for_model(model_class):
         # Analytics DB
         'audit_logs': 'analytics',
         'user_events': 'analytics',
+        'kpi_rollups': 'analytics',
+        'kpi_rollup_watermarks': 'analytics',
         
         # Marketing DB
         'campaigns': 'marketing',
@@ -10,6 +10,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 
 from backend.api.v1.endpoints import auth, products, orders, rag, tickets, cart, kb_articles, summarization, analytics, ticket_deduplication, audit_logs, personalization, knowledge_sync
@@ -47,12 +48,48 @@ async def lifespan(app: FastAPI):
         "log_format": LOG_FORMAT,
         "log_level": LOG_LEVEL
     })
+    
+    # Build long-lived agents once per worker (embedding model, LLM clients, sub-services)
+    try:
+        from ai_modules.core.agent_pool import warm_up
+        from ai_modules.agent_customer_service import CustomerServiceAgent
+        from ai_modules.agent_operations import OperationsAgent
+        await run_in_threadpool(warm_up, CustomerServiceAgent, OperationsAgent)
+    except Exception as e:
+        logger.warning(f"Agent warm-up skipped: {e}", extra={"event": "agent_warmup_failed"})
+    
+    # SLA timers: load open-ticket deadlines once, then fire breaches as they come due
+    sla_engine = None
+    try:
+        from backend.services.sla import get_sla_engine
+        sla_engine = get_sla_engine()
+        await run_in_threadpool(sla_engine.seed)
+        sla_engine.start()
+    except Exception as e:
+        logger.warning(f"SLA engine not started: {e}", extra={"event": "sla_engine_failed"})
+    
+    # KPI rollups: backfill on first run, then fold in changed rows every interval;
+    # anomaly baselines are updated from the new hourly rollups after each refresh
+    rollup_job = None
+    try:
+        from backend.services.kpi_rollups import get_kpi_rollup_job
+        from backend.services.kpi_anomalies import get_kpi_anomaly_detector
+        rollup_job = get_kpi_rollup_job()
+        rollup_job.on_refresh(get_kpi_anomaly_detector().update)
+        rollup_job.start()
+    except Exception as e:
+        logger.warning(f"KPI rollup job not started: {e}", extra={"event": "kpi_rollup_failed"})
+    
     logger.info("Backend started successfully!", extra={"event": "startup_complete"})
     
     yield
     
     # Shutdown
     logger.info("Shutting down CRM-AI-Agent Backend...", extra={"event": "shutdown"})
+    if sla_engine is not None:
+        sla_engine.stop()
+    if rollup_job is not None:
+        rollup_job.stop()
 
 
 # Initialize FastAPI app
@@ -142,6 +179,13 @@ app.include_router(audit_logs.router, prefix="/audit", tags=["Audit Logs"])
 app.include_router(personalization.router, prefix="/ai/personalization", tags=["AI Personalization"])
 app.include_router(knowledge_sync.router, prefix="/kb/sync", tags=["Knowledge Sync"])
 
+# Prometheus metrics (AI stage latency histograms...) - optional dependency
+try:
+    from prometheus_client import make_asgi_app
+    app.mount("/metrics", make_asgi_app())
+except ImportError:
+    logger.info("prometheus-client not installed, /metrics disabled")
+
 
 if __name__ == "__main__":
     import uvicorn
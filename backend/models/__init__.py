@@ -4,13 +4,14 @@ Database models package
 from backend.models.user import User
 from backend.models.product import Product
 from backend.models.order import Order, OrderItem
-from backend.models.ticket import Ticket, TicketMessage
-from backend.models.ticket_routing import RoutingRule, WorkQueue, Assignment
+from backend.models.ticket import Ticket, TicketMessage, TicketSignature, TicketSignatureBand, TicketSlaEvent
+from backend.models.ticket_routing import RoutingRule, RoutingRuleVersion, WorkQueue, Assignment
 from backend.models.payment_transaction import PaymentTransactionModel
 from backend.models.kb_article import KBArticle
 from backend.models.conversation import Conversation, ConversationMessage
 from backend.models.cart import Cart, CartItem
 from backend.models.audit_log import AuditLog
+from backend.models.kpi_rollup import KpiRollup, KpiRollupWatermark
 
 __all__ = [
     "User",
@@ -19,7 +20,11 @@ __all__ = [
     "OrderItem",
     "Ticket",
     "TicketMessage",
+    "TicketSignature",
+    "TicketSignatureBand",
+    "TicketSlaEvent",
     "RoutingRule",
+    "RoutingRuleVersion",
     "WorkQueue",
     "Assignment",
     "PaymentTransactionModel",
@@ -29,4 +34,6 @@ __all__ = [
     "Cart",
     "CartItem",
     "AuditLog",
+    "KpiRollup",
+    "KpiRollupWatermark",
 ]
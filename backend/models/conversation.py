@@ -3,7 +3,7 @@ Conversation Model for RAG Chat History
 Note: In microservices architecture, conversations are in knowledge_db
 """
 import uuid
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.database.session import Base
@@ -15,6 +15,11 @@ class Conversation(Base):
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String(36), nullable=False)  # UUID string, no FK (different DB)
     title = Column(String(255), nullable=True)
+    # Sentiment aggregate over user messages (updated per message)
+    sentiment_score = Column(Float, nullable=True)  # running mean, -1 to 1
+    sentiment_label = Column(String(20), nullable=True)
+    sentiment_ewma = Column(Float, nullable=True)
+    sentiment_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -31,6 +36,8 @@ class ConversationMessage(Base):
     role = Column(String(50), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     message_metadata = Column("metadata", Text, nullable=True)  # JSON string for tool info, sources, etc.
+    sentiment_score = Column(Float, nullable=True)  # -1 to 1, scored once on write
+    sentiment_label = Column(String(20), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
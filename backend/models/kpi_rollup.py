@@ -0,0 +1,38 @@
+"""
+KPI Rollup models - Số liệu tổng hợp theo giờ / ngày
+Tables: kpi_rollups, kpi_rollup_watermarks (Analytics DB)
+"""
+from sqlalchemy import Column, String, Float, DateTime
+from sqlalchemy.sql import func
+from backend.database.session import Base
+
+
+class KpiRollup(Base):
+    """
+    Một ô tổng hợp: (grain, bucket_start, metric, dimension) → value
+
+    grain:      HOUR | DAY (bucket_start là đầu giờ / đầu ngày, UTC)
+    metric:     orders.count, orders.revenue, tickets.count, tickets.sentiment,
+                customers.new, conversations.count
+    dimension:  status / sentiment label, '' nếu metric không chia nhỏ
+    """
+    __tablename__ = "kpi_rollups"
+
+    grain = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    metric = Column(String(64), primary_key=True)
+    dimension = Column(String(64), primary_key=True, default="")
+    value = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<KpiRollup({self.grain} {self.bucket_start} {self.metric}[{self.dimension}]={self.value})>"
+
+
+class KpiRollupWatermark(Base):
+    """Mốc đã tổng hợp tới của từng bảng nguồn (orders, tickets, customers, conversations)"""
+    __tablename__ = "kpi_rollup_watermarks"
+
+    source = Column(String(32), primary_key=True)
+    high_water = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
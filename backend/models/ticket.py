@@ -2,7 +2,7 @@
 Ticket models for customer support system
 """
 import uuid
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Enum, Float, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.database.session import Base
@@ -60,9 +60,12 @@ class Ticket(Base):
     order_id = Column(String(36))
     
     # AI Analysis
-    sentiment_score = Column(Float)  # -1 to 1 (negative to positive)
+    sentiment_score = Column(Float)  # -1 to 1 (negative to positive), running mean of customer messages
     sentiment_label = Column(String(20))  # POSITIVE, NEUTRAL, NEGATIVE
+    sentiment_ewma = Column(Float)  # EWMA of customer message scores (recent trend)
+    sentiment_count = Column(Integer, default=0)  # Customer messages scored
     ai_suggested_category = Column(String(50))
+    possible_duplicate_of = Column(String(36))  # Open ticket of the same customer flagged at creation
     
     # Channel
     channel = Column(String(50), default="WEB")  # WEB, EMAIL, TELEGRAM, FACEBOOK
@@ -72,6 +75,11 @@ class Ticket(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     resolved_at = Column(DateTime(timezone=True))
     closed_at = Column(DateTime(timezone=True))
+    first_response_at = Column(DateTime(timezone=True))  # First staff/AI reply
+    
+    # SLA deadlines (from priority + queue, see backend/services/sla.py)
+    response_due_at = Column(DateTime(timezone=True))
+    resolution_due_at = Column(DateTime(timezone=True), index=True)
     
     # Relationships
     messages = relationship("TicketMessage", back_populates="ticket", cascade="all, delete-orphan")
@@ -98,6 +106,8 @@ class TicketMessage(Base):
     message = Column(Text, nullable=False)
     
     # AI metadata
+    sentiment_score = Column(Float)  # -1 to 1, scored once on write
+    sentiment_label = Column(String(20))  # POSITIVE, NEUTRAL, NEGATIVE
     rag_sources = Column(Text)  # JSON string of source documents used
     agent_thoughts = Column(Text)  # JSON string of agent reasoning process
     
@@ -109,3 +119,61 @@ class TicketMessage(Base):
     
     def __repr__(self):
         return f"<TicketMessage {self.id} for Ticket {self.ticket_id}>"
+
+
+class TicketSignature(Base):
+    """
+    MinHash signature of a ticket's content (subject + first message)
+    Used by TicketDeduplicationService for LSH candidate search
+    """
+    __tablename__ = "ticket_signatures"
+
+    ticket_id = Column(String(36), ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True)
+    customer_id = Column(String(36), nullable=False, index=True)  # cross-DB, no FK
+    scheme = Column(String(64), nullable=False)  # e.g. minhash-128-k3-s1; recomputed when it changes
+    signature = Column(LargeBinary, nullable=False)  # uint32[num_perm], little-endian
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<TicketSignature {self.ticket_id} ({self.scheme})>"
+
+
+class TicketSignatureBand(Base):
+    """
+    LSH band hashes of a ticket signature (one row per band)
+    Indexed by (customer_id, band_hash) for the duplicate check at ticket creation
+    """
+    __tablename__ = "ticket_signature_bands"
+    __table_args__ = (
+        Index("idx_tsb_customer_hash", "customer_id", "band_hash"),
+    )
+
+    ticket_id = Column(String(36), ForeignKey("tickets.id", ondelete="CASCADE"), primary_key=True)
+    band_hash = Column(BigInteger, primary_key=True)
+    customer_id = Column(String(36), nullable=False)  # cross-DB, no FK
+
+    def __repr__(self):
+        return f"<TicketSignatureBand {self.ticket_id} {self.band_hash}>"
+
+
+class TicketSlaEvent(Base):
+    """
+    SLA event của ticket: BREACH khi quá hạn phản hồi/giải quyết,
+    ESCALATION khi priority được nâng do breach.
+    Mỗi (ticket, kind, event) ghi đúng một lần dù nhiều worker cùng phát hiện.
+    """
+    __tablename__ = "ticket_sla_events"
+    __table_args__ = (
+        UniqueConstraint("ticket_id", "kind", "event", name="uq_sla_event"),
+    )
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    ticket_id = Column(String(36), ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False)  # RESPONSE, RESOLUTION
+    event = Column(String(20), nullable=False)  # BREACH, ESCALATION
+    due_at = Column(DateTime(timezone=True), nullable=False)
+    detail = Column(String(64))  # e.g. "HIGH->URGENT"
+    fired_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"<TicketSlaEvent {self.ticket_id} {self.kind} {self.event}>"
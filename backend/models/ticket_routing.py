@@ -1,9 +1,9 @@
 """
 Ticket Routing models for auto-routing rules & assignments
-Tables: routing_rules, work_queues, assignments (Support DB)
+Tables: routing_rules, routing_rule_versions, work_queues, assignments (Support DB)
 """
 import uuid
-from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, BigInteger, Text, DateTime, ForeignKey, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.database.session import Base
@@ -44,6 +44,24 @@ class RoutingRule(Base):
         return f"<RoutingRule {self.code} (priority={self.priority})>"
 
 
+class RoutingRuleVersion(Base):
+    """
+    Bộ đếm phiên bản của routing_rules (một row, id = 1).
+
+    Tăng mỗi khi rule thay đổi (trigger trên routing_rules, hoặc
+    bump_rules_version() khi sửa qua app) → mỗi worker chỉ biên dịch lại
+    bộ rule khi version khác với bản đang cache.
+    """
+    __tablename__ = "routing_rule_versions"
+
+    id = Column(Integer, primary_key=True, default=1)
+    version = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<RoutingRuleVersion {self.version}>"
+
+
 class WorkQueue(Base):
     """Work queue for ticket routing"""
     __tablename__ = "work_queues"
@@ -20,6 +20,8 @@ class TicketMessageResponse(BaseModel):
     is_staff: bool
     is_ai_generated: bool
     message: str
+    sentiment_score: Optional[float] = None
+    sentiment_label: Optional[str] = None
     rag_sources: Optional[str] = None
     agent_thoughts: Optional[str] = None
     created_at: datetime
@@ -57,9 +59,13 @@ class TicketResponse(BaseModel):
     order_id: Optional[str] = None
     sentiment_score: Optional[float] = None
     sentiment_label: Optional[str] = None
+    possible_duplicate_of: Optional[str] = None
     channel: str
     created_at: datetime
     updated_at: Optional[datetime] = None
+    first_response_at: Optional[datetime] = None
+    response_due_at: Optional[datetime] = None
+    resolution_due_at: Optional[datetime] = None
     messages: List[TicketMessageResponse] = []
     
     class Config:
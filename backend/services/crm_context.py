@@ -0,0 +1,144 @@
+"""
+CRM Context Provider
+Ngữ cảnh khách hàng (profile, đơn gần đây, ticket gần đây) cho chat cá nhân hóa.
+
+- Fan-out song song tới Identity / Order / Support DB (mỗi nhánh một session riêng)
+- Cache theo customer_id với TTL ngắn; kết quả có nhánh lỗi không được cache
+- Write path của order/ticket gọi invalidate_customer_context() để tránh dữ liệu cũ
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import os
+
+from sqlalchemy.orm import Session
+
+from backend.database.session import IdentitySession, OrderSession, SupportSession
+from backend.models.user import User
+from backend.models.order import Order
+from backend.models.ticket import Ticket
+from ai_modules.core.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RECENT_LIMIT = 5
+
+
+class CRMContextProvider:
+    """
+    Load CRM context for a customer in one parallel round trip.
+
+    Usage:
+        context = crm_context_provider.get(current_user.id)
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 60.0,
+        maxsize: int = 5000,
+        max_workers: int = 8,
+        identity_factory: Callable[[], Session] = IdentitySession,
+        order_factory: Callable[[], Session] = OrderSession,
+        support_factory: Callable[[], Session] = SupportSession
+    ):
+        self.cache = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crm-context")
+        self._identity_factory = identity_factory
+        self._order_factory = order_factory
+        self._support_factory = support_factory
+
+    def get(self, customer_id: str) -> Dict[str, Any]:
+        """Cached CRM context (customer, orders, tickets)"""
+        key = str(customer_id)
+        crm_context = self.cache.get(key)
+        if crm_context is not None:
+            return crm_context
+        crm_context, complete = self._load(key)
+        # A failed branch is transient: serve the partial context once, don't cache it
+        if complete:
+            self.cache.set(key, crm_context)
+        return crm_context
+
+    def invalidate(self, customer_id: Optional[str]):
+        if customer_id:
+            self.cache.invalidate(str(customer_id))
+
+    def load(self, customer_id: str) -> Dict[str, Any]:
+        """Query the three DBs concurrently (bypasses cache)"""
+        return self._load(customer_id)[0]
+
+    def _load(self, customer_id: str) -> Tuple[Dict[str, Any], bool]:
+        """(context, complete) — complete=False khi có nhánh lỗi"""
+        futures = {
+            "customer": self._executor.submit(self._run, self._identity_factory, self._load_customer, customer_id),
+            "orders": self._executor.submit(self._run, self._order_factory, self._load_orders, customer_id),
+            "tickets": self._executor.submit(self._run, self._support_factory, self._load_tickets, customer_id),
+        }
+
+        crm_context: Dict[str, Any] = {}
+        complete = True
+        for key, future in futures.items():
+            try:
+                value = future.result()
+            except Exception as e:
+                logger.warning(f"CRM context {key} failed for {customer_id}: {e}")
+                value = None if key == "customer" else []
+                complete = False
+            if value is not None:
+                crm_context[key] = value
+        return crm_context, complete
+
+    @staticmethod
+    def _run(factory: Callable[[], Session], loader: Callable, customer_id: str):
+        """Session per branch — SQLAlchemy sessions are not thread-safe"""
+        db = factory()
+        try:
+            return loader(db, customer_id)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _load_customer(db: Session, customer_id: str) -> Optional[Dict[str, Any]]:
+        row = db.query(User.full_name, User.email, User.phone).filter(User.id == customer_id).first()
+        if not row:
+            return None
+        return {"full_name": row.full_name, "email": row.email, "phone": row.phone}
+
+    @staticmethod
+    def _load_orders(db: Session, customer_id: str) -> List[Dict[str, Any]]:
+        rows = db.query(Order.order_number, Order.status, Order.total_amount).filter(
+            Order.customer_id == customer_id
+        ).order_by(Order.created_at.desc()).limit(RECENT_LIMIT).all()
+        return [
+            {
+                "order_number": r.order_number,
+                "status": getattr(r.status, "value", r.status),
+                "total_amount": float(r.total_amount or 0)
+            }
+            for r in rows
+        ]
+
+    @staticmethod
+    def _load_tickets(db: Session, customer_id: str) -> List[Dict[str, Any]]:
+        rows = db.query(Ticket.ticket_number, Ticket.subject, Ticket.status).filter(
+            Ticket.customer_id == customer_id
+        ).order_by(Ticket.created_at.desc()).limit(RECENT_LIMIT).all()
+        return [
+            {
+                "ticket_number": r.ticket_number,
+                "subject": r.subject,
+                "status": getattr(r.status, "value", r.status)
+            }
+            for r in rows
+        ]
+
+
+# Per-worker singleton
+crm_context_provider = CRMContextProvider(
+    ttl_seconds=float(os.getenv("CRM_CONTEXT_TTL_SECONDS", "60"))
+)
+
+
+def invalidate_customer_context(customer_id: Optional[str]):
+    """Call after order / ticket writes for this customer"""
+    crm_context_provider.invalidate(customer_id)
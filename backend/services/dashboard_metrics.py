@@ -0,0 +1,162 @@
+"""
+Dashboard Metrics - Số liệu tổng hợp cho analytics/tickets endpoints
+
+- Mỗi DB một query duy nhất: các COUNT/SUM gộp bằng conditional aggregation
+  (SUM(CASE WHEN ... THEN 1 ELSE 0 END))
+- fan_out(): chạy query của các DB song song trên executor dùng chung →
+  độ trễ ≈ query chậm nhất thay vì tổng các round trip
+- Số liệu theo staff: một GROUP BY assigned_to, percentile thời gian giải
+  quyết bằng window function (không query riêng cho từng staff)
+
+Session truyền vào mỗi nhánh phải là session riêng của nhánh đó (mỗi DB một
+session, không dùng chung một session giữa các thread).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Sequence
+import os
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from backend.models.user import User, UserType
+from backend.models.order import Order, OrderStatus
+from backend.models.ticket import Ticket, TicketStatus
+from backend.models.product import Product
+from backend.models.conversation import Conversation
+from backend.services.time_series import duration_seconds
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DASHBOARD_FANOUT_WORKERS", "8")),
+    thread_name_prefix="dashboard"
+)
+
+
+def fan_out(tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """Chạy các task song song, trả về {key: kết quả}; lỗi của task được raise lại"""
+    futures = {key: _executor.submit(task) for key, task in tasks.items()}
+    return {key: future.result() for key, future in futures.items()}
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _sum_if(condition, value):
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+def order_metrics(db: Session, since: datetime, stale_before: Optional[datetime] = None) -> Dict[str, Any]:
+    """Order DB: total, recent, pending, revenue (từ since), stale_pending (PENDING trước stale_before)"""
+    stale_before = stale_before or datetime.min
+    row = db.query(
+        func.count(Order.id).label("total"),
+        _count_if(Order.created_at >= since).label("recent"),
+        _count_if(Order.status == OrderStatus.PENDING).label("pending"),
+        _sum_if(Order.created_at >= since, Order.total_amount).label("revenue"),
+        _count_if(and_(Order.status == OrderStatus.PENDING, Order.created_at < stale_before)).label("stale_pending"),
+    ).one()
+    return {
+        "total": int(row.total or 0),
+        "recent": int(row.recent),
+        "pending": int(row.pending),
+        "revenue": float(row.revenue or 0),
+        "stale_pending": int(row.stale_pending),
+    }
+
+
+def ticket_metrics(db: Session, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """Support DB: tổng, theo trạng thái, ticket tiêu cực (toàn bộ và từ since)"""
+    negative = Ticket.sentiment_label == "NEGATIVE"
+    recent_negative = and_(negative, Ticket.created_at >= since) if since is not None else negative
+    row = db.query(
+        func.count(Ticket.id).label("total"),
+        _count_if(Ticket.status == TicketStatus.OPEN).label("open"),
+        _count_if(Ticket.status == TicketStatus.IN_PROGRESS).label("in_progress"),
+        _count_if(Ticket.status == TicketStatus.RESOLVED).label("resolved"),
+        _count_if(negative).label("negative"),
+        _count_if(recent_negative).label("recent_negative"),
+    ).one()
+    return {
+        "total": int(row.total or 0),
+        "open": int(row.open),
+        "in_progress": int(row.in_progress),
+        "resolved": int(row.resolved),
+        "negative": int(row.negative),
+        "recent_negative": int(row.recent_negative),
+    }
+
+
+def product_metrics(db: Session) -> Dict[str, Any]:
+    """Product DB: sản phẩm active và sắp hết hàng"""
+    active = Product.is_active == True
+    row = db.query(
+        _count_if(active).label("active"),
+        _count_if(and_(active, Product.stock_quantity <= Product.low_stock_threshold)).label("low_stock"),
+    ).one()
+    return {"active": int(row.active), "low_stock": int(row.low_stock)}
+
+
+def customer_metrics(db: Session, since: datetime) -> Dict[str, Any]:
+    """Identity DB: tổng khách hàng và khách mới từ since"""
+    row = db.query(
+        func.count(User.id).label("total"),
+        _count_if(User.created_at >= since).label("new"),
+    ).filter(User.user_type == UserType.CUSTOMER).one()
+    return {"total": int(row.total or 0), "new": int(row.new)}
+
+
+def conversation_metrics(db: Session, since: datetime) -> Dict[str, Any]:
+    """Knowledge DB: số hội thoại từ since"""
+    total = db.query(func.count(Conversation.id)).filter(Conversation.created_at >= since).scalar()
+    return {"recent": int(total or 0)}
+
+
+def staff_ticket_metrics(db: Session) -> Dict[str, Dict[str, int]]:
+    """Support DB: {staff_id: {"assigned", "resolved"}} trong một GROUP BY assigned_to"""
+    rows = db.query(
+        Ticket.assigned_to,
+        func.count(Ticket.id).label("assigned"),
+        _count_if(Ticket.status == TicketStatus.RESOLVED).label("resolved"),
+    ).filter(Ticket.assigned_to.isnot(None)).group_by(Ticket.assigned_to)
+    return {row.assigned_to: {"assigned": int(row.assigned), "resolved": int(row.resolved)} for row in rows}
+
+
+def resolution_percentiles(
+    db: Session,
+    percentiles: Sequence[float] = (0.5, 0.9, 0.95)
+) -> Dict[str, Dict[float, float]]:
+    """
+    Support DB: {staff_id: {p: giờ}} thời gian giải quyết (created_at → resolved/closed)
+    theo nearest-rank. ROW_NUMBER() / COUNT() OVER (PARTITION BY assigned_to)
+    chạy trong SQL, DB chỉ trả về các dòng đúng hạng percentile.
+    """
+    done = func.coalesce(Ticket.resolved_at, Ticket.closed_at)
+    duration = duration_seconds(Ticket.created_at, done, db.get_bind().dialect.name)
+    ranked = db.query(
+        Ticket.assigned_to.label("staff_id"),
+        duration.label("seconds"),
+        func.row_number().over(partition_by=Ticket.assigned_to, order_by=duration).label("row_pos"),
+        func.count(Ticket.id).over(partition_by=Ticket.assigned_to).label("row_total"),
+    ).filter(
+        Ticket.assigned_to.isnot(None),
+        Ticket.created_at.isnot(None),
+        done.isnot(None)
+    ).subquery()
+
+    # Hạng nearest-rank: pos = ceil(p·n) ⇔ pos·1000 >= p‰·n > (pos - 1)·1000 (số nguyên, không lệch float)
+    per_mille = {p: int(round(p * 1000)) for p in percentiles}
+
+    def at_rank(pos, total, pm):
+        return and_(pos * 1000 >= pm * total, (pos - 1) * 1000 < pm * total)
+
+    rows = db.query(ranked.c.staff_id, ranked.c.seconds, ranked.c.row_pos, ranked.c.row_total).filter(
+        or_(*(at_rank(ranked.c.row_pos, ranked.c.row_total, pm) for pm in per_mille.values()))
+    )
+    result: Dict[str, Dict[float, float]] = {}
+    for row in rows:
+        for p, pm in per_mille.items():
+            if row.row_pos * 1000 >= pm * row.row_total > (row.row_pos - 1) * 1000:
+                result.setdefault(row.staff_id, {})[p] = round(float(row.seconds) / 3600, 2)
+    return result
+
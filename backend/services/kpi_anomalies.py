@@ -0,0 +1,256 @@
+"""
+KPI Anomalies - Phát hiện bất thường trên chuỗi KPI theo giờ (streaming)
+
+Mỗi chuỗi (ticket tiêu cực, ticket mới, số đơn, doanh thu) giữ 24 baseline
+EWMA theo giờ trong ngày (mùa vụ ngày/đêm). Khi kpi_rollups có thêm giờ đã
+"chốt", update() đọc các ô HOUR mới trong một query, tính z-score của từng
+giờ so với baseline cùng giờ rồi mới cập nhật baseline:
+- Ngưỡng tự co giãn theo quy mô shop: độ lệch chuẩn tối thiểu là sqrt(mean)
+  với chuỗi đếm (nhiễu Poisson), 10% mean với doanh thu
+- Giờ bị gắn cờ chỉ được học ở mức kẹp (mean ± z·std), tránh kéo lệch baseline
+- Giờ không có ô rollup được tính là 0 (kể từ giờ rollup đầu tiên: lần
+  update đầu không học các ngày trước khi có dữ liệu)
+
+Kết quả giữ trong bộ nhớ worker; /analytics/anomalies/detect chỉ đọc
+anomalies(). update() được gọi sau mỗi lần KpiRollupJob refresh. Khi một
+chuỗi chưa ready() (rollup chưa backfill, baseline chưa đủ min_samples ngày)
+endpoint dùng lại ngưỡng cố định cho chuỗi đó.
+"""
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import math
+import threading
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ai_modules.core.streaming_stats import EWMAStats
+from backend.models.kpi_rollup import KpiRollup
+from backend.services.kpi_rollups import GRAIN_HOUR, WATERMARK_OVERLAP, hour_floor, rollups_refreshed_at
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_Z_THRESHOLD = 3.0
+DEFAULT_SEASONAL_ALPHA = 0.1
+DEFAULT_MIN_SAMPLES = 7
+DEFAULT_WARMUP_DAYS = 14
+# Giờ chỉ được đánh giá khi đã kết thúc quá khoảng này (rollup kịp gom dữ liệu muộn)
+SETTLE_DELAY = WATERMARK_OVERLAP
+MAX_KEPT_ANOMALIES = 1000
+
+
+@dataclass(frozen=True)
+class AnomalySeries:
+    """
+    Một chuỗi KPI theo giờ từ kpi_rollups.
+
+    dimensions: chỉ cộng các dimension này (None = mọi dimension)
+    direction:  "up" | "down" | "both" - chiều lệch được coi là bất thường
+    counts:     chuỗi đếm (sàn độ lệch chuẩn kiểu Poisson) hay số tiền
+    """
+    type: str
+    metric: str
+    direction: str
+    severity: str
+    message: str
+    recommendation: str
+    dimensions: Optional[Tuple[str, ...]] = None
+    counts: bool = True
+
+    def std_floor(self, mean: float) -> float:
+        return math.sqrt(max(mean, 1.0)) if self.counts else max(0.1 * abs(mean), 1.0)
+
+    def flags(self, z: float, threshold: float) -> bool:
+        if self.direction == "up":
+            return z >= threshold
+        if self.direction == "down":
+            return z <= -threshold
+        return abs(z) >= threshold
+
+
+ANOMALY_SERIES: Tuple[AnomalySeries, ...] = (
+    AnomalySeries(
+        "HIGH_NEGATIVE_SENTIMENT", "tickets.sentiment", "up", "HIGH",
+        "Ticket cảm xúc tiêu cực tăng bất thường: {value:.0f} lúc {hour} (bình thường ~{expected:.1f})",
+        "Kiểm tra nguyên nhân và xử lý ưu tiên", dimensions=("NEGATIVE",)
+    ),
+    AnomalySeries(
+        "TICKET_SPIKE", "tickets.count", "up", "MEDIUM",
+        "Ticket mới tăng bất thường: {value:.0f} lúc {hour} (bình thường ~{expected:.1f})",
+        "Phân công thêm nhân viên hỗ trợ"
+    ),
+    AnomalySeries(
+        "ORDER_DROP", "orders.count", "down", "HIGH",
+        "Số đơn hàng giảm bất thường: {value:.0f} lúc {hour} (bình thường ~{expected:.1f})",
+        "Kiểm tra checkout, thanh toán và tồn kho"
+    ),
+    AnomalySeries(
+        "REVENUE_ANOMALY", "orders.revenue", "both", "MEDIUM",
+        "Doanh thu bất thường: {value:,.0f} lúc {hour} (bình thường ~{expected:,.0f})",
+        "Đối chiếu đơn hàng và chương trình khuyến mãi", counts=False
+    ),
+)
+
+
+class KpiAnomalyDetector:
+    """
+    Usage:
+        detector = get_kpi_anomaly_detector()
+        detector.update(analytics_db)                 # sau mỗi lần refresh rollup
+        detector.anomalies(since=now - timedelta(hours=24))
+
+    Args:
+        series: Các chuỗi được theo dõi
+        z_threshold: |z| tối thiểu để gắn cờ
+        seasonal_alpha: alpha EWMA của baseline mỗi giờ trong ngày
+        min_samples: Số ngày tối thiểu của một baseline trước khi đánh giá
+        warmup_days: Lần update đầu tiên học lại từ bấy nhiêu ngày rollup
+        clock: Thời điểm hiện tại (UTC naive)
+    """
+
+    def __init__(
+        self,
+        series: Tuple[AnomalySeries, ...] = ANOMALY_SERIES,
+        z_threshold: float = DEFAULT_Z_THRESHOLD,
+        seasonal_alpha: float = DEFAULT_SEASONAL_ALPHA,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        warmup_days: int = DEFAULT_WARMUP_DAYS,
+        clock: Callable[[], datetime] = datetime.utcnow
+    ):
+        self.series = series
+        self.z_threshold = z_threshold
+        self.warmup_days = warmup_days
+        self.clock = clock
+        self._baselines: Dict[str, List[EWMAStats]] = {
+            s.type: [EWMAStats(alpha=seasonal_alpha, min_count=min_samples) for _ in range(24)] for s in series
+        }
+        self._last_hour: Optional[datetime] = None
+        self._anomalies: Deque[Dict[str, Any]] = deque(maxlen=MAX_KEPT_ANOMALIES)
+        self._lock = threading.Lock()
+
+    @property
+    def last_hour(self) -> Optional[datetime]:
+        """Giờ cuối cùng đã được đánh giá"""
+        return self._last_hour
+
+    def ready(self, series_type: str) -> bool:
+        """Chuỗi đã có baseline đủ mẫu ở mọi giờ trong ngày (z-score đáng tin)"""
+        baselines = self._baselines.get(series_type)
+        return self._last_hour is not None and baselines is not None and all(b.ready for b in baselines)
+
+    def is_current(self, now: Optional[datetime] = None) -> bool:
+        """Đã đánh giá tới giờ chốt gần nhất chưa (không cần update())"""
+        closed = hour_floor((now or self.clock()) - SETTLE_DELAY)
+        return self._last_hour is not None and self._last_hour + timedelta(hours=1) >= closed
+
+    def update(self, db: Session) -> List[Dict[str, Any]]:
+        """Đánh giá các giờ rollup đã chốt kể từ lần trước; trả về bất thường mới"""
+        with self._lock:
+            refreshed_at = rollups_refreshed_at(db)
+            if refreshed_at is None:
+                return []
+            # Giờ [h, h+1) đã chốt khi kết thúc trước cả now và lần refresh rollup cũ nhất
+            closed = hour_floor(min(self.clock(), refreshed_at) - SETTLE_DELAY)
+            if self._last_hour is not None:
+                start = self._last_hour + timedelta(hours=1)
+            else:
+                first = self._first_hour(db)
+                if first is None:
+                    return []
+                start = max(closed - timedelta(days=self.warmup_days), first)
+            if start >= closed:
+                return []
+
+            values = self._load(db, start, closed)
+            found = []
+            hour = start
+            while hour < closed:
+                for series in self.series:
+                    anomaly = self._observe(series, hour, values.get((series.type, hour), 0.0))
+                    if anomaly is not None:
+                        found.append(anomaly)
+                hour += timedelta(hours=1)
+            self._last_hour = closed - timedelta(hours=1)
+            self._anomalies.extend(found)
+
+        if found:
+            logger.info(f"[KpiAnomaly] {len(found)} anomalies up to {self._last_hour}")
+        return found
+
+    def anomalies(self, since: datetime) -> List[Dict[str, Any]]:
+        """Bất thường của các giờ từ `since`, mới nhất trước"""
+        with self._lock:
+            return [a for a in reversed(self._anomalies) if a["hour"] >= since]
+
+    def _first_hour(self, db: Session) -> Optional[datetime]:
+        """Giờ rollup sớm nhất của các chuỗi (None = chưa có dữ liệu)"""
+        first = db.query(func.min(KpiRollup.bucket_start)).filter(
+            KpiRollup.grain == GRAIN_HOUR,
+            KpiRollup.metric.in_({s.metric for s in self.series})
+        ).scalar()
+        return hour_floor(first) if first is not None else None
+
+    def _load(self, db: Session, start: datetime, end: datetime) -> Dict[Tuple[str, datetime], float]:
+        """{(series type, giờ): giá trị} của mọi chuỗi trong [start, end) - một query"""
+        rows = db.query(
+            KpiRollup.bucket_start, KpiRollup.metric, KpiRollup.dimension, func.sum(KpiRollup.value)
+        ).filter(
+            KpiRollup.grain == GRAIN_HOUR,
+            KpiRollup.metric.in_({s.metric for s in self.series}),
+            KpiRollup.bucket_start >= start,
+            KpiRollup.bucket_start < end
+        ).group_by(KpiRollup.bucket_start, KpiRollup.metric, KpiRollup.dimension)
+
+        values: Dict[Tuple[str, datetime], float] = {}
+        for bucket, metric, dimension, total in rows:
+            for series in self.series:
+                if series.metric == metric and (series.dimensions is None or dimension in series.dimensions):
+                    key = (series.type, hour_floor(bucket))
+                    values[key] = values.get(key, 0.0) + float(total or 0)
+        return values
+
+    def _observe(self, series: AnomalySeries, hour: datetime, value: float) -> Optional[Dict[str, Any]]:
+        """z-score so với baseline cùng giờ trong ngày, rồi học giá trị (kẹp nếu bất thường)"""
+        baseline = self._baselines[series.type][hour.hour]
+        expected, floor = baseline.mean, series.std_floor(baseline.mean)
+        z = baseline.zscore(value, std_floor=floor)
+        flagged = z is not None and series.flags(z, self.z_threshold)
+
+        learned = value
+        if flagged:
+            std = max(baseline.std, floor)
+            learned = expected + math.copysign(self.z_threshold * std, z)
+        baseline.update(learned)
+
+        if not flagged:
+            return None
+        return {
+            "type": series.type,
+            "severity": series.severity,
+            "message": series.message.format(value=value, expected=expected, hour=hour.strftime("%d/%m %H:00")),
+            "recommendation": series.recommendation,
+            "metric": series.metric,
+            "hour": hour,
+            "value": round(value, 2),
+            "expected": round(expected, 2),
+            "z_score": round(z, 2),
+        }
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_detector: Optional[KpiAnomalyDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_kpi_anomaly_detector() -> KpiAnomalyDetector:
+    """Detector dùng chung trong worker"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = KpiAnomalyDetector()
+    return _detector
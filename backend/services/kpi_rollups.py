@@ -0,0 +1,444 @@
+"""
+KPI Rollups - Số liệu dashboard tổng hợp sẵn theo giờ / ngày (Analytics DB)
+
+Job nền refresh() đọc các dòng nguồn thay đổi sau watermark của từng nguồn,
+tính lại đúng những giờ bị ảnh hưởng (theo created_at của dòng) rồi ghi đè
+các ô HOUR đó; ô DAY được cộng lại từ các ô HOUR của ngày. Chi phí mỗi lần
+chạy tỉ lệ với số dòng thay đổi, không với kích thước bảng nguồn.
+
+/analytics/dashboard và /analytics/kpi/overview đọc rollup_sums(): một
+aggregate query trên kpi_rollups (số ô ~ số ngày × số dimension) thay vì
+quét orders / tickets / users / conversations.
+
+Nguồn:
+- orders:        số đơn và doanh thu theo status (watermark theo updated_at vì status đổi)
+- tickets:       số ticket theo status và theo sentiment_label (watermark theo updated_at)
+- customers:     user CUSTOMER mới (watermark theo created_at)
+- conversations: hội thoại mới (watermark theo created_at)
+
+Watermark được quét lùi WATERMARK_OVERLAP để bắt transaction commit muộn;
+tính lại một giờ là idempotent nên quét trùng không làm sai số liệu.
+Sau mỗi lần refresh, các listener đăng ký qua on_refresh() (vd. phát hiện
+bất thường trên chuỗi giờ) được gọi với một session Analytics DB.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import threading
+import logging
+
+from sqlalchemy import and_, case, delete, func, insert, or_
+from sqlalchemy.orm import Session
+
+from backend.models.kpi_rollup import KpiRollup, KpiRollupWatermark
+from backend.models.order import Order, OrderStatus
+from backend.models.ticket import Ticket, TicketStatus
+from backend.models.user import User, UserType
+from backend.models.conversation import Conversation
+
+logger = logging.getLogger(__name__)
+
+GRAIN_HOUR = "HOUR"
+GRAIN_DAY = "DAY"
+WATERMARK_OVERLAP = timedelta(minutes=5)
+# high_water của nguồn đã quét nhưng chưa có dòng nào
+EMPTY_WATERMARK = datetime(1970, 1, 1)
+DEFAULT_INTERVAL_SECONDS = float(os.getenv("KPI_ROLLUP_INTERVAL_SECONDS", "60"))
+_FETCH_BATCH = 5000
+_IN_CHUNK = 500
+
+
+def _naive(moment: datetime) -> datetime:
+    """Datetime có tzinfo → UTC naive (cùng hệ với datetime.utcnow())"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def hour_floor(moment: datetime) -> datetime:
+    return _naive(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def day_floor(moment: datetime) -> datetime:
+    return hour_floor(moment).replace(hour=0)
+
+
+def _value(enum_or_str) -> str:
+    return getattr(enum_or_str, "value", enum_or_str) or ""
+
+
+def _ranges(buckets: Sequence[datetime], step: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Các bucket đã sort → các khoảng [start, end) liên tục"""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for bucket in buckets:
+        if ranges and ranges[-1][1] == bucket:
+            ranges[-1] = (ranges[-1][0], bucket + step)
+        else:
+            ranges.append((bucket, bucket + step))
+    return ranges
+
+
+# ─── Sources ─────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class RollupSource:
+    """
+    Một bảng nguồn của rollup.
+
+    columns: cột đọc khi tính lại một giờ (created_at luôn đứng đầu)
+    measure: row → [(metric, dimension, amount)] cộng vào ô giờ của row
+    track_updates: watermark theo updated_at (dòng đổi trạng thái sau khi tạo)
+    """
+    name: str
+    database: str
+    model: Any
+    columns: Tuple[Any, ...]
+    measure: Callable[[Any], Iterable[Tuple[str, str, float]]]
+    metrics: Tuple[str, ...]
+    track_updates: bool = False
+    criteria: Tuple[Any, ...] = ()
+
+    def marker(self):
+        """Thời điểm thay đổi cuối của dòng"""
+        if self.track_updates:
+            return func.coalesce(self.model.updated_at, self.model.created_at)
+        return self.model.created_at
+
+    def changed_since(self, moment: datetime):
+        if self.track_updates:
+            return or_(
+                self.model.updated_at > moment,
+                and_(self.model.updated_at.is_(None), self.model.created_at > moment)
+            )
+        return self.model.created_at > moment
+
+
+def _measure_order(row):
+    status = _value(row.status)
+    return (("orders.count", status, 1), ("orders.revenue", status, row.total_amount or 0))
+
+
+def _measure_ticket(row):
+    return (("tickets.count", _value(row.status), 1), ("tickets.sentiment", row.sentiment_label or "", 1))
+
+
+ROLLUP_SOURCES: Tuple[RollupSource, ...] = (
+    RollupSource(
+        "orders", "order", Order, (Order.created_at, Order.status, Order.total_amount),
+        _measure_order, ("orders.count", "orders.revenue"), track_updates=True
+    ),
+    RollupSource(
+        "tickets", "support", Ticket, (Ticket.created_at, Ticket.status, Ticket.sentiment_label),
+        _measure_ticket, ("tickets.count", "tickets.sentiment"), track_updates=True
+    ),
+    RollupSource(
+        "customers", "identity", User, (User.created_at,),
+        lambda row: (("customers.new", "", 1),), ("customers.new",),
+        criteria=(User.user_type == UserType.CUSTOMER,)
+    ),
+    RollupSource(
+        "conversations", "knowledge", Conversation, (Conversation.created_at,),
+        lambda row: (("conversations.count", "", 1),), ("conversations.count",)
+    ),
+)
+
+
+# ─── Refresh job ─────────────────────────────────────────────────
+
+class KpiRollupJob:
+    """
+    Usage:
+        job = get_kpi_rollup_job()
+        job.refresh()      # {source: số giờ được tính lại}
+        job.start()        # thread nền refresh mỗi interval_seconds
+        job.on_refresh(lambda analytics_db: ...)
+
+    Args:
+        session_factories: {"analytics" | "order" | "support" | "identity" | "knowledge": factory}
+                           (mặc định: session factory của từng DB)
+        sources: Các nguồn được tổng hợp
+        overlap: Khoảng quét lùi trước watermark
+    """
+
+    def __init__(
+        self,
+        session_factories: Optional[Dict[str, Callable[[], Session]]] = None,
+        sources: Sequence[RollupSource] = ROLLUP_SOURCES,
+        overlap: timedelta = WATERMARK_OVERLAP
+    ):
+        self.session_factories = session_factories or {}
+        self.sources = tuple(sources)
+        self.overlap = overlap
+        self._listeners: List[Callable[[Session], Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def on_refresh(self, listener: Callable[[Session], Any]):
+        """Gọi listener(analytics_db) sau mỗi lần refresh()"""
+        self._listeners.append(listener)
+
+    def _session(self, database: str) -> Session:
+        if database in self.session_factories:
+            return self.session_factories[database]()
+        from backend.database import session as sessions
+        return {
+            "analytics": sessions.AnalyticsSession,
+            "order": sessions.OrderSession,
+            "support": sessions.SupportSession,
+            "identity": sessions.IdentitySession,
+            "knowledge": sessions.KnowledgeSession,
+        }[database]()
+
+    def refresh(self) -> Dict[str, int]:
+        """Cập nhật rollup của mọi nguồn (mỗi nguồn một transaction trên Analytics DB)"""
+        refreshed = {}
+        for source in self.sources:
+            analytics_db = self._session("analytics")
+            source_db = self._session(source.database)
+            try:
+                refreshed[source.name] = self.refresh_source(source, source_db, analytics_db)
+            except Exception:
+                analytics_db.rollback()
+                raise
+            finally:
+                source_db.close()
+                analytics_db.close()
+
+        for listener in self._listeners:
+            analytics_db = self._session("analytics")
+            try:
+                listener(analytics_db)
+            except Exception as e:
+                logger.error(f"[KpiRollup] refresh listener failed: {e}")
+            finally:
+                analytics_db.close()
+        return refreshed
+
+    def refresh_source(self, source: RollupSource, source_db: Session, analytics_db: Session) -> int:
+        """Tính lại các giờ có dòng thay đổi sau watermark; trả về số giờ đã ghi"""
+        # Khoá dòng watermark: nhiều worker chạy job thì lần lượt từng worker
+        watermark = analytics_db.query(KpiRollupWatermark).filter(
+            KpiRollupWatermark.source == source.name
+        ).with_for_update().one_or_none()
+        if watermark is None:
+            watermark = KpiRollupWatermark(source=source.name)
+            analytics_db.add(watermark)
+
+        query = source_db.query(source.model.created_at, source.marker())
+        if watermark.high_water is not None:
+            query = query.filter(source.changed_since(watermark.high_water - self.overlap))
+
+        hours = set()
+        high_water = watermark.high_water
+        for created_at, changed_at in query.yield_per(_FETCH_BATCH):
+            if created_at is None:
+                continue
+            hours.add(hour_floor(created_at))
+            changed_at = _naive(changed_at or created_at)
+            if high_water is None or changed_at > high_water:
+                high_water = changed_at
+
+        if hours:
+            self._rewrite(source, source_db, analytics_db, sorted(hours))
+        watermark.high_water = high_water or EMPTY_WATERMARK
+        # updated_at = lần refresh cuối (kể cả khi high_water không đổi)
+        watermark.updated_at = datetime.utcnow()
+        analytics_db.commit()
+        if hours:
+            logger.info(f"[KpiRollup] {source.name}: {len(hours)} hours rebuilt up to {watermark.high_water}")
+        return len(hours)
+
+    def _rewrite(self, source: RollupSource, source_db: Session, analytics_db: Session, hours: List[datetime]):
+        """Ghi đè ô HOUR của các giờ đã cho, rồi ô DAY của các ngày chứa chúng"""
+        cells: Dict[Tuple[datetime, str, str], float] = {}
+        for start, end in _ranges(hours, timedelta(hours=1)):
+            rows = source_db.query(*source.columns).filter(
+                source.model.created_at >= start, source.model.created_at < end, *source.criteria
+            )
+            for row in rows.yield_per(_FETCH_BATCH):
+                hour = hour_floor(row[0])
+                for metric, dimension, amount in source.measure(row):
+                    key = (hour, metric, dimension)
+                    cells[key] = cells.get(key, 0.0) + float(amount)
+        self._replace(analytics_db, GRAIN_HOUR, source.metrics, hours, cells)
+
+        days = sorted({day_floor(hour) for hour in hours})
+        day_cells: Dict[Tuple[datetime, str, str], float] = {}
+        for start, end in _ranges(days, timedelta(days=1)):
+            rows = analytics_db.query(
+                KpiRollup.bucket_start, KpiRollup.metric, KpiRollup.dimension, KpiRollup.value
+            ).filter(
+                KpiRollup.grain == GRAIN_HOUR,
+                KpiRollup.metric.in_(source.metrics),
+                KpiRollup.bucket_start >= start,
+                KpiRollup.bucket_start < end
+            )
+            for bucket, metric, dimension, value in rows:
+                key = (day_floor(bucket), metric, dimension)
+                day_cells[key] = day_cells.get(key, 0.0) + (value or 0.0)
+        self._replace(analytics_db, GRAIN_DAY, source.metrics, days, day_cells)
+
+    @staticmethod
+    def _replace(db: Session, grain: str, metrics: Tuple[str, ...], buckets: List[datetime], cells: Dict):
+        for i in range(0, len(buckets), _IN_CHUNK):
+            db.execute(delete(KpiRollup).where(
+                KpiRollup.grain == grain,
+                KpiRollup.metric.in_(metrics),
+                KpiRollup.bucket_start.in_(buckets[i:i + _IN_CHUNK])
+            ))
+        rows = [
+            {"grain": grain, "bucket_start": bucket, "metric": metric, "dimension": dimension, "value": value}
+            for (bucket, metric, dimension), value in cells.items()
+        ]
+        if rows:
+            db.execute(insert(KpiRollup), rows)
+
+    # ─── Background loop ─────────────────────────────────────────
+
+    def start(self, interval_seconds: float = DEFAULT_INTERVAL_SECONDS):
+        """Thread nền: refresh ngay (backfill lần đầu), sau đó mỗi interval_seconds"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"[KpiRollup] refresh failed: {e}")
+                if self._stop.wait(interval_seconds):
+                    break
+
+        self._thread = threading.Thread(target=loop, name="kpi-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# ─── Reads ───────────────────────────────────────────────────────
+
+def rollups_refreshed_at(db: Session, sources: Sequence[RollupSource] = ROLLUP_SOURCES) -> Optional[datetime]:
+    """
+    Thời điểm refresh cũ nhất trong các nguồn: rollup phản ánh đủ dữ liệu
+    trước mốc này. None nếu có nguồn chưa được backfill lần nào.
+    """
+    names = [source.name for source in sources]
+    ready, refreshed_at = db.query(
+        func.count(KpiRollupWatermark.source), func.min(KpiRollupWatermark.updated_at)
+    ).filter(
+        KpiRollupWatermark.source.in_(names),
+        KpiRollupWatermark.high_water.isnot(None)
+    ).one()
+    if (ready or 0) < len(names) or refreshed_at is None:
+        return None
+    return _naive(refreshed_at)
+
+
+def rollup_sums(
+    db: Session,
+    windows: Optional[Dict[str, datetime]] = None,
+    sources: Sequence[RollupSource] = ROLLUP_SOURCES
+) -> Optional[Dict[Tuple[str, str], Dict[str, float]]]:
+    """
+    {(metric, dimension): {"all": tổng mọi thời điểm, <window>: tổng từ mốc}}
+
+    Một query trên kpi_rollups: ô DAY cho các ngày trọn vẹn, ô HOUR cho phần
+    lẻ đầu cửa sổ (mốc làm tròn xuống đầu giờ). None nếu có nguồn chưa được
+    backfill lần nào → caller tính trực tiếp từ bảng gốc.
+    """
+    if rollups_refreshed_at(db, sources) is None:
+        return None
+
+    windows = windows or {}
+    is_day = KpiRollup.grain == GRAIN_DAY
+    columns = [KpiRollup.metric, KpiRollup.dimension, func.sum(case((is_day, KpiRollup.value), else_=0))]
+    partial_hours = []
+    for since in windows.values():
+        start = hour_floor(since)
+        first_day = day_floor(start)
+        if first_day < start:
+            first_day += timedelta(days=1)
+        hour_part = and_(KpiRollup.grain == GRAIN_HOUR, KpiRollup.bucket_start >= start, KpiRollup.bucket_start < first_day)
+        in_window = or_(hour_part, and_(is_day, KpiRollup.bucket_start >= first_day))
+        columns.append(func.sum(case((in_window, KpiRollup.value), else_=0)))
+        partial_hours.append(hour_part)
+
+    rows = db.query(*columns).filter(or_(is_day, *partial_hours)).group_by(KpiRollup.metric, KpiRollup.dimension)
+    sums: Dict[Tuple[str, str], Dict[str, float]] = {}
+    for metric, dimension, *totals in rows:
+        sums[(metric, dimension)] = dict(zip(["all", *windows], (float(total or 0) for total in totals)))
+    return sums
+
+
+def rollup_value(
+    sums: Dict[Tuple[str, str], Dict[str, float]],
+    metric: str,
+    window: str = "all",
+    dimensions: Optional[Iterable[str]] = None
+) -> float:
+    """Tổng một metric trong cửa sổ, lọc theo dimension nếu có"""
+    wanted = set(dimensions) if dimensions is not None else None
+    return sum(
+        cell.get(window, 0.0) for (name, dimension), cell in sums.items()
+        if name == metric and (wanted is None or dimension in wanted)
+    )
+
+
+def dashboard_rollups(db: Session, since: datetime) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Số liệu orders / tickets / customers / conversations của dashboard từ
+    rollup, cùng khóa với order_metrics(), ticket_metrics()... trong
+    backend/services/dashboard_metrics.py. None nếu rollup chưa sẵn sàng.
+    """
+    sums = rollup_sums(db, {"recent": since})
+    if sums is None:
+        return None
+
+    def count(metric, window="all", *dimensions):
+        return int(rollup_value(sums, metric, window, dimensions or None))
+
+    return {
+        "orders": {
+            "total": count("orders.count"),
+            "recent": count("orders.count", "recent"),
+            "pending": count("orders.count", "all", OrderStatus.PENDING.value),
+            "revenue": rollup_value(sums, "orders.revenue", "recent"),
+        },
+        "tickets": {
+            "total": count("tickets.count"),
+            "open": count("tickets.count", "all", TicketStatus.OPEN.value),
+            "in_progress": count("tickets.count", "all", TicketStatus.IN_PROGRESS.value),
+            "resolved": count("tickets.count", "all", TicketStatus.RESOLVED.value),
+            "negative": count("tickets.sentiment", "all", "NEGATIVE"),
+            "recent_negative": count("tickets.sentiment", "recent", "NEGATIVE"),
+        },
+        "customers": {
+            "total": count("customers.new"),
+            "new": count("customers.new", "recent"),
+        },
+        "conversations": {
+            "recent": count("conversations.count", "recent"),
+        },
+    }
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_job: Optional[KpiRollupJob] = None
+_job_lock = threading.Lock()
+
+
+def get_kpi_rollup_job() -> KpiRollupJob:
+    """Rollup job dùng chung trong worker"""
+    global _job
+    if _job is None:
+        with _job_lock:
+            if _job is None:
+                _job = KpiRollupJob()
+    return _job
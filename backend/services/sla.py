@@ -0,0 +1,344 @@
+"""
+SLA Engine - Deadline phản hồi / giải quyết của ticket
+
+Deadline = created_at + target theo priority (nhân hệ số của queue nếu có).
+Mỗi deadline là một timer trong TimingWheel của worker:
+- ticket tạo / đổi priority → apply() + sync(): schedule timer (O(1))
+- phản hồi đầu tiên / resolved / closed → sync(): cancel timer (O(1))
+- tick() định kỳ chỉ xử lý timer đến hạn: đọc lại các ticket đó trong một
+  query, ghi BREACH và nâng priority một bậc (ESCALATION)
+
+Khi worker khởi động, seed() nạp deadline của ticket đang mở một lần; sau đó
+không còn quét toàn bảng. Nhiều worker cùng phát hiện một breach → unique
+(ticket_id, kind, event) giữ đúng một event.
+
+sla_metrics() tính compliance cho /analytics/kpi/overview bằng một aggregate
+query trên các cột due_at.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+import logging
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ai_modules.core.timing_wheel import TimingWheel
+from backend.models.ticket import Ticket, TicketPriority, TicketSlaEvent, TicketStatus
+from backend.models.ticket_routing import Assignment, WorkQueue
+
+try:
+    from prometheus_client import Counter
+    SLA_EVENTS = Counter(
+        "crm_ticket_sla_events_total",
+        "Ticket SLA breaches and escalations",
+        ["kind", "event"]
+    )
+except ImportError:  # prometheus-client is optional
+    SLA_EVENTS = None
+
+logger = logging.getLogger(__name__)
+
+KIND_RESPONSE = "RESPONSE"
+KIND_RESOLUTION = "RESOLUTION"
+EVENT_BREACH = "BREACH"
+EVENT_ESCALATION = "ESCALATION"
+
+# priority → (giờ phản hồi, giờ giải quyết)
+SLA_TARGET_HOURS: Dict[str, Tuple[float, float]] = {
+    TicketPriority.URGENT.value: (1, 4),
+    TicketPriority.HIGH.value: (4, 24),
+    TicketPriority.MEDIUM.value: (8, 48),
+    TicketPriority.LOW.value: (24, 72),
+}
+# Queue có SLA chặt hơn: nhân target với hệ số
+QUEUE_SLA_FACTORS: Dict[str, float] = {
+    "VIP": 0.5,
+    "ESCALATION": 0.5,
+}
+ESCALATION_ORDER = [TicketPriority.LOW, TicketPriority.MEDIUM, TicketPriority.HIGH, TicketPriority.URGENT]
+CLOSED_STATUSES = frozenset({TicketStatus.RESOLVED.value, TicketStatus.CLOSED.value})
+
+DEFAULT_TICK_SECONDS = 1.0
+DEFAULT_INTERVAL_SECONDS = 15.0
+
+
+def _value(enum_or_str) -> Optional[str]:
+    return getattr(enum_or_str, "value", enum_or_str)
+
+
+def _epoch(moment: datetime) -> float:
+    """Datetime (naive = UTC như datetime.utcnow()) → epoch seconds"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def compute_deadlines(
+    priority,
+    created_at: Optional[datetime] = None,
+    queue: Optional[str] = None
+) -> Tuple[datetime, datetime]:
+    """(response_due_at, resolution_due_at) theo priority và queue"""
+    response_hours, resolution_hours = SLA_TARGET_HOURS.get(
+        _value(priority), SLA_TARGET_HOURS[TicketPriority.MEDIUM.value]
+    )
+    factor = QUEUE_SLA_FACTORS.get(queue, 1.0) if queue else 1.0
+    start = created_at or datetime.utcnow()
+    return (
+        start + timedelta(hours=response_hours * factor),
+        start + timedelta(hours=resolution_hours * factor),
+    )
+
+
+def current_queue(db: Session, ticket_id: str) -> Optional[str]:
+    """Code của queue được gán gần nhất cho ticket"""
+    return (
+        db.query(WorkQueue.code)
+        .join(Assignment, Assignment.queue_id == WorkQueue.id)
+        .filter(Assignment.ticket_id == ticket_id)
+        .order_by(Assignment.assigned_at.desc())
+        .limit(1)
+        .scalar()
+    )
+
+
+class SLAEngine:
+    """
+    Usage:
+        engine = get_sla_engine()
+        engine.apply(ticket, queue="VIP")   # trước commit: ghi due_at
+        db.commit()
+        engine.sync(ticket)                 # sau commit: timer khớp trạng thái ticket
+        engine.tick()                       # chạy định kỳ (start() tạo thread nền)
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable] = None,
+        tick_seconds: float = DEFAULT_TICK_SECONDS,
+        escalate: bool = True,
+        clock: Callable[[], float] = time.time
+    ):
+        self.session_factory = session_factory
+        self.escalate = escalate
+        self.clock = clock
+        self.wheel = TimingWheel(tick_seconds=tick_seconds, start=clock())
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _session(self):
+        if self.session_factory is not None:
+            return self.session_factory()
+        from backend.database.session import SupportSession
+        return SupportSession()
+
+    # ─── Ticket events (O(1)) ────────────────────────────────────
+
+    def apply(self, ticket: Ticket, queue: Optional[str] = None):
+        """Tính và ghi due_at lên ticket (tạo mới, đổi priority, đổi queue)"""
+        ticket.response_due_at, ticket.resolution_due_at = compute_deadlines(
+            ticket.priority, ticket.created_at, queue
+        )
+
+    def sync(self, ticket):
+        """
+        Đồng bộ timer với trạng thái ticket: deadline chưa đạt thì schedule,
+        đã phản hồi / đã đóng thì cancel. Nhận ORM object hoặc row cùng tên cột.
+        """
+        closed = _value(ticket.status) in CLOSED_STATUSES
+        if closed or ticket.first_response_at is not None or ticket.response_due_at is None:
+            self.wheel.cancel((ticket.id, KIND_RESPONSE))
+        else:
+            self.wheel.schedule((ticket.id, KIND_RESPONSE), _epoch(ticket.response_due_at))
+        if closed or ticket.resolution_due_at is None:
+            self.wheel.cancel((ticket.id, KIND_RESOLUTION))
+        else:
+            self.wheel.schedule((ticket.id, KIND_RESOLUTION), _epoch(ticket.resolution_due_at))
+
+    def seed(self, db: Optional[Session] = None) -> int:
+        """Nạp timer của mọi ticket đang mở (một lần khi worker khởi động)"""
+        own = db is None
+        db = db or self._session()
+        try:
+            rows = db.query(
+                Ticket.id, Ticket.status, Ticket.first_response_at,
+                Ticket.response_due_at, Ticket.resolution_due_at
+            ).filter(
+                Ticket.status.notin_([TicketStatus(s) for s in CLOSED_STATUSES]),
+                Ticket.resolution_due_at.isnot(None)
+            ).all()
+        finally:
+            if own:
+                db.close()
+        for row in rows:
+            self.sync(row)
+        logger.info(f"[SLA] Seeded {len(self.wheel)} timers from {len(rows)} open tickets")
+        return len(rows)
+
+    # ─── Timer processing ────────────────────────────────────────
+
+    def tick(self, now: Optional[float] = None, db: Optional[Session] = None) -> List[Dict[str, Any]]:
+        """Xử lý timer đến hạn; trả về các event đã ghi"""
+        now = self.clock() if now is None else now
+        fired = self.wheel.advance(now)
+        if not fired:
+            return []
+        own = db is None
+        db = db or self._session()
+        try:
+            return self._fire(db, [key for key, _, _ in fired], now)
+        finally:
+            if own:
+                db.close()
+
+    def _fire(self, db: Session, keys: List[Tuple[str, str]], now: float) -> List[Dict[str, Any]]:
+        ticket_ids = list({ticket_id for ticket_id, _ in keys})
+        tickets = {t.id: t for t in db.query(Ticket).filter(Ticket.id.in_(ticket_ids)).all()}
+        recorded = {
+            (row.ticket_id, row.kind, row.event)
+            for row in db.query(TicketSlaEvent.ticket_id, TicketSlaEvent.kind, TicketSlaEvent.event)
+            .filter(TicketSlaEvent.ticket_id.in_(ticket_ids))
+        }
+
+        events: List[Dict[str, Any]] = []
+        for ticket_id, kind in keys:
+            ticket = tickets.get(ticket_id)
+            if ticket is None or (ticket_id, kind, EVENT_BREACH) in recorded:
+                continue
+            if not self._breached(ticket, kind, now):
+                self.sync(ticket)  # đã phản hồi/đóng, hoặc deadline được dời ở worker khác
+                continue
+            due_at = ticket.response_due_at if kind == KIND_RESPONSE else ticket.resolution_due_at
+            savepoint = db.begin_nested()
+            try:
+                fired = [TicketSlaEvent(ticket_id=ticket_id, kind=kind, event=EVENT_BREACH, due_at=due_at)]
+                if self.escalate and (ticket_id, kind, EVENT_ESCALATION) not in recorded:
+                    escalated = self._escalate(ticket)
+                    if escalated:
+                        fired.append(TicketSlaEvent(
+                            ticket_id=ticket_id, kind=kind, event=EVENT_ESCALATION,
+                            due_at=due_at, detail=escalated
+                        ))
+                db.add_all(fired)
+                savepoint.commit()
+            except IntegrityError:
+                savepoint.rollback()  # worker khác đã ghi breach này
+                continue
+            for event in fired:
+                recorded.add((ticket_id, kind, event.event))
+                if SLA_EVENTS is not None:
+                    SLA_EVENTS.labels(kind=kind, event=event.event).inc()
+                events.append({
+                    "ticket_id": ticket_id, "kind": kind, "event": event.event,
+                    "due_at": due_at, "detail": event.detail
+                })
+
+        db.commit()
+        if events:
+            logger.warning(f"[SLA] {len(events)} SLA events: " + ", ".join(
+                f"{e['ticket_id']} {e['kind']} {e['event']}" for e in events
+            ))
+        return events
+
+    def _breached(self, ticket: Ticket, kind: str, now: float) -> bool:
+        if _value(ticket.status) in CLOSED_STATUSES:
+            return False
+        if kind == KIND_RESPONSE:
+            due_at = ticket.response_due_at
+            if ticket.first_response_at is not None:
+                return False
+        else:
+            due_at = ticket.resolution_due_at
+        return due_at is not None and _epoch(due_at) <= now + self.wheel.tick_seconds
+
+    @staticmethod
+    def _escalate(ticket: Ticket) -> Optional[str]:
+        """Nâng priority một bậc; trả về "OLD->NEW" hoặc None nếu đã URGENT"""
+        current = TicketPriority(_value(ticket.priority) or TicketPriority.MEDIUM.value)
+        index = ESCALATION_ORDER.index(current)
+        if index + 1 >= len(ESCALATION_ORDER):
+            return None
+        ticket.priority = ESCALATION_ORDER[index + 1]
+        return f"{current.value}->{ticket.priority.value}"
+
+    # ─── Background loop ─────────────────────────────────────────
+
+    def start(self, interval_seconds: float = DEFAULT_INTERVAL_SECONDS):
+        """Thread nền gọi tick() mỗi interval_seconds"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.error(f"[SLA] tick failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name="sla-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def sla_metrics(db: Session, since: datetime, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    SLA compliance (%) của ticket tạo từ `since`: deadline đã tới hạn hoặc đã
+    đạt được tính vào mẫu số, đạt đúng hạn tính vào tử số.
+    open_breaches: ticket đang mở đã quá hạn giải quyết (toàn bộ backlog).
+    """
+    now = now or datetime.utcnow()
+    resolved_at = func.coalesce(Ticket.resolved_at, Ticket.closed_at)
+
+    def counted(due, done):
+        return func.sum(case((and_(due.isnot(None), or_(done.isnot(None), due <= now)), 1), else_=0))
+
+    def met(due, done):
+        return func.sum(case((and_(due.isnot(None), done.isnot(None), done <= due), 1), else_=0))
+
+    row = db.query(
+        counted(Ticket.response_due_at, Ticket.first_response_at).label("response_total"),
+        met(Ticket.response_due_at, Ticket.first_response_at).label("response_met"),
+        counted(Ticket.resolution_due_at, resolved_at).label("resolution_total"),
+        met(Ticket.resolution_due_at, resolved_at).label("resolution_met"),
+    ).filter(Ticket.created_at >= since).one()
+
+    open_breaches = db.query(func.count(Ticket.id)).filter(
+        Ticket.resolution_due_at < now,
+        Ticket.status.notin_([TicketStatus(s) for s in CLOSED_STATUSES])
+    ).scalar()
+
+    def percent(part, whole) -> Optional[float]:
+        return round(100.0 * (part or 0) / whole, 1) if whole else None
+
+    response_total, resolution_total = row.response_total or 0, row.resolution_total or 0
+    return {
+        "sla_compliance": percent((row.response_met or 0) + (row.resolution_met or 0), response_total + resolution_total),
+        "response_compliance": percent(row.response_met, response_total),
+        "resolution_compliance": percent(row.resolution_met, resolution_total),
+        "open_breaches": open_breaches or 0,
+    }
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_engine: Optional[SLAEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_sla_engine() -> SLAEngine:
+    """SLA engine dùng chung trong worker"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = SLAEngine()
+    return _engine
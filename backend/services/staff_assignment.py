@@ -0,0 +1,192 @@
+"""
+Staff Assignment Service - Giao ticket cho nhân viên đang ít việc nhất
+
+Mỗi worker giữ trong bộ nhớ:
+- số ticket đang mở của từng staff (seed từ Support DB: GROUP BY assigned_to)
+- danh sách staff active (Identity DB)
+- min-heap (load, staff_id) trên toàn bộ staff
+
+pick() lấy staff ít ticket nhất trong O(log n) và tăng bộ đếm ngay; track()
+cập nhật khi ticket được giao lại hoặc đổi trạng thái. Ticket do worker khác
+xử lý không đi qua bộ đếm của worker này → seed lại định kỳ (reseed_seconds)
+để hội tụ về số liệu trong DB.
+
+Usage:
+    assigner = get_staff_assignment()
+    ticket.assigned_to = assigner.pick(support_db, identity_db)
+    ...
+    assigner.track(old_assignee, old_status, ticket.assigned_to, ticket.status)
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import heapq
+import threading
+import time
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.models.ticket import Ticket, TicketStatus
+from backend.models.user import User, UserStatus, UserType
+
+logger = logging.getLogger(__name__)
+
+# Ticket còn tính vào khối lượng việc của staff
+WORKLOAD_STATUSES = frozenset({
+    TicketStatus.OPEN.value,
+    TicketStatus.IN_PROGRESS.value,
+    TicketStatus.WAITING_CUSTOMER.value,
+})
+DEFAULT_RESEED_SECONDS = 300
+
+
+def _is_open(status) -> bool:
+    return getattr(status, "value", status) in WORKLOAD_STATUSES
+
+
+class _LoadHeap:
+    """Min-heap (load, staff_id), entry cũ bị bỏ khi peek (lazy deletion)"""
+
+    def __init__(self):
+        self._heap: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, load: int, staff_id: str):
+        heapq.heappush(self._heap, (load, staff_id))
+
+    def rebuild(self, loads: Dict[str, int], members: Set[str]):
+        self._heap = [(loads.get(staff_id, 0), staff_id) for staff_id in members]
+        heapq.heapify(self._heap)
+
+    def peek(self, loads: Dict[str, int], members: Set[str]) -> Optional[str]:
+        while self._heap:
+            load, staff_id = self._heap[0]
+            if staff_id in members and loads.get(staff_id, 0) == load:
+                return staff_id
+            heapq.heappop(self._heap)
+        return None
+
+
+class StaffAssignmentService:
+    """
+    Bộ đếm workload theo staff + chọn staff ít việc nhất.
+
+    Args:
+        reseed_seconds: Sau khoảng này lần pick() tiếp theo đọc lại DB
+                        (staff mới, ticket do worker khác giao/đóng)
+    """
+
+    def __init__(self, reseed_seconds: float = DEFAULT_RESEED_SECONDS):
+        self.reseed_seconds = reseed_seconds
+        self._lock = threading.Lock()
+        self._loads: Dict[str, int] = {}
+        self._staff: Set[str] = set()
+        self._heap = _LoadHeap()
+        self._seeded_at: Optional[float] = None
+
+    # ─── Seeding ─────────────────────────────────────────────────
+
+    @property
+    def is_stale(self) -> bool:
+        return self._seeded_at is None or time.monotonic() - self._seeded_at > self.reseed_seconds
+
+    def seed(self, support_db: Optional[Session] = None, identity_db: Optional[Session] = None):
+        """Đọc lại staff active và số ticket đang mở của từng staff"""
+        from backend.database.session import IdentitySession, SupportSession
+
+        own_identity = identity_db is None
+        identity_db = identity_db or IdentitySession()
+        try:
+            staff = {
+                row.id for row in identity_db.query(User.id).filter(
+                    User.user_type == UserType.STAFF,
+                    User.status == UserStatus.ACTIVE
+                )
+            }
+        finally:
+            if own_identity:
+                identity_db.close()
+
+        own_support = support_db is None
+        support_db = support_db or SupportSession()
+        try:
+            loads = dict(
+                support_db.query(Ticket.assigned_to, func.count(Ticket.id)).filter(
+                    Ticket.assigned_to.isnot(None),
+                    Ticket.status.in_([TicketStatus(s) for s in WORKLOAD_STATUSES])
+                ).group_by(Ticket.assigned_to).all()
+            )
+        finally:
+            if own_support:
+                support_db.close()
+
+        with self._lock:
+            self._loads = {staff_id: int(count) for staff_id, count in loads.items()}
+            self._staff = staff
+            self._heap.rebuild(self._loads, self._staff)
+            self._seeded_at = time.monotonic()
+        logger.info(f"[StaffAssignment] Seeded {len(staff)} staff")
+
+    # ─── Assignment ──────────────────────────────────────────────
+
+    def pick(self, support_db: Optional[Session] = None, identity_db: Optional[Session] = None) -> Optional[str]:
+        """
+        Staff ít ticket đang mở nhất và tính ngay ticket mới vào workload.
+        None nếu không có staff nào.
+        """
+        if self.is_stale:
+            self.seed(support_db, identity_db)
+
+        with self._lock:
+            staff_id = self._heap.peek(self._loads, self._staff)
+            if staff_id is not None:
+                self._adjust(staff_id, 1)
+            return staff_id
+
+    def track(self, before_staff: Optional[str], before_status, after_staff: Optional[str], after_status):
+        """Cập nhật workload khi ticket đổi người phụ trách và/hoặc trạng thái"""
+        before = before_staff if before_staff and _is_open(before_status) else None
+        after = after_staff if after_staff and _is_open(after_status) else None
+        if before == after:
+            return
+        with self._lock:
+            if before:
+                self._adjust(before, -1)
+            if after:
+                self._adjust(after, 1)
+
+    def load(self, staff_id: str) -> int:
+        return self._loads.get(staff_id, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Workload hiện tại của staff active"""
+        with self._lock:
+            return {staff_id: self._loads.get(staff_id, 0) for staff_id in self._staff}
+
+    def _adjust(self, staff_id: str, delta: int):
+        """Đổi load một staff + đẩy entry mới vào heap (caller giữ lock)"""
+        load = max(0, self._loads.get(staff_id, 0) + delta)
+        self._loads[staff_id] = load
+        if staff_id not in self._staff:
+            return
+        self._heap.push(load, staff_id)
+        if len(self._heap) > 4 * len(self._staff) + 64:
+            self._heap.rebuild(self._loads, self._staff)
+
+
+# ─── Factory ─────────────────────────────────────────────────────
+
+_service: Optional[StaffAssignmentService] = None
+_service_lock = threading.Lock()
+
+
+def get_staff_assignment() -> StaffAssignmentService:
+    """Bộ đếm workload dùng chung trong worker"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = StaffAssignmentService()
+    return _service
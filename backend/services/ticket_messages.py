@@ -0,0 +1,38 @@
+"""
+Ticket Messages - Truy vấn tin nhắn ticket dùng chung
+
+first_messages() lấy tin nhắn đầu tiên của nhiều ticket bằng grouped query,
+chia id thành từng khối IN_CLAUSE_CHUNK để mệnh đề IN không vượt giới hạn
+tham số của DB. Dùng cho deduplication (so sánh nội dung) và routing
+(keyword trên tin nhắn đầu).
+"""
+from typing import Dict, List
+
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from backend.models.ticket import TicketMessage
+
+IN_CLAUSE_CHUNK = 1000
+
+
+def first_messages(db: Session, ticket_ids: List[str]) -> Dict[str, str]:
+    """{ticket_id: nội dung tin nhắn đầu tiên} - một grouped query mỗi khối id"""
+    found: Dict[str, str] = {}
+    for i in range(0, len(ticket_ids), IN_CLAUSE_CHUNK):
+        chunk = ticket_ids[i:i + IN_CLAUSE_CHUNK]
+        first_at = db.query(
+            TicketMessage.ticket_id,
+            func.min(TicketMessage.created_at).label("first_at")
+        ).filter(TicketMessage.ticket_id.in_(chunk)).group_by(TicketMessage.ticket_id).subquery()
+        rows = db.query(TicketMessage.ticket_id, TicketMessage.message).join(
+            first_at,
+            and_(
+                TicketMessage.ticket_id == first_at.c.ticket_id,
+                TicketMessage.created_at == first_at.c.first_at
+            )
+        ).order_by(TicketMessage.id).all()
+        # Trùng created_at: giữ tin có id nhỏ nhất
+        for row in rows:
+            found.setdefault(row.ticket_id, row.message or "")
+    return found
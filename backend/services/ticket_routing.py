@@ -3,8 +3,9 @@ Ticket Routing Service - Auto-route tickets dựa trên routing_rules từ DB
 
 Flow:
 1. Ticket được tạo → gọi route_ticket()
-2. Lấy tất cả routing_rules (is_active=1) sắp xếp theo priority
-3. Evaluate predicate trên ticket
+2. Lấy bộ rule đã biên dịch (cache theo worker, biên dịch lại khi
+   routing_rule_versions.version thay đổi)
+3. Evaluate predicate trên ticket (rule priority thấp trước, rule đầu tiên khớp thắng)
 4. Áp dụng action (assign queue, set priority, assign staff)
 5. Tạo assignment record
 
@@ -24,16 +25,241 @@ Action format:
     "assign_to": "<user_uuid>",
     "add_tags": ["urgent"]
 }
+
+Biên dịch: mỗi predicate thành danh sách closure (frozenset cho
+category/priority/channel, ngưỡng float cho sentiment); keyword của mọi rule
+gộp vào một automaton Aho–Corasick (label = rule id) → text của ticket chỉ
+quét một lượt dù có bao nhiêu rule.
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Callable, FrozenSet, Optional, List, Sequence
+from collections import Counter
+from dataclasses import dataclass, field
+import threading
+from sqlalchemy import and_, func, insert, update
 from sqlalchemy.orm import Session
 import logging
 
-from backend.models.ticket import Ticket, TicketPriority
-from backend.models.ticket_routing import RoutingRule, WorkQueue, Assignment
+from ai_modules.core.keyword_matcher import KeywordMatcher
+from backend.models.ticket import Ticket, TicketMessage, TicketPriority, TicketStatus
+from backend.models.ticket_routing import RoutingRule, RoutingRuleVersion, WorkQueue, Assignment
+from backend.services.staff_assignment import get_staff_assignment
+from backend.services.ticket_messages import IN_CLAUSE_CHUNK, first_messages
 
 logger = logging.getLogger(__name__)
 
+RULES_VERSION_ID = 1
+
+# Bulk re-routing: ticket chưa xử lý xong
+BACKLOG_STATUSES = [TicketStatus.OPEN, TicketStatus.IN_PROGRESS, TicketStatus.WAITING_CUSTOMER]
+DEFAULT_REROUTE_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class RoutingContext:
+    """Các trường của ticket mà predicate cần, tính một lần cho mỗi ticket"""
+    category: Optional[str]
+    priority: Optional[str]
+    channel: str
+    sentiment: Optional[float]
+    keyword_hits: FrozenSet[str] = frozenset()
+
+
+Check = Callable[[RoutingContext], bool]
+
+
+@dataclass
+class CompiledRule:
+    """Một routing rule đã biên dịch: tất cả checks phải đúng (AND)"""
+    id: str
+    code: str
+    name: str
+    priority: int
+    action: Dict[str, Any]
+    checks: List[Check] = field(default_factory=list)
+
+    def matches(self, context: RoutingContext) -> bool:
+        return all(check(context) for check in self.checks)
+
+
+def _as_set(values) -> FrozenSet:
+    if values is None:
+        return frozenset()
+    if isinstance(values, str):
+        return frozenset([values])
+    return frozenset(values)
+
+
+def _member(attr: str, allowed: FrozenSet) -> Check:
+    return lambda context: getattr(context, attr) in allowed
+
+
+def _sentiment_below(threshold: float) -> Check:
+    return lambda context: context.sentiment is not None and context.sentiment < threshold
+
+
+def _keyword_hit(rule_id: str) -> Check:
+    return lambda context: rule_id in context.keyword_hits
+
+
+class CompiledRuleSet:
+    """
+    Bộ rule active đã biên dịch, sắp xếp theo priority.
+
+    Usage:
+        rules = CompiledRuleSet(db_rules, version=7)
+        rule = rules.match(ticket, first_message="tôi muốn hoàn tiền")
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[RoutingRule],
+        version: int = 0,
+        queue_ids: Optional[Dict[str, str]] = None
+    ):
+        self.version = version
+        self.queue_ids: Dict[str, str] = dict(queue_ids or {})
+        self.rules: List[CompiledRule] = []
+        keywords: Dict[str, List[str]] = {}
+
+        for rule in sorted(rules, key=lambda r: r.priority):
+            compiled = self._compile(rule, keywords)
+            if compiled is not None:
+                self.rules.append(compiled)
+
+        # whole_word=False: giữ ngữ nghĩa "keyword nằm trong text" như trước
+        self.matcher = KeywordMatcher(keywords, whole_word=False) if keywords else None
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    @property
+    def needs_text(self) -> bool:
+        """Có rule nào lọc theo keyword (cần subject + tin nhắn đầu)"""
+        return self.matcher is not None
+
+    @staticmethod
+    def _compile(rule: RoutingRule, keywords: Dict[str, List[str]]) -> Optional[CompiledRule]:
+        predicate = rule.predicate
+        if not predicate or not isinstance(predicate, dict):
+            return None
+
+        checks: List[Check] = []
+        try:
+            if "category" in predicate:
+                checks.append(_member("category", _as_set(predicate["category"])))
+            if "priority" in predicate:
+                checks.append(_member("priority", _as_set(predicate["priority"])))
+            if "channel" in predicate:
+                checks.append(_member("channel", _as_set(predicate["channel"])))
+            if "sentiment_below" in predicate:
+                checks.append(_sentiment_below(float(predicate["sentiment_below"])))
+            if "keywords" in predicate:
+                words = [kw for kw in _as_set(predicate["keywords"]) if isinstance(kw, str) and kw]
+                if not words:
+                    return None  # không keyword nào có thể khớp
+                keywords[rule.id] = words
+                checks.append(_keyword_hit(rule.id))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[TicketRouting] Skipping rule '{rule.code}': invalid predicate ({e})")
+            return None
+
+        return CompiledRule(
+            id=rule.id,
+            code=rule.code,
+            name=rule.name,
+            priority=rule.priority,
+            action=dict(rule.action or {}),
+            checks=checks
+        )
+
+    def context(self, ticket: Ticket, first_message: Optional[str] = None) -> RoutingContext:
+        keyword_hits: FrozenSet[str] = frozenset()
+        if self.matcher is not None:
+            text = ticket.subject or ""
+            if first_message:
+                text += " " + first_message
+            keyword_hits = frozenset(m.label for m in self.matcher.find_all(text))
+        return RoutingContext(
+            category=ticket.category.value if ticket.category else None,
+            priority=ticket.priority.value if ticket.priority else None,
+            channel=ticket.channel or "",
+            sentiment=ticket.sentiment_score,
+            keyword_hits=keyword_hits
+        )
+
+    def match(self, ticket: Ticket, first_message: Optional[str] = None) -> Optional[CompiledRule]:
+        """Rule đầu tiên (priority thấp nhất) khớp ticket"""
+        if not self.rules:
+            return None
+        context = self.context(ticket, first_message)
+        for rule in self.rules:
+            if rule.matches(context):
+                return rule
+        return None
+
+
+# ─── Per-worker cache ────────────────────────────────────────────
+
+_compiled: Optional[CompiledRuleSet] = None
+_compiled_lock = threading.Lock()
+
+
+def get_rules_version(db: Session) -> int:
+    """Version hiện tại của routing_rules (0 nếu chưa có row đếm)"""
+    version = (
+        db.query(RoutingRuleVersion.version)
+        .filter(RoutingRuleVersion.id == RULES_VERSION_ID)
+        .scalar()
+    )
+    return int(version or 0)
+
+
+def bump_rules_version(db: Session) -> None:
+    """
+    Đánh dấu routing_rules đã thay đổi (gọi sau khi tạo/sửa/xóa rule qua app;
+    caller commit). Trên MySQL trigger của routing_rules cũng tăng version.
+    """
+    updated = (
+        db.query(RoutingRuleVersion)
+        .filter(RoutingRuleVersion.id == RULES_VERSION_ID)
+        .update({RoutingRuleVersion.version: RoutingRuleVersion.version + 1}, synchronize_session=False)
+    )
+    if not updated:
+        db.add(RoutingRuleVersion(id=RULES_VERSION_ID, version=1))
+
+
+def get_compiled_rules(db: Session) -> CompiledRuleSet:
+    """
+    Bộ rule đã biên dịch của worker. Mỗi lần gọi chỉ đọc một row version;
+    rule và queue chỉ được load + biên dịch lại khi version đổi.
+    """
+    global _compiled
+    version = get_rules_version(db)
+    current = _compiled
+    if current is not None and current.version == version:
+        return current
+
+    with _compiled_lock:
+        if _compiled is not None and _compiled.version == version:
+            return _compiled
+        rules = (
+            db.query(RoutingRule)
+            .filter(RoutingRule.is_active == 1)
+            .order_by(RoutingRule.priority.asc())
+            .all()
+        )
+        queue_ids = {code: queue_id for queue_id, code in db.query(WorkQueue.id, WorkQueue.code).all()}
+        _compiled = CompiledRuleSet(rules, version=version, queue_ids=queue_ids)
+        logger.info(f"[TicketRouting] Compiled {len(_compiled)} routing rules (version {version})")
+        return _compiled
+
+
+def invalidate_compiled_rules() -> None:
+    """Bỏ bộ rule đã cache của worker này (lần route tiếp theo biên dịch lại)"""
+    global _compiled
+    with _compiled_lock:
+        _compiled = None
+
 
 class TicketRoutingService:
     """
@@ -47,23 +273,19 @@ class TicketRoutingService:
     def __init__(self, db: Session):
         self.db = db
 
-    def route_ticket(self, ticket: Ticket) -> Dict[str, Any]:
+    def route_ticket(self, ticket: Ticket, first_message: Optional[str] = None) -> Dict[str, Any]:
         """
         Auto-route ticket dựa trên routing_rules.
         
         Args:
             ticket: Ticket object cần route
+            first_message: Tin nhắn đầu tiên của khách nếu caller đã có sẵn;
+                           None → chỉ query khi có rule lọc theo keyword
             
         Returns:
             Dict với matched_rule, assignment, actions_applied
         """
-        # Load active rules sorted by priority (lower = higher)
-        rules = (
-            self.db.query(RoutingRule)
-            .filter(RoutingRule.is_active == 1)
-            .order_by(RoutingRule.priority.asc())
-            .all()
-        )
+        rules = get_compiled_rules(self.db)
 
         if not rules:
             logger.info(f"[TicketRouting] No active rules found for ticket {ticket.id}")
@@ -73,22 +295,24 @@ class TicketRoutingService:
                 "ticket_id": ticket.id
             }
 
-        # Evaluate each rule
-        for rule in rules:
-            if self._evaluate_predicate(rule.predicate, ticket):
-                # Apply actions
-                result = self._apply_action(rule, ticket)
-                return {
-                    "routed": True,
-                    "matched_rule": {
-                        "id": rule.id,
-                        "code": rule.code,
-                        "name": rule.name,
-                        "priority": rule.priority
-                    },
-                    "actions_applied": result,
-                    "ticket_id": ticket.id
-                }
+        if first_message is None and rules.needs_text:
+            first_message = self._first_message(ticket)
+
+        rule = rules.match(ticket, first_message)
+        if rule is not None:
+            # Apply actions
+            result = self._apply_action(rule, ticket, rules.queue_ids)
+            return {
+                "routed": True,
+                "matched_rule": {
+                    "id": rule.id,
+                    "code": rule.code,
+                    "name": rule.name,
+                    "priority": rule.priority
+                },
+                "actions_applied": result,
+                "ticket_id": ticket.id
+            }
 
         logger.info(f"[TicketRouting] No rule matched for ticket {ticket.id}")
         return {
@@ -97,59 +321,203 @@ class TicketRoutingService:
             "ticket_id": ticket.id
         }
 
-    def _evaluate_predicate(self, predicate: Dict, ticket: Ticket) -> bool:
+    def route_backlog(
+        self,
+        batch_size: int = DEFAULT_REROUTE_BATCH_SIZE,
+        dry_run: bool = False,
+        statuses: Optional[List[TicketStatus]] = None
+    ) -> Dict[str, Any]:
         """
-        Evaluate a predicate dict against a ticket.
-        All specified conditions must match (AND logic).
+        Re-route toàn bộ ticket đang mở theo bộ rule hiện tại (vd. sau khi sửa rule).
+
+        Ticket được đọc theo keyset (id > last_id, chỉ các cột predicate cần),
+        tin nhắn đầu lấy bằng một query mỗi batch, rule đánh giá trong bộ nhớ.
+        Assignment ghi bằng một bulk INSERT - chỉ cho ticket có queue/assignee
+        khác assignment gần nhất (lấy bằng một grouped query mỗi batch) -
+        priority/assigned_to bằng một bulk UPDATE theo primary key, mỗi batch
+        một commit. Dry-run báo cùng các con số "chỉ thay đổi".
+
+        Args:
+            batch_size: Số ticket mỗi batch
+            dry_run: Chỉ đếm kết quả, không ghi gì
+            statuses: Trạng thái cần re-route (mặc định BACKLOG_STATUSES)
+
+        Returns:
+            Dict với scanned, routed, unmatched, by_rule, reassigned,
+            by_queue (chỉ assignment mới), priority_changes, batches, dry_run
         """
-        if not predicate or not isinstance(predicate, dict):
-            return False
-
-        # Check category
-        if "category" in predicate:
-            allowed = predicate["category"]
-            ticket_cat = ticket.category.value if ticket.category else None
-            if ticket_cat not in allowed:
-                return False
-
-        # Check priority
-        if "priority" in predicate:
-            allowed = predicate["priority"]
-            ticket_pri = ticket.priority.value if ticket.priority else None
-            if ticket_pri not in allowed:
-                return False
-
-        # Check channel
-        if "channel" in predicate:
-            allowed = predicate["channel"]
-            ticket_ch = ticket.channel or ""
-            if ticket_ch not in allowed:
-                return False
-
-        # Check keywords (any keyword in subject or first message)
-        if "keywords" in predicate:
-            keywords = predicate["keywords"]
-            text = (ticket.subject or "").lower()
-            if ticket.messages:
-                text += " " + (ticket.messages[0].message or "").lower()
-            if not any(kw.lower() in text for kw in keywords):
-                return False
-
-        # Check sentiment threshold
-        if "sentiment_below" in predicate:
-            threshold = float(predicate["sentiment_below"])
-            score = ticket.sentiment_score
-            if score is None or score >= threshold:
-                return False
-
-        return True
-
-    def _apply_action(self, rule: RoutingRule, ticket: Ticket) -> Dict[str, Any]:
+        rules = get_compiled_rules(self.db)
+        statuses = statuses or BACKLOG_STATUSES
+        by_rule: Counter = Counter()
+        by_queue: Counter = Counter()
+        priority_changes: Counter = Counter()
+        scanned = batches = reassigned_count = 0
+        last_id = None
+
+        while rules:
+            query = self.db.query(
+                Ticket.id, Ticket.subject, Ticket.category, Ticket.priority, Ticket.status,
+                Ticket.channel, Ticket.sentiment_score, Ticket.assigned_to
+            ).filter(Ticket.status.in_(statuses))
+            if last_id is not None:
+                query = query.filter(Ticket.id > last_id)
+            tickets = query.order_by(Ticket.id).limit(batch_size).all()
+            if not tickets:
+                break
+            last_id = tickets[-1].id
+            scanned += len(tickets)
+            batches += 1
+
+            ticket_ids = [t.id for t in tickets]
+            first = first_messages(self.db, ticket_ids) if rules.needs_text else {}
+            latest = self._latest_assignments(ticket_ids)
+            assignments: List[Dict[str, Any]] = []
+            ticket_updates: List[Dict[str, Any]] = []
+            reassigned = []
+
+            for ticket in tickets:
+                rule = rules.match(ticket, first.get(ticket.id))
+                if rule is None:
+                    continue
+                by_rule[rule.code] += 1
+                changes = self._planned_changes(rule, ticket)
+                queue_code = rule.action.get("assign_queue")
+                queue_id = self._queue_id(queue_code, rules.queue_ids) if queue_code else None
+                assignee_id = rule.action.get("assign_to") or None
+                if "priority" in changes:
+                    priority_changes[changes["priority"].value] += 1
+                if changes:
+                    ticket_updates.append({"id": ticket.id, **changes})
+                if "assigned_to" in changes:
+                    reassigned.append((ticket.assigned_to, ticket.status, changes["assigned_to"]))
+                # Cùng queue + assignee với lần gần nhất → không ghi thêm lịch sử
+                if (queue_id, assignee_id) in latest.get(ticket.id, ()):
+                    continue
+                if queue_id:
+                    by_queue[queue_code] += 1
+                assignments.append({
+                    "ticket_id": ticket.id,
+                    "queue_id": queue_id,
+                    "assignee_id": assignee_id,
+                    "decided_by_rule": rule.id
+                })
+
+            reassigned_count += len(assignments)
+
+            if dry_run:
+                continue
+            try:
+                if assignments:
+                    self.db.execute(insert(Assignment), assignments)
+                if ticket_updates:
+                    self.db.execute(update(Ticket), ticket_updates)
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                logger.error(f"[TicketRouting] Bulk re-route failed after ticket {last_id}: {e}")
+                raise
+            workload = get_staff_assignment()
+            for previous, ticket_status, assignee_id in reassigned:
+                workload.track(previous, ticket_status, assignee_id, ticket_status)
+            logger.info(
+                f"[TicketRouting] Re-routed batch {batches}: "
+                f"{len(assignments)}/{len(tickets)} tickets reassigned"
+            )
+
+        routed = sum(by_rule.values())
+        return {
+            "dry_run": dry_run,
+            "rules_version": rules.version,
+            "scanned": scanned,
+            "routed": routed,
+            "unmatched": scanned - routed,
+            "by_rule": dict(by_rule),
+            "reassigned": reassigned_count,
+            "by_queue": dict(by_queue),
+            "priority_changes": dict(priority_changes),
+            "batches": batches
+        }
+
+    def _latest_assignments(self, ticket_ids: List[str]) -> Dict[str, set]:
+        """
+        {ticket_id: {(queue_id, assignee_id)}} của assignment gần nhất - một
+        grouped query mỗi khối id. assigned_at chỉ chính xác tới giây nên có thể
+        có nhiều bản ghi cùng mốc → giữ cả tập.
+        """
+        latest: Dict[str, set] = {}
+        for i in range(0, len(ticket_ids), IN_CLAUSE_CHUNK):
+            chunk = ticket_ids[i:i + IN_CLAUSE_CHUNK]
+            last_at = self.db.query(
+                Assignment.ticket_id,
+                func.max(Assignment.assigned_at).label("last_at")
+            ).filter(Assignment.ticket_id.in_(chunk)).group_by(Assignment.ticket_id).subquery()
+            rows = self.db.query(Assignment.ticket_id, Assignment.queue_id, Assignment.assignee_id).join(
+                last_at,
+                and_(
+                    Assignment.ticket_id == last_at.c.ticket_id,
+                    Assignment.assigned_at == last_at.c.last_at
+                )
+            ).all()
+            for row in rows:
+                latest.setdefault(row.ticket_id, set()).add((row.queue_id, row.assignee_id))
+        return latest
+
+    @staticmethod
+    def _planned_changes(rule: CompiledRule, ticket) -> Dict[str, Any]:
+        """Các cột ticket mà action của rule sẽ đổi (bỏ qua giá trị không đổi)"""
+        changes: Dict[str, Any] = {}
+        if "set_priority" in rule.action:
+            try:
+                priority = TicketPriority(rule.action["set_priority"])
+                if priority != ticket.priority:
+                    changes["priority"] = priority
+            except ValueError:
+                pass
+        assignee_id = rule.action.get("assign_to")
+        if assignee_id and assignee_id != ticket.assigned_to:
+            changes["assigned_to"] = assignee_id
+        return changes
+
+    def _queue_id(self, queue_code: str, queue_ids: Optional[Dict[str, str]] = None) -> Optional[str]:
+        queue_id = (queue_ids or {}).get(queue_code)
+        if queue_id is None:
+            # Queue tạo sau lần biên dịch gần nhất
+            queue_id = self.db.query(WorkQueue.id).filter(WorkQueue.code == queue_code).scalar()
+            if queue_id is not None and queue_ids is not None:
+                queue_ids[queue_code] = queue_id
+        return queue_id
+
+    def _first_message(self, ticket: Ticket) -> Optional[str]:
+        """Nội dung tin nhắn đầu tiên (một cột, không load relationship)"""
+        if ticket.id is None:
+            return None
+        return (
+            self.db.query(TicketMessage.message)
+            .filter(TicketMessage.ticket_id == ticket.id)
+            .order_by(TicketMessage.created_at.asc(), TicketMessage.id.asc())
+            .limit(1)
+            .scalar()
+        )
+
+    def _evaluate_predicate(self, predicate: Dict, ticket: Ticket, first_message: Optional[str] = None) -> bool:
+        """
+        Evaluate một predicate dict đơn lẻ against a ticket (không qua cache,
+        dùng để thử rule). All specified conditions must match (AND logic).
+        """
+        probe = RoutingRule(id="_probe", code="_probe", name="_probe", priority=0, predicate=predicate, action={})
+        return CompiledRuleSet([probe]).match(ticket, first_message) is not None
+
+    def _apply_action(
+        self,
+        rule: CompiledRule,
+        ticket: Ticket,
+        queue_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         """
         Apply routing action to ticket.
         Creates an Assignment record.
         """
-        action = rule.action or {}
+        action = rule.action
         applied = {}
 
         # Set priority
@@ -165,12 +533,12 @@ class TicketRoutingService:
         queue_id = None
         if "assign_queue" in action:
             queue_code = action["assign_queue"]
-            queue = self.db.query(WorkQueue).filter(WorkQueue.code == queue_code).first()
-            if queue:
-                queue_id = queue.id
+            queue_id = self._queue_id(queue_code, queue_ids)
+            if queue_id:
                 applied["queue"] = queue_code
 
         # Assign to specific staff
+        previous_assignee = ticket.assigned_to
         assignee_id = action.get("assign_to")
         if assignee_id:
             ticket.assigned_to = assignee_id
@@ -188,6 +556,8 @@ class TicketRoutingService:
         try:
             self.db.commit()
             self.db.refresh(ticket)
+            if assignee_id:
+                get_staff_assignment().track(previous_assignee, ticket.status, ticket.assigned_to, ticket.status)
             logger.info(
                 f"[TicketRouting] Ticket {ticket.id} routed by rule '{rule.code}' "
                 f"→ queue={queue_id}, assignee={assignee_id}"
@@ -0,0 +1,142 @@
+"""
+Time Series - Gom nhóm theo thời gian ngay trong SQL
+
+time_series() sinh một query GROUP BY bucket (hour / day / week / month) với
+nhiều metric aggregate cùng lúc, nên DB chỉ trả về một dòng mỗi bucket thay
+vì toàn bộ bản ghi trong cửa sổ. Bucket trống được điền ở backend để client
+luôn nhận chuỗi liên tục.
+
+Biểu thức bucket phụ thuộc dialect (MySQL / SQLite / PostgreSQL) và luôn trả
+về chuỗi 'YYYY-MM-DD HH:00:00'. Tuần bắt đầu từ thứ Hai; mọi mốc theo UTC.
+
+Usage:
+    points = time_series(
+        db, Order.created_at, start=start_date, granularity="day",
+        metrics={"order_count": func.count(Order.id), "revenue": func.sum(Order.total_amount)},
+    )
+    # [{"bucket": datetime(2026, 3, 1), "order_count": 12, "revenue": 3400.0}, ...]
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+
+GRANULARITIES = ("hour", "day", "week", "month")
+MAX_BUCKETS = 2000
+
+# DATE_FORMAT (MySQL) và strftime (SQLite) dùng chung cú pháp cho các mẫu này
+_STRFTIME_FORMATS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00", "month": "%Y-%m-01 00:00:00"}
+_POSTGRES_FORMAT = "YYYY-MM-DD HH24:00:00"
+
+
+def bucket_floor(moment: datetime, granularity: str) -> datetime:
+    """Đầu bucket chứa `moment`"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "hour":
+        return moment
+    moment = moment.replace(hour=0)
+    if granularity == "week":
+        return moment - timedelta(days=moment.weekday())
+    if granularity == "month":
+        return moment.replace(day=1)
+    return moment
+
+
+def next_bucket(bucket: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return bucket + timedelta(hours=1)
+    if granularity == "week":
+        return bucket + timedelta(days=7)
+    if granularity == "month":
+        return bucket.replace(year=bucket.year + 1, month=1) if bucket.month == 12 else bucket.replace(month=bucket.month + 1)
+    return bucket + timedelta(days=1)
+
+
+def bucket_expression(column, granularity: str, dialect: str):
+    """Biểu thức SQL đưa `column` về chuỗi đầu bucket theo dialect"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}. Valid: {list(GRANULARITIES)}")
+
+    if dialect == "mysql":
+        if granularity == "week":
+            # WEEKDAY(): thứ Hai = 0
+            return func.date_format(func.subdate(func.date(column), func.weekday(column)), "%Y-%m-%d 00:00:00")
+        return func.date_format(column, _STRFTIME_FORMATS[granularity])
+    if dialect == "sqlite":
+        if granularity == "week":
+            # Nhảy tới Chủ nhật (giữ nguyên nếu đã là Chủ nhật) rồi lùi 6 ngày → thứ Hai
+            return func.strftime("%Y-%m-%d 00:00:00", column, "weekday 0", "-6 days")
+        return func.strftime(_STRFTIME_FORMATS[granularity], column)
+    if dialect == "postgresql":
+        return func.to_char(func.date_trunc(granularity, column), _POSTGRES_FORMAT)
+    raise ValueError(f"Time bucketing not supported for dialect: {dialect}")
+
+
+def duration_seconds(start, end, dialect: str):
+    """Biểu thức SQL: số giây từ `start` tới `end` theo dialect"""
+    if dialect == "mysql":
+        return func.timestampdiff(literal_column("SECOND"), start, end)
+    if dialect == "sqlite":
+        return (func.julianday(end) - func.julianday(start)) * 86400.0
+    if dialect == "postgresql":
+        return func.extract("epoch", end - start)
+    raise ValueError(f"Durations not supported for dialect: {dialect}")
+
+
+def _parse_bucket(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+
+
+def time_series(
+    db: Session,
+    column,
+    start: datetime,
+    metrics: Dict[str, Any],
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    filters: Iterable[Any] = (),
+    fill: Any = 0
+) -> List[Dict[str, Any]]:
+    """
+    Chuỗi [{"bucket": datetime, <metric>: giá trị}] từ bucket chứa `start` tới
+    bucket chứa `end` (mặc định bây giờ), mỗi bucket đúng một phần tử.
+
+    Args:
+        db: Session của DB chứa bảng
+        column: Cột thời gian để gom nhóm (vd. Order.created_at)
+        metrics: {tên: biểu thức aggregate} (vd. func.count(Order.id))
+        filters: Điều kiện thêm (vd. Order.status == OrderStatus.DELIVERED)
+        fill: Giá trị cho bucket không có dữ liệu
+
+    Raises:
+        ValueError: granularity không hợp lệ hoặc cửa sổ quá MAX_BUCKETS bucket
+    """
+    end = end or datetime.utcnow()
+    first, last = bucket_floor(start, granularity), bucket_floor(end, granularity)
+    buckets = [first]
+    while buckets[-1] < last:
+        if len(buckets) >= MAX_BUCKETS:
+            raise ValueError(f"Too many {granularity} buckets (max {MAX_BUCKETS}); use a coarser granularity")
+        buckets.append(next_bucket(buckets[-1], granularity))
+
+    bucket = bucket_expression(column, granularity, db.get_bind().dialect.name).label("bucket")
+    rows = (
+        db.query(bucket, *(expression.label(name) for name, expression in metrics.items()))
+        .filter(column >= start, column <= end, *filters)
+        .group_by(bucket)
+        .all()
+    )
+    found = {_parse_bucket(row.bucket): row for row in rows}
+
+    series = []
+    for moment in buckets:
+        row = found.get(moment)
+        point = {"bucket": moment}
+        for name in metrics:
+            value = getattr(row, name) if row is not None else None
+            point[name] = fill if value is None else value
+        series.append(point)
+    return series
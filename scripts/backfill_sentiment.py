@@ -0,0 +1,63 @@
+"""
+Bulk Sentiment Backfill for Support DB
+Chấm lại điểm cảm xúc cho toàn bộ ticket_messages và dựng lại aggregate tickets.
+
+Usage:
+    python scripts/backfill_sentiment.py
+    python scripts/backfill_sentiment.py --max-rate 300 --workers 8
+    python scripts/backfill_sentiment.py --max-batches 200   # dừng sau 200 batch, chạy lại để tiếp tục
+    python scripts/backfill_sentiment.py --reset             # bỏ checkpoint, chạy lại từ đầu
+
+Checkpoint lưu sau mỗi batch (mặc định: scripts/.sentiment_backfill.json).
+"""
+import sys
+from pathlib import Path
+
+# ── Path setup ──────────────────────────────────────────────────────
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from ai_modules.sentiment.backfill import (
+    SentimentBackfill, BackfillCheckpoint, DEFAULT_BATCH_SIZE, PHASE_DONE,
+)
+
+DEFAULT_CHECKPOINT = Path(__file__).resolve().parent / ".sentiment_backfill.json"
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Backfill ticket message sentiment")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per keyset page")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent LLM batch calls (default: SENTIMENT_BATCH_CONCURRENCY)")
+    parser.add_argument("--max-rate", type=float, default=None, help="Max rows per second (throttle)")
+    parser.add_argument("--max-batches", type=int, default=None, help="Stop after N batches (resume later)")
+    parser.add_argument("--only-missing", action="store_true", help="Only score messages without a score")
+    parser.add_argument("--checkpoint", default=str(DEFAULT_CHECKPOINT), help="Checkpoint file path")
+    parser.add_argument("--reset", action="store_true", help="Ignore existing checkpoint and start over")
+    args = parser.parse_args()
+
+    checkpoint = BackfillCheckpoint(args.checkpoint)
+    if args.reset:
+        checkpoint.clear()
+
+    job = SentimentBackfill(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_rows_per_second=args.max_rate,
+        only_missing=args.only_missing,
+        checkpoint=checkpoint
+    )
+    state = job.run(max_batches=args.max_batches)
+
+    print("\n" + "=" * 60)
+    if state["phase"] == PHASE_DONE:
+        print("✅ BACKFILL COMPLETE!")
+    else:
+        print(f"⏸  Stopped in phase '{state['phase']}' — run again to resume")
+    print("=" * 60)
+    print(f"  Messages scored:    {state['messages']}")
+    print(f"  Tickets aggregated: {state['tickets']}")
+
+
+if __name__ == "__main__":
+    main()
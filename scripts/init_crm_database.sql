@@ -135,6 +135,10 @@ CREATE TABLE IF NOT EXISTS conversations (
     id INT AUTO_INCREMENT PRIMARY KEY,
     user_id INT NOT NULL,
     title VARCHAR(255) NULL,
+    sentiment_score FLOAT NULL,
+    sentiment_label VARCHAR(20) NULL,
+    sentiment_ewma FLOAT NULL,
+    sentiment_count INT DEFAULT 0 NOT NULL,
     created_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL,
     updated_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6) NOT NULL,
     CONSTRAINT fk_conversations_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
@@ -151,6 +155,8 @@ CREATE TABLE IF NOT EXISTS conversation_messages (
     role VARCHAR(50) NOT NULL,
     content TEXT NOT NULL,
     metadata TEXT NULL,
+    sentiment_score FLOAT NULL,
+    sentiment_label VARCHAR(20) NULL,
     created_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL,
     CONSTRAINT fk_messages_conversation FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE,
     INDEX idx_messages_conversation (conversation_id),
@@ -170,11 +176,13 @@ CREATE TABLE IF NOT EXISTS tickets (
     status ENUM('OPEN', 'IN_PROGRESS', 'WAITING_CUSTOMER', 'RESOLVED', 'CLOSED') DEFAULT 'OPEN' NOT NULL,
     priority ENUM('LOW', 'MEDIUM', 'HIGH', 'URGENT') DEFAULT 'MEDIUM' NOT NULL,
     category VARCHAR(100) NULL,
+    possible_duplicate_of INT NULL,
     created_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL,
     updated_at DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6) NOT NULL,
     resolved_at DATETIME(6) NULL,
     CONSTRAINT fk_tickets_customer FOREIGN KEY (customer_id) REFERENCES users(id),
     CONSTRAINT fk_tickets_staff FOREIGN KEY (assigned_to) REFERENCES users(id) ON DELETE SET NULL,
+    CONSTRAINT fk_tickets_duplicate FOREIGN KEY (possible_duplicate_of) REFERENCES tickets(id) ON DELETE SET NULL,
     INDEX idx_tickets_customer (customer_id),
     INDEX idx_tickets_status (status),
     INDEX idx_tickets_priority (priority)
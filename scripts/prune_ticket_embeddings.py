@@ -0,0 +1,34 @@
+"""
+Ticket Embedding Prune for Support DB
+Xoá khỏi index semantic (ChromaDB) các ticket đã đóng, đã gộp hoặc đã xoá,
+để collection chỉ chứa ticket đang mở. Chạy định kỳ (cron), vd. mỗi đêm.
+
+Usage:
+    python scripts/prune_ticket_embeddings.py
+"""
+import sys
+from pathlib import Path
+
+# ── Path setup ──────────────────────────────────────────────────────
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.database.session import SupportSession
+from ai_modules.ticket_deduplication import TicketDeduplicationService
+
+
+def main():
+    db = SupportSession()
+    try:
+        removed = TicketDeduplicationService(db).prune_embeddings()
+    finally:
+        db.close()
+
+    print("\n" + "=" * 60)
+    print("✅ TICKET EMBEDDINGS PRUNED!")
+    print("=" * 60)
+    print(f"  Removed:        {removed} closed/merged/deleted tickets")
+
+
+if __name__ == "__main__":
+    main()
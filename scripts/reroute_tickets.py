@@ -0,0 +1,49 @@
+"""
+Bulk Ticket Re-routing for Support DB
+Áp dụng lại routing_rules hiện tại cho toàn bộ ticket đang mở (vd. sau khi sửa rule).
+
+Usage:
+    python scripts/reroute_tickets.py --dry-run          # chỉ xem phân bố, không ghi
+    python scripts/reroute_tickets.py
+    python scripts/reroute_tickets.py --batch-size 1000
+"""
+import sys
+from pathlib import Path
+
+# ── Path setup ──────────────────────────────────────────────────────
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.database.session import SupportSession
+from backend.services.ticket_routing import TicketRoutingService, DEFAULT_REROUTE_BATCH_SIZE
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-route open tickets with the current routing rules")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_REROUTE_BATCH_SIZE, help="Tickets per batch (one commit each)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the would-be assignments without writing")
+    args = parser.parse_args()
+
+    db = SupportSession()
+    try:
+        result = TicketRoutingService(db).route_backlog(batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    print("\n" + "=" * 60)
+    print("🔍 DRY RUN — nothing written" if result["dry_run"] else "✅ RE-ROUTING COMPLETE!")
+    print("=" * 60)
+    print(f"  Rules version:  {result['rules_version']}")
+    print(f"  Tickets:        {result['scanned']} scanned, {result['routed']} routed, {result['unmatched']} unmatched")
+    print(f"  Reassigned:     {result['reassigned']} (queue/assignee changed)")
+    for label, counts in (("By rule", result["by_rule"]), ("By queue", result["by_queue"]),
+                          ("Priority →", result["priority_changes"])):
+        if counts:
+            print(f"  {label}:")
+            for key, count in sorted(counts.items(), key=lambda item: -item[1]):
+                print(f"    {key:<24} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+KPI Rollup Refresh for Analytics DB
+Tổng hợp orders / tickets / customers / conversations vào kpi_rollups
+(backfill lần đầu, sau đó chỉ các dòng thay đổi sau watermark).
+
+Usage:
+    python scripts/rollup_kpis.py              # refresh một lần
+    python scripts/rollup_kpis.py --rebuild    # xoá watermark + rollup, tính lại từ đầu
+"""
+import sys
+from pathlib import Path
+
+# ── Path setup ──────────────────────────────────────────────────────
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from sqlalchemy import update
+
+from backend.database.session import AnalyticsSession
+from backend.models.kpi_rollup import KpiRollup, KpiRollupWatermark
+from backend.services.kpi_rollups import KpiRollupJob
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Refresh the hourly/daily KPI rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Drop existing rollups and backfill from scratch")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        db = AnalyticsSession()
+        try:
+            db.query(KpiRollup).delete(synchronize_session=False)
+            db.execute(update(KpiRollupWatermark).values(high_water=None))
+            db.commit()
+        finally:
+            db.close()
+
+    refreshed = KpiRollupJob().refresh()
+
+    print("\n" + "=" * 60)
+    print("✅ KPI ROLLUPS REBUILT!" if args.rebuild else "✅ KPI ROLLUPS REFRESHED!")
+    print("=" * 60)
+    for source, hours in refreshed.items():
+        print(f"  {source:<16} {hours} hours rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -81,7 +81,8 @@ CREATE TABLE IF NOT EXISTS users (
     CONSTRAINT uq_user_email UNIQUE (email),
     INDEX idx_user_type (user_type),
     INDEX idx_user_status (status),
-    INDEX idx_user_phone (phone)
+    INDEX idx_user_phone (phone),
+    INDEX idx_user_created (created_at)
 ) ENGINE=InnoDB;
 
 -- ============================================================================
@@ -1,7 +1,7 @@
 -- ============================================================================
 -- DATABASE: crm_order_db
--- Mục đích: Quản lý Orders, Payments, Shipments, Returns, Carts
--- Tables: 6
+-- Mục đích: Quản lý Orders, Payments, Shipments, Returns, Carts, Chat Checkout State
+-- Tables: 7
 -- Port: 3312
 -- ============================================================================
 
@@ -74,7 +74,9 @@ CREATE TABLE IF NOT EXISTS orders (
     INDEX idx_order_status (status),
     INDEX idx_order_payment (payment_status),
     INDEX idx_order_date (ordered_at),
-    INDEX idx_order_cust_status (customer_id, status)
+    INDEX idx_order_cust_status (customer_id, status),
+    INDEX idx_order_created (created_at),
+    INDEX idx_order_updated (updated_at)
 ) ENGINE=InnoDB;
 
 -- ============================================================================
@@ -255,4 +257,19 @@ CREATE TABLE IF NOT EXISTS carts (
     INDEX idx_cart_session (session_id)
 ) ENGINE=InnoDB;
 
-SELECT 'crm_order_db initialized successfully with 6 tables!' AS status;
+-- ============================================================================
+-- BẢNG: order_workflow_states
+-- State của order workflow trong chat (dùng chung giữa các uvicorn worker)
+-- LƯU Ý: payload là JSON gọn của OrderDraft, expires_at theo hạn thanh toán
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS order_workflow_states (
+    conversation_id VARCHAR(64)     NOT NULL PRIMARY KEY,
+    state           VARCHAR(32)     NOT NULL,
+    payload         TEXT            NOT NULL COMMENT 'Compact JSON {s: state, d: OrderDraft}',
+    expires_at      DATETIME        NOT NULL,
+    updated_at      DATETIME        NOT NULL,
+    
+    INDEX idx_ows_expires (expires_at)
+) ENGINE=InnoDB;
+
+SELECT 'crm_order_db initialized successfully with 7 tables!' AS status;
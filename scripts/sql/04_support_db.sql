@@ -1,7 +1,7 @@
 -- ============================================================================
 -- DATABASE: crm_support_db
 -- Mục đích: Quản lý Tickets, Conversations, Messages, Channels, Routing
--- Tables: 12
+-- Tables: 16
 -- Port: 3313
 -- ============================================================================
 
@@ -71,7 +71,10 @@ CREATE TABLE IF NOT EXISTS tickets (
     -- AI/Sentiment
     sentiment_score DECIMAL(4, 3)   NULL COMMENT '0.0-1.0',
     sentiment_label ENUM('NEGATIVE', 'NEUTRAL', 'POSITIVE', 'MIXED') NULL,
+    sentiment_ewma  DECIMAL(4, 3)   NULL COMMENT 'EWMA of customer message scores',
+    sentiment_count INT             DEFAULT 0 NOT NULL COMMENT 'Scored customer messages',
     ai_suggested    TINYINT(1)      DEFAULT 0 NOT NULL COMMENT 'AI auto-response suggested',
+    possible_duplicate_of CHAR(36)  NULL COMMENT 'Open ticket flagged as duplicate at creation',
     
     -- Timestamps
     created_at      DATETIME(6)     DEFAULT CURRENT_TIMESTAMP(6) NOT NULL,
@@ -80,6 +83,10 @@ CREATE TABLE IF NOT EXISTS tickets (
     resolved_at     DATETIME(6)     NULL,
     closed_at       DATETIME(6)     NULL,
     
+    -- SLA deadlines (from priority + queue)
+    response_due_at   DATETIME(6)   NULL,
+    resolution_due_at DATETIME(6)   NULL,
+    
     CONSTRAINT uq_ticket_number UNIQUE (ticket_number),
     CONSTRAINT fk_tk_channel FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE SET NULL,
     INDEX idx_tk_customer (customer_id),
@@ -87,7 +94,9 @@ CREATE TABLE IF NOT EXISTS tickets (
     INDEX idx_tk_priority (priority),
     INDEX idx_tk_assignee (assignee_id),
     INDEX idx_tk_created (created_at),
-    INDEX idx_tk_cust_status (customer_id, status)
+    INDEX idx_tk_cust_status (customer_id, status),
+    INDEX idx_tk_resolution_due (resolution_due_at),
+    INDEX idx_tk_updated (updated_at)
 ) ENGINE=InnoDB;
 
 -- ============================================================================
@@ -119,6 +128,10 @@ CREATE TABLE IF NOT EXISTS ticket_messages (
     is_internal     TINYINT(1)  DEFAULT 0 NOT NULL COMMENT 'Internal note, not visible to customer',
     is_ai_generated TINYINT(1)  DEFAULT 0 NOT NULL,
     
+    -- Sentiment (scored once on write)
+    sentiment_score DECIMAL(4, 3) NULL COMMENT '-1.0..1.0',
+    sentiment_label VARCHAR(20)   NULL,
+    
     -- Attachments
     attachments     JSON        NULL COMMENT '[{name, url, mime_type, size}]',
     
@@ -128,8 +141,54 @@ CREATE TABLE IF NOT EXISTS ticket_messages (
     INDEX idx_tmsg_created (created_at)
 ) ENGINE=InnoDB;
 
+-- ============================================================================
+-- BẢNG: ticket_sla_events (SLA breaches and escalations)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS ticket_sla_events (
+    id          CHAR(36)    DEFAULT (UUID()) NOT NULL PRIMARY KEY,
+    ticket_id   CHAR(36)    NOT NULL,
+    kind        ENUM('RESPONSE', 'RESOLUTION') NOT NULL,
+    event       ENUM('BREACH', 'ESCALATION') NOT NULL,
+    due_at      DATETIME(6) NOT NULL,
+    detail      VARCHAR(64) NULL COMMENT 'e.g. HIGH->URGENT',
+    fired_at    DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL,
+    
+    CONSTRAINT fk_sla_ticket FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
+    CONSTRAINT uq_sla_event UNIQUE (ticket_id, kind, event),
+    INDEX idx_sla_fired (fired_at)
+) ENGINE=InnoDB;
+
+-- ============================================================================
+-- BẢNG: ticket_signatures (MinHash signatures for duplicate detection)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS ticket_signatures (
+    ticket_id       CHAR(36)    NOT NULL PRIMARY KEY,
+    customer_id     CHAR(36)    NOT NULL COMMENT 'User ID (no FK)',
+    scheme          VARCHAR(64) NOT NULL COMMENT 'minhash-<num_perm>-k<shingle>-s<seed>',
+    signature       BLOB        NOT NULL COMMENT 'uint32[num_perm], little-endian',
+    created_at      DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL,
+    
+    CONSTRAINT fk_tsig_ticket FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
+    INDEX idx_tsig_customer (customer_id)
+) ENGINE=InnoDB;
+
+-- ============================================================================
+-- BẢNG: ticket_signature_bands (LSH bands for the duplicate check at creation)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS ticket_signature_bands (
+    ticket_id       CHAR(36)    NOT NULL,
+    band_hash       BIGINT      NOT NULL COMMENT 'blake2b-64 of (scheme, band index, band values)',
+    customer_id     CHAR(36)    NOT NULL COMMENT 'User ID (no FK)',
+    
+    PRIMARY KEY (ticket_id, band_hash),
+    CONSTRAINT fk_tsb_ticket FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE,
+    INDEX idx_tsb_customer_hash (customer_id, band_hash)
+) ENGINE=InnoDB;
+
 -- ============================================================================
 -- BẢNG: conversations (Live chat sessions)
+-- Khác bảng conversations của RAG chat (Knowledge DB, models/conversation.py):
+-- live chat không được chấm sentiment nên không có cột sentiment_*
 -- ============================================================================
 CREATE TABLE IF NOT EXISTS conversations (
     id              CHAR(36)    DEFAULT (UUID()) NOT NULL PRIMARY KEY,
@@ -206,6 +265,45 @@ CREATE TABLE IF NOT EXISTS routing_rules (
     INDEX idx_rule_priority (priority)
 ) ENGINE=InnoDB;
 
+-- ============================================================================
+-- BẢNG: routing_rule_versions (version counter for the compiled rule cache)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS routing_rule_versions (
+    id          INT         NOT NULL PRIMARY KEY,
+    version     BIGINT      DEFAULT 0 NOT NULL,
+    updated_at  TIMESTAMP   DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO routing_rule_versions (id, version) VALUES (1, 0);
+
+-- ============================================================================
+-- TRIGGER: Tăng version khi routing_rules thay đổi (worker biên dịch lại rule)
+-- ============================================================================
+DELIMITER //
+
+CREATE TRIGGER trg_routing_rules_after_insert
+AFTER INSERT ON routing_rules
+FOR EACH ROW
+BEGIN
+    UPDATE routing_rule_versions SET version = version + 1 WHERE id = 1;
+END//
+
+CREATE TRIGGER trg_routing_rules_after_update
+AFTER UPDATE ON routing_rules
+FOR EACH ROW
+BEGIN
+    UPDATE routing_rule_versions SET version = version + 1 WHERE id = 1;
+END//
+
+CREATE TRIGGER trg_routing_rules_after_delete
+AFTER DELETE ON routing_rules
+FOR EACH ROW
+BEGIN
+    UPDATE routing_rule_versions SET version = version + 1 WHERE id = 1;
+END//
+
+DELIMITER ;
+
 -- ============================================================================
 -- BẢNG: work_queues
 -- ============================================================================
@@ -266,4 +364,4 @@ INSERT INTO work_queues (id, code, name) VALUES
 (UUID(), 'VIP', 'VIP Customers'),
 (UUID(), 'ESCALATION', 'Escalation Queue');
 
-SELECT 'crm_support_db initialized successfully with 12 tables!' AS status;
+SELECT 'crm_support_db initialized successfully with 16 tables!' AS status;
@@ -1,7 +1,7 @@
 -- ============================================================================
 -- DATABASE: crm_analytics_db
 -- Mục đích: Analytics, KPIs, ML Models, RAG Queries, Sentiments
--- Tables: 11
+-- Tables: 14
 -- Port: 3315
 -- ============================================================================
 
@@ -182,6 +182,20 @@ CREATE TABLE IF NOT EXISTS sentiments (
     CONSTRAINT chk_sent_score CHECK (score >= 0 AND score <= 1)
 ) ENGINE=InnoDB;
 
+-- ============================================================================
+-- BẢNG: sentiment_cache
+-- Cache kết quả sentiment từ LLM theo nội dung (dùng chung giữa các worker)
+-- LƯU Ý: text_hash = sha256(model_version + text chuẩn hóa)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS sentiment_cache (
+    text_hash       CHAR(64)    NOT NULL PRIMARY KEY,
+    model_version   VARCHAR(64) NOT NULL COMMENT 'provider:model:prompt_version',
+    result          TEXT        NOT NULL COMMENT 'JSON {score, label, confidence, emotions, provider}',
+    created_at      DATETIME    NOT NULL,
+    
+    INDEX idx_sc_model (model_version)
+) ENGINE=InnoDB;
+
 -- ============================================================================
 -- BẢNG: analytics_queue
 -- ============================================================================
@@ -198,6 +212,33 @@ CREATE TABLE IF NOT EXISTS analytics_queue (
     INDEX idx_aq_created (created_at)
 ) ENGINE=InnoDB;
 
+-- ============================================================================
+-- BẢNG: kpi_rollups (số liệu dashboard tổng hợp theo giờ / ngày)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS kpi_rollups (
+    grain       VARCHAR(8)  NOT NULL COMMENT 'HOUR, DAY',
+    bucket_start DATETIME   NOT NULL COMMENT 'Đầu giờ / đầu ngày (UTC)',
+    metric      VARCHAR(64) NOT NULL COMMENT 'orders.count, orders.revenue, tickets.count, etc',
+    dimension   VARCHAR(64) DEFAULT '' NOT NULL COMMENT 'Status / sentiment label',
+    value       DOUBLE      DEFAULT 0 NOT NULL,
+    updated_at  DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL ON UPDATE CURRENT_TIMESTAMP(6),
+    
+    PRIMARY KEY (grain, metric, bucket_start, dimension),
+    INDEX idx_kr_bucket (grain, bucket_start)
+) ENGINE=InnoDB;
+
+-- ============================================================================
+-- BẢNG: kpi_rollup_watermarks (mốc đã tổng hợp của từng bảng nguồn)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS kpi_rollup_watermarks (
+    source      VARCHAR(32) NOT NULL PRIMARY KEY COMMENT 'orders, tickets, customers, conversations',
+    high_water  DATETIME(6) NULL COMMENT 'NULL = chưa backfill',
+    updated_at  DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6) NOT NULL ON UPDATE CURRENT_TIMESTAMP(6)
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO kpi_rollup_watermarks (source) VALUES
+('orders'), ('tickets'), ('customers'), ('conversations');
+
 -- ============================================================================
 -- SEED DATA: Default KPI Definitions
 -- ============================================================================
@@ -220,4 +261,4 @@ INSERT INTO ml_models (id, name, version, model_type, description, is_active) VA
 (UUID(), 'product-recommendation', 'v1.0', 'recommendation', 'Product recommendation model', 1),
 (UUID(), 'ticket-deduplication', 'v1.0', 'similarity', 'Ticket similarity detection', 1);
 
-SELECT 'crm_analytics_db initialized successfully with 11 tables!' AS status;
+SELECT 'crm_analytics_db initialized successfully with 14 tables!' AS status;
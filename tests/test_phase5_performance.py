@@ -0,0 +1,2183 @@
+"""
+Phase 5 Performance Test Suite
+==============================
+Validates the performance backlog (chat, sentiment, tickets, analytics):
+
+USER-026:  FAQ cache — clustered chat history + precomputed answers
+USER-027:  Aho–Corasick intent matcher (single-pass, scored routing)
+USER-028:  Embedding nearest-centroid intent classifier
+USER-029:  TTL order-workflow state store (memory LRU + SQL)
+USER-030:  Per-worker agent pool with request-scoped DB binding
+USER-031:  Concurrent CRM-context fan-out + per-customer TTL cache
+USER-032:  Per-stage latency spans (AgentResponse.timings + histograms)
+USER-033:  Catalog gazetteer — product mentions linked to ids in one pass
+USER-034:  Batched LLM sentiment (token-budget packing, bounded concurrency)
+USER-035:  Compiled rule-based sentiment engine with scoped negation
+USER-036:  Content-addressed sentiment cache (memory LRU + analytics table)
+USER-037:  Incremental per-message sentiment (running mean + EWMA aggregates)
+USER-038:  Checkpointed bulk sentiment backfill (keyset pages, bulk UPDATE)
+USER-039:  MinHash/LSH candidate index for ticket deduplication
+USER-040:  Semantic duplicate detection (sentence embeddings + ANN index)
+USER-041:  Online duplicate check at ticket creation (indexed LSH band table)
+USER-042:  Compiled routing rules cached per worker (rules version counter)
+USER-043:  Bulk backlog re-routing (keyset batches, bulk writes, dry run)
+USER-044:  Load-aware staff assignment (in-memory workload heap)
+USER-045:  Timing-wheel SLA engine (breach/escalation events, real KPI)
+USER-046:  Parallel dashboard aggregation (one conditional query per DB)
+USER-047:  Hourly/daily KPI rollups in the analytics DB (watermark refresh)
+USER-048:  SQL-side time bucketing with gap filling for order trends
+USER-049:  Grouped staff performance with SQL resolution-time percentiles
+USER-050:  Streaming anomaly detection (seasonal EWMA baselines over rollups)
+
+Usage:
+    pytest tests/test_phase5_performance.py -v
+"""
+import sys
+import os
+from pathlib import Path
+
+# Add project root to path
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# Force DEMO_MODE
+os.environ["DEMO_MODE"] = "true"
+
+import pytest
+
+
+def read(rel_path):
+    """Read file relative to project root."""
+    return Path(ROOT_DIR / rel_path).read_text(encoding="utf-8")
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """
+    Factory for throwaway sqlite DBs: sqlite_db(Model, ...) returns a sessionmaker
+    bound to a new file with those models' tables (engine: session.get_bind()).
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    engines = []
+
+    def make(*models):
+        engine = create_engine(f"sqlite:///{tmp_path / f'db{len(engines)}.sqlite'}")
+        engines.append(engine)
+        for model in models:
+            model.__table__.create(engine)
+        return sessionmaker(bind=engine)
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+def record_sql(engine):
+    """List that collects every SQL statement executed on engine"""
+    from sqlalchemy import event
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-026: FAQ cache
+# ══════════════════════════════════════════════════════════════════
+
+class TestFaqCache:
+    """USER-026 — Nearest-centroid FAQ answers mined from chat history"""
+
+    def _unit(self, *values):
+        import numpy as np
+        v = np.asarray(values, dtype=np.float32)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def test_match_above_threshold(self):
+        from ai_modules.agent_customer_service.rag.faq_cache import FAQCache, FAQEntry
+        cache = FAQCache([
+            FAQEntry(question="Đổi trả thế nào?", answer="A1", centroid=self._unit(1, 0, 0)),
+            FAQEntry(question="Phí ship bao nhiêu?", answer="A2", centroid=self._unit(0, 1, 0)),
+        ])
+        hit = cache.match(self._unit(0.05, 1, 0), threshold=0.9)
+        assert hit is not None
+        assert hit["answer"] == "A2"
+
+    def test_no_match_below_threshold(self):
+        from ai_modules.agent_customer_service.rag.faq_cache import FAQCache, FAQEntry
+        cache = FAQCache([FAQEntry(question="q", answer="a", centroid=self._unit(1, 0, 0))])
+        assert cache.match(self._unit(1, 1, 0), threshold=0.95) is None
+
+    def test_empty_cache_and_dim_mismatch(self):
+        from ai_modules.agent_customer_service.rag.faq_cache import FAQCache, FAQEntry
+        assert FAQCache().match([1.0, 0.0]) is None
+        cache = FAQCache([FAQEntry(question="q", answer="a", centroid=[1.0, 0.0, 0.0])])
+        assert cache.match([1.0, 0.0]) is None
+
+    def test_save_load_roundtrip(self, tmp_path):
+        from ai_modules.agent_customer_service.rag.faq_cache import FAQCache, FAQEntry
+        path = str(tmp_path / "faq.json")
+        FAQCache([FAQEntry(question="q", answer="a", centroid=[0.0, 1.0], cluster_size=7)]).save(path)
+        loaded = FAQCache.load(path)
+        assert len(loaded) == 1
+        assert loaded.entries[0].cluster_size == 7
+        assert FAQCache.load(str(tmp_path / "missing.json")).entries == []
+
+    def test_miner_clusters_and_queries_once_per_cluster(self):
+        from unittest.mock import MagicMock
+        import numpy as np
+        from ai_modules.agent_customer_service.rag.faq_cache import FAQMiner
+
+        rag = MagicMock()
+        rag.query.return_value = {"answer": "ans", "sources": [{"type": "policy"}], "confidence": 0.8}
+        questions = ["a1", "a2", "a3", "b1", "b2", "c1"]
+        embeddings = np.array([
+            [1, 0.01, 0], [1, 0.02, 0], [1, 0, 0.01],
+            [0, 1, 0], [0.01, 1, 0],
+            [0, 0, 1],
+        ], dtype=np.float32)
+
+        cache = FAQMiner(rag, cluster_threshold=0.9, min_cluster_size=2).build(questions, embeddings)
+
+        assert len(cache) == 2
+        assert rag.query.call_count == 2
+        assert cache.entries[0].cluster_size == 3
+        # Mining must bypass the cache it is building
+        assert rag.query.call_args.kwargs["use_faq_cache"] is False
+
+    def test_service_embeds_once_and_checks_cache(self):
+        source = read("ai_modules/agent_customer_service/rag/service.py")
+        assert "embed_query(question)" in source
+        assert "self.faq_cache.match" in source
+        assert source.count("query_embedding=query_embedding") == 2
+
+    def test_config_threshold(self):
+        from ai_modules.core.config import AIConfig
+        assert AIConfig().faq_cache_threshold == 0.92
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-027: Aho–Corasick intent matcher
+# ══════════════════════════════════════════════════════════════════
+
+class TestKeywordMatcher:
+    """USER-027 — Compiled multi-pattern intent detection"""
+
+    def test_find_all_positions_and_overlaps(self):
+        from ai_modules.core.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"a": ["he", "she", "hers"], "b": ["his"]}, whole_word=False)
+        found = {(m.keyword, m.start, m.end) for m in matcher.find_all("ushers")}
+        assert found == {("she", 1, 4), ("he", 2, 4), ("hers", 2, 6)}
+
+    def test_case_insensitive_and_whole_word(self):
+        from ai_modules.core.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"compare": ["hay"], "lookup": ["ORD-"]})
+        assert matcher.classify("Tôi muốn thay đổi địa chỉ") is None
+        assert matcher.classify("cái này hay cái kia") == "compare"
+        assert matcher.classify("kiểm tra ord-20240101-ABC") == "lookup"
+
+    def test_longest_leftmost_scoring(self):
+        from ai_modules.core.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({
+            "order_lookup": ["đơn hàng"],
+            "order_cancel": ["hủy đơn"],
+        })
+        # First-match used to route this to order_lookup
+        assert matcher.classify("tôi muốn hủy đơn hàng") == "order_cancel"
+
+    def test_tie_breaks_by_declaration_order(self):
+        from ai_modules.core.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"first": ["abc"], "second": ["xyz"]})
+        assert matcher.classify("xyz abc") == "first"
+        assert matcher.classify("nothing", default="unknown") == "unknown"
+
+    def test_operations_agent_routes_by_score(self):
+        from ai_modules.agent_operations.agent import OperationsAgent
+        detect = OperationsAgent._intent_matcher.classify
+        assert detect("tìm ticket trùng lặp") == "find_duplicates"
+        assert detect("hủy đơn ORD-20240101-X") == "order_cancel"
+        assert detect("xin chào", default="unknown") == "unknown"
+
+    def test_operations_agent_english_inflections(self):
+        from ai_modules.agent_operations.agent import OperationsAgent
+        detect = OperationsAgent._intent_matcher.classify
+        assert detect("find duplicates") == "find_duplicates"
+        assert detect("check my tickets") == "ticket_status"
+        assert detect("show similar tickets") == "find_duplicates"
+        assert detect("orders list") == "order_lookup"
+        # Ranh giới trái vẫn được giữ
+        assert detect("reorder", default="unknown") == "unknown"
+
+    def test_word_prefix_keeps_left_boundary(self):
+        from ai_modules.core.keyword_matcher import KeywordMatcher
+        matcher = KeywordMatcher({"compare": ["hay"]}, word_prefix=True)
+        assert matcher.classify("Tôi muốn thay đổi địa chỉ") is None
+        assert matcher.classify("cái này hay cái kia") == "compare"
+
+    def test_agents_compile_at_class_load(self):
+        for path in ("ai_modules/agent_customer_service/agent.py", "ai_modules/agent_operations/agent.py"):
+            source = read(path)
+            assert "_intent_matcher = KeywordMatcher(intent_keywords" in source
+            assert "self.intent_keywords = {" not in source
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-028: Embedding intent classifier
+# ══════════════════════════════════════════════════════════════════
+
+class TestIntentClassifier:
+    """USER-028 — Nearest-centroid classifier over the RAG query vector"""
+
+    def _fake_embed(self, texts):
+        # Deterministic toy embedding: one axis per "topic" word
+        axes = ["ship", "lỗi", "lấy"]
+        return [[1.0 if a in t else 0.0 for a in axes] + [0.1] for t in texts]
+
+    def test_fit_and_predict(self):
+        from ai_modules.agent_customer_service.intent_classifier import IntentClassifier
+        clf = IntentClassifier.fit(self._fake_embed, {
+            "track_order": ["ship tới đâu", "bao giờ ship"],
+            "complaint": ["máy lỗi", "hàng lỗi rồi"],
+        })
+        intent, score = clf.predict([1.0, 0.0, 0.0, 0.1])
+        assert intent == "track_order"
+        assert score > 0.9
+
+    def test_low_confidence_returns_none(self):
+        from ai_modules.agent_customer_service.intent_classifier import IntentClassifier
+        clf = IntentClassifier({"a": [1.0, 0.0], "b": [0.0, 1.0]}, min_score=0.5, min_margin=0.05)
+        # Equidistant → margin too small
+        assert clf.predict([1.0, 1.0])[0] is None
+        assert clf.predict([0.0, 0.0]) == (None, 0.0)
+        assert clf.predict([1.0, 0.0, 0.0]) == (None, 0.0)
+
+    def test_examples_cover_agent_intents(self):
+        from ai_modules.agent_customer_service.intent_classifier import INTENT_EXAMPLES
+        from ai_modules.agent_customer_service.agent import CustomerServiceAgent
+        assert set(INTENT_EXAMPLES) <= set(CustomerServiceAgent.intent_keywords)
+
+    def test_agent_keyword_fast_path_skips_embedding(self):
+        from unittest.mock import MagicMock
+        from ai_modules.agent_customer_service.agent import CustomerServiceAgent
+        agent = CustomerServiceAgent.__new__(CustomerServiceAgent)
+        agent.rag_service = MagicMock()
+        assert agent._detect_intent("tôi muốn thanh toán") == ("payment", None)
+        agent.rag_service.policy_retriever.embed_query.assert_not_called()
+
+    def test_agent_reuses_embedding_for_rag(self):
+        source = read("ai_modules/agent_customer_service/agent.py")
+        assert "intent, query_embedding = self._detect_intent(query)" in source
+        assert "query_embedding=query_embedding" in source
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-029: Order workflow state store
+# ══════════════════════════════════════════════════════════════════
+
+class TestWorkflowStateStore:
+    """USER-029 — Serialized, TTL-evicting workflow state shared by workers"""
+
+    def _draft(self, **kwargs):
+        from ai_modules.agent_customer_service.order_workflow.workflow_manager import (
+            OrderDraft, OrderItem
+        )
+        draft = OrderDraft(user_id="u1", conversation_id="c1", **kwargs)
+        draft.add_item(OrderItem(product_id="p1", product_name="Laptop", quantity=2, unit_price=100.0))
+        draft.shipping.phone = "0901234567"
+        return draft
+
+    def test_serialize_roundtrip_is_compact(self):
+        from ai_modules.agent_customer_service.order_workflow.state_store import (
+            serialize_workflow, deserialize_workflow
+        )
+        from ai_modules.agent_customer_service.order_workflow import OrderState
+        raw = serialize_workflow(OrderState.DRAFT_REVIEW, self._draft())
+        assert " " not in raw.replace("Laptop", "")
+        assert "null" not in raw
+        state, draft = deserialize_workflow(raw)
+        assert state == OrderState.DRAFT_REVIEW
+        assert draft.items[0].quantity == 2
+        assert draft.subtotal == 200.0
+        assert draft.shipping.phone == "0901234567"
+
+    def test_memory_store_lru_and_ttl(self):
+        from datetime import datetime, timedelta
+        from ai_modules.agent_customer_service.order_workflow import InMemoryWorkflowStore, OrderState
+        store = InMemoryWorkflowStore(max_entries=2)
+        store.put("a", OrderState.COLLECTING_PRODUCTS, self._draft())
+        store.put("b", OrderState.COLLECTING_PRODUCTS, self._draft())
+        store.get("a")  # touch → b is LRU
+        store.put("c", OrderState.COLLECTING_PRODUCTS, self._draft())
+        assert store.get("b") is None
+        assert store.get("a") is not None
+
+        store.put("x", OrderState.PAYMENT_PENDING,
+                  self._draft(expires_at=datetime.now() - timedelta(seconds=1)))
+        assert store.get("x") is None
+
+    def test_terminal_state_evicts(self):
+        from ai_modules.agent_customer_service.order_workflow import InMemoryWorkflowStore, OrderState
+        store = InMemoryWorkflowStore()
+        store.save("a", OrderState.COLLECTING_PRODUCTS, self._draft())
+        store.save("a", OrderState.ORDER_CREATED, self._draft())
+        assert len(store) == 0
+
+    def test_sqlite_store_shared_between_instances(self, tmp_path):
+        from datetime import datetime, timedelta
+        from ai_modules.agent_customer_service.order_workflow import SQLWorkflowStore, OrderState
+        url = f"sqlite:///{tmp_path / 'wf.db'}"
+        worker_a, worker_b = SQLWorkflowStore(url), SQLWorkflowStore(url)
+        worker_a.put(42, OrderState.COLLECTING_INFO, self._draft())
+        worker_a.put(42, OrderState.DRAFT_REVIEW, self._draft())
+        state, draft = worker_b.get(42)
+        assert state == OrderState.DRAFT_REVIEW
+        assert draft.items[0].product_name == "Laptop"
+
+        worker_a.put(7, OrderState.PAYMENT_PENDING,
+                     self._draft(expires_at=datetime.now() - timedelta(seconds=1)))
+        assert worker_b.get(7) is None
+        assert worker_b.purge_expired() == 1
+
+    def test_agent_no_longer_keeps_class_level_dict(self):
+        source = read("ai_modules/agent_customer_service/agent.py")
+        assert "_order_workflows" not in source
+        assert "get_workflow_store()" in source
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-030: Agent pooling + request-scoped DB
+# ══════════════════════════════════════════════════════════════════
+
+class TestAgentPool:
+    """USER-030 — Long-lived agents, DB session bound per call"""
+
+    def test_request_scoped_binding_and_fallback(self):
+        from ai_modules.core.request_scope import RequestScoped, bind_request
+
+        class Service:
+            db = RequestScoped("db")
+            order_db = RequestScoped("order_db", fallback="db")
+
+            def __init__(self, db=None):
+                self.db = db
+                self.order_db = None
+
+        svc = Service(db="default")
+        assert svc.db == "default"
+        with bind_request(db="request-db"):
+            assert svc.db == "request-db"
+            assert svc.order_db == "request-db"
+            with bind_request(order_db="order"):
+                assert svc.order_db == "order"
+                assert svc.db == "request-db"
+        assert svc.db == "default"
+        assert svc.order_db is None
+
+    def test_binding_isolated_between_threads(self):
+        import threading
+        from ai_modules.core.request_scope import RequestScoped, bind_request
+
+        class Service:
+            db = RequestScoped("db")
+
+        shared = Service()
+        seen = {}
+        barrier = threading.Barrier(2)
+
+        def worker(name):
+            with bind_request(db=name):
+                barrier.wait()
+                seen[name] = shared.db
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in ("a", "b")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert seen == {"a": "a", "b": "b"}
+
+    def test_pool_returns_same_instance(self):
+        from ai_modules.core.agent_pool import get_agent, reset_pool
+        from ai_modules.core.base_agent import BaseAgent, AgentType, AgentResponse
+
+        class EchoAgent(BaseAgent):
+            created = 0
+
+            def __init__(self, db=None):
+                super().__init__(db, AgentType.OPERATIONS)
+                EchoAgent.created += 1
+
+            def process_query(self, query, user_id=None, context=None):
+                return AgentResponse(success=True, message=str(self.db))
+
+            def get_available_tools(self):
+                return []
+
+        reset_pool()
+        agent = get_agent(EchoAgent)
+        assert get_agent(EchoAgent) is agent
+        assert EchoAgent.created == 1
+        assert agent.run("q", db="session-1").message == "session-1"
+        assert agent.db is None
+        reset_pool()
+
+    def test_operations_agent_order_db_bound_per_call(self):
+        from unittest.mock import MagicMock
+        from ai_modules.core.request_scope import bind_request
+        from ai_modules.agent_operations.agent import OperationsAgent
+
+        agent = OperationsAgent()
+        support_db, order_db = MagicMock(), MagicMock()
+        with bind_request(db=support_db, order_db=order_db, current_user="u"):
+            assert agent.db is support_db
+            assert agent.order_db is order_db
+            assert agent.dedup_service.db is support_db
+            assert agent.current_user == "u"
+        assert agent.db is None
+
+    def test_rag_endpoint_uses_pool(self):
+        source = read("backend/api/v1/endpoints/rag.py")
+        assert "CustomerServiceAgent(db=None)" not in source
+        assert "get_agent(CustomerServiceAgent)" in source
+        assert "db=db" in source
+        assert "warm_up" in read("backend/main.py")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-031: CRM context fan-out + cache
+# ══════════════════════════════════════════════════════════════════
+
+class TestCrmContextCache:
+    """USER-031 — Parallel identity/order/support queries, cached per customer"""
+
+    def test_ttl_cache_expiry_lru_and_stats(self):
+        import time
+        from ai_modules.core.ttl_cache import TTLCache
+        cache = TTLCache(maxsize=2, ttl_seconds=0.05)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "b" not in cache and cache.get("a") == 1
+        time.sleep(0.06)
+        assert cache.get("a") is None
+        assert cache.stats()["hits"] == 2
+
+    def _provider(self, delay=0.0):
+        import time
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock
+        from backend.services.crm_context import CRMContextProvider
+
+        calls = {"count": 0}
+
+        def factory(rows):
+            def make():
+                calls["count"] += 1
+                time.sleep(delay)
+                db = MagicMock()
+                chain = db.query.return_value.filter.return_value
+                chain.first.return_value = rows[0] if rows else None
+                chain.order_by.return_value.limit.return_value.all.return_value = rows
+                return db
+            return make
+
+        provider = CRMContextProvider(
+            ttl_seconds=30,
+            identity_factory=factory([SimpleNamespace(full_name="An", email="a@x", phone="09")]),
+            order_factory=factory([SimpleNamespace(order_number="ORD-1", status="PENDING", total_amount=10)]),
+            support_factory=factory([SimpleNamespace(ticket_number="TKT-1", subject="Hỏng", status="OPEN")]),
+        )
+        return provider, calls
+
+    def test_fan_out_is_concurrent(self):
+        import time
+        provider, calls = self._provider(delay=0.2)
+        start = time.perf_counter()
+        context = provider.load("u1")
+        elapsed = time.perf_counter() - start
+        assert calls["count"] == 3
+        assert elapsed < 0.5  # three 0.2s branches in parallel, not 0.6s serial
+        assert context["customer"]["full_name"] == "An"
+        assert context["orders"][0]["order_number"] == "ORD-1"
+        assert context["tickets"][0]["status"] == "OPEN"
+
+    def test_cache_and_invalidation(self):
+        provider, calls = self._provider()
+        provider.get("u1")
+        provider.get("u1")
+        assert calls["count"] == 3
+        provider.invalidate("u1")
+        provider.get("u1")
+        assert calls["count"] == 6
+
+    def test_failed_branch_not_cached(self):
+        provider, calls = self._provider()
+        broken = provider._order_factory
+        provider._order_factory = lambda: (_ for _ in ()).throw(RuntimeError("db down"))
+        assert provider.get("u1")["orders"] == []
+        assert "u1" not in provider.cache
+        provider._order_factory = broken
+        assert provider.get("u1")["orders"][0]["order_number"] == "ORD-1"
+        assert "u1" in provider.cache
+
+    def test_agent_order_cancel_invalidates(self):
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock
+        from ai_modules.agent_operations.agent import OperationsAgent
+        from backend.services.crm_context import crm_context_provider
+
+        order = SimpleNamespace(order_number="ORD-20240101-X", customer_id="u1", can_cancel=True, status="PENDING")
+        order_db = MagicMock()
+        order_db.query.return_value.filter.return_value.first.return_value = order
+        crm_context_provider.cache.set("u1", {"orders": [{"status": "PENDING"}]})
+
+        response = OperationsAgent(db=MagicMock(), order_db=order_db).process_query("hủy đơn ORD-20240101-X")
+        assert response.success
+        order_db.commit.assert_called_once()
+        assert "u1" not in crm_context_provider.cache
+
+    def test_write_paths_invalidate(self):
+        for path in ("backend/api/v1/endpoints/orders.py", "backend/api/v1/endpoints/tickets.py",
+                     "backend/api/v1/endpoints/cart.py", "ai_modules/agent_operations/agent.py"):
+            assert "invalidate_customer_context(" in read(path)
+        assert "crm_context_provider.get(current_user.id)" in read("backend/api/v1/endpoints/rag.py")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-032: Per-stage timings
+# ══════════════════════════════════════════════════════════════════
+
+class TestStageTimings:
+    """USER-032 — Spans aggregated per request, exposed in debug payload"""
+
+    def test_spans_accumulate_into_outer_timer(self):
+        from ai_modules.core.timing import stage_timer, span, current_timer
+        with stage_timer() as outer:
+            with span("intent"):
+                pass
+            with stage_timer() as inner:  # nested agent call reuses the outer timer
+                with span("llm"):
+                    pass
+                with span("llm"):
+                    pass
+            assert inner is outer
+        timings = outer.as_dict()
+        assert set(timings) == {"intent", "llm"}
+        assert all(ms >= 0 for ms in timings.values())
+        assert current_timer() is None
+
+    def test_span_without_timer_is_noop(self):
+        from ai_modules.core.timing import span, current_timer
+        with span("embedding"):
+            pass
+        assert current_timer() is None
+
+    def test_agent_response_has_timings(self):
+        from ai_modules.core.base_agent import AgentResponse
+        assert AgentResponse(success=True, message="ok").timings is None
+
+    def test_pipeline_is_instrumented(self):
+        agent = read("ai_modules/agent_customer_service/agent.py")
+        assert "response.timings = timer.as_dict()" in agent
+        retriever = read("ai_modules/agent_customer_service/rag/retriever.py")
+        assert 'span("chroma_policy")' in retriever and 'span("embedding")' in retriever
+        service = read("ai_modules/agent_customer_service/rag/service.py")
+        assert 'span("llm")' in service and 'span("faq_lookup")' in service
+        endpoint = read("backend/api/v1/endpoints/rag.py")
+        assert "debug: bool = Form(False)" in endpoint
+        assert 'response_data["timings"] = timer.as_dict()' in endpoint
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-033: Product gazetteer
+# ══════════════════════════════════════════════════════════════════
+
+class TestProductGazetteer:
+    """USER-033 — Catalog-driven entity linking for comparisons / orders"""
+
+    CATALOG = [
+        {"id": "p1", "name": "iPhone 15", "brand": "Apple", "sku": "IP15-128"},
+        {"id": "p2", "name": "Samsung Galaxy S24", "brand": "Samsung"},
+        {"id": "p3", "name": "Tai nghe Không dây X1", "brand": "Sony"},
+        {"id": "p4", "name": "iPhone 15 Pro", "brand": "Apple"},
+    ]
+
+    def _gazetteer(self):
+        from ai_modules.agent_customer_service.rag.gazetteer import ProductGazetteer
+        return ProductGazetteer(self.CATALOG)
+
+    def test_normalize(self):
+        from ai_modules.agent_customer_service.rag.gazetteer import normalize
+        assert normalize("iPhone 15 Pro-Max (256GB)") == "iphone 15 pro max 256gb"
+        assert normalize("Điện thoại") == "dien thoai"
+
+    def test_resolve_names_aliases_and_sku(self):
+        g = self._gazetteer()
+        assert g.resolve("so sánh iPhone 15 với Galaxy S24") == ["p1", "p2"]
+        assert g.resolve("iphone15 hay samsung galaxy s24") == ["p1", "p2"]
+        assert g.resolve("mã IP15-128 còn hàng không") == ["p1"]
+        assert g.resolve("tai nghe khong day x1") == ["p3"]
+
+    def test_longest_mention_wins(self):
+        g = self._gazetteer()
+        assert g.resolve("iphone 15 pro và iphone 15") == ["p4", "p1"]
+
+    def test_brand_only_mentions(self):
+        g = self._gazetteer()
+        assert g.resolve("điện thoại samsung nào tốt") == []
+        assert g.brands("điện thoại samsung nào tốt") == ["samsung"]
+
+    def test_cache_rebuilds_on_signature_change(self):
+        from ai_modules.agent_customer_service.rag.gazetteer import GazetteerCache
+        state = {"sig": 1, "loads": 0}
+
+        def loader():
+            state["loads"] += 1
+            return self.CATALOG[:state["sig"]]
+
+        cache = GazetteerCache(loader, lambda: state["sig"], check_interval=0)
+        assert len(cache.get()) == 1
+        cache.get()
+        assert state["loads"] == 1
+        state["sig"] = 2
+        assert len(cache.get()) == 2
+        assert state["loads"] == 2
+
+    def test_metadata_signature_tracks_content(self):
+        from ai_modules.agent_customer_service.rag.gazetteer import metadata_signature
+        ids = ["product_1", "product_2"]
+        metadatas = [{"product_id": "1", "title": "iPhone 15"}, {"product_id": "2", "title": "Galaxy S24"}]
+        renamed = [metadatas[0], {"product_id": "2", "title": "Galaxy S24 Ultra"}]
+        assert metadata_signature(ids, metadatas) == metadata_signature(ids[::-1], metadatas[::-1])
+        assert metadata_signature(ids, metadatas) != metadata_signature(ids, renamed)
+        assert "signature=self._catalog_signature" in read("ai_modules/agent_customer_service/rag/retriever.py")
+
+    def test_compare_uses_product_ids(self):
+        agent = read("ai_modules/agent_customer_service/agent.py")
+        assert "gazetteer().resolve(query" in agent
+        assert "product_ids=product_ids" in agent
+        assert "get_by_ids(product_ids" in read("ai_modules/agent_customer_service/rag/service.py")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-034: Batched LLM sentiment
+# ══════════════════════════════════════════════════════════════════
+
+class TestBatchSentiment:
+    """USER-034 — Many texts per LLM call, per-item rule-based fallback"""
+
+    def _analyzer(self, respond):
+        import json
+        from ai_modules.sentiment.analyzer import SentimentAnalyzer
+        from ai_modules.sentiment.cache import SentimentCache
+        analyzer = SentimentAnalyzer(cache=SentimentCache())
+        analyzer.demo_mode = False
+        analyzer.llm_client = object()
+        analyzer.llm_provider = "openai"
+        calls = []
+
+        def fake_call(prompt, max_tokens):
+            items = json.loads(prompt.split("ITEMS:\n", 1)[1].split("\n", 1)[0])
+            calls.append(items)
+            return respond(items)
+
+        analyzer._call_llm = fake_call
+        return analyzer, calls
+
+    def test_one_call_per_batch(self):
+        import json
+        analyzer, calls = self._analyzer(lambda items: json.dumps(
+            [{"id": it["id"], "score": 0.9, "label": "POSITIVE", "confidence": 0.9} for it in items]
+        ))
+        results = analyzer.batch_analyze([f"tin nhắn {i}" for i in range(10)])
+        assert len(calls) == 1 and len(calls[0]) == 10
+        assert all(r.provider == "openai" and r.label.value == "POSITIVE" for r in results)
+
+    def test_split_by_token_budget(self, monkeypatch):
+        import json
+        from ai_modules.sentiment import analyzer as analyzer_module
+        monkeypatch.setattr(analyzer_module.ai_config, "sentiment_batch_token_budget", 100)
+        analyzer, calls = self._analyzer(lambda items: json.dumps(
+            [{"id": it["id"], "score": 0.0, "label": "NEUTRAL"} for it in items]
+        ))
+        results = analyzer.batch_analyze([str(i) * 150 for i in range(6)], max_concurrency=3)
+        assert len(results) == 6
+        assert len(calls) > 1
+        assert sum(len(c) for c in calls) == 6
+
+    def test_unparsed_items_fall_back_to_rules(self):
+        import json
+        analyzer, _ = self._analyzer(lambda items: "```json\n" + json.dumps(
+            [{"id": 0, "score": -0.8, "label": "NEGATIVE"}, {"id": 1, "score": "??"}]
+        ) + "\n```")
+        results = analyzer.batch_analyze(["tệ quá", "rất tốt, cảm ơn", "", "ok"])
+        assert [r.provider for r in results] == ["openai", "rule_based", "none", "rule_based"]
+        assert results[0].label.value == "NEGATIVE"
+
+    def test_failed_call_falls_back(self):
+        def boom(items):
+            raise RuntimeError("timeout")
+        analyzer, _ = self._analyzer(boom)
+        results = analyzer.batch_analyze(["sản phẩm tốt", "giao hàng chậm"])
+        assert [r.provider for r in results] == ["rule_based", "rule_based"]
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-035: Compiled rule-based sentiment
+# ══════════════════════════════════════════════════════════════════
+
+class TestRuleSentimentEngine:
+    """USER-035 — One automaton scan per text, scoped negation, array scoring"""
+
+    def _engine(self):
+        from ai_modules.sentiment.analyzer import SentimentAnalyzer
+        return SentimentAnalyzer._rule_engine
+
+    def test_negation_is_scoped(self):
+        engine = self._engine()
+        assert engine.score("không tốt")[0] < 0
+        # Negator in another clause no longer flips the whole text
+        assert engine.score("giao hàng không chậm, sản phẩm tốt")[0] > 0
+
+    def test_single_letter_negator_needs_word_boundary(self):
+        engine = self._engine()
+        assert engine.score("kiểm tra thấy rất tốt")[0] > 0
+        assert engine.score("k tốt")[0] < 0
+
+    def test_phrase_beats_parts(self):
+        # "không hài lòng" is one negative phrase, not negator + positive
+        score, _, hits = self._engine().score("tôi không hài lòng")
+        assert score < 0 and hits == 1
+
+    def test_batch_arrays(self):
+        engine = self._engine()
+        scores, confidences, hits = engine.score_batch(["rất tốt", "tệ quá", "bình thường", ""])
+        assert scores.shape == (4,)
+        assert list(engine.labels(scores)) == [1, -1, 0, 0]
+        assert confidences[2] == 0.4 and hits[3] == 0
+
+    def test_batch_analyze_matches_single(self):
+        from ai_modules.sentiment import SentimentAnalyzer
+        analyzer = SentimentAnalyzer()
+        texts = ["Sản phẩm rất tuyệt vời!", "quá tệ, thất vọng", "không phản hồi gì cả"] * 50
+        batch = analyzer.batch_analyze(texts)
+        single = [analyzer.analyze_text(t) for t in texts[:3]]
+        assert [r.score for r in batch[:3]] == [r.score for r in single]
+        assert len(batch) == 150
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-036: Sentiment result cache
+# ══════════════════════════════════════════════════════════════════
+
+class TestSentimentCache:
+    """USER-036 — LLM sentiment cached by normalized text + model version"""
+
+    def _analyzer(self, cache):
+        import json
+        from ai_modules.sentiment.analyzer import SentimentAnalyzer
+        analyzer = SentimentAnalyzer(cache=cache)
+        analyzer.demo_mode = False
+        analyzer.llm_client = object()
+        analyzer.llm_provider = "openai"
+        calls = []
+
+        def fake_call(prompt, max_tokens):
+            if "ITEMS:" in prompt:
+                items = json.loads(prompt.split("ITEMS:\n", 1)[1].split("\n", 1)[0])
+                calls.append(len(items))
+                return json.dumps([{"id": it["id"], "score": 0.7, "label": "POSITIVE"} for it in items])
+            calls.append(1)
+            return json.dumps({"score": 0.5, "label": "POSITIVE"})
+
+        analyzer._call_llm = fake_call
+        return analyzer, calls
+
+    def test_key_normalizes_text_and_separates_models(self):
+        from ai_modules.sentiment.cache import cache_key
+        assert cache_key("  Cảm   ơn ", "openai:m:v1") == cache_key("cảm ơn", "openai:m:v1")
+        assert cache_key("cảm ơn", "openai:m:v1") != cache_key("cảm ơn", "gemini:m:v1")
+
+    def test_analyze_text_hits_cache(self):
+        from ai_modules.sentiment.cache import SentimentCache
+        cache = SentimentCache()
+        analyzer, calls = self._analyzer(cache)
+        first = analyzer.analyze_text("Cảm ơn")
+        second = analyzer.analyze_text("cảm ơn")
+        assert calls == [1]
+        assert second.score == first.score and second.provider == "openai"
+        assert second.text_preview == "cảm ơn"
+        assert cache.stats()["memory_hits"] == 1
+
+    def test_batch_dedupes_and_reuses(self):
+        from ai_modules.sentiment.cache import SentimentCache
+        analyzer, calls = self._analyzer(SentimentCache())
+        analyzer.batch_analyze(["ok", "OK", "giao hàng chậm quá", "ok"])
+        assert calls == [2]
+        results = analyzer.batch_analyze(["ok", "giao hàng chậm quá", "mới"])
+        assert calls == [2, 1]
+        assert all(r.provider == "openai" for r in results)
+
+    def test_sql_tier_shared_between_caches(self, tmp_path):
+        from sqlalchemy import create_engine
+        from ai_modules.sentiment.cache import SentimentCache, SQLSentimentStore
+        engine = create_engine(f"sqlite:///{tmp_path / 'sentiment.db'}")
+        writer = SentimentCache(store=SQLSentimentStore(engine))
+        writer.put_many(["ok"], "v", [{"score": 0.3, "label": "POSITIVE", "confidence": 0.9, "provider": "openai"}])
+        reader = SentimentCache(store=SQLSentimentStore(engine))
+        assert reader.get_many(["OK", "khác"], "v")[0]["score"] == 0.3
+        assert reader.stats()["sql_hits"] == 1 and reader.stats()["misses"] == 1
+
+    def test_sql_put_many_ignores_existing_keys(self, tmp_path):
+        from sqlalchemy import create_engine
+        from ai_modules.sentiment.cache import SQLSentimentStore
+        engine = create_engine(f"sqlite:///{tmp_path / 'sentiment.db'}")
+        store = SQLSentimentStore(engine)
+        statements = record_sql(engine)
+        store.put_many("v", {"a": {"score": 0.1}})
+        # A second worker writing the same key (plus a new one) must not raise
+        store.put_many("v", {"a": {"score": 0.9}, "b": {"score": -0.5}})
+        assert store.get_many(["a", "b"]) == {"a": {"score": 0.1}, "b": {"score": -0.5}}
+        assert not any(sql.lstrip().upper().startswith("SELECT") for sql in statements[:2])
+        assert all("ON CONFLICT" in sql.upper() for sql in statements[:2])
+
+    def test_rule_based_fallback_not_cached(self):
+        from ai_modules.sentiment.cache import SentimentCache
+        cache = SentimentCache()
+        analyzer, _ = self._analyzer(cache)
+        analyzer._call_llm = lambda prompt, max_tokens: "not json"
+        assert analyzer.analyze_text("tốt").provider == "rule_based"
+        assert len(cache.memory) == 0
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-037: Incremental per-message sentiment
+# ══════════════════════════════════════════════════════════════════
+
+class TestIncrementalSentiment:
+    """USER-037 — Messages scored once on write; ticket/conversation aggregates O(1)"""
+
+    def _ticket_db(self, sqlite_db):
+        from backend.models.ticket import Ticket, TicketMessage
+        return sqlite_db(Ticket, TicketMessage)()
+
+    def test_aggregate_matches_full_recompute(self):
+        from ai_modules.sentiment.incremental import SentimentAggregate
+        scores = [-0.8, -0.2, 0.1, 0.6, 0.9]
+        aggregate = SentimentAggregate()
+        for score in scores:
+            aggregate.update(score)
+        assert aggregate.count == 5
+        assert aggregate.mean == pytest.approx(sum(scores) / len(scores))
+        assert aggregate.trend == "improving"
+        assert SentimentAggregate.from_scores(scores) == aggregate
+
+    def test_trend_follows_recent_messages(self):
+        from ai_modules.sentiment.incremental import SentimentAggregate
+        assert SentimentAggregate.from_scores([-1.0, 1.0]).trend == "improving"
+        assert SentimentAggregate.from_scores([0.8, 0.5, -0.9]).trend == "declining"
+        assert SentimentAggregate.from_scores([0.3]).trend == "stable"
+
+    def test_row_round_trip(self):
+        from types import SimpleNamespace
+        from ai_modules.sentiment.incremental import SentimentAggregate
+        row = SimpleNamespace(sentiment_count=None, sentiment_score=None, sentiment_ewma=None, sentiment_label=None)
+        assert SentimentAggregate.from_row(row).count == 0
+        SentimentAggregate.from_scores([-0.6, -0.4]).apply_to(row)
+        assert row.sentiment_count == 2 and row.sentiment_label == "NEGATIVE"
+        assert SentimentAggregate.from_row(row) == SentimentAggregate.from_scores([-0.6, -0.4])
+
+    def test_staff_message_not_scored(self):
+        from types import SimpleNamespace
+        from ai_modules.sentiment import SentimentAnalyzer
+        analyzer = SentimentAnalyzer()
+        ticket = SimpleNamespace(sentiment_count=0, sentiment_score=None, sentiment_ewma=None, sentiment_label=None)
+        customer = SimpleNamespace(message="quá tệ, thất vọng", is_staff=False, sentiment_score=None, sentiment_label=None)
+        staff = SimpleNamespace(message="cảm ơn anh", is_staff=True, sentiment_score=None, sentiment_label=None)
+        calls, analyze = [], analyzer.analyze_text
+        analyzer.analyze_text = lambda text: calls.append(text) or analyze(text)
+        analyzer.score_ticket_message(ticket, customer)
+        assert analyzer.score_ticket_message(ticket, staff) is None
+        assert customer.sentiment_label == "NEGATIVE" and staff.sentiment_score is None
+        assert calls == [customer.message]
+        assert ticket.sentiment_count == 1 and ticket.sentiment_score == customer.sentiment_score
+
+    def test_analyze_ticket_reads_persisted_scores(self, sqlite_db):
+        from ai_modules.sentiment import SentimentAnalyzer
+        from backend.models.ticket import Ticket, TicketMessage
+        db = self._ticket_db(sqlite_db)
+        analyzer = SentimentAnalyzer()
+        ticket = Ticket(ticket_number="TKT-1", customer_id="c1", subject="Giao hàng")
+        db.add(ticket)
+        db.flush()
+        message = TicketMessage(ticket_id=ticket.id, sender_id="c1", is_staff=False, message="quá tệ, thất vọng")
+        db.add(message)
+        analyzer.score_ticket_message(ticket, message)
+        db.commit()
+
+        analyzer.analyze_text = None  # read path must not re-score
+        analyzer.batch_analyze = None
+        result = analyzer.analyze_ticket(ticket.id, db=db)
+        assert result["overall_sentiment"]["label"] == "NEGATIVE"
+        assert result["customer_message_count"] == 1
+        assert result["message_sentiments"][0]["sentiment"]["score"] == message.sentiment_score
+
+    def test_legacy_messages_backfilled_once(self, sqlite_db):
+        from ai_modules.sentiment import SentimentAnalyzer
+        from backend.models.ticket import Ticket, TicketMessage
+        db = self._ticket_db(sqlite_db)
+        analyzer = SentimentAnalyzer()
+        ticket = Ticket(ticket_number="TKT-2", customer_id="c1", subject="Đổi trả")
+        db.add(ticket)
+        db.flush()
+        db.add_all([
+            TicketMessage(ticket_id=ticket.id, sender_id="c1", is_staff=False, message="sản phẩm tốt"),
+            TicketMessage(ticket_id=ticket.id, sender_id="s1", is_staff=True, message="cảm ơn anh"),
+        ])
+        db.commit()
+
+        first = analyzer.analyze_ticket(ticket.id, db=db)
+        assert first["customer_message_count"] == 1 and len(first["message_sentiments"]) == 1
+        assert ticket.sentiment_count == 1
+
+        analyzer.batch_analyze = None
+        assert analyzer.analyze_ticket(ticket.id, db=db)["overall_sentiment"] == first["overall_sentiment"]
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-038: Checkpointed sentiment backfill
+# ══════════════════════════════════════════════════════════════════
+
+class TestSentimentBackfill:
+    """USER-038 — Keyset-paginated re-scoring with resumable checkpoints"""
+
+    def _support_db(self, sqlite_db, tickets=3, messages_per_ticket=4):
+        from backend.models.ticket import Ticket, TicketMessage
+        factory = sqlite_db(Ticket, TicketMessage)
+        texts = ["quá tệ, thất vọng", "xin lỗi anh", "cảm ơn, tốt rồi", "ok"]
+        db = factory()
+        for t in range(tickets):
+            ticket = Ticket(ticket_number=f"TKT-{t}", customer_id="c1", subject="s",
+                            sentiment_score=-0.5, sentiment_label="NEGATIVE")
+            db.add(ticket)
+            db.flush()
+            for i in range(messages_per_ticket):
+                db.add(TicketMessage(ticket_id=ticket.id, sender_id="c1", is_staff=(i == 1),
+                                     message=texts[i % len(texts)]))
+        db.commit()
+        db.close()
+        return factory
+
+    def test_scores_messages_and_rebuilds_aggregates(self, sqlite_db):
+        from ai_modules.sentiment import SentimentAnalyzer
+        from ai_modules.sentiment.backfill import SentimentBackfill, PHASE_DONE
+        from backend.models.ticket import Ticket, TicketMessage
+        factory = self._support_db(sqlite_db)
+        state = SentimentBackfill(factory, SentimentAnalyzer(), batch_size=5).run()
+        assert state["phase"] == PHASE_DONE
+        assert state["messages"] == 9 and state["tickets"] == 3
+
+        db = factory()
+        unscored = db.query(TicketMessage).filter(TicketMessage.sentiment_score.is_(None)).all()
+        assert len(unscored) == 3 and all(m.is_staff for m in unscored)
+        ticket = db.query(Ticket).first()
+        assert ticket.sentiment_count == 3
+        assert ticket.sentiment_score != -0.5
+
+    def test_resumes_from_checkpoint(self, sqlite_db, tmp_path):
+        from ai_modules.sentiment import SentimentAnalyzer
+        from ai_modules.sentiment.backfill import (
+            SentimentBackfill, BackfillCheckpoint, PHASE_MESSAGES, PHASE_DONE
+        )
+        factory = self._support_db(sqlite_db)
+        analyzer = SentimentAnalyzer()
+        scored = []
+        original = analyzer.batch_analyze
+
+        def counting(texts, max_concurrency=None):
+            scored.append(len(texts))
+            return original(texts, max_concurrency=max_concurrency)
+
+        analyzer.batch_analyze = counting
+        checkpoint = BackfillCheckpoint(str(tmp_path / "backfill.json"))
+        first = SentimentBackfill(factory, analyzer, batch_size=5, checkpoint=checkpoint).run(max_batches=1)
+        assert first["phase"] == PHASE_MESSAGES and checkpoint.load()["messages"] == 5
+
+        second = SentimentBackfill(factory, analyzer, batch_size=5, checkpoint=checkpoint).run()
+        assert second["phase"] == PHASE_DONE and second["messages"] == 9
+        assert scored == [5, 4]
+
+    def test_throttle_limits_rate(self, monkeypatch):
+        from ai_modules.sentiment import backfill
+        sleeps = []
+        monkeypatch.setattr(backfill.time, "sleep", sleeps.append)
+        job = backfill.SentimentBackfill(max_rows_per_second=100)
+        job._throttle(50, backfill.time.monotonic())
+        assert sleeps and 0.4 < sleeps[0] <= 0.5
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-039: MinHash / LSH ticket deduplication
+# ══════════════════════════════════════════════════════════════════
+
+class TestMinHashDeduplication:
+    """USER-039 — Persisted MinHash signatures + LSH banding for the duplicate scan"""
+
+    def _support_db(self, sqlite_db):
+        from backend.models.ticket import Ticket, TicketMessage, TicketSignature, TicketSignatureBand
+        return sqlite_db(Ticket, TicketMessage, TicketSignature, TicketSignatureBand)()
+
+    def _ticket(self, db, customer, subject, message):
+        import uuid
+        from backend.models.ticket import Ticket, TicketMessage
+        ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id=customer, subject=subject)
+        db.add(ticket)
+        db.flush()
+        db.add(TicketMessage(ticket_id=ticket.id, sender_id=customer, is_staff=False, message=message))
+        db.commit()
+        return ticket.id
+
+    def test_signature_similarity_tracks_jaccard(self):
+        from ai_modules.core.minhash import MinHasher, shingles
+        hasher = MinHasher()
+        a = "giao hàng chậm quá, đơn hàng DH123 chưa nhận được"
+        b = "giao hàng chậm quá đơn DH123 vẫn chưa nhận được hàng"
+        sa, sb = shingles(a), shingles(b)
+        jaccard = len(sa & sb) / len(sa | sb)
+        estimate = MinHasher.similarity(hasher.signature(a), hasher.signature(b))
+        assert abs(estimate - jaccard) < 0.15
+        assert MinHasher.similarity(hasher.signature(a), hasher.signature("đổi mật khẩu tài khoản")) < 0.2
+        sig = hasher.signature(a)
+        assert (MinHasher.from_bytes(MinHasher.to_bytes(sig)) == sig).all()
+
+    def test_lsh_pairs_scoped(self):
+        from ai_modules.core.minhash import MinHasher, LSHIndex
+        hasher = MinHasher()
+        index = LSHIndex()
+        text = "sản phẩm bị lỗi màn hình sau 2 ngày sử dụng"
+        index.add("t1", hasher.signature(text), scope="c1")
+        index.add("t2", hasher.signature(text + " ạ"), scope="c1")
+        index.add("t3", hasher.signature(text), scope="c2")
+        index.add("t4", hasher.signature("yêu cầu hoàn tiền đơn 456"), scope="c1")
+        assert index.candidate_pairs() == {("t1", "t2")}
+
+    def test_auto_detect_uses_candidates_and_persists(self, sqlite_db):
+        from ai_modules.ticket_deduplication import TicketDeduplicationService
+        from backend.models.ticket import TicketSignature
+        db = self._support_db(sqlite_db)
+        a = self._ticket(db, "c1", "Giao hàng chậm", "đơn hàng DH123 chưa nhận được, giao hàng chậm quá")
+        b = self._ticket(db, "c1", "Giao hàng chậm", "đơn hàng DH123 vẫn chưa nhận được, giao hàng chậm quá")
+        self._ticket(db, "c2", "Giao hàng chậm", "đơn hàng DH123 chưa nhận được, giao hàng chậm quá")
+        self._ticket(db, "c1", "Đổi mật khẩu", "tôi quên mật khẩu tài khoản")
+
+        service = TicketDeduplicationService(db)
+        compared = []
+        original = service._calculate_similarity
+
+        def counting(text1, text2, threshold=0.0):
+            compared.append((text1, text2))
+            return original(text1, text2, threshold)
+
+        service._calculate_similarity = counting
+        groups = service.auto_detect_duplicates(similarity_threshold=0.8)
+        assert len(groups) == 1 and len(compared) == 1
+        primary, duplicates = groups[0]
+        assert {primary, duplicates[0][0]} == {a, b}
+        assert db.query(TicketSignature).count() == 4
+
+        from ai_modules.core.minhash import MinHasher
+        service.hasher = MinHasher()
+        service.hasher.signature = None  # stored signatures are reused, not recomputed
+        assert service.auto_detect_duplicates(similarity_threshold=0.8) == groups
+
+    def test_find_similar_loads_messages_once(self, sqlite_db):
+        from ai_modules.ticket_deduplication import TicketDeduplicationService
+        db = self._support_db(sqlite_db)
+        a = self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền đơn hàng 456")
+        b = self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền cho đơn hàng 456")
+        similar = TicketDeduplicationService(db).find_similar_tickets(a, similarity_threshold=0.7)
+        assert [t.id for t, _ in similar] == [b]
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-040: Semantic ticket deduplication
+# ══════════════════════════════════════════════════════════════════
+
+class TestSemanticDeduplication:
+    """USER-040 — Embedding nearest neighbours catch paraphrased duplicates"""
+
+    CONCEPTS = [("chưa nhận", "chưa giao", "giao tới"), ("mật khẩu",), ("hoàn tiền",)]
+
+    def _embed(self, texts):
+        self.embedded.extend(texts)
+        return [[1.0 if any(k in t.lower() for k in group) else 0.05 for group in self.CONCEPTS] for t in texts]
+
+    def _service(self, sqlite_db):
+        import uuid
+        import chromadb
+        from backend.models.ticket import Ticket, TicketMessage, TicketSignature, TicketSignatureBand
+        from ai_modules.ticket_deduplication import TicketDeduplicationService
+        from ai_modules.ticket_embeddings import TicketEmbeddingIndex
+        self.embedded = []
+        collection = chromadb.EphemeralClient().get_or_create_collection(
+            f"tickets_{uuid.uuid4().hex[:8]}", metadata={"hnsw:space": "cosine"}
+        )
+        index = TicketEmbeddingIndex(collection=collection, embed_fn=self._embed)
+        db = sqlite_db(Ticket, TicketMessage, TicketSignature, TicketSignatureBand)()
+        return db, TicketDeduplicationService(db, embedding_index=index)
+
+    def _ticket(self, db, customer, subject, message, status="OPEN"):
+        import uuid
+        from backend.models.ticket import Ticket, TicketMessage
+        ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id=customer,
+                        subject=subject, status=status)
+        db.add(ticket)
+        db.flush()
+        db.add(TicketMessage(ticket_id=ticket.id, sender_id=customer, is_staff=False, message=message))
+        db.commit()
+        return ticket.id
+
+    def test_paraphrase_found_semantically_not_lexically(self, sqlite_db):
+        db, service = self._service(sqlite_db)
+        a = self._ticket(db, "c1", "Khiếu nại", "tôi chưa nhận được hàng")
+        b = self._ticket(db, "c1", "Hỏi đơn", "đơn hàng của tôi chưa giao tới")
+        self._ticket(db, "c1", "Tài khoản", "quên mật khẩu")
+        self._ticket(db, "c2", "Khiếu nại", "tôi chưa nhận được hàng")
+
+        assert service.find_similar_tickets(a, similarity_threshold=0.8) == []
+        similar = service.find_similar_tickets(a, similarity_threshold=0.8, mode="semantic")
+        assert [t.id for t, _ in similar] == [b]
+
+        groups = service.auto_detect_duplicates(similarity_threshold=0.8, mode="semantic")
+        assert len(groups) == 1
+        assert {groups[0][0], groups[0][1][0][0]} == {a, b}
+
+    def test_embeddings_computed_once(self, sqlite_db):
+        db, service = self._service(sqlite_db)
+        self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền")
+        self._ticket(db, "c1", "Hoàn tiền", "muốn được hoàn tiền đơn 12")
+        service.auto_detect_duplicates(mode="semantic")
+        assert len(self.embedded) == 2
+        service.auto_detect_duplicates(mode="semantic")
+        assert len(self.embedded) == 2
+
+    def test_closed_tickets_not_suggested(self, sqlite_db):
+        db, service = self._service(sqlite_db)
+        a = self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền")
+        self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền lần nữa", status="CLOSED")
+        assert service.find_similar_tickets(a, mode="semantic") == []
+        assert service.auto_detect_duplicates(mode="semantic") == []
+
+    def test_window_applied_after_uncapped_query(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.models.ticket import Ticket
+        db, service = self._service(sqlite_db)
+        a = self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền")
+        b = self._ticket(db, "c1", "Hoàn tiền", "muốn được hoàn tiền")
+        # More same-concept neighbours than DEFAULT_TOP_K, all outside the 24h window
+        old = [self._ticket(db, "c1", "Hoàn tiền", f"hoàn tiền đơn {i}") for i in range(12)]
+        db.query(Ticket).filter(Ticket.id.in_(old)).update(
+            {Ticket.created_at: datetime.utcnow() - timedelta(days=10)}, synchronize_session=False
+        )
+        db.commit()
+        groups = dict(service.auto_detect_duplicates(similarity_threshold=0.8, mode="semantic"))
+        in_window = groups.get(a) or groups.get(b)
+        assert in_window and {other for other, _ in in_window} & {a, b}
+
+    def test_merge_and_prune_drop_embeddings(self, sqlite_db, monkeypatch):
+        from backend.models.ticket import Ticket
+        monkeypatch.setattr(Ticket, "admin_notes", None, raising=False)  # merge notes: no column in this schema
+        db, service = self._service(sqlite_db)
+        a = self._ticket(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền")
+        b = self._ticket(db, "c1", "Hoàn tiền", "muốn được hoàn tiền")
+        c = self._ticket(db, "c1", "Tài khoản", "quên mật khẩu")
+        d = self._ticket(db, "c1", "Giao hàng", "chưa nhận được hàng")
+        service.auto_detect_duplicates(mode="semantic")
+        index = service.embedding_index
+        assert index.missing([a, b, c, d]) == []
+
+        service.merge_tickets(a, [b])
+        assert index.missing([a, b]) == [b]
+
+        db.query(Ticket).filter(Ticket.id == c).update({Ticket.status: "CLOSED"}, synchronize_session=False)
+        db.query(Ticket).filter(Ticket.id == d).delete(synchronize_session=False)
+        db.commit()
+        assert service.prune_embeddings() == 2
+        assert index.missing([a, c, d]) == [c, d]
+
+    def test_endpoints_accept_mode(self):
+        source = read("backend/api/v1/endpoints/ticket_deduplication.py")
+        assert source.count('mode: Literal["lexical", "semantic"]') == 2
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-041: Online duplicate check at creation
+# ══════════════════════════════════════════════════════════════════
+
+class TestDuplicateCheckOnCreate:
+    """USER-041 — New tickets checked against persisted LSH bands in one query"""
+
+    def _db(self, sqlite_db):
+        from backend.models.ticket import Ticket, TicketMessage, TicketSignature, TicketSignatureBand
+        return sqlite_db(Ticket, TicketMessage, TicketSignature, TicketSignatureBand)()
+
+    def _create(self, db, customer, subject, message, status="OPEN"):
+        import uuid
+        from backend.models.ticket import Ticket
+        from ai_modules.ticket_deduplication import TicketDeduplicationService
+        ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id=customer,
+                        subject=subject, status=status)
+        db.add(ticket)
+        db.flush()
+        match = TicketDeduplicationService(db).check_new_ticket(ticket, message)
+        db.commit()
+        return ticket, match
+
+    def test_flags_same_customer_open_duplicate(self, sqlite_db):
+        from backend.models.ticket import TicketSignatureBand
+        db = self._db(sqlite_db)
+        first, match = self._create(db, "c1", "Giao hàng chậm", "đơn hàng DH123 chưa nhận được, giao hàng chậm quá")
+        assert match is None and first.possible_duplicate_of is None
+        assert db.query(TicketSignatureBand).filter_by(ticket_id=first.id).count() > 1
+
+        second, match = self._create(db, "c1", "Giao hàng chậm", "đơn hàng DH123 vẫn chưa nhận được, giao hàng chậm quá")
+        assert match[0] == first.id and match[1] >= 0.6
+        assert second.possible_duplicate_of == first.id
+
+    def test_ignores_other_customers_and_unrelated(self, sqlite_db):
+        db = self._db(sqlite_db)
+        self._create(db, "c1", "Giao hàng chậm", "đơn hàng DH123 chưa nhận được")
+        _, other_customer = self._create(db, "c2", "Giao hàng chậm", "đơn hàng DH123 chưa nhận được")
+        _, unrelated = self._create(db, "c1", "Tài khoản", "tôi quên mật khẩu đăng nhập")
+        assert other_customer is None and unrelated is None
+
+    def test_closed_ticket_not_flagged(self, sqlite_db):
+        db = self._db(sqlite_db)
+        self._create(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền đơn 456", status="CLOSED")
+        _, match = self._create(db, "c1", "Hoàn tiền", "yêu cầu hoàn tiền đơn 456")
+        assert match is None
+
+    def test_failure_keeps_ticket(self, sqlite_db):
+        import uuid
+        from backend.models.ticket import Ticket
+        from ai_modules.ticket_deduplication import TicketDeduplicationService
+        db = sqlite_db(Ticket)()  # no signature tables
+        ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id="c1", subject="s")
+        db.add(ticket)
+        db.flush()
+        assert TicketDeduplicationService(db).check_new_ticket(ticket, "xin chào") is None
+        db.commit()
+        assert db.query(Ticket).count() == 1
+
+    def test_create_paths_call_check(self):
+        assert "check_new_ticket(new_ticket, ticket_data.initial_message)" in read("backend/api/v1/endpoints/tickets.py")
+        assert "self.dedup_service.check_new_ticket(new_ticket, query)" in read("ai_modules/agent_operations/agent.py")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-042: Compiled, cached routing rules
+# ══════════════════════════════════════════════════════════════════
+
+class TestCompiledRouting:
+    """USER-042 — Rules compiled once per version, keywords in one automaton"""
+
+    def _db(self, sqlite_db):
+        from backend.models.ticket import Ticket, TicketMessage
+        from backend.models.ticket_routing import RoutingRule, RoutingRuleVersion, WorkQueue, Assignment
+        from backend.services.ticket_routing import invalidate_compiled_rules
+        invalidate_compiled_rules()
+        return sqlite_db(Ticket, TicketMessage, RoutingRule, RoutingRuleVersion, WorkQueue, Assignment)()
+
+    def _ticket(self, db, subject, **fields):
+        import uuid
+        from backend.models.ticket import Ticket
+        ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id="c1", subject=subject, **fields)
+        db.add(ticket)
+        db.flush()
+        return ticket
+
+    def _seed(self, db):
+        from backend.models.ticket_routing import RoutingRule, WorkQueue
+        db.add_all([
+            WorkQueue(code="ESCALATION", name="Escalation"),
+            WorkQueue(code="BILLING", name="Billing"),
+            RoutingRule(code="refund", name="Refund", priority=20,
+                        predicate={"keywords": ["Hoàn Tiền", "refund"]}, action={"assign_queue": "BILLING"}),
+            RoutingRule(code="angry", name="Angry", priority=10,
+                        predicate={"sentiment_below": -0.3}, action={"assign_queue": "ESCALATION", "set_priority": "URGENT"}),
+            RoutingRule(code="off", name="Off", priority=1, is_active=0,
+                        predicate={"channel": ["WEB"]}, action={}),
+        ])
+        db.commit()
+
+    def test_compiled_semantics(self):
+        from backend.models.ticket import Ticket, TicketCategory, TicketPriority
+        from backend.models.ticket_routing import RoutingRule
+        from backend.services.ticket_routing import CompiledRuleSet
+        rules = CompiledRuleSet([
+            RoutingRule(id="b", code="b", name="b", priority=50, predicate={"keywords": ["LỖI"]}, action={}),
+            RoutingRule(id="a", code="a", name="a", priority=5, action={},
+                        predicate={"category": ["COMPLAINT"], "priority": ["HIGH", "URGENT"], "channel": "EMAIL"}),
+            RoutingRule(id="x", code="x", name="x", priority=1, predicate={}, action={}),
+            RoutingRule(id="y", code="y", name="y", priority=2, predicate={"sentiment_below": "abc"}, action={}),
+        ])
+        assert [r.code for r in rules.rules] == ["a", "b"] and rules.needs_text
+        complaint = Ticket(subject="x", category=TicketCategory.COMPLAINT, priority=TicketPriority.HIGH, channel="EMAIL")
+        assert rules.match(complaint).code == "a"
+        assert rules.match(Ticket(subject="Báo lỗi thanh toán", channel="WEB")).code == "b"
+        assert rules.match(Ticket(subject="hỏi", channel="WEB"), first_message="app bị lỗi").code == "b"
+        assert rules.match(Ticket(subject="hỏi", channel="WEB")) is None
+
+    def test_route_ticket_uses_cached_rules(self, sqlite_db):
+        from backend.models.ticket import TicketMessage, TicketPriority
+        from backend.services.ticket_routing import TicketRoutingService, get_compiled_rules
+        db = self._db(sqlite_db)
+        self._seed(db)
+        service = TicketRoutingService(db)
+
+        angry = self._ticket(db, "Tệ quá", sentiment_score=-0.8)
+        result = service.route_ticket(angry)
+        assert result["matched_rule"]["code"] == "angry"
+        assert result["actions_applied"] == {"priority": "URGENT", "queue": "ESCALATION"}
+        assert angry.priority == TicketPriority.URGENT
+
+        statements = record_sql(db.get_bind())
+        refund = self._ticket(db, "Đơn 123")
+        db.add(TicketMessage(ticket_id=refund.id, sender_id="c1", message="Tôi muốn hoàn tiền"))
+        db.flush()
+        assert service.route_ticket(refund)["matched_rule"]["code"] == "refund"
+        assert not any("FROM routing_rules" in sql or "FROM work_queues" in sql for sql in statements)
+        assert get_compiled_rules(db) is get_compiled_rules(db)
+
+    def test_version_bump_recompiles(self, sqlite_db):
+        from backend.models.ticket_routing import RoutingRule
+        from backend.services.ticket_routing import (
+            TicketRoutingService, bump_rules_version, get_compiled_rules, get_rules_version,
+        )
+        db = self._db(sqlite_db)
+        self._seed(db)
+        before = get_compiled_rules(db)
+        assert get_rules_version(db) == 0 and len(before) == 2
+
+        db.add(RoutingRule(code="web", name="Web", priority=1, predicate={"channel": ["WEB"]}, action={}))
+        bump_rules_version(db)
+        db.commit()
+        after = get_compiled_rules(db)
+        assert after is not before and after.version == 1 and after.rules[0].code == "web"
+        bump_rules_version(db)
+        db.commit()
+        assert get_rules_version(db) == 2
+        assert TicketRoutingService(db).route_ticket(self._ticket(db, "x", channel="WEB"))["matched_rule"]["code"] == "web"
+
+    def test_evaluate_predicate_still_available(self):
+        from backend.models.ticket import Ticket
+        from backend.services.ticket_routing import TicketRoutingService
+        service = TicketRoutingService(db=None)
+        assert service._evaluate_predicate({"keywords": ["refund"]}, Ticket(subject="REFUND please"))
+        assert not service._evaluate_predicate({}, Ticket(subject="REFUND please"))
+
+    def test_agent_passes_first_message(self):
+        assert "route_ticket(new_ticket, first_message=query)" in read("ai_modules/agent_operations/agent.py")
+        assert "CREATE TRIGGER trg_routing_rules_after_update" in read("scripts/sql/04_support_db.sql")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-043: Bulk backlog re-routing
+# ══════════════════════════════════════════════════════════════════
+
+class TestBulkReroute:
+    """USER-043 — Open tickets re-routed in batches with one commit each"""
+
+    def _setup(self, sqlite_db, count=7):
+        import uuid
+        from backend.models.ticket import Ticket, TicketMessage, TicketStatus
+        from backend.models.ticket_routing import RoutingRule, RoutingRuleVersion, WorkQueue, Assignment
+        from backend.services.ticket_routing import invalidate_compiled_rules
+        invalidate_compiled_rules()
+        db = sqlite_db(Ticket, TicketMessage, RoutingRule, RoutingRuleVersion, WorkQueue, Assignment)()
+        db.add_all([
+            WorkQueue(code="BILLING", name="Billing"),
+            RoutingRule(code="refund", name="Refund", priority=10,
+                        predicate={"keywords": ["hoàn tiền"]},
+                        action={"assign_queue": "BILLING", "set_priority": "HIGH", "assign_to": "staff-1"}),
+        ])
+        for i in range(count):
+            ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id="c1", subject=f"Đơn {i}",
+                            status=TicketStatus.CLOSED if i == 0 else TicketStatus.OPEN)
+            db.add(ticket)
+            db.flush()
+            text = "cần hoàn tiền gấp" if i % 2 == 0 else "hỏi về sản phẩm"
+            db.add(TicketMessage(ticket_id=ticket.id, sender_id="c1", message=text))
+        db.commit()
+        return db
+
+    def test_dry_run_writes_nothing(self, sqlite_db):
+        from backend.models.ticket import Ticket, TicketPriority
+        from backend.models.ticket_routing import Assignment
+        from backend.services.ticket_routing import TicketRoutingService
+        db = self._setup(sqlite_db)
+        result = TicketRoutingService(db).route_backlog(batch_size=2, dry_run=True)
+        assert result["scanned"] == 6 and result["routed"] == 3 and result["unmatched"] == 3
+        assert result["by_rule"] == {"refund": 3} and result["by_queue"] == {"BILLING": 3}
+        assert result["priority_changes"] == {"HIGH": 3} and result["batches"] == 3
+        assert result["reassigned"] == 3
+        assert db.query(Assignment).count() == 0
+        assert db.query(Ticket).filter(Ticket.priority == TicketPriority.HIGH).count() == 0
+
+    def test_bulk_writes_one_commit_per_batch(self, sqlite_db):
+        from sqlalchemy import event
+        from backend.models.ticket import Ticket, TicketPriority
+        from backend.models.ticket_routing import Assignment
+        from backend.services.ticket_routing import TicketRoutingService
+        db = self._setup(sqlite_db)
+        commits = []
+        event.listen(db.get_bind(), "commit", lambda conn: commits.append(1))
+        result = TicketRoutingService(db).route_backlog(batch_size=4)
+        assert result["routed"] == 3 and result["batches"] == 2 and len(commits) == 2
+        assert db.query(Assignment).count() == 3
+        assert {a.assignee_id for a in db.query(Assignment)} == {"staff-1"}
+        routed = db.query(Ticket).filter(Ticket.priority == TicketPriority.HIGH).all()
+        assert len(routed) == 3 and all(t.assigned_to == "staff-1" for t in routed)
+
+        # Second pass: same queue/assignee → no new assignment rows, nothing to change
+        preview = TicketRoutingService(db).route_backlog(dry_run=True)
+        again = TicketRoutingService(db).route_backlog()
+        for report in (preview, again):
+            assert report["routed"] == 3 and report["reassigned"] == 0
+            assert report["by_queue"] == {} and report["priority_changes"] == {}
+        assert db.query(Assignment).count() == 3
+
+    def test_reroute_records_changed_assignee(self, sqlite_db):
+        from backend.models.ticket_routing import Assignment, RoutingRule
+        from backend.services.ticket_routing import TicketRoutingService, invalidate_compiled_rules
+        db = self._setup(sqlite_db)
+        TicketRoutingService(db).route_backlog()
+        rule = db.query(RoutingRule).one()
+        rule.action = {**rule.action, "assign_to": "staff-2"}
+        db.commit()
+        invalidate_compiled_rules()
+        result = TicketRoutingService(db).route_backlog()
+        assert result["reassigned"] == 3 and result["by_queue"] == {"BILLING": 3}
+        assert db.query(Assignment).filter(Assignment.assignee_id == "staff-2").count() == 3
+
+    def test_first_messages_chunked(self, sqlite_db, monkeypatch):
+        from backend.models.ticket import Ticket
+        from backend.services import ticket_messages
+        db = self._setup(sqlite_db)
+        ids = [t.id for t in db.query(Ticket)]
+        statements = record_sql(db.get_bind())
+        monkeypatch.setattr(ticket_messages, "IN_CLAUSE_CHUNK", 3)
+        first = ticket_messages.first_messages(db, ids + ["missing"])
+        assert set(first) == set(ids) and len(statements) == 3
+        assert "first_messages(self.db" in read("backend/services/ticket_routing.py")
+        assert "first_messages(self.db" in read("ai_modules/ticket_deduplication.py")
+
+    def test_cli_exists(self):
+        source = read("scripts/reroute_tickets.py")
+        assert "route_backlog(batch_size=args.batch_size, dry_run=args.dry_run)" in source
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-044: Load-aware staff assignment
+# ══════════════════════════════════════════════════════════════════
+
+class TestStaffAssignment:
+    """USER-044 — Least-loaded staff picked from in-memory workload counters"""
+
+    def _setup(self, sqlite_db, loads):
+        import uuid
+        from backend.models.ticket import Ticket, TicketStatus
+        from backend.models.user import User, UserType, UserStatus
+        support_db = sqlite_db(Ticket)()
+        identity_db = sqlite_db(User)()
+
+        identity_db.add_all([
+            User(id=staff_id, email=f"{staff_id}@crm.vn", password_hash="x", user_type=UserType.STAFF)
+            for staff_id in ("s1", "s2", "s3")
+        ] + [
+            User(id="gone", email="gone@crm.vn", password_hash="x", user_type=UserType.STAFF, status=UserStatus.INACTIVE),
+            User(id="cust", email="cust@crm.vn", password_hash="x", user_type=UserType.CUSTOMER),
+        ])
+        identity_db.commit()
+        for staff_id, count in loads.items():
+            for _ in range(count):
+                support_db.add(Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id="c1",
+                                      subject="s", status=TicketStatus.IN_PROGRESS, assigned_to=staff_id))
+            # Closed tickets do not count as workload
+            support_db.add(Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id="c1",
+                                  subject="s", status=TicketStatus.CLOSED, assigned_to=staff_id))
+        support_db.commit()
+        return support_db, identity_db
+
+    def test_picks_least_loaded_and_reserves(self, sqlite_db):
+        from backend.services.staff_assignment import StaffAssignmentService
+        support_db, identity_db = self._setup(sqlite_db, {"s1": 3, "s2": 1, "s3": 2, "gone": 0})
+        service = StaffAssignmentService()
+        picks = [service.pick(support_db, identity_db) for _ in range(4)]
+        assert picks == ["s2", "s2", "s3", "s1"]   # ties broken by staff id
+        assert service.snapshot() == {"s1": 4, "s2": 3, "s3": 3}
+        assert "gone" not in picks and "cust" not in picks
+
+    def test_track_status_and_reassignment(self, sqlite_db):
+        from backend.models.ticket import TicketStatus
+        from backend.services.staff_assignment import StaffAssignmentService
+        support_db, identity_db = self._setup(sqlite_db, {"s1": 1, "s2": 2, "s3": 2})
+        service = StaffAssignmentService()
+        service.seed(support_db, identity_db)
+        service.track("s2", TicketStatus.IN_PROGRESS, "s2", TicketStatus.RESOLVED)
+        service.track("s3", TicketStatus.OPEN, "s1", TicketStatus.OPEN)
+        service.track(None, TicketStatus.OPEN, "s3", "CLOSED")   # no-op
+        assert service.snapshot() == {"s1": 2, "s2": 1, "s3": 1}
+        assert service.pick(support_db, identity_db) in ("s2", "s3")
+
+    def test_no_staff_returns_none(self, sqlite_db):
+        from backend.models.ticket import Ticket
+        from backend.models.user import User
+        from backend.services.staff_assignment import StaffAssignmentService
+        db = sqlite_db(Ticket, User)()
+        assert StaffAssignmentService().pick(db, db) is None
+
+    def test_heap_stays_bounded(self, sqlite_db):
+        from backend.models.ticket import TicketStatus
+        from backend.services.staff_assignment import StaffAssignmentService
+        support_db, identity_db = self._setup(sqlite_db, {})
+        service = StaffAssignmentService()
+        service.seed(support_db, identity_db)
+        for _ in range(500):
+            staff_id = service.pick(support_db, identity_db)
+            service.track(staff_id, TicketStatus.OPEN, staff_id, TicketStatus.CLOSED)
+        assert len(service._heap) <= 4 * 3 + 64
+        assert sum(service.snapshot().values()) == 0
+
+    def test_create_ticket_uses_service(self):
+        source = read("backend/api/v1/endpoints/tickets.py")
+        assert "get_staff_assignment().pick(db, identity_db)" in source
+        assert "random.choice(" not in source
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-045: Timing-wheel SLA engine
+# ══════════════════════════════════════════════════════════════════
+
+class TestSlaTimers:
+    """USER-045 — Deadlines scheduled in a timing wheel, breaches fired as they pass"""
+
+    def test_timing_wheel_fires_in_order_and_cancels(self):
+        from ai_modules.core import TimingWheel
+        wheel = TimingWheel(tick_seconds=1.0, slots=8, levels=2, start=1000.0)
+        for key, delay in (("a", 5), ("b", 70), ("c", 30), ("far", 500), ("late", -3)):
+            wheel.schedule(key, 1000.0 + delay)
+        assert wheel.cancel("c") and not wheel.cancel("missing")
+        assert [k for k, _, _ in wheel.advance(1000.0)] == ["late"]
+        assert [k for k, _, _ in wheel.advance(1004.5)] == []
+        assert [k for k, _, _ in wheel.advance(1005.0)] == ["a"]
+        assert [k for k, _, _ in wheel.advance(1069.9)] == []
+        assert [k for k, _, _ in wheel.advance(1070.0)] == ["b"]
+        wheel.schedule("b", 1080.0)  # reschedule after firing
+        assert sorted(k for k, _, _ in wheel.advance(1600.0)) == ["b", "far"]
+        assert len(wheel) == 0
+
+    def _db(self, sqlite_db):
+        from backend.models.ticket import Ticket, TicketSlaEvent
+        from backend.models.ticket_routing import WorkQueue, Assignment
+        return sqlite_db(Ticket, TicketSlaEvent, WorkQueue, Assignment)
+
+    def _ticket(self, db, engine, created_at, priority, queue=None):
+        import uuid
+        from backend.models.ticket import Ticket
+        ticket = Ticket(ticket_number=f"TKT-{uuid.uuid4().hex[:8]}", customer_id="c1", subject="s",
+                        priority=priority, created_at=created_at)
+        engine.apply(ticket, queue=queue)
+        db.add(ticket)
+        db.commit()
+        engine.sync(ticket)
+        return ticket
+
+    def test_deadlines_from_priority_and_queue(self):
+        from datetime import datetime, timedelta
+        from backend.services.sla import compute_deadlines
+        start = datetime(2026, 1, 1, 8, 0)
+        assert compute_deadlines("URGENT", start) == (start + timedelta(hours=1), start + timedelta(hours=4))
+        assert compute_deadlines("MEDIUM", start, queue="VIP") == (start + timedelta(hours=4), start + timedelta(hours=24))
+
+    def test_breach_escalates_once(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.models.ticket import Ticket, TicketPriority, TicketSlaEvent
+        from backend.services.sla import SLAEngine, _epoch
+        Session = self._db(sqlite_db)
+        db = Session()
+        created = datetime(2026, 1, 1, 8, 0)
+        engine = SLAEngine(session_factory=Session, clock=lambda: _epoch(created))
+        late = self._ticket(db, engine, created, TicketPriority.HIGH)
+        answered = self._ticket(db, engine, created, TicketPriority.HIGH)
+        answered.first_response_at = created + timedelta(hours=1)
+        db.commit()
+        engine.sync(answered)
+        assert len(engine.wheel) == 3   # 2 for late, resolution only for answered
+
+        assert engine.tick(_epoch(created + timedelta(hours=3))) == []
+        events = engine.tick(_epoch(created + timedelta(hours=4, seconds=1)))
+        assert [(e["ticket_id"], e["kind"], e["event"]) for e in events] == [
+            (late.id, "RESPONSE", "BREACH"), (late.id, "RESPONSE", "ESCALATION")]
+        assert events[1]["detail"] == "HIGH->URGENT"
+        db.expire_all()
+        assert db.get(Ticket, late.id).priority == TicketPriority.URGENT
+
+        # A second worker that seeded the same tickets does not duplicate events
+        other = SLAEngine(session_factory=Session, clock=lambda: _epoch(created))
+        assert other.seed() == 2
+        assert [e["kind"] for e in other.tick(_epoch(created + timedelta(hours=5)))] == []
+        assert db.query(TicketSlaEvent).count() == 2
+
+    def test_resolved_ticket_cancels_timers(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.models.ticket import TicketPriority, TicketStatus
+        from backend.services.sla import SLAEngine, _epoch
+        Session = self._db(sqlite_db)
+        db = Session()
+        created = datetime(2026, 1, 1, 8, 0)
+        engine = SLAEngine(session_factory=Session, clock=lambda: _epoch(created))
+        ticket = self._ticket(db, engine, created, TicketPriority.URGENT)
+        ticket.status = TicketStatus.RESOLVED
+        db.commit()
+        engine.sync(ticket)
+        assert len(engine.wheel) == 0
+        assert engine.tick(_epoch(created + timedelta(days=1))) == []
+
+    def test_sla_metrics(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.models.ticket import TicketPriority, TicketStatus
+        from backend.services.sla import SLAEngine, sla_metrics, _epoch
+        Session = self._db(sqlite_db)
+        db = Session()
+        now = datetime(2026, 1, 10, 12, 0)
+        engine = SLAEngine(session_factory=Session, clock=lambda: _epoch(now))
+        # URGENT: response 1h, resolution 4h
+        met = self._ticket(db, engine, now - timedelta(hours=10), TicketPriority.URGENT)
+        met.first_response_at = met.created_at + timedelta(minutes=30)
+        met.resolved_at = met.created_at + timedelta(hours=2)
+        met.status = TicketStatus.RESOLVED
+        self._ticket(db, engine, now - timedelta(hours=10), TicketPriority.URGENT)   # both breached, open
+        self._ticket(db, engine, now - timedelta(minutes=10), TicketPriority.URGENT)  # nothing due yet
+        db.commit()
+        metrics = sla_metrics(db, since=now - timedelta(days=30), now=now)
+        assert metrics == {"sla_compliance": 50.0, "response_compliance": 50.0,
+                           "resolution_compliance": 50.0, "open_breaches": 1}
+
+    def test_kpi_and_hooks_wired(self):
+        analytics = read("backend/api/v1/endpoints/analytics.py")
+        assert "95.5" not in analytics and 'sla["sla_compliance"]' in analytics
+        tickets = read("backend/api/v1/endpoints/tickets.py")
+        assert "sla.apply(new_ticket)" in tickets and "get_sla_engine().sync(ticket)" in tickets
+        assert "sla_engine.start()" in read("backend/main.py")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-046: Parallel single-query-per-DB dashboard
+# ══════════════════════════════════════════════════════════════════
+
+def dashboard_dbs(sqlite_db):
+    """Seeded identity/order/support/product/knowledge sessions + per-DB SQL logs"""
+    import uuid
+    from datetime import datetime, timedelta
+    from backend.models.user import User, UserType
+    from backend.models.order import Order, OrderStatus
+    from backend.models.ticket import Ticket, TicketStatus
+    from backend.models.product import Product
+    from backend.models.conversation import Conversation
+
+    now = datetime.utcnow()
+    layout = {"identity": User, "order": Order, "support": Ticket, "product": Product, "knowledge": Conversation}
+    sessions, statements = {}, {}
+    for name, model in layout.items():
+        sessions[name] = sqlite_db(model)()
+        statements[name] = record_sql(sessions[name].get_bind())
+
+    sessions["identity"].add_all([
+        User(email="a@x.vn", password_hash="x", user_type=UserType.CUSTOMER, created_at=now - timedelta(days=30)),
+        User(email="b@x.vn", password_hash="x", user_type=UserType.CUSTOMER, created_at=now - timedelta(days=1)),
+        User(email="s@x.vn", password_hash="x", user_type=UserType.STAFF, created_at=now),
+    ])
+    sessions["order"].add_all([
+        Order(order_number="O1", customer_id="c", total_amount=100.0, status=OrderStatus.PENDING,
+              created_at=now - timedelta(days=3)),
+        Order(order_number="O2", customer_id="c", total_amount=50.0, status=OrderStatus.PENDING,
+              created_at=now - timedelta(hours=2)),
+        Order(order_number="O3", customer_id="c", total_amount=30.0, status=OrderStatus.DELIVERED,
+              created_at=now - timedelta(days=20)),
+    ])
+    for status, label, age in ((TicketStatus.OPEN, "NEGATIVE", 1), (TicketStatus.OPEN, None, 1),
+                               (TicketStatus.IN_PROGRESS, "NEGATIVE", 20), (TicketStatus.RESOLVED, None, 2)):
+        sessions["support"].add(Ticket(ticket_number=f"T-{uuid.uuid4().hex[:8]}", customer_id="c", subject="s",
+                                       status=status, sentiment_label=label, created_at=now - timedelta(days=age)))
+    sessions["product"].add_all([
+        Product(sku="P1", name="p1", price=1.0, stock_quantity=2, low_stock_threshold=5, is_active=True),
+        Product(sku="P2", name="p2", price=1.0, stock_quantity=50, low_stock_threshold=5, is_active=True),
+        Product(sku="P3", name="p3", price=1.0, stock_quantity=0, low_stock_threshold=5, is_active=False),
+    ])
+    sessions["knowledge"].add_all([
+        Conversation(user_id="c", created_at=now - timedelta(days=1)),
+        Conversation(user_id="c", created_at=now - timedelta(days=40)),
+    ])
+    for db in sessions.values():
+        db.commit()
+    for bucket in statements.values():
+        bucket.clear()
+    return sessions, statements
+
+
+def rollup_db(sqlite_db):
+    """Empty analytics DB with the KPI rollup tables"""
+    from backend.models.kpi_rollup import KpiRollup, KpiRollupWatermark
+    return sqlite_db(KpiRollup, KpiRollupWatermark)()
+
+
+class TestDashboardFanOut:
+    """USER-046 — One aggregate query per DB, DBs queried concurrently"""
+
+    def test_dashboard_one_query_per_db(self, sqlite_db):
+        from backend.api.v1.endpoints.analytics import get_dashboard_stats
+        sessions, statements = dashboard_dbs(sqlite_db)
+        result = get_dashboard_stats(
+            days=7, db=sessions["identity"], order_db=sessions["order"], support_db=sessions["support"],
+            product_db=sessions["product"], knowledge_db=sessions["knowledge"],
+            analytics_db=rollup_db(sqlite_db), current_user=None
+        )
+        assert result["orders"] == {"total": 3, "recent": 2, "pending": 2, "total_revenue": 150.0,
+                                    "average_order_value": 75.0}
+        assert result["tickets"] == {"total": 4, "open": 2, "in_progress": 1, "negative_sentiment": 1}
+        assert result["products"] == {"total_active": 2, "low_stock": 1}
+        assert result["customers"] == {"total": 2, "new": 1}
+        assert result["engagement"] == {"conversations": 1}
+        assert all(len(bucket) == 1 for bucket in statements.values()), statements
+
+    def test_anomalies_use_aggregates(self, sqlite_db, monkeypatch):
+        from backend.api.v1.endpoints import analytics
+        from backend.services import kpi_anomalies
+        monkeypatch.setattr(kpi_anomalies, "_detector", None)
+        analytics._state_checks.clear()
+        sessions, statements = dashboard_dbs(sqlite_db)
+        result = analytics.detect_anomalies(db=sessions["identity"], order_db=sessions["order"],
+                                            support_db=sessions["support"], product_db=sessions["product"],
+                                            analytics_db=rollup_db(sqlite_db), current_user=None)
+        assert result["total_anomalies"] == 0 and result["system_health"] == "HEALTHY"
+        assert [len(statements[name]) for name in ("support", "product", "order", "identity")] == [1, 1, 1, 0]
+
+    def test_ticket_metrics_and_stale_orders(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.services.dashboard_metrics import ticket_metrics, order_metrics
+        sessions, _ = dashboard_dbs(sqlite_db)
+        stats = ticket_metrics(sessions["support"])
+        assert (stats["total"], stats["open"], stats["resolved"], stats["negative"]) == (4, 2, 1, 2)
+        now = datetime.utcnow()
+        orders = order_metrics(sessions["order"], since=now - timedelta(days=1), stale_before=now - timedelta(days=2))
+        assert orders["stale_pending"] == 1 and orders["recent"] == 1
+
+    def test_fan_out_runs_concurrently(self):
+        import time
+        from backend.services.dashboard_metrics import fan_out
+        started = time.monotonic()
+        result = fan_out({name: (lambda name=name: time.sleep(0.2) or name) for name in "abcd"})
+        assert result == {"a": "a", "b": "b", "c": "c", "d": "d"}
+        assert time.monotonic() - started < 0.6
+
+    def test_stats_summary_single_query(self):
+        source = read("backend/api/v1/endpoints/tickets.py")
+        assert "stats = ticket_metrics(db)" in source
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-047: KPI rollup tables
+# ══════════════════════════════════════════════════════════════════
+
+class TestKpiRollups:
+    """USER-047 — Dashboard/KPI read hourly+daily rollups refreshed from watermarks"""
+
+    def _setup(self, sqlite_db):
+        from backend.services.kpi_rollups import KpiRollupJob
+        sessions, statements = dashboard_dbs(sqlite_db)
+        sessions["analytics"] = rollup_db(sqlite_db)
+        job = KpiRollupJob(session_factories={name: (lambda db=db: db) for name, db in sessions.items()})
+        return sessions, statements, job
+
+    def test_dashboard_reads_rollups_only(self, sqlite_db):
+        from backend.api.v1.endpoints.analytics import get_dashboard_stats
+        sessions, statements, job = self._setup(sqlite_db)
+        job.refresh()
+        for bucket in statements.values():
+            bucket.clear()
+        result = get_dashboard_stats(
+            days=7, db=sessions["identity"], order_db=sessions["order"], support_db=sessions["support"],
+            product_db=sessions["product"], knowledge_db=sessions["knowledge"],
+            analytics_db=sessions["analytics"], current_user=None
+        )
+        assert result["orders"] == {"total": 3, "recent": 2, "pending": 2, "total_revenue": 150.0,
+                                    "average_order_value": 75.0}
+        assert result["tickets"] == {"total": 4, "open": 2, "in_progress": 1, "negative_sentiment": 1}
+        assert result["customers"] == {"total": 2, "new": 1}
+        assert result["engagement"] == {"conversations": 1}
+        # Raw tables untouched; only the product snapshot stays live
+        assert [len(statements[name]) for name in ("order", "support", "identity", "knowledge", "product")] == \
+            [0, 0, 0, 0, 1]
+
+    def test_kpi_overview_from_rollups(self, sqlite_db):
+        from backend.api.v1.endpoints.analytics import get_kpi_overview
+        sessions, statements, job = self._setup(sqlite_db)
+        job.refresh()
+        statements["order"].clear()
+        result = get_kpi_overview(db=sessions["identity"], order_db=sessions["order"], support_db=sessions["support"],
+                                  analytics_db=sessions["analytics"], current_user=None)
+        assert result["revenue"]["last_30_days"] == 180.0 and result["revenue"]["last_7_days"] == 150.0
+        assert (result["orders"]["last_30_days"], result["orders"]["last_7_days"]) == (3, 2)
+        assert result["support"]["ticket_backlog"] == 3
+        assert statements["order"] == []
+
+    def test_incremental_refresh_rebuilds_changed_hours(self, sqlite_db):
+        from datetime import datetime
+        from backend.models.order import Order, OrderStatus
+        from backend.models.ticket import Ticket, TicketStatus
+        from backend.services.kpi_rollups import dashboard_rollups
+        sessions, _, job = self._setup(sqlite_db)
+        assert job.refresh() == {"orders": 3, "tickets": 3, "customers": 3, "conversations": 2}
+        # Nothing changed: only the overlap before each watermark (newest row's hour) is rescanned
+        assert job.refresh() == {"orders": 1, "tickets": 1, "customers": 1, "conversations": 1}
+
+        now = datetime.utcnow()
+        ticket = sessions["support"].query(Ticket).filter(Ticket.status == TicketStatus.IN_PROGRESS).one()
+        ticket.status, ticket.updated_at = TicketStatus.RESOLVED, now
+        sessions["order"].add(Order(order_number="O4", customer_id="c", total_amount=20.0,
+                                    status=OrderStatus.PENDING, created_at=now))
+        sessions["support"].commit()
+        sessions["order"].commit()
+        refreshed = job.refresh()
+        # Hour of the changed row (ticket created 20 days ago) + the overlap hour
+        assert refreshed["orders"] == 2 and refreshed["tickets"] == 2
+
+        rollups = dashboard_rollups(sessions["analytics"], since=now.replace(hour=0, minute=0, second=0, microsecond=0))
+        assert rollups["orders"]["total"] == 4 and rollups["orders"]["pending"] == 3
+        assert rollups["tickets"]["in_progress"] == 0 and rollups["tickets"]["resolved"] == 2
+
+    def test_window_combines_partial_hours_and_days(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.models.kpi_rollup import KpiRollup, KpiRollupWatermark
+        from backend.services.kpi_rollups import rollup_sums, rollup_value, ROLLUP_SOURCES
+        db = rollup_db(sqlite_db)
+        assert rollup_sums(db) is None
+        day = datetime(2026, 3, 10)
+        cells = [("DAY", day - timedelta(days=1), 24), ("DAY", day, 10), ("DAY", day + timedelta(days=1), 5)]
+        cells += [("HOUR", day + timedelta(hours=h), 1) for h in range(10)]
+        db.add_all([KpiRollup(grain=g, bucket_start=b, metric="orders.count", dimension="PENDING", value=v)
+                    for g, b, v in cells])
+        db.add_all([KpiRollupWatermark(source=s.name, high_water=day) for s in ROLLUP_SOURCES])
+        db.commit()
+        sums = rollup_sums(db, {"w": day + timedelta(hours=6, minutes=30)})
+        # 06:00-09:00 of day 10 (4 hourly cells) + all of day 11
+        assert rollup_value(sums, "orders.count", "w") == 9
+        assert rollup_value(sums, "orders.count") == 39
+        assert rollup_value(sums, "orders.count", dimensions=["OPEN"]) == 0
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-048: SQL-side time-bucketed trends
+# ══════════════════════════════════════════════════════════════════
+
+class TestTimeSeriesBuckets:
+    """USER-048 — GROUP BY bucket in SQL, gaps filled, several metrics per call"""
+
+    def _orders(self, sqlite_db, created):
+        from backend.models.order import Order, OrderStatus
+        db = sqlite_db(Order)()
+        db.add_all([
+            Order(order_number=f"O{i}", customer_id="c", total_amount=amount, status=OrderStatus.PENDING, created_at=when)
+            for i, (when, amount) in enumerate(created)
+        ])
+        db.commit()
+        return db, record_sql(db.get_bind())
+
+    def test_order_trends_grouped_in_sql_with_gaps(self, sqlite_db):
+        from datetime import datetime, timedelta
+        from backend.api.v1.endpoints.analytics import get_order_trends
+        now = datetime.utcnow()
+        db, statements = self._orders(sqlite_db, [
+            (now - timedelta(days=2), 10.0), (now - timedelta(days=2), 5.5), (now - timedelta(days=5), 7.0),
+            (now - timedelta(days=40), 99.0),
+        ])
+        result = get_order_trends(days=7, granularity="day", db=db, current_user=None)
+        assert result["data_points"] == 8 and result["granularity"] == "day"
+        by_date = {point["date"]: point for point in result["trends"]}
+        assert by_date[(now - timedelta(days=2)).date().isoformat()] == {
+            "date": (now - timedelta(days=2)).date().isoformat(), "order_count": 2, "revenue": 15.5}
+        assert by_date[(now - timedelta(days=5)).date().isoformat()]["order_count"] == 1
+        assert sum(point["order_count"] for point in result["trends"]) == 3
+        assert by_date[(now - timedelta(days=1)).date().isoformat()] == {
+            "date": (now - timedelta(days=1)).date().isoformat(), "order_count": 0, "revenue": 0.0}
+        assert len(statements) == 1 and "GROUP BY" in statements[0]
+
+    def test_week_and_month_buckets_match_python(self, sqlite_db):
+        from datetime import datetime
+        from sqlalchemy import func
+        from backend.models.order import Order
+        from backend.services.time_series import time_series, bucket_floor
+        moments = [datetime(2025, 12, 28, 23, 30), datetime(2025, 12, 29, 0, 5), datetime(2026, 1, 4, 12),
+                   datetime(2026, 1, 5), datetime(2026, 2, 1, 8)]
+        db, _ = self._orders(sqlite_db, [(moment, 1.0) for moment in moments])
+        for granularity in ("hour", "day", "week", "month"):
+            series = time_series(db, Order.created_at, start=datetime(2025, 12, 20), end=datetime(2026, 2, 2),
+                                 granularity=granularity, metrics={"n": func.count(Order.id), "s": func.sum(Order.total_amount)})
+            expected = {}
+            for moment in moments:
+                expected[bucket_floor(moment, granularity)] = expected.get(bucket_floor(moment, granularity), 0) + 1
+            assert {p["bucket"]: p["n"] for p in series if p["n"]} == expected, granularity
+            buckets = [p["bucket"] for p in series]
+            assert buckets == sorted(set(buckets)) and all(p["s"] == p["n"] for p in series)
+        months = time_series(db, Order.created_at, start=datetime(2025, 11, 15), end=datetime(2026, 2, 2),
+                             granularity="month", metrics={"n": func.count(Order.id)})
+        assert [p["bucket"].month for p in months] == [11, 12, 1, 2]
+
+    def test_too_many_buckets_rejected(self, sqlite_db):
+        import pytest
+        from fastapi import HTTPException
+        from backend.api.v1.endpoints.analytics import get_order_trends
+        db, statements = self._orders(sqlite_db, [])
+        with pytest.raises(HTTPException) as exc:
+            get_order_trends(days=365, granularity="hour", db=db, current_user=None)
+        assert exc.value.status_code == 400 and statements == []
+
+    def test_mysql_bucket_expressions(self):
+        from sqlalchemy.dialects import mysql
+        from backend.models.order import Order
+        from backend.services.time_series import bucket_expression
+        compiled = {
+            g: str(bucket_expression(Order.created_at, g, "mysql").compile(dialect=mysql.dialect()))
+            for g in ("hour", "day", "week", "month")
+        }
+        assert all("date_format" in sql for sql in compiled.values())
+        assert "subdate" in compiled["week"] and "weekday" in compiled["week"]
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-049: Grouped staff performance
+# ══════════════════════════════════════════════════════════════════
+
+class TestStaffPerformance:
+    """USER-049 — One staff lookup + grouped ticket aggregates, percentiles in SQL"""
+
+    def _dbs(self, sqlite_db, staff_count=3):
+        import uuid
+        from datetime import datetime, timedelta
+        from backend.models.user import User, UserType
+        from backend.models.ticket import Ticket, TicketStatus
+
+        sessions, statements = {}, {}
+        for name, model in (("identity", User), ("support", Ticket)):
+            sessions[name] = sqlite_db(model)()
+            statements[name] = record_sql(sessions[name].get_bind())
+
+        sessions["identity"].add(User(id="cust", email="c@x.vn", password_hash="x", user_type=UserType.CUSTOMER))
+        for i in range(staff_count):
+            sessions["identity"].add(User(id=f"s{i + 1}", email=f"s{i + 1}@x.vn", password_hash="x",
+                                          full_name=f"Staff {i + 1}", user_type=UserType.STAFF))
+        base = datetime(2026, 3, 1, 8)
+
+        def ticket(staff, status, hours=None):
+            return Ticket(ticket_number=f"T-{uuid.uuid4().hex[:8]}", customer_id="cust", subject="s",
+                          assigned_to=staff, status=status, created_at=base,
+                          resolved_at=base + timedelta(hours=hours) if hours is not None else None)
+
+        # s1: 10 resolved in 1..10h (inserted out of order) + 2 open; s2: one resolved in 5h; s3: nothing
+        sessions["support"].add_all([ticket("s1", TicketStatus.RESOLVED, h) for h in (7, 2, 10, 1, 5, 9, 3, 8, 4, 6)])
+        sessions["support"].add_all([ticket("s1", TicketStatus.OPEN), ticket("s1", TicketStatus.IN_PROGRESS)])
+        sessions["support"].add(ticket("s2", TicketStatus.RESOLVED, 5))
+        sessions["support"].add(ticket(None, TicketStatus.OPEN))
+        for db in sessions.values():
+            db.commit()
+        for bucket in statements.values():
+            bucket.clear()
+        return sessions, statements
+
+    def test_counts_and_percentiles(self, sqlite_db):
+        from backend.api.v1.endpoints.analytics import get_staff_performance
+        sessions, _ = self._dbs(sqlite_db)
+        result = get_staff_performance(db=sessions["identity"], support_db=sessions["support"], current_user=None)
+        rows = {row["staff_id"]: row for row in result["performance"]}
+        assert result["total_staff"] == 3 and set(rows) == {"s1", "s2", "s3"}
+        assert (rows["s1"]["tickets_assigned"], rows["s1"]["tickets_resolved"]) == (12, 10)
+        assert rows["s1"]["resolution_rate"] == 83.33
+        assert rows["s1"]["resolution_time_hours"] == {"p50": 5.0, "p90": 9.0, "p95": 10.0}
+        assert rows["s2"]["resolution_time_hours"] == {"p50": 5.0, "p90": 5.0, "p95": 5.0}
+        assert rows["s3"]["tickets_assigned"] == 0
+        assert rows["s3"]["resolution_time_hours"] == {"p50": None, "p90": None, "p95": None}
+        assert result["performance"][0]["staff_id"] == "s2"
+
+    def test_query_count_independent_of_staff(self, sqlite_db):
+        from backend.api.v1.endpoints.analytics import get_staff_performance
+        sessions, statements = self._dbs(sqlite_db, staff_count=200)
+        result = get_staff_performance(db=sessions["identity"], support_db=sessions["support"], current_user=None)
+        assert result["total_staff"] == 200
+        assert (len(statements["identity"]), len(statements["support"])) == (1, 2)
+        assert "row_number() OVER" in statements["support"][1]
+
+    def test_mysql_duration_expression(self):
+        from sqlalchemy.dialects import mysql
+        from backend.models.ticket import Ticket
+        from backend.services.time_series import duration_seconds
+        sql = str(duration_seconds(Ticket.created_at, Ticket.resolved_at, "mysql").compile(dialect=mysql.dialect()))
+        assert sql.startswith("timestampdiff(SECOND,")
+
+
+# ══════════════════════════════════════════════════════════════════
+# USER-050: Streaming anomaly detection over KPI series
+# ══════════════════════════════════════════════════════════════════
+
+class TestKpiAnomalyDetection:
+    """USER-050 — Seasonal EWMA baselines per series, fed incrementally from rollups"""
+
+    def _analytics(self, sqlite_db, scale=1, days=14):
+        from datetime import datetime, timedelta
+        from backend.models.kpi_rollup import KpiRollup, KpiRollupWatermark
+        from backend.services.kpi_rollups import ROLLUP_SOURCES
+        db = rollup_db(sqlite_db)
+        now = datetime(2026, 3, 20, 12, 30)
+        start = datetime(2026, 3, 20) - timedelta(days=days)
+        cells, hour = [], start
+        while hour <= datetime(2026, 3, 20, 11):
+            busy = 9 <= hour.hour <= 18
+            wobble = (hour.day + hour.hour) % 3 - 1  # -1, 0, 1
+            cells += [
+                KpiRollup(grain="HOUR", bucket_start=hour, metric="orders.count", dimension="DELIVERED",
+                          value=scale * (20 if busy else 3) + wobble),
+                KpiRollup(grain="HOUR", bucket_start=hour, metric="orders.revenue", dimension="DELIVERED",
+                          value=scale * (2000 if busy else 300) + 50 * wobble),
+                KpiRollup(grain="HOUR", bucket_start=hour, metric="tickets.sentiment", dimension="NEGATIVE",
+                          value=scale * 1 + (wobble if scale > 1 else 0)),
+            ]
+            hour += timedelta(hours=1)
+        db.add_all(cells)
+        db.add_all([KpiRollupWatermark(source=s.name, high_water=now, updated_at=now) for s in ROLLUP_SOURCES])
+        db.commit()
+        return db, now
+
+    def _detector(self, now):
+        from backend.services.kpi_anomalies import KpiAnomalyDetector
+        clock = {"now": now}
+        return KpiAnomalyDetector(clock=lambda: clock["now"]), clock
+
+    def _set(self, db, hour, metric, dimension, value):
+        from backend.models.kpi_rollup import KpiRollup
+        db.merge(KpiRollup(grain="HOUR", bucket_start=hour, metric=metric, dimension=dimension, value=value))
+        db.commit()
+
+    def test_ewma_stats(self):
+        import pytest
+        from ai_modules.core import EWMAStats
+        stats = EWMAStats(alpha=0.5, min_count=3)
+        assert stats.zscore(10) is None
+        for value in (10, 10, 10):
+            stats.update(value)
+        assert stats.mean == 10 and stats.var == 0 and stats.zscore(10) is None
+        assert stats.zscore(13, std_floor=1.0) == 3.0
+        stats.update(14)
+        assert stats.mean == 12 and stats.var == pytest.approx(4.0)
+        with pytest.raises(ValueError):
+            EWMAStats(alpha=0)
+
+    def test_quiet_history_then_spike_is_flagged(self, sqlite_db):
+        from datetime import datetime
+        db, now = self._analytics(sqlite_db)
+        detector, _ = self._detector(now)
+        # 14 days of a day/night pattern: no false positives
+        assert detector.update(db) == []
+        assert detector.last_hour == datetime(2026, 3, 20, 11)
+
+        self._set(db, datetime(2026, 3, 20, 12), "tickets.sentiment", "NEGATIVE", 9)
+        self._set(db, datetime(2026, 3, 20, 12), "orders.count", "DELIVERED", 2)
+        self._set(db, datetime(2026, 3, 20, 12), "orders.revenue", "DELIVERED", 2000)
+        from backend.models.kpi_rollup import KpiRollupWatermark
+        db.query(KpiRollupWatermark).update({"updated_at": datetime(2026, 3, 20, 13, 30)})
+        db.commit()
+        detector.clock = lambda: datetime(2026, 3, 20, 13, 30)
+        found = {a["type"]: a for a in detector.update(db)}
+        assert set(found) == {"HIGH_NEGATIVE_SENTIMENT", "ORDER_DROP"}
+        assert found["ORDER_DROP"]["value"] == 2 and found["ORDER_DROP"]["z_score"] <= -3
+        assert found["HIGH_NEGATIVE_SENTIMENT"]["expected"] == 1.0
+        assert {a["type"] for a in detector.anomalies(since=datetime(2026, 3, 20, 12))} == set(found)
+        assert detector.anomalies(since=datetime(2026, 3, 20, 13)) == []
+
+    def test_threshold_scales_with_shop(self, sqlite_db):
+        from datetime import datetime
+        small, now = self._analytics(sqlite_db)
+        big, _ = self._analytics(sqlite_db, scale=100)
+        hour = datetime(2026, 3, 20, 11)
+        self._set(small, hour, "tickets.sentiment", "NEGATIVE", 8)      # 1 → 8
+        self._set(big, hour, "tickets.sentiment", "NEGATIVE", 107)      # 100 → 107
+        small_detector, _ = self._detector(now)
+        big_detector, _ = self._detector(now)
+        assert [a["type"] for a in small_detector.update(small)] == ["HIGH_NEGATIVE_SENTIMENT"]
+        assert big_detector.update(big) == []
+
+    def test_incremental_update_and_readiness(self, sqlite_db):
+        db, now = self._analytics(sqlite_db)
+        detector, _ = self._detector(now)
+        assert not detector.is_current()
+        detector.update(db)
+        assert detector.is_current()
+        statements = record_sql(db.get_bind())
+        # Same closed hour: readiness check only, no rollup scan
+        assert detector.update(db) == [] and len(statements) == 1
+        # Rollups never backfilled → nothing evaluated
+        fresh, _ = self._detector(now)
+        assert fresh.update(rollup_db(sqlite_db)) == []
+        assert fresh.last_hour is None
+
+    def test_rollup_job_feeds_detector_and_endpoint_reads(self, sqlite_db, monkeypatch):
+        from datetime import datetime
+        from backend.api.v1.endpoints import analytics
+        from backend.services import kpi_anomalies
+        from backend.services.kpi_rollups import KpiRollupJob
+        db, now = self._analytics(sqlite_db)
+        self._set(db, datetime(2026, 3, 20, 11), "tickets.sentiment", "NEGATIVE", 9)
+        detector, _ = self._detector(now)
+        job = KpiRollupJob(session_factories={"analytics": lambda: db}, sources=())
+        job.on_refresh(detector.update)
+        job.refresh()
+        assert detector.last_hour == datetime(2026, 3, 20, 11)
+
+        monkeypatch.setattr(kpi_anomalies, "_detector", detector)
+        monkeypatch.setattr(analytics, "datetime", type("FrozenDatetime", (datetime,), {"utcnow": staticmethod(lambda: now)}))
+        analytics._state_checks.set("state", {
+            "tickets": {"open": 0, "recent_negative": 9},
+            "products": {"low_stock": 0},
+            "orders": {"stale_pending": 0},
+        })
+        statements = record_sql(db.get_bind())
+        result = analytics.detect_anomalies(db=None, order_db=None, support_db=None, product_db=None,
+                                            analytics_db=db, current_user=None)
+        # Baseline ready → the z-score alert replaces the fixed 24h threshold
+        assert [a["type"] for a in result["anomalies"]] == ["HIGH_NEGATIVE_SENTIMENT"]
+        assert result["anomalies"][0]["occurrences"] == 1 and result["system_health"] == "ATTENTION"
+        assert statements == []
+        analytics._state_checks.clear()
+
+    def test_fixed_thresholds_until_detector_ready(self, sqlite_db, monkeypatch):
+        from datetime import datetime
+        from backend.api.v1.endpoints import analytics
+        from backend.services import kpi_anomalies
+        db, now = self._analytics(sqlite_db, days=3)
+        detector, _ = self._detector(now)
+        detector.update(db)
+        assert detector.last_hour is not None and not detector.ready("HIGH_NEGATIVE_SENTIMENT")
+
+        monkeypatch.setattr(kpi_anomalies, "_detector", detector)
+        monkeypatch.setattr(analytics, "datetime", type("FrozenDatetime", (datetime,), {"utcnow": staticmethod(lambda: now)}))
+        analytics._state_checks.set("state", {
+            "tickets": {"open": 25, "recent_negative": 6},
+            "products": {"low_stock": 0},
+            "orders": {"stale_pending": 0},
+        })
+        result = analytics.detect_anomalies(db=None, order_db=None, support_db=None, product_db=None,
+                                            analytics_db=db, current_user=None)
+        analytics._state_checks.clear()
+        assert [a["type"] for a in result["anomalies"]] == ["HIGH_NEGATIVE_SENTIMENT", "TICKET_OVERFLOW"]
+        assert "6 ticket" in result["anomalies"][0]["message"]
+        assert "TICKET_SPIKE" in {s.type for s in kpi_anomalies.ANOMALY_SERIES}
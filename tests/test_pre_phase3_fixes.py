@@ -87,7 +87,10 @@ class TestFix2TicketsCrossDB:
     def test_user_query_uses_identity_db(self):
         """Staff member query uses identity_db, not db (support session)"""
         source = Path(ROOT_DIR / "backend/api/v1/endpoints/tickets.py").read_text(encoding="utf-8")
-        assert "identity_db.query(User)" in source
+        # Staff roster is seeded by the assignment service from the identity session
+        assigner = Path(ROOT_DIR / "backend/services/staff_assignment.py").read_text(encoding="utf-8")
+        assert "identity_db.query(User.id)" in assigner
+        assert "get_staff_assignment().pick(db, identity_db)" in source
         # The old pattern used the support db variable 'db' for User queries
         # Make sure we don't have bare "= db.query(User)" (not "identity_db")
         import re